@@ -0,0 +1,494 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import time
+import typing
+
+import edq.util.dirent
+
+import comics.cbz
+import comics.store
+import comics.transcode
+
+_logger = logging.getLogger(__name__)
+
+INDEX_FILENAME: str = '.comics-audit.sqlite'
+""" The name of the index kept in an audited library's root (unless another path is given). """
+
+AUDIT_EXTENSIONS: typing.Set[str] = comics.transcode.SOURCE_EXTENSIONS | {'.avif', comics.cbz.EXTENSION}
+""" The files that are audited (images and chapter archives). """
+
+DEFAULT_BATCH_SIZE: int = 64
+""" The number of files sent to a worker process at once. """
+
+STATUS_OK: str = 'ok'
+STATUS_EMPTY: str = 'empty'
+STATUS_TRUNCATED: str = 'truncated'
+""" The file starts like an image (or archive), but its end marker (or declared length) is missing. """
+
+STATUS_NOT_IMAGE: str = 'not_image'
+""" The file does not start with any known image (or archive) signature, e.g., a saved HTML error page. """
+
+STATUS_UNREADABLE: str = 'unreadable'
+
+_JPEG_SIGNATURE: bytes = b'\xff\xd8\xff'
+_JPEG_END: bytes = b'\xff\xd9'
+_PNG_SIGNATURE: bytes = b'\x89PNG\r\n\x1a\n'
+_PNG_END: bytes = b'IEND\xaeB`\x82'
+_GIF_SIGNATURES: typing.Tuple[bytes, ...] = (b'GIF87a', b'GIF89a')
+_TIFF_SIGNATURES: typing.Tuple[bytes, ...] = (b'II*\x00', b'MM\x00*')
+_ZIP_SIGNATURE: bytes = b'PK\x03\x04'
+_ZIP_END: bytes = b'PK\x05\x06'
+
+_END_MARKER_WINDOW: int = 4096
+""" How far from the end of a file an end marker may be (to allow for trailing padding). """
+
+_ZIP_END_WINDOW: int = 22 + 65535
+""" How far from the end of an archive its end of central directory record may be (the record plus the largest comment). """
+
+_SCHEMA: typing.List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        digest TEXT,
+        checked REAL NOT NULL
+    )
+    ''',
+]
+
+class FileStatus:
+    """ The outcome of checking one file, as of the size and modification time it had when it was checked. """
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'status', 'digest')
+
+    def __init__(self,
+            path: str,
+            size: int,
+            mtime_ns: int,
+            status: str,
+            digest: typing.Union[str, None] = None,
+            ) -> None:
+        self.path: str = path
+        """ The file's path (relative to the library in the index, absolute in a repair list). """
+
+        self.size: int = size
+        self.mtime_ns: int = mtime_ns
+
+        self.status: str = status
+        """ See the STATUS_* constants. """
+
+        self.digest: typing.Union[str, None] = digest
+        """ The SHA-256 of the file's contents (the same key the image store uses), or None if it could not be read. """
+
+    def is_ok(self) -> bool:
+        """ Check if the file passed. """
+
+        return (self.status == STATUS_OK)
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """ Get a JSON-friendly representation. """
+
+        return {
+            'path': self.path,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'status': self.status,
+            'digest': self.digest,
+        }
+
+    @staticmethod
+    def from_dict(data: typing.Dict[str, typing.Any]) -> 'FileStatus':
+        """ Load a status from to_dict(). """
+
+        return FileStatus(data['path'], int(data['size']), int(data['mtime_ns']), data['status'], digest = data.get('digest', None))
+
+    def __repr__(self) -> str:
+        return f"{self.path} - {self.status}"
+
+class AuditReport:
+    """ The outcome of auditing a library. """
+
+    def __init__(self) -> None:
+        self.checked_count: int = 0
+        """ Files that were (re)read because they are new or changed since the last audit. """
+
+        self.checked_bytes: int = 0
+
+        self.cached_count: int = 0
+        """ Files whose status was taken from the index because they have not changed. """
+
+        self.removed_count: int = 0
+        """ Files in the index that are no longer in the library. """
+
+        self.bad_files: typing.List[FileStatus] = []
+        """ Files that did not pass (new and old), with absolute paths. """
+
+        self.duration_secs: float = 0.0
+
+    def __repr__(self) -> str:
+        return (f"Checked: {self.checked_count} ({self.checked_bytes} bytes), Unchanged: {self.cached_count}, "
+                + f"Removed: {self.removed_count}, Bad: {len(self.bad_files)}, Time: {self.duration_secs:.3f}s")
+
+class AuditIndex:
+    """
+    What each file in a library looked like (size and modification time) when it was last checked, and how the check went.
+    Stored as an SQLite database.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        """ Where the index is stored. """
+
+        self._connection: typing.Union[sqlite3.Connection, None] = sqlite3.connect(path)
+        with self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def close(self) -> None:
+        """ Close the index. """
+
+        if (self._connection is not None):
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> 'AuditIndex':
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+    def get_all(self) -> typing.Dict[str, FileStatus]:
+        """ Get the last status of every file in the index, keyed by (relative) path. """
+
+        if (self._connection is None):
+            return {}
+
+        rows = self._connection.execute('SELECT path, size, mtime_ns, status, digest FROM files').fetchall()
+        return {row[0]: FileStatus(row[0], row[1], row[2], row[3], digest = row[4]) for row in rows}
+
+    def update(self, statuses: typing.List[FileStatus]) -> None:
+        """ Record newly checked files. """
+
+        if (self._connection is None):
+            return
+
+        now = time.time()
+        rows = [(status.path, status.size, status.mtime_ns, status.status, status.digest, now) for status in statuses]
+
+        with self._connection:
+            self._connection.executemany(
+                    'INSERT OR REPLACE INTO files (path, size, mtime_ns, status, digest, checked) VALUES (?, ?, ?, ?, ?, ?)',
+                    rows)
+
+    def remove(self, paths: typing.List[str]) -> None:
+        """ Forget files that are no longer in the library. """
+
+        if (self._connection is None):
+            return
+
+        with self._connection:
+            self._connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in paths])
+
+def audit(
+        library_dir: str,
+        index_path: typing.Union[str, None] = None,
+        processes: typing.Union[int, None] = None,
+        full: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        ) -> AuditReport:
+    """
+    Check every image (and chapter archive) under a library directory for a valid signature and end marker,
+    see check_file().
+
+    Only files that are new or whose size or modification time changed since the last audit are read
+    (unless `full` is set), everything else keeps the status recorded in the index
+    (by default, INDEX_FILENAME in the library's root).
+    Files are read in a pool of worker processes (one per core, by default).
+    With zero processes, files are read in the calling thread.
+    """
+
+    start = time.monotonic()
+
+    if (index_path is None):
+        index_path = os.path.join(library_dir, INDEX_FILENAME)
+
+    if (processes is None):
+        processes = os.cpu_count() or 1
+
+    report = AuditReport()
+
+    with AuditIndex(index_path) as index:
+        known = index.get_all()
+        to_check = []
+
+        for (relpath, size, mtime_ns) in _walk(library_dir):
+            previous = known.pop(relpath, None)
+            if ((not full) and (previous is not None) and (previous.size == size) and (previous.mtime_ns == mtime_ns)):
+                report.cached_count += 1
+                if (not previous.is_ok()):
+                    report.bad_files.append(_to_absolute(library_dir, previous))
+
+                continue
+
+            to_check.append(relpath)
+
+        for statuses in _check_batches(library_dir, to_check, processes, max(1, batch_size)):
+            index.update(statuses)
+
+            for status in statuses:
+                report.checked_count += 1
+                report.checked_bytes += status.size
+                if (not status.is_ok()):
+                    report.bad_files.append(_to_absolute(library_dir, status))
+
+        index.remove(list(known.keys()))
+        report.removed_count = len(known)
+
+    report.bad_files.sort(key = lambda status: status.path)
+    report.duration_secs = time.monotonic() - start
+
+    return report
+
+def check_file(path: str) -> FileStatus:
+    """
+    Check a single file by memory-mapping it and looking at its signature and end marker:
+    JPEG (EOI), PNG (IEND), GIF (trailer), WebP (RIFF length), AVIF (box lengths), BMP (declared size),
+    and CBZ (end of central directory).
+    TIFF files only have their signature checked.
+    The returned status has the file's size and modification time from before it was read.
+    """
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return FileStatus(path, 0, 0, STATUS_UNREADABLE)
+
+    if (stat.st_size == 0):
+        return FileStatus(path, 0, stat.st_mtime_ns, STATUS_EMPTY, digest = hashlib.sha256().hexdigest())
+
+    try:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            status = _check_data(data)
+            digest = hashlib.sha256(data).hexdigest()
+    except (OSError, ValueError) as ex:
+        _logger.debug("Could not read '%s'.", path, exc_info = ex)
+        return FileStatus(path, stat.st_size, stat.st_mtime_ns, STATUS_UNREADABLE)
+
+    return FileStatus(path, stat.st_size, stat.st_mtime_ns, status, digest = digest)
+
+def write_repair_list(path: str, statuses: typing.List[FileStatus]) -> None:
+    """ Write a repair list (files that did not pass an audit) as JSONL (one file per line), see apply_repairs(). """
+
+    with open(path, 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+        for status in statuses:
+            file.write(json.dumps(status.to_dict()) + '\n')
+
+def read_repair_list(path: str) -> typing.List[FileStatus]:
+    """ Read a repair list written by write_repair_list(). """
+
+    statuses = []
+    with open(path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+        for line in file:
+            line = line.strip()
+            if (len(line) > 0):
+                statuses.append(FileStatus.from_dict(json.loads(line)))
+
+    return statuses
+
+def apply_repairs(
+        statuses: typing.List[FileStatus],
+        store: typing.Union[comics.store.ImageStore, None] = None,
+        ) -> int:
+    """
+    Remove the bad files from a repair list, so the next download of their comics fetches them again
+    (a removed image is missing, and a chapter with a removed archive is downloaded again).
+    Files that changed since they were audited (e.g., were already fixed) are left alone.
+    If an image store is given, a bad body in it (which would otherwise just be linked back in) is removed too.
+    Returns the number of files removed.
+    """
+
+    removed = 0
+
+    for status in statuses:
+        try:
+            stat = os.stat(status.path)
+        except OSError:
+            continue
+
+        if ((stat.st_size != status.size) or (stat.st_mtime_ns != status.mtime_ns)):
+            _logger.debug("File changed since it was audited, leaving it: '%s'.", status.path)
+            continue
+
+        os.remove(status.path)
+        removed += 1
+
+        if ((store is not None) and (status.digest is not None)):
+            object_path = store.get_object_path(status.digest)
+            if (os.path.exists(object_path)):
+                _logger.debug("Removing bad image from the store: '%s'.", object_path)
+                os.remove(object_path)
+
+    return removed
+
+def _check_batch(paths: typing.List[str]) -> typing.List[FileStatus]:
+    """ Check several files, see check_file(). Runs in a worker process. """
+
+    return [check_file(path) for path in paths]
+
+def _check_batches(
+        library_dir: str,
+        relpaths: typing.List[str],
+        processes: int,
+        batch_size: int,
+        ) -> typing.Iterator[typing.List[FileStatus]]:
+    """ Check files in batches (in worker processes, if any), yielding each batch's statuses (with relative paths) as it is done. """
+
+    batches = [[os.path.join(library_dir, relpath) for relpath in relpaths[i:(i + batch_size)]] for i in range(0, len(relpaths), batch_size)]
+    if (len(batches) == 0):
+        return
+
+    if (processes == 0):
+        results: typing.Iterable[typing.List[FileStatus]] = map(_check_batch, batches)
+        yield from _relative_batches(batches, relpaths, results, batch_size)
+        return
+
+    # Forking a process that has threads (e.g., a caller's download workers) is not safe.
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers = min(processes, len(batches)), mp_context = context) as executor:
+        yield from _relative_batches(batches, relpaths, executor.map(_check_batch, batches), batch_size)
+
+def _relative_batches(
+        batches: typing.List[typing.List[str]],
+        relpaths: typing.List[str],
+        results: typing.Iterable[typing.List[FileStatus]],
+        batch_size: int,
+        ) -> typing.Iterator[typing.List[FileStatus]]:
+    """ Swap the absolute paths in each batch's statuses for the relative paths they were made from. """
+
+    for (i, statuses) in enumerate(results):
+        for (status, relpath) in zip(statuses, relpaths[(i * batch_size):((i + 1) * batch_size)]):
+            status.path = relpath
+
+        yield statuses
+
+def _walk(library_dir: str) -> typing.Iterator[typing.Tuple[str, int, int]]:
+    """ Find every file that should be audited, yielding its path (relative to the library), size, and modification time. """
+
+    dirs = ['']
+    while (len(dirs) > 0):
+        reldir = dirs.pop()
+
+        try:
+            entries = list(os.scandir(os.path.join(library_dir, reldir)))
+        except OSError as ex:
+            _logger.warning("Could not list '%s'.", os.path.join(library_dir, reldir), exc_info = ex)
+            continue
+
+        for entry in sorted(entries, key = lambda entry: entry.name):
+            # Manifests, maps, indexes, and partial files.
+            if (entry.name.startswith('.')):
+                continue
+
+            relpath = os.path.join(reldir, entry.name)
+
+            if (entry.is_dir(follow_symlinks = False)):
+                dirs.append(relpath)
+                continue
+
+            if (os.path.splitext(entry.name)[-1].lower() not in AUDIT_EXTENSIONS):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            yield relpath, stat.st_size, stat.st_mtime_ns
+
+def _to_absolute(library_dir: str, status: FileStatus) -> FileStatus:
+    """ Get a copy of a status with an absolute path. """
+
+    path = os.path.abspath(os.path.join(library_dir, status.path))
+    return FileStatus(path, status.size, status.mtime_ns, status.status, digest = status.digest)
+
+def _check_data(data: mmap.mmap) -> str:
+    """ Check a (non-empty) file's contents against the signatures and end markers of the formats it could be. """
+
+    size = len(data)
+    head = data[:16]
+
+    if (head.startswith(_JPEG_SIGNATURE)):
+        return _check_end_marker(data, _JPEG_END, _END_MARKER_WINDOW)
+
+    if (head.startswith(_PNG_SIGNATURE)):
+        return _check_end_marker(data, _PNG_END, _END_MARKER_WINDOW)
+
+    if (head[:6] in _GIF_SIGNATURES):
+        tail = data[max(0, size - _END_MARKER_WINDOW):].rstrip(b'\x00')
+        return STATUS_OK if tail.endswith(b';') else STATUS_TRUNCATED
+
+    if ((head[:4] == b'RIFF') and (head[8:12] == b'WEBP')):
+        declared_size = int.from_bytes(head[4:8], 'little') + 8
+        return STATUS_OK if (size >= declared_size) else STATUS_TRUNCATED
+
+    if (head[4:8] == b'ftyp'):
+        return _check_boxes(data)
+
+    if (head[:2] == b'BM'):
+        declared_size = int.from_bytes(head[2:6], 'little')
+        return STATUS_OK if (size >= declared_size) else STATUS_TRUNCATED
+
+    if (head[:4] in _TIFF_SIGNATURES):
+        return STATUS_OK
+
+    if (head.startswith(_ZIP_SIGNATURE)):
+        return _check_end_marker(data, _ZIP_END, _ZIP_END_WINDOW)
+
+    return STATUS_NOT_IMAGE
+
+def _check_end_marker(data: mmap.mmap, marker: bytes, window: int) -> str:
+    """ Check that an end marker is within a window of the end of the file. """
+
+    if (data.rfind(marker, max(0, len(data) - window)) < 0):
+        return STATUS_TRUNCATED
+
+    return STATUS_OK
+
+def _check_boxes(data: mmap.mmap) -> str:
+    """ Check that the top-level boxes of an ISO BMFF file (e.g., AVIF) add up to the file's size. """
+
+    size = len(data)
+    offset = 0
+
+    while (offset < size):
+        if ((offset + 8) > size):
+            return STATUS_TRUNCATED
+
+        box_size = int.from_bytes(data[offset:(offset + 4)], 'big')
+        header_size = 8
+
+        if (box_size == 0):
+            # The last box, running to the end of the file.
+            return STATUS_OK
+
+        if (box_size == 1):
+            if ((offset + 16) > size):
+                return STATUS_TRUNCATED
+
+            box_size = int.from_bytes(data[(offset + 8):(offset + 16)], 'big')
+            header_size = 16
+
+        if (box_size < header_size):
+            return STATUS_TRUNCATED
+
+        offset += box_size
+
+    return STATUS_OK if (offset == size) else STATUS_TRUNCATED
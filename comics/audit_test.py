@@ -0,0 +1,167 @@
+import hashlib
+import io
+import os
+import typing
+import zipfile
+
+import edq.testing.unittest
+import edq.util.dirent
+import PIL.Image
+
+import comics.audit
+import comics.store
+
+class TestAudit(edq.testing.unittest.BaseTest):
+    """ Test auditing downloaded libraries. """
+
+    def test_check_file(self) -> None:
+        """ Test checking files of every format, whole and cut short. """
+
+        # [(name, contents, expected status), ...]
+        test_cases: typing.List[typing.Tuple[str, bytes, str]] = []
+
+        for (name, format) in [('a.jpg', 'JPEG'), ('a.png', 'PNG'), ('a.gif', 'GIF'), ('a.webp', 'WEBP'), ('a.bmp', 'BMP')]:
+            data = _make_image(format)
+            test_cases.append((name, data, comics.audit.STATUS_OK))
+            test_cases.append((name, data[:(len(data) // 2)], comics.audit.STATUS_TRUNCATED))
+
+        archive = _make_archive()
+        avif = _make_boxes([b'ftypavif', b'meta' + (b'\x00' * 20), b'mdat' + (b'\x01' * 100)])
+
+        test_cases += [
+            ('a.jpg', _make_image('JPEG') + (b'\x00' * 100), comics.audit.STATUS_OK),
+            ('a.tif', _make_image('TIFF')[:100], comics.audit.STATUS_OK),
+            ('a.cbz', archive, comics.audit.STATUS_OK),
+            ('a.cbz', archive[:-30], comics.audit.STATUS_TRUNCATED),
+            ('a.avif', avif, comics.audit.STATUS_OK),
+            ('a.avif', avif[:-10], comics.audit.STATUS_TRUNCATED),
+            ('a.avif', avif + b'\x00\x00\x00', comics.audit.STATUS_TRUNCATED),
+            ('a.avif', _make_boxes([b'ftypavif']) + b'\x00\x00\x00\x00mdat' + (b'\x01' * 10), comics.audit.STATUS_OK),
+            ('a.jpg', b'<html><body>Too Many Requests</body></html>', comics.audit.STATUS_NOT_IMAGE),
+            ('a.jpg', b'', comics.audit.STATUS_EMPTY),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (name, data, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({name}, {len(data)} bytes):"):
+                path = self._write(self._make_temp_dir(), name, data)
+                status = comics.audit.check_file(path)
+
+                self.assertEqual(expected, status.status)
+                self.assertEqual(len(data), status.size)
+                self.assertEqual(os.stat(path).st_mtime_ns, status.mtime_ns)
+                self.assertEqual(hashlib.sha256(data).hexdigest(), status.digest)
+
+        status = comics.audit.check_file(os.path.join(self._make_temp_dir(), 'missing.jpg'))
+        self.assertEqual(comics.audit.STATUS_UNREADABLE, status.status)
+        self.assertIsNone(status.digest)
+
+    def test_audit_incremental(self) -> None:
+        """ Test that only new and changed files are read again, and that bad files are reported every time. """
+
+        for processes in [0, 1]:
+            with self.subTest(msg = f"Processes {processes}:"):
+                library_dir = self._make_temp_dir()
+                good = _make_image('JPEG')
+
+                self._write(library_dir, os.path.join('Comic', '0001', '000.jpg'), good)
+                self._write(library_dir, os.path.join('Comic', '0001', '001.jpg'), good[:100])
+                self._write(library_dir, os.path.join('Comic', '0002', '000.png'), _make_image('PNG'))
+                self._write(library_dir, os.path.join('Comic', '0002', 'notes.txt'), b'not audited')
+                self._write(library_dir, os.path.join('Comic', '.comics-manifest.json'), b'{}')
+
+                report = comics.audit.audit(library_dir, processes = processes, batch_size = 2)
+                self.assertEqual((3, 0, 0), (report.checked_count, report.cached_count, report.removed_count))
+                bad_path = os.path.join(os.path.abspath(library_dir), 'Comic', '0001', '001.jpg')
+                self.assertEqual([bad_path], [status.path for status in report.bad_files])
+
+                report = comics.audit.audit(library_dir, processes = processes)
+                self.assertEqual((0, 3, 0), (report.checked_count, report.cached_count, report.removed_count))
+                self.assertEqual([bad_path], [status.path for status in report.bad_files])
+
+                # Fix the bad file, add a new one, and remove a good one.
+                self._write(library_dir, os.path.join('Comic', '0001', '001.jpg'), good)
+                self._write(library_dir, os.path.join('Comic', '0003', '000.jpg'), b'<html></html>')
+                os.remove(os.path.join(library_dir, 'Comic', '0002', '000.png'))
+
+                report = comics.audit.audit(library_dir, processes = processes)
+                self.assertEqual((2, 1, 1), (report.checked_count, report.cached_count, report.removed_count))
+                self.assertEqual([comics.audit.STATUS_NOT_IMAGE], [status.status for status in report.bad_files])
+
+                report = comics.audit.audit(library_dir, processes = processes, full = True)
+                self.assertEqual((3, 0, 0), (report.checked_count, report.cached_count, report.removed_count))
+                self.assertEqual(1, len(report.bad_files))
+
+    def test_repairs(self) -> None:
+        """ Test that a repair list removes the bad files (and their stored bodies), except any that changed since the audit. """
+
+        library_dir = self._make_temp_dir()
+        bad = b'<html></html>'
+
+        with comics.store.ImageStore(os.path.join(self._make_temp_dir(), 'store')) as store:
+            paths = []
+            for name in ['000.jpg', '001.jpg', '002.jpg']:
+                path = self._write(library_dir, name, bad + name.encode('utf-8'))
+                store.add_file(f"http://test.invalid/{name}", path)
+                paths.append(path)
+
+            report = comics.audit.audit(library_dir, processes = 0)
+            self.assertEqual(3, len(report.bad_files))
+
+            repair_list_path = os.path.join(self._make_temp_dir(), 'repairs.jsonl')
+            comics.audit.write_repair_list(repair_list_path, report.bad_files)
+
+            statuses = comics.audit.read_repair_list(repair_list_path)
+            self.assertEqual([status.to_dict() for status in report.bad_files], [status.to_dict() for status in statuses])
+
+            # The store keeps its own link to each body, so this edit only changes the library's copy.
+            os.remove(paths[1])
+            self._write(library_dir, '001.jpg', _make_image('JPEG'))
+            os.remove(paths[2])
+
+            self.assertEqual(1, comics.audit.apply_repairs(statuses, store = store))
+
+            self.assertEqual(['001.jpg'], sorted(name for name in os.listdir(library_dir) if not name.startswith('.')))
+            self.assertIsNone(store.lookup('http://test.invalid/000.jpg'))
+            self.assertIsNotNone(store.lookup('http://test.invalid/001.jpg'))
+
+    def _write(self, base_dir: str, relpath: str, data: bytes) -> str:
+        """ Write a file (and any missing directories) and return its path. """
+
+        path = os.path.join(base_dir, relpath)
+        edq.util.dirent.mkdir(os.path.dirname(path))
+
+        with open(path, 'wb') as file:
+            file.write(data)
+
+        return path
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+
+def _make_image(format: str) -> bytes:
+    """ Encode a small gradient image. """
+
+    image = PIL.Image.new('RGB', (32, 24))
+    image.putdata([((x * 8) % 256, (y * 10) % 256, ((x + y) * 4) % 256) for y in range(24) for x in range(32)])
+
+    output = io.BytesIO()
+    image.save(output, format = format)
+    return output.getvalue()
+
+def _make_archive() -> bytes:
+    """ Build a small chapter archive. """
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', compression = zipfile.ZIP_STORED) as archive:
+        archive.writestr('000.jpg', _make_image('JPEG'))
+
+    return output.getvalue()
+
+def _make_boxes(boxes: typing.List[bytes]) -> bytes:
+    """ Build an ISO BMFF file out of boxes (each given as its type and contents). """
+
+    return b''.join((len(box) + 4).to_bytes(4, 'big') + box for box in boxes)
@@ -0,0 +1,323 @@
+"""
+Benchmark downloading a comic end to end against a local stand-in server (see comics.bench.server).
+Each scenario runs in a fresh process, which reports images/sec, request latency, peak RSS, file syscalls, and context switches.
+Results can be saved and compared against a baseline to catch throughput regressions.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import typing
+
+import requests
+
+import comics.bench.server
+import comics.cli.parser
+import comics.download
+import comics.ratelimit
+import comics.source
+import comics.sources.coffeemanga_to
+
+DEFAULT_RATE_PER_SEC: float = 1000.0
+""" Benchmarks measure the downloader, not the politeness of its default rate limit. """
+
+DEFAULT_MAX_REGRESSION: float = 0.10
+
+class Scenario:
+    """ One way of downloading the stand-in comic. """
+
+    def __init__(self, name: str, workers: int = 1, prefetch_chapters: int = 0, use_async: bool = False) -> None:
+        self.name: str = name
+        """ The name results are reported under. """
+
+        self.workers: int = workers
+        """ The number of images downloaded at once. """
+
+        self.prefetch_chapters: int = prefetch_chapters
+        """ The number of upcoming chapters to list images for ahead of time. """
+
+        self.use_async: bool = use_async
+        """ Use comics.download.download_async() instead of comics.download.download(). """
+
+SCENARIOS: typing.Dict[str, Scenario] = {scenario.name: scenario for scenario in [
+    Scenario('serial'),
+    Scenario('workers-4', workers = 4),
+    Scenario('workers-4-prefetch-2', workers = 4, prefetch_chapters = 2),
+    Scenario('async-4-prefetch-2', workers = 4, prefetch_chapters = 2, use_async = True),
+]}
+
+RESULT_COLUMNS: typing.List[typing.Tuple[str, str, str]] = [
+    ('images', 'Images', '{:d}'),
+    ('missing', 'Missing', '{:d}'),
+    ('secs', 'Secs', '{:.2f}'),
+    ('images_per_sec', 'Img/s', '{:.1f}'),
+    ('p50_ms', 'p50 ms', '{:.1f}'),
+    ('p99_ms', 'p99 ms', '{:.1f}'),
+    ('peak_rss_mib', 'RSS MiB', '{:.1f}'),
+    ('file_syscalls', 'File I/O', '{:d}'),
+    ('context_switches', 'Ctx Sw', '{:d}'),
+]
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    options = comics.bench.server.options_from_args(args)
+
+    results: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    with comics.bench.server.StandInServer(options) as server:
+        for name in args.scenarios:
+            runs = []
+            for _ in range(args.repeat):
+                runs.append(_run_in_process(SCENARIOS[name], server.base_url, server.comic_url, args.rate_per_sec))
+
+            # Report the median run (by throughput).
+            runs.sort(key = lambda run: run['images_per_sec'])
+            results[name] = runs[len(runs) // 2]
+            results[name]['server_counts'] = server.reset_counts()
+
+    _print_results(results)
+
+    if (args.output_path is not None):
+        with open(args.output_path, 'w', encoding = 'utf-8') as file:
+            json.dump(results, file, indent = 4)
+
+    if (args.baseline_path is not None):
+        with open(args.baseline_path, 'r', encoding = 'utf-8') as file:
+            baseline = json.load(file)
+
+        if (not _check_baseline(results, baseline, args.max_regression)):
+            return 1
+
+    return 0
+
+def _run_in_process(scenario: Scenario, base_url: str, comic_url: str, rate_per_sec: float) -> typing.Dict[str, typing.Any]:
+    """ Run a scenario in a fresh process, so its memory and syscall counts are its own. """
+
+    log_level = logging.getLogger().getEffectiveLevel()
+
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers = 1, mp_context = context) as executor:
+        return executor.submit(_run_scenario, scenario, base_url, comic_url, rate_per_sec, log_level).result()
+
+def _run_scenario(
+        scenario: Scenario,
+        base_url: str,
+        comic_url: str,
+        rate_per_sec: float,
+        log_level: int = logging.INFO,
+        ) -> typing.Dict[str, typing.Any]:
+    """ Download the stand-in comic (in the current process) and measure it. """
+
+    logging.getLogger().setLevel(log_level)
+
+    source = comics.sources.coffeemanga_to.ComicSource(base_url = base_url,
+            max_concurrency = scenario.workers,
+            rate_per_sec = rate_per_sec,
+            burst = max(comics.ratelimit.DEFAULT_BURST, 2 * scenario.workers))
+    comics.source.register(base_url, source)
+
+    latencies: typing.List[float] = []
+
+    def record_latency(response: requests.Response) -> None:
+        latencies.append(response.elapsed.total_seconds())
+
+    source.session.add_response_hook(record_latency)
+
+    with tempfile.TemporaryDirectory(prefix = 'comics-bench-') as temp_dir:
+        start_file_syscalls = _get_file_syscall_count()
+        start_context_switches = _get_context_switch_count()
+        start = time.perf_counter()
+
+        if (scenario.use_async):
+            result = asyncio.run(comics.download.download_async(comic_url, temp_dir,
+                    workers = scenario.workers,
+                    prefetch_chapters = scenario.prefetch_chapters,
+            ))
+        else:
+            result = comics.download.download(comic_url, temp_dir,
+                    workers = scenario.workers,
+                    prefetch_chapters = scenario.prefetch_chapters,
+            )
+
+        secs = time.perf_counter() - start
+        file_syscalls = _get_file_syscall_count() - start_file_syscalls
+        context_switches = _get_context_switch_count() - start_context_switches
+
+    source.close()
+
+    images = 0
+    missing = 0
+    for chapter_download_result in result.chapter_download_results:
+        images += chapter_download_result.downloaded_count()
+        missing += chapter_download_result.missing_count()
+
+    latencies.sort()
+
+    return {
+        'images': images,
+        'missing': missing,
+        'secs': secs,
+        'images_per_sec': images / secs,
+        'requests': source.session.stats.requests,
+        'new_connections': source.session.stats.new_connections,
+        'p50_ms': _percentile(latencies, 0.50) * 1000.0,
+        'p99_ms': _percentile(latencies, 0.99) * 1000.0,
+        'peak_rss_mib': _get_peak_rss_mib(),
+        'file_syscalls': file_syscalls,
+        'context_switches': context_switches,
+        'metrics': result.metrics.to_dict(),
+    }
+
+def _percentile(sorted_values: typing.List[float], fraction: float) -> float:
+    """ Get a (nearest-rank) percentile from sorted values. """
+
+    if (len(sorted_values) == 0):
+        return 0.0
+
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def _get_peak_rss_mib() -> float:
+    """ Get this process's peak resident set size, or -1 if it is not available on this platform. """
+
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return -1.0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KiB, macOS reports bytes.
+    if (sys.platform == 'darwin'):
+        return peak / (1024.0 * 1024.0)
+
+    return peak / 1024.0
+
+def _get_context_switch_count() -> int:
+    """ Get the number of (voluntary and involuntary) context switches this process has made, or 0 if not available. """
+
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return 0
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+def _get_file_syscall_count() -> int:
+    """
+    Get the number of read and write syscalls this process has made on files (socket I/O is not included),
+    or 0 if not available (only Linux reports them, in /proc/self/io).
+    This is mostly a measure of how many chunks images are written to disk in.
+    """
+
+    try:
+        with open(os.path.join('/proc', 'self', 'io'), 'r', encoding = 'utf-8') as file:
+            lines = file.readlines()
+    except OSError:
+        return 0
+
+    count = 0
+    for line in lines:
+        key, _, value = line.partition(':')
+        if (key in ('syscr', 'syscw')):
+            count += int(value)
+
+    return count
+
+def _print_results(results: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+    """ Print results as a table. """
+
+    name_width = max([len('Scenario')] + [len(name) for name in results])
+
+    header = [f"{'Scenario':<{name_width}}"] + [f"{label:>9}" for (_, label, _) in RESULT_COLUMNS]
+    print('  '.join(header))
+
+    for (name, result) in results.items():
+        row = [f"{name:<{name_width}}"] + [f"{template.format(result[key]):>9}" for (key, _, template) in RESULT_COLUMNS]
+        print('  '.join(row))
+
+def _check_baseline(
+        results: typing.Dict[str, typing.Dict[str, typing.Any]],
+        baseline: typing.Dict[str, typing.Dict[str, typing.Any]],
+        max_regression: float,
+        ) -> bool:
+    """ Check that no scenario's throughput has fallen more than the allowed fraction below its baseline. """
+
+    passed = True
+    for (name, result) in results.items():
+        if (name not in baseline):
+            continue
+
+        floor = baseline[name]['images_per_sec'] * (1.0 - max_regression)
+        if (result['images_per_sec'] < floor):
+            passed = False
+            print(f"Regression in '{name}': {result['images_per_sec']:.1f} images/sec,"
+                    + f" baseline is {baseline[name]['images_per_sec']:.1f} (floor {floor:.1f}).", file = sys.stderr)
+
+    return passed
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('--scenario', dest = 'scenarios', metavar = 'NAME',
+        action = 'append', choices = list(SCENARIOS.keys()), default = None,
+        help = f"A scenario to run, may be repeated (default: all). Choices: {', '.join(SCENARIOS.keys())}.",
+    )
+
+    parser.add_argument('--repeat', dest = 'repeat',
+        action = 'store', type = int, default = 1,
+        help = "Run each scenario this many times and report the median run (default: %(default)s).",
+    )
+
+    parser.add_argument('--rate', dest = 'rate_per_sec',
+        action = 'store', type = float, default = DEFAULT_RATE_PER_SEC,
+        help = "The rate limit (requests per second) used by the source (default: %(default)s).",
+    )
+
+    parser.add_argument('--output', dest = 'output_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Write the results as JSON to this path (default: %(default)s).",
+    )
+
+    parser.add_argument('--baseline', dest = 'baseline_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Fail if any scenario's throughput has regressed from the results (see --output) in this file (default: %(default)s).",
+    )
+
+    parser.add_argument('--max-regression', dest = 'max_regression', metavar = 'FRACTION',
+        action = 'store', type = float, default = DEFAULT_MAX_REGRESSION,
+        help = "How far (as a fraction) throughput may fall below the baseline (default: %(default)s).",
+    )
+
+    comics.bench.server.add_server_arguments(parser)
+
+    return parser
+
+def _parse_args() -> argparse.Namespace:
+    """ Parse args, filling in the default scenarios. """
+
+    args = _get_parser().parse_args()
+    if (args.scenarios is None):
+        args.scenarios = list(SCENARIOS.keys())
+
+    return args
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import edq.testing.unittest
+
+import comics.bench.download
+
+class TestDownloadBench(edq.testing.unittest.BaseTest):
+    """ Test the download benchmark's reporting. """
+
+    def test_percentile(self) -> None:
+        """ Test the nearest-rank percentiles reported for latencies. """
+
+        values = [float(value) for value in range(1, 101)]
+
+        # [(values, fraction, expected), ...]
+        test_cases = [
+            ([], 0.5, 0.0),
+            ([5.0], 0.5, 5.0),
+            ([5.0], 0.99, 5.0),
+            (values, 0.50, 50.0),
+            (values, 0.99, 99.0),
+            (values, 1.0, 100.0),
+            (values, 0.0, 1.0),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (sorted_values, fraction, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({fraction}):"):
+                self.assertEqual(expected, comics.bench.download._percentile(sorted_values, fraction))
+
+    def test_check_baseline(self) -> None:
+        """ Test that throughput falling too far below the baseline fails the check. """
+
+        baseline = {'serial': {'images_per_sec': 100.0}}
+
+        # [(results, expected), ...]
+        test_cases = [
+            ({'serial': {'images_per_sec': 100.0}}, True),
+            ({'serial': {'images_per_sec': 90.0}}, True),
+            ({'serial': {'images_per_sec': 89.0}}, False),
+            ({'other': {'images_per_sec': 1.0}}, True),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (results, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                self.assertEqual(expected, comics.bench.download._check_baseline(results, baseline, 0.10))
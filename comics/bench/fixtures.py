@@ -0,0 +1,111 @@
+"""
+Synthetic (but structurally faithful) coffeemanga.to responses for offline benchmarks.
+All fixtures are deterministic for a given set of arguments.
+"""
+
+import json
+import typing
+
+NEXT_ACTION: str = '7f3a9c0e5b1d2f4a6c8e0b2d4f6a8c0e1b3d5f7a'
+
+CHUNK_PATH: str = '/_next/static/chunks/app/(main)/series/%5Bslug%5D/page-3f9a1c7e2b4d6f80.js'
+
+def chapter_ids(chapter_count: int) -> typing.List[int]:
+    """ Get the source ids of a fixture comic's chapters (newest first, as the page lists them). """
+
+    return [100000 + number for number in range(chapter_count, 0, -1)]
+
+def series_page(
+        chapter_count: int = 200,
+        title: str = 'Fixture Comic',
+        chunk_path: str = CHUNK_PATH,
+        filler_blocks: int = 400,
+        ) -> str:
+    """
+    Build a comic's page: a full Next.js document with navigation and filler markup,
+    several flight script pushes, the JS chunk that holds the next action,
+    and a script with every chapter (each escaped inside a JS string).
+    """
+
+    parts = [
+        '<!DOCTYPE html><html lang="en"><head><meta charSet="utf-8"/>',
+        '<meta name="viewport" content="width=device-width, initial-scale=1"/>',
+        '<link rel="stylesheet" href="/_next/static/css/8c2f0d1a.css" data-precedence="next"/>',
+        '<script src="/_next/static/chunks/webpack-1a2b3c4d5e6f.js" async=""></script>',
+        '<script src="/_next/static/chunks/main-app-0f1e2d3c4b5a.js" async=""></script>',
+        f'<script src="{chunk_path}" async=""></script>',
+        f'<title>{title} - Read Online</title></head><body>',
+        '<nav class="flex items-center justify-between"><ul>',
+    ]
+
+    for i in range(20):
+        parts.append(f'<li class="nav-item"><a href="/genre/{i}" class="px-2 py-1 hover:underline">Genre {i}</a></li>')
+
+    parts.append('</ul></nav><main class="container mx-auto">')
+    parts.append(f'<div class="series-header"><h1 class="text-2xl font-bold">{title}</h1>')
+    parts.append('<p class="description">A comic used for benchmarks &amp; tests.</p></div>')
+
+    for i in range(filler_blocks):
+        parts.append(f'<div class="card" data-index="{i}"><img src="/covers/{i}.webp" alt="Cover {i}" loading="lazy"/>'
+                f'<span class="title">Recommended Series {i}</span><span class="meta">Updated {i % 30} days ago</span></div>')
+
+    parts.append('</main>')
+
+    parts.append('<script>(self.__next_f=self.__next_f||[]).push([0])</script>')
+    parts.append('<script>self.__next_f.push([1,"1:\\"$Sreact.fragment\\"\\n2:I[8719,[],\\"\\"]\\n"])</script>')
+    parts.append('<script>self.__next_f.push([1,' + json.dumps(_chapters_payload(chapter_count)) + '])</script>')
+    parts.append('<script>self.__next_f.push([1,"9:[[\\"$\\",\\"meta\\",\\"0\\",{\\"name\\":\\"robots\\"}]]\\n"])</script>')
+    parts.append('</body></html>')
+
+    return ''.join(parts)
+
+def _chapters_payload(chapter_count: int) -> str:
+    """ Build the (flight line) text that lists a comic's chapters. """
+
+    rows = []
+    for (i, chapter_id) in enumerate(chapter_ids(chapter_count)):
+        number = chapter_count - i
+        rows.append({
+            'chapter': {
+                'id': chapter_id,
+                'chap': number,
+                'title': f"Chapter {number}",
+                'slug': f"chapter-{number}",
+                'imagesCount': 20 + (number % 15),
+                'createdAt': f"2025-{1 + (number % 12):02d}-{1 + (number % 28):02d}T00:00:00.000Z",
+            },
+            'views': number * 37,
+        })
+
+    return '5:' + json.dumps(['$', 'div', None, {'children': rows}], separators = (',', ':')) + '\n'
+
+def chunk_script(next_action: str = NEXT_ACTION) -> str:
+    """ Build the JS chunk that registers the getChapterImages server action. """
+
+    filler = ''.join(f'function f{i}(e,t){{return e+t*{i}}}' for i in range(200))
+
+    return ('"use strict";(self.webpackChunk_N_E=self.webpackChunk_N_E||[]).push([[4931],{2211:(e,t,s)=>{'
+            + filler
+            + f'var a=(0,s(7120).createServerReference)("{next_action}",s(7120).callServer,void 0,s(7120).findSourceMapURL,"getChapterImages");'
+            + 'var b=(0,s(7120).createServerReference)("00aa",s(7120).callServer,void 0,s(7120).findSourceMapURL,"getComments");'
+            + '}}]);')
+
+def image_urls(base_url: str, chapter_id: int, image_count: int) -> typing.List[str]:
+    """ Get the image URLs for a fixture chapter. """
+
+    return [f"{base_url}/images/{chapter_id}/{i:03d}.jpg" for i in range(image_count)]
+
+def chapter_images_response(base_url: str, chapter_id: int, image_count: int = 40) -> str:
+    """ Build the server action (flight) response that lists a chapter's images. """
+
+    rows = []
+    for (i, url) in enumerate(image_urls(base_url, chapter_id, image_count)):
+        rows.append({
+            'id': (chapter_id * 1000) + i,
+            'src': url,
+            'width': 800,
+            'height': 1200 + (i % 7),
+        })
+
+    return ('0:{"a":"$@1","f":"","b":"bench"}\n'
+            + '1:' + json.dumps(rows, separators = (',', ':')) + '\n')
@@ -0,0 +1,177 @@
+"""
+Benchmark parsing coffeemanga.to flight payloads:
+server action responses that list a chapter's images (with the streaming parser, see comics.flight),
+and the page script that lists a comic's chapters (where each chapter is picked out with a regex),
+each against the original parsing.
+Payloads are synthetic fixtures (see comics.bench.fixtures), so no network access is needed.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+import tracemalloc
+import typing
+
+import comics.bench.fixtures
+import comics.cli.parser
+import comics.model
+import comics.sources.coffeemanga_to
+
+DEFAULT_IMAGE_COUNTS: typing.List[int] = [40, 2000, 20000]
+DEFAULT_CHAPTER_COUNTS: typing.List[int] = [500, 5000]
+
+CHUNK_SIZE: int = 16 * 1024
+""" How much of a response arrives at a time. """
+
+BASE_URL: str = 'https://coffeemanga.to'
+COMIC_URL: str = f"{BASE_URL}/series/fixture"
+
+_Parser = typing.Callable[[typing.List[bytes]], typing.List[typing.Any]]
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    source = comics.sources.coffeemanga_to.ComicSource()
+
+    image_parsers: typing.Dict[str, _Parser] = {
+        'regex': _parse_images_regex,
+        'flight': lambda chunks: [image.url for image in source._parse_chapter_images(chunks)],
+    }
+
+    chapter_parsers: typing.Dict[str, _Parser] = {
+        'regex': _parse_chapters_regex,
+        'current': lambda chunks: [chapter.source_id for chapter in source._parse_chapters_from_script(COMIC_URL, _join(chunks))],
+    }
+
+    print(f"{'Payload':<9}  {'Records':>7}  {'KiB':>7}  {'Parser':>6}  {'ms':>8}  {'peak KiB':>8}")
+
+    for image_count in args.image_counts:
+        response = comics.bench.fixtures.chapter_images_response(BASE_URL, 1, image_count = image_count)
+        if (not _run_parsers('images', image_count, response, image_parsers, args.iterations)):
+            return 1
+
+    for chapter_count in args.chapter_counts:
+        script = _get_chapters_script(chapter_count)
+        if (not _run_parsers('chapters', chapter_count, script, chapter_parsers, args.iterations)):
+            return 1
+
+    return 0
+
+def _run_parsers(name: str, count: int, payload: str, parsers: typing.Dict[str, _Parser], iterations: int) -> bool:
+    """ Check that the parsers agree on a payload and print each one's timing and memory. """
+
+    data = payload.encode('utf-8')
+    chunks = [data[i:(i + CHUNK_SIZE)] for i in range(0, len(data), CHUNK_SIZE)]
+
+    expected = None
+    for (label, parser) in parsers.items():
+        result = parser(chunks)
+        if ((expected is not None) and (result != expected)):
+            print(f"Parsers disagree for {name} with {count} records.", file = sys.stderr)
+            return False
+
+        expected = result
+
+        secs = _time(parser, chunks, iterations)
+        peak = _peak_memory(parser, chunks)
+
+        print(f"{name:<9}  {count:>7}  {len(data) / 1024:>7.1f}  {label:>6}  {secs * 1000:>8.3f}  {peak / 1024:>8.1f}")
+
+    return True
+
+def _time(parser: _Parser, chunks: typing.List[bytes], iterations: int) -> float:
+    """ Get the best average time (in seconds) for a parse over a few rounds. """
+
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parser(chunks)
+
+        best = min(best, (time.perf_counter() - start) / max(1, iterations))
+
+    return best
+
+def _peak_memory(parser: _Parser, chunks: typing.List[bytes]) -> int:
+    """ Get the peak memory (in bytes) allocated during a parse (on top of the chunks themselves). """
+
+    tracemalloc.start()
+    try:
+        parser(chunks)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _get_chapters_script(chapter_count: int) -> str:
+    """ Get the body of the fixture page's script that lists a comic's chapters. """
+
+    page = comics.bench.fixtures.series_page(chapter_count = chapter_count, filler_blocks = 0)
+    for match in re.finditer(r'<script>(.*?)</script>', page, re.DOTALL):
+        if ('imagesCount' in match.group(1)):
+            return match.group(1)
+
+    raise ValueError("Fixture page has no chapters script.")
+
+def _join(chunks: typing.Iterable[bytes]) -> str:
+    """ Buffer a whole response. """
+
+    return b''.join(chunks).decode('utf-8')
+
+def _parse_images_regex(chunks: typing.Iterable[bytes]) -> typing.List[typing.Any]:
+    """ The original image list parsing: buffer the whole response and search it. """
+
+    match = re.search(r'\s*1:(\[.+\])\s*', _join(chunks))
+    if (match is None):
+        raise ValueError("Failed to parse out image data structure.")
+
+    images = [comics.model.ComicImage(row['src'], index = i) for (i, row) in enumerate(json.loads(match.group(1)))]
+    return [image.url for image in images]
+
+def _parse_chapters_regex(chunks: typing.Iterable[bytes]) -> typing.List[typing.Any]:
+    """ The original chapter parsing: find each (escaped) chapter, then decode each one twice. """
+
+    matches = re.findall(r'\\"chapter\\":(\{[^\}]+\})', _join(chunks))
+    return _build_chapters([json.loads(json.loads(f'"{match}"')) for match in matches])
+
+def _build_chapters(rows: typing.List[typing.Dict[str, typing.Any]]) -> typing.List[typing.Any]:
+    """ Build chapters (oldest first) the way the source does, and reduce them to something comparable. """
+
+    chapters = []
+    for (i, data) in enumerate(reversed(rows)):
+        chapters.append(comics.model.ComicChapter(COMIC_URL, index = i, source_id = data['id'], name = str(data['chap'])))
+
+    return [chapter.source_id for chapter in chapters]
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('--images', dest = 'image_counts', metavar = 'COUNT',
+        action = 'store', type = int, nargs = '+', default = DEFAULT_IMAGE_COUNTS,
+        help = "The number of images in each fixture server action response (default: %(default)s).",
+    )
+
+    parser.add_argument('--chapters', dest = 'chapter_counts', metavar = 'COUNT',
+        action = 'store', type = int, nargs = '+', default = DEFAULT_CHAPTER_COUNTS,
+        help = "The number of chapters in each fixture page script (default: %(default)s).",
+    )
+
+    parser.add_argument('--iterations', dest = 'iterations',
+        action = 'store', type = int, default = 10,
+        help = "The number of parses to time for each payload (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
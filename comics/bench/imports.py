@@ -0,0 +1,96 @@
+"""
+Benchmark startup: how long importing the package (and starting CLI tools) takes in a fresh interpreter,
+how many modules get imported, and which source modules are loaded along the way.
+The eager scenario loads every source, like the registry used to do as soon as `comics.source` was imported.
+No network access is needed.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import typing
+
+import comics.cli.parser
+
+DEFAULT_REPEAT: int = 10
+
+LOOKUP_URL: str = 'https://coffeemanga.to/series/example'
+""" A URL whose source is known (but not yet loaded). """
+
+SOURCE_MODULE_PREFIX: str = 'comics.sources.'
+
+def _run_module_code(module_name: str, *args: str) -> str:
+    """ Get code that runs a module as a script (like `python -m`) with the given arguments. """
+
+    argv = [module_name] + list(args)
+    return f"import runpy, sys; sys.argv = {argv!r}; runpy.run_module('{module_name}', run_name = '__main__', alter_sys = True)"
+
+SCENARIOS: typing.List[typing.Tuple[str, str]] = [
+    ('python', 'pass'),
+    ('import comics.source', 'import comics.source'),
+    ('eager sources', 'import comics.source; comics.source.get_sources(load_all = True)'),
+    ('first lookup', f"import comics.source; comics.source.lookup('{LOOKUP_URL}')"),
+    ('comics.cli', _run_module_code('comics.cli')),
+    ('download --version', _run_module_code('comics.cli.download', '--version')),
+    ('audit --version', _run_module_code('comics.cli.audit', '--version')),
+]
+""" Each scenario's name and the code it runs. """
+
+_MODULE_REPORT_PREFIX: str = 'imported-module: '
+
+_MODULE_REPORT_CODE: str = ("import atexit, sys; "
+        + f"atexit.register(lambda: sys.stderr.write(''.join(f'{_MODULE_REPORT_PREFIX}{{name}}\\n' for name in sorted(sys.modules)))); ")
+""" Reports every loaded module (on stderr) as the interpreter exits (`-X importtime` misses modules loaded through importlib). """
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    print(f"{'Scenario':<22}  {'median ms':>9}  {'min ms':>7}  {'modules':>7}  Source Modules")
+
+    for (name, code) in SCENARIOS:
+        times = [_time_run(code) for _ in range(max(1, args.repeat))]
+        modules = _get_loaded_modules(code)
+        source_modules = [module for module in modules if module.startswith(SOURCE_MODULE_PREFIX)]
+
+        print(f"{name:<22}  {statistics.median(times) * 1000:>9.1f}  {min(times) * 1000:>7.1f}  {len(modules):>7}  {', '.join(source_modules)}")
+
+    return 0
+
+def _time_run(code: str) -> float:
+    """ Time a fresh interpreter from start to exit. """
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def _get_loaded_modules(code: str) -> typing.List[str]:
+    """ Get every module that is loaded by the time a fresh interpreter exits. """
+
+    result = subprocess.run([sys.executable, '-c', _MODULE_REPORT_CODE + code],
+            check = True, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True)
+
+    return [line[len(_MODULE_REPORT_PREFIX):] for line in result.stderr.splitlines() if line.startswith(_MODULE_REPORT_PREFIX)]
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('--repeat', dest = 'repeat',
+        action = 'store', type = int, default = DEFAULT_REPEAT,
+        help = "The number of times to run each scenario (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+Benchmark the memory used by download results (and the cost of summarizing them) against the original result model,
+which kept each result's fields in a per-instance dict and rescanned every image to summarize a chapter.
+No network access is needed.
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+import typing
+
+import comics.cli.parser
+import comics.metrics
+import comics.model
+
+DEFAULT_CHAPTER_COUNT: int = 200
+DEFAULT_IMAGE_COUNT: int = 50
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    builders: typing.Dict[str, typing.Callable[[int, int], typing.List[typing.Any]]] = {
+        'current': _build_current,
+        'original': _build_legacy,
+    }
+
+    image_count = args.chapters * args.images
+    print(f"{args.chapters} chapters x {args.images} images ({image_count} images).")
+    print(f"{'Model':>8}  {'KiB':>9}  {'B/image':>8}  {'build ms':>9}  {'summary ms':>10}")
+
+    expected = None
+    measurements = {}
+    for (label, builder) in builders.items():
+        results, size, build_secs = _measure(builder, args.chapters, args.images)
+
+        summary = [(chapter_result.missing_count(), repr(chapter_result)) for chapter_result in results]
+        if ((expected is not None) and (summary != expected)):
+            print("Models disagree on the chapter summaries.", file = sys.stderr)
+            return 1
+
+        expected = summary
+        summary_secs = _time_summary(results, args.iterations)
+        measurements[label] = (size, summary_secs)
+
+        print(f"{label:>8}  {size / 1024:>9.1f}  {size / image_count:>8.1f}  {build_secs * 1000:>9.1f}  {summary_secs * 1000:>10.3f}")
+
+        del results
+
+    current_size, current_secs = measurements['current']
+    original_size, original_secs = measurements['original']
+    print(f"{'savings':>8}  {(1.0 - (current_size / original_size)) * 100:>8.1f}%  {'':>8}  {'':>9}  {original_secs / current_secs:>9.1f}x")
+
+    return 0
+
+def _measure(builder: typing.Callable[[int, int], typing.List[typing.Any]],
+        chapter_count: int, image_count: int) -> typing.Tuple[typing.List[typing.Any], int, float]:
+    """ Build results, returning them along with the bytes they hold and how long they took to build. """
+
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        results = builder(chapter_count, image_count)
+        build_secs = time.perf_counter() - start
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    return results, size, build_secs
+
+def _time_summary(results: typing.List[typing.Any], iterations: int) -> float:
+    """ Get the best time (in seconds) to summarize every chapter (as the download CLI does) over a few rounds. """
+
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for chapter_result in results:
+                chapter_result.missing_count()
+                repr(chapter_result)
+
+        best = min(best, (time.perf_counter() - start) / iterations)
+
+    return best
+
+def _build_current(chapter_count: int, image_count: int) -> typing.List[typing.Any]:
+    """ Build chapter results with the current model, recording images the way a download does. """
+
+    results = []
+    for chapter_index in range(chapter_count):
+        chapter = comics.model.ComicChapter(f"https://example.com/chapter/{chapter_index}", index = chapter_index, name = str(chapter_index))
+        chapter_result = comics.model.ChapterDownloadResult(chapter, f"/tmp/comic/{chapter_index:03d}")
+
+        for image_index in range(image_count):
+            image = comics.model.ComicImage(f"https://example.com/{chapter_index}/{image_index}.jpg", index = image_index)
+            chapter_result.add_image_result(comics.model.ImageDownloadResult(image, f"/tmp/comic/{chapter_index:03d}/{image}"))
+
+        for (image_index, image_result) in enumerate(chapter_result.image_results):
+            _record(image_index, image_result)
+
+        results.append(chapter_result)
+
+    return results
+
+def _build_legacy(chapter_count: int, image_count: int) -> typing.List[typing.Any]:
+    """ Build the same chapter results with the original model. """
+
+    results = []
+    for chapter_index in range(chapter_count):
+        chapter = _LegacyChapter(f"https://example.com/chapter/{chapter_index}", chapter_index)
+        chapter_result = _LegacyChapterResult(chapter, f"/tmp/comic/{chapter_index:03d}")
+
+        for image_index in range(image_count):
+            image = _LegacyImage(f"https://example.com/{chapter_index}/{image_index}.jpg", image_index)
+            chapter_result.image_results.append(_LegacyImageResult(image, f"/tmp/comic/{chapter_index:03d}/{image}"))
+
+        for (image_index, image_result) in enumerate(chapter_result.image_results):
+            _record(image_index, image_result)
+
+        results.append(chapter_result)
+
+    return results
+
+def _record(image_index: int, image_result: typing.Any) -> None:
+    """ Record a plausible outcome for an image: mostly downloads, with some pre-existing images and some errors. """
+
+    if (image_index % 10 == 0):
+        image_result.already_exists = True
+    elif (image_index % 25 == 1):
+        image_result.error = "Failed to download image."
+    else:
+        image_result.downloaded = True
+
+class _LegacyImage:
+    """ The original ComicImage. """
+
+    def __init__(self, url: str, index: int) -> None:
+        self.url: str = url
+        self.extension: str = '.jpg'
+        self.index: int = index
+        self.source_id: typing.Union[str, None] = None
+        self.name: typing.Union[str, None] = None
+
+    def __repr__(self) -> str:
+        return f"{self.index:03d}{self.extension}"
+
+class _LegacyImageResult:
+    """ The original ImageDownloadResult. """
+
+    def __init__(self, image: _LegacyImage, out_path: str) -> None:
+        self.image: _LegacyImage = image
+        self.out_path: str = out_path
+        self.downloaded: bool = False
+        self.already_exists: bool = False
+        self.error: typing.Union[str, None] = None
+        self.exception: typing.Union[Exception, None] = None
+
+    def has_error(self) -> bool:
+        """ Check if this image download had any type of error. """
+
+        return ((self.error is not None) or (self.exception is not None))
+
+class _LegacyChapter:
+    """ The original ComicChapter. """
+
+    def __init__(self, url: str, index: int) -> None:
+        self.url: str = url
+        self.index: int = index
+        self.source_id: typing.Union[str, None] = None
+        self.name: str = str(index)
+
+    def __repr__(self) -> str:
+        return self.name
+
+class _LegacyChapterResult:
+    """ The original ChapterDownloadResult, which rescans its images to summarize itself. """
+
+    def __init__(self, chapter: _LegacyChapter, out_path: str) -> None:
+        self.chapter: _LegacyChapter = chapter
+        self.out_path: str = out_path
+        self.image_results: typing.List[_LegacyImageResult] = []
+        self.error: typing.Union[str, None] = None
+        self.exception: typing.Union[Exception, None] = None
+        self.metrics: comics.metrics.Metrics = comics.metrics.Metrics()
+
+    def missing_count(self) -> int:
+        """ Get a count of the images that are missing (not downloaded or pre-existing). """
+
+        count = 0
+        for image_result in self.image_results:
+            if (image_result.downloaded or image_result.already_exists):
+                count += 1
+
+        return (len(self.image_results) - count)
+
+    def __repr__(self) -> str:
+        downloaded = 0
+        errors = 0
+        already_exists = 0
+
+        for image_result in self.image_results:
+            if (image_result.downloaded):
+                downloaded += 1
+
+            if (image_result.has_error()):
+                errors += 1
+
+            if (image_result.already_exists):
+                already_exists += 1
+
+        return f"{self.chapter} - Images: {len(self.image_results)}, Downloads: {downloaded}, Errors: {errors}, Already Exists: {already_exists}"
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('--chapters', dest = 'chapters',
+        action = 'store', type = int, default = DEFAULT_CHAPTER_COUNT,
+        help = "The number of chapters to build results for (default: %(default)s).",
+    )
+
+    parser.add_argument('--images', dest = 'images',
+        action = 'store', type = int, default = DEFAULT_IMAGE_COUNT,
+        help = "The number of images in each chapter (default: %(default)s).",
+    )
+
+    parser.add_argument('--iterations', dest = 'iterations',
+        action = 'store', type = int, default = 20,
+        help = "The number of times to time summarizing every chapter (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import edq.testing.unittest
+
+import comics.bench.memory
+
+class TestMemoryBench(edq.testing.unittest.BaseTest):
+    """ Test the result model memory benchmark. """
+
+    def test_models_agree(self) -> None:
+        """ Test that the current model reports what the original one did, in less memory. """
+
+        current, current_size, _ = comics.bench.memory._measure(comics.bench.memory._build_current, 20, 50)
+        legacy, legacy_size, _ = comics.bench.memory._measure(comics.bench.memory._build_legacy, 20, 50)
+
+        self.assertEqual([repr(result) for result in legacy], [repr(result) for result in current])
+        self.assertEqual([result.missing_count() for result in legacy], [result.missing_count() for result in current])
+        self.assertLess(current_size, legacy_size)
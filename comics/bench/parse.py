@@ -0,0 +1,139 @@
+"""
+Benchmark parsing coffeemanga.to comic pages against the original (BeautifulSoup-based) parser.
+Pages are synthetic fixtures (see comics.bench.fixtures), so no network access is needed.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+import typing
+
+import comics.bench.fixtures
+import comics.cli.parser
+import comics.model
+import comics.sources.coffeemanga_to
+
+DEFAULT_CHAPTER_COUNTS: typing.List[int] = [50, 500, 2000]
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    source = comics.sources.coffeemanga_to.ComicSource()
+    parsers: typing.Dict[str, typing.Callable[[str, str], typing.Any]] = {
+        'current': source._parse_info,
+    }
+
+    legacy = _get_legacy_parser()
+    if (legacy is None):
+        print("BeautifulSoup is not installed, skipping the original parser.")
+    else:
+        parsers['original'] = legacy
+
+    print(f"{'Chapters':>8}  {'Page KiB':>8}  {'Parser':>8}  {'ms/page':>9}")
+
+    for chapter_count in args.chapter_counts:
+        page = comics.bench.fixtures.series_page(chapter_count = chapter_count)
+
+        expected = None
+        timings = {}
+        for (label, parser) in parsers.items():
+            result = _summarize(parser('https://coffeemanga.to/series/fixture', page))
+            if ((expected is not None) and (result != expected)):
+                print(f"Parsers disagree for {chapter_count} chapters.", file = sys.stderr)
+                return 1
+
+            expected = result
+            timings[label] = _time(parser, page, args.iterations)
+
+            print(f"{chapter_count:>8}  {len(page) / 1024:>8.1f}  {label:>8}  {timings[label] * 1000:>9.3f}")
+
+        if ('original' in timings):
+            print(f"{'':>8}  {'':>8}  {'speedup':>8}  {timings['original'] / timings['current']:>8.1f}x")
+
+    return 0
+
+def _time(parser: typing.Callable[[str, str], typing.Any], page: str, iterations: int) -> float:
+    """ Get the best average time (in seconds) for a parse over a few rounds. """
+
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parser('https://coffeemanga.to/series/fixture', page)
+
+        best = min(best, (time.perf_counter() - start) / iterations)
+
+    return best
+
+def _summarize(info: typing.Tuple[str, typing.List[comics.model.ComicChapter], str]) -> typing.Tuple[str, typing.List[typing.Any], str]:
+    """ Reduce a parse to something comparable. """
+
+    name, chapters, chunk_path = info
+    return name, [(chapter.index, chapter.source_id, chapter.name) for chapter in chapters], chunk_path
+
+def _get_legacy_parser() -> typing.Union[typing.Callable[[str, str], typing.Any], None]:
+    """ Get the original page parser (which requires BeautifulSoup), or None if it is not installed. """
+
+    try:
+        import bs4  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+
+    def parse(url: str, text: str) -> typing.Tuple[str, typing.List[comics.model.ComicChapter], str]:
+        document = bs4.BeautifulSoup(text, 'html.parser')
+
+        name = document.select('h1')[0].get_text()
+        chapters = None
+        chunk_path = None
+
+        for script_tag in document.select('script'):
+            text = str(script_tag)
+
+            if ('imagesCount' in text):
+                chapters = []
+                matches = re.findall(r'\\"chapter\\":(\{[^\}]+\})', script_tag.get_text())
+                for (i, match) in enumerate(reversed(matches)):
+                    data = json.loads(json.loads(f'"{match}"'))
+                    chapters.append(comics.model.ComicChapter(url, index = i, source_id = data['id'], name = str(data['chap'])))
+
+                continue
+
+            match = re.search(r'src="(/_next/static/chunks/app/.*/series/.*/page-.*\.js)"', text)
+            if ((match is not None) and (chunk_path is None)):
+                chunk_path = match.group(1)
+
+        if ((chapters is None) or (chunk_path is None)):
+            raise ValueError("Failed to parse page.")
+
+        return name, chapters, chunk_path
+
+    return parse
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('--chapters', dest = 'chapter_counts', metavar = 'COUNT',
+        action = 'store', type = int, nargs = '+', default = DEFAULT_CHAPTER_COUNTS,
+        help = "The number of chapters in each fixture page (default: %(default)s).",
+    )
+
+    parser.add_argument('--iterations', dest = 'iterations',
+        action = 'store', type = int, default = 20,
+        help = "The number of parses to time for each page (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,447 @@
+"""
+Run a local stand-in for coffeemanga.to that serves synthetic comics (see comics.bench.fixtures).
+Latency, bandwidth, and failures can be injected to benchmark downloads without touching the real site.
+"""
+
+import argparse
+import http
+import http.server
+import json
+import random
+import re
+import sys
+import threading
+import time
+import typing
+
+import comics.bench.fixtures
+import comics.cli.parser
+
+DEFAULT_CHAPTER_COUNT: int = 20
+DEFAULT_IMAGES_PER_CHAPTER: int = 20
+DEFAULT_IMAGE_SIZE: int = 64 * 1024
+
+WRITE_CHUNK_SIZE: int = 16 * 1024
+""" Bodies are written in chunks of this size, so bandwidth limits and dropped connections apply partway through. """
+
+COMIC_PATH: str = '/series/fixture-comic'
+
+_IMAGE_PATH_PATTERN: re.Pattern = re.compile(r'^/images/(\d+)/(\d+)\.jpg$')
+_RANGE_PATTERN: re.Pattern = re.compile(r'^bytes=(\d+)-$')
+
+class ServerOptions:
+    """ How the stand-in server behaves. """
+
+    def __init__(self,
+            chapter_count: int = DEFAULT_CHAPTER_COUNT,
+            images_per_chapter: int = DEFAULT_IMAGES_PER_CHAPTER,
+            image_size: int = DEFAULT_IMAGE_SIZE,
+            latency_secs: float = 0.0,
+            latency_jitter_secs: float = 0.0,
+            bandwidth_bytes_per_sec: typing.Union[int, None] = None,
+            error_rate: float = 0.0,
+            error_status: int = http.HTTPStatus.INTERNAL_SERVER_ERROR,
+            throttle_rate: float = 0.0,
+            drop_rate: float = 0.0,
+            seed: int = 0,
+            ) -> None:
+        self.chapter_count: int = chapter_count
+        """ The number of chapters in the comic. """
+
+        self.images_per_chapter: int = images_per_chapter
+        """ The number of images in each chapter. """
+
+        self.image_size: int = image_size
+        """ The size (in bytes) of every image. """
+
+        self.latency_secs: float = latency_secs
+        """ How long to wait before responding to any request. """
+
+        self.latency_jitter_secs: float = latency_jitter_secs
+        """ A random amount of extra latency (up to this much) added to each request. """
+
+        self.bandwidth_bytes_per_sec: typing.Union[int, None] = bandwidth_bytes_per_sec
+        """ If set, how fast each response body is written. """
+
+        self.error_rate: float = error_rate
+        """ The fraction of image requests that fail with `error_status`. """
+
+        self.error_status: int = error_status
+        """ The status that failed image requests get. """
+
+        self.throttle_rate: float = throttle_rate
+        """ The fraction of image requests that are throttled (with a 429 and `Retry-After: 0`). """
+
+        self.drop_rate: float = drop_rate
+        """ The fraction of image responses whose connection is closed halfway through the body. """
+
+        self.seed: int = seed
+        """ Seeds the random choices of which requests fail, so runs are repeatable. """
+
+class StandInServer:
+    """
+    A threaded HTTP server that mimics the parts of coffeemanga.to that downloads use:
+    the comic's page, the JS chunk holding the next action, the server action that lists a chapter's images,
+    and the images themselves (with Range support).
+    """
+
+    def __init__(self, options: typing.Union[ServerOptions, None] = None, host: str = '127.0.0.1', port: int = 0) -> None:
+        if (options is None):
+            options = ServerOptions()
+
+        self.options: ServerOptions = options
+        """ How this server behaves. """
+
+        self.counts: typing.Dict[str, int] = {}
+        """ The number of requests served, by kind (e.g., 'image' or 'action'). """
+
+        self._lock: threading.Lock = threading.Lock()
+        self._random: random.Random = random.Random(options.seed)
+        self._server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread: typing.Union[threading.Thread, None] = None
+
+        self.image_body: bytes = _make_image_body(options.image_size)
+        """ The body served for every image. """
+
+        address = self._server.server_address
+        self.base_url: str = f"http://{str(address[0])}:{address[1]}"
+        """ The root URL of this server. """
+
+        self.comic_url: str = f"{self.base_url}{COMIC_PATH}"
+        """ The URL of the comic this server hosts. """
+
+    def start(self) -> 'StandInServer':
+        """ Start serving in a background thread. """
+
+        self._thread = threading.Thread(target = self._server.serve_forever, name = 'comics-bench-server', daemon = True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """ Serve in the current thread until interrupted. """
+
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        """ Stop serving and close the listening socket. """
+
+        if (self._thread is not None):
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+
+        self._server.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.stop()
+
+    def reset_counts(self) -> typing.Dict[str, int]:
+        """ Clear the request counts and return what they were. """
+
+        with self._lock:
+            counts = self.counts
+            self.counts = {}
+
+        return counts
+
+    def count(self, kind: str) -> None:
+        """ Count a request of the given kind. """
+
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def should_inject(self, rate: float) -> bool:
+        """ Randomly decide if something that happens at the given rate happens now. """
+
+        if (rate <= 0.0):
+            return False
+
+        with self._lock:
+            return (self._random.random() < rate)
+
+    def inject_latency(self) -> None:
+        """ Inject latency. """
+
+        delay = self.options.latency_secs
+        if (self.options.latency_jitter_secs > 0.0):
+            with self._lock:
+                delay += self._random.uniform(0.0, self.options.latency_jitter_secs)
+
+        if (delay > 0.0):
+            time.sleep(delay)
+
+def _make_handler(server: StandInServer) -> typing.Type[http.server.BaseHTTPRequestHandler]:
+    """ Make a request handler class bound to a server. """
+
+    options = server.options
+    chapter_ids = set(comics.bench.fixtures.chapter_ids(options.chapter_count))
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """ Handles a single connection (which may carry many requests). """
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            """ Serve the comic page, JS chunks, and images. """
+
+            server.inject_latency()
+            path = self.path.split('?', 1)[0]
+
+            if (path == COMIC_PATH):
+                server.count('page')
+                page = comics.bench.fixtures.series_page(chapter_count = options.chapter_count)
+                self._send(http.HTTPStatus.OK, page.encode(), 'text/html; charset=utf-8')
+                return
+
+            if (path.startswith('/_next/static/chunks/')):
+                server.count('chunk')
+                self._send(http.HTTPStatus.OK, comics.bench.fixtures.chunk_script().encode(), 'application/javascript')
+                return
+
+            match = _IMAGE_PATH_PATTERN.match(path)
+            if ((match is not None) and (int(match.group(1)) in chapter_ids) and (int(match.group(2)) < options.images_per_chapter)):
+                server.count('image')
+                self._send_image()
+                return
+
+            server.count('not_found')
+            self._send(http.HTTPStatus.NOT_FOUND, b'Not Found', 'text/plain')
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            """ Serve the server action that lists a chapter's images. """
+
+            server.inject_latency()
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            if ((self.path.split('?', 1)[0] != COMIC_PATH) or (self.headers.get('Next-Action') != comics.bench.fixtures.NEXT_ACTION)):
+                server.count('bad_action')
+                self._send(http.HTTPStatus.NOT_FOUND, b'Server action not found.', 'text/plain')
+                return
+
+            try:
+                chapter_id = int(json.loads(body)[0])
+            except (ValueError, TypeError, IndexError):
+                chapter_id = -1
+
+            if (chapter_id not in chapter_ids):
+                server.count('bad_action')
+                self._send(http.HTTPStatus.BAD_REQUEST, b'Unknown chapter.', 'text/plain')
+                return
+
+            server.count('action')
+            text = comics.bench.fixtures.chapter_images_response(server.base_url, chapter_id, image_count = options.images_per_chapter)
+            self._send(http.HTTPStatus.OK, text.encode(), 'text/x-component')
+
+        def _send_image(self) -> None:
+            """ Send an image, injecting any failures. """
+
+            if (server.should_inject(options.throttle_rate)):
+                server.count('throttled')
+                self._send(http.HTTPStatus.TOO_MANY_REQUESTS, b'Slow down.', 'text/plain', {'Retry-After': '0'})
+                return
+
+            if (server.should_inject(options.error_rate)):
+                server.count('error')
+                self._send(options.error_status, b'Injected error.', 'text/plain')
+                return
+
+            body = server.image_body
+            status = http.HTTPStatus.OK
+            headers = {
+                'ETag': '"fixture"',
+                'Accept-Ranges': 'bytes',
+            }
+
+            range_match = _RANGE_PATTERN.match(self.headers.get('Range', ''))
+            if ((range_match is not None) and (self.headers.get('If-Range', headers['ETag']) == headers['ETag'])):
+                start = int(range_match.group(1))
+                if (start >= len(body)):
+                    self._send(http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, b'', 'text/plain', {'Content-Range': f"bytes */{len(body)}"})
+                    return
+
+                status = http.HTTPStatus.PARTIAL_CONTENT
+                headers['Content-Range'] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                body = body[start:]
+
+            drop_at = None
+            if (server.should_inject(options.drop_rate)):
+                server.count('dropped')
+                drop_at = len(body) // 2
+
+            self._send(status, body, 'image/jpeg', headers, drop_at = drop_at)
+
+        def _send(self,
+                status: int,
+                body: bytes,
+                content_type: str,
+                headers: typing.Union[typing.Dict[str, str], None] = None,
+                drop_at: typing.Union[int, None] = None,
+                ) -> None:
+            """ Send a response, pacing the body to the configured bandwidth (and possibly cutting it short). """
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for (key, value) in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+
+            end = len(body)
+            if (drop_at is not None):
+                end = drop_at
+                self.close_connection = True
+
+            chunk_size = WRITE_CHUNK_SIZE
+            delay = 0.0
+            if (options.bandwidth_bytes_per_sec is not None):
+                chunk_size = max(1, min(chunk_size, options.bandwidth_bytes_per_sec // 10))
+                delay = chunk_size / options.bandwidth_bytes_per_sec
+
+            try:
+                for offset in range(0, end, chunk_size):
+                    self.wfile.write(body[offset:min(end, offset + chunk_size)])
+                    if (delay > 0.0):
+                        time.sleep(delay)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+        def log_message(self, format: str, *args: typing.Any) -> None:  # pylint: disable=redefined-builtin
+            """ Stay quiet, the benchmark output is what matters. """
+
+    return Handler
+
+def _make_image_body(size: int) -> bytes:
+    """ Make an image body (JPEG markers around deterministic filler) of the given size. """
+
+    size = max(4, size)
+    filler = bytes(random.Random(size).getrandbits(8) for _ in range(min(size, 4096)))
+    body = (filler * ((size // len(filler)) + 1))[:(size - 4)]
+
+    return b'\xff\xd8' + body + b'\xff\xd9'
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """ Add the arguments that configure a stand-in server. """
+
+    parser.add_argument('--chapters', dest = 'chapter_count', metavar = 'COUNT',
+        action = 'store', type = int, default = DEFAULT_CHAPTER_COUNT,
+        help = "The number of chapters in the comic (default: %(default)s).",
+    )
+
+    parser.add_argument('--images-per-chapter', dest = 'images_per_chapter', metavar = 'COUNT',
+        action = 'store', type = int, default = DEFAULT_IMAGES_PER_CHAPTER,
+        help = "The number of images in each chapter (default: %(default)s).",
+    )
+
+    parser.add_argument('--image-size', dest = 'image_size', metavar = 'BYTES',
+        action = 'store', type = int, default = DEFAULT_IMAGE_SIZE,
+        help = "The size of each image (default: %(default)s).",
+    )
+
+    parser.add_argument('--latency-ms', dest = 'latency_ms',
+        action = 'store', type = float, default = 0.0,
+        help = "Latency added to every request (default: %(default)s).",
+    )
+
+    parser.add_argument('--latency-jitter-ms', dest = 'latency_jitter_ms',
+        action = 'store', type = float, default = 0.0,
+        help = "Up to this much random latency is added to every request (default: %(default)s).",
+    )
+
+    parser.add_argument('--bandwidth-kib', dest = 'bandwidth_kib',
+        action = 'store', type = float, default = None,
+        help = "Limit each response body to this many KiB per second (default: unlimited).",
+    )
+
+    parser.add_argument('--error-rate', dest = 'error_rate',
+        action = 'store', type = float, default = 0.0,
+        help = "The fraction of image requests that fail (default: %(default)s).",
+    )
+
+    parser.add_argument('--error-status', dest = 'error_status',
+        action = 'store', type = int, default = int(http.HTTPStatus.INTERNAL_SERVER_ERROR),
+        help = "The status failed image requests get (default: %(default)s).",
+    )
+
+    parser.add_argument('--throttle-rate', dest = 'throttle_rate',
+        action = 'store', type = float, default = 0.0,
+        help = "The fraction of image requests that get a 429 (default: %(default)s).",
+    )
+
+    parser.add_argument('--drop-rate', dest = 'drop_rate',
+        action = 'store', type = float, default = 0.0,
+        help = "The fraction of image responses that are cut off halfway through (default: %(default)s).",
+    )
+
+    parser.add_argument('--seed', dest = 'seed',
+        action = 'store', type = int, default = 0,
+        help = "Seed for injected latency and failures (default: %(default)s).",
+    )
+
+def options_from_args(args: argparse.Namespace) -> ServerOptions:
+    """ Build server options from parsed arguments (see add_server_arguments()). """
+
+    bandwidth = None
+    if (args.bandwidth_kib is not None):
+        bandwidth = max(1, int(args.bandwidth_kib * 1024))
+
+    return ServerOptions(
+        chapter_count = args.chapter_count,
+        images_per_chapter = args.images_per_chapter,
+        image_size = args.image_size,
+        latency_secs = args.latency_ms / 1000.0,
+        latency_jitter_secs = args.latency_jitter_ms / 1000.0,
+        bandwidth_bytes_per_sec = bandwidth,
+        error_rate = args.error_rate,
+        error_status = args.error_status,
+        throttle_rate = args.throttle_rate,
+        drop_rate = args.drop_rate,
+        seed = args.seed,
+    )
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    server = StandInServer(options_from_args(args), host = args.host, port = args.port)
+    print(f"Serving a stand-in comic at: {server.comic_url}", flush = True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+    return 0
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('--host', dest = 'host',
+        action = 'store', type = str, default = '127.0.0.1',
+        help = "The address to listen on (default: %(default)s).",
+    )
+
+    parser.add_argument('--port', dest = 'port',
+        action = 'store', type = int, default = 0,
+        help = "The port to listen on, 0 picks a free port (default: %(default)s).",
+    )
+
+    add_server_arguments(parser)
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import argparse
+import http
+import json
+import typing
+
+import edq.testing.unittest
+import requests
+
+import comics.bench.fixtures
+import comics.bench.server
+
+class TestServer(edq.testing.unittest.BaseTest):
+    """ Test the stand-in coffeemanga.to server. """
+
+    _server: comics.bench.server.StandInServer
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        options = comics.bench.server.ServerOptions(chapter_count = 2, images_per_chapter = 3, image_size = 1000)
+        cls._server = comics.bench.server.StandInServer(options).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._server.stop()
+
+    def setUp(self) -> None:
+        self._server.reset_counts()
+
+    def test_site(self) -> None:
+        """ Test the comic's page, JS chunk, and server action. """
+
+        chapter_id = comics.bench.fixtures.chapter_ids(2)[0]
+        action_headers = {'Next-Action': comics.bench.fixtures.NEXT_ACTION}
+
+        # [(method, path, body, headers, expected status, expected body substring, expected count kind), ...]
+        test_cases: typing.List[typing.Tuple[str, str, typing.Union[str, None], typing.Dict[str, str], int, str, str]] = [
+            ('GET', comics.bench.server.COMIC_PATH, None, {}, 200, 'Fixture Comic', 'page'),
+            ('GET', comics.bench.fixtures.CHUNK_PATH, None, {}, 200, 'getChapterImages', 'chunk'),
+            ('POST', comics.bench.server.COMIC_PATH, json.dumps([str(chapter_id)]), action_headers, 200,
+                    comics.bench.fixtures.image_urls(self._server.base_url, chapter_id, 3)[2], 'action'),
+            ('POST', comics.bench.server.COMIC_PATH, json.dumps(['1']), action_headers, 400, 'Unknown chapter', 'bad_action'),
+            ('POST', comics.bench.server.COMIC_PATH, 'not json', action_headers, 400, 'Unknown chapter', 'bad_action'),
+            ('POST', comics.bench.server.COMIC_PATH, json.dumps([str(chapter_id)]), {'Next-Action': 'stale'}, 404, 'not found', 'bad_action'),
+            ('POST', '/other', json.dumps([str(chapter_id)]), action_headers, 404, 'not found', 'bad_action'),
+            ('GET', '/missing', None, {}, 404, 'Not Found', 'not_found'),
+            ('GET', f"/images/{chapter_id}/003.jpg", None, {}, 404, 'Not Found', 'not_found'),
+            ('GET', '/images/1/000.jpg', None, {}, 404, 'Not Found', 'not_found'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (method, path, body, headers, expected_status, expected_text, expected_kind) = test_case
+
+            with self.subTest(msg = f"Case {i} ({method} {path}):"):
+                response = requests.request(method, self._server.base_url + path, data = body, headers = headers, timeout = 10)
+
+                self.assertEqual(expected_status, response.status_code)
+                self.assertIn(expected_text, response.text)
+                self.assertEqual({expected_kind: 1}, self._server.reset_counts())
+
+    def test_images(self) -> None:
+        """ Test serving images, in full and in part. """
+
+        body = self._server.image_body
+        etag = '"fixture"'
+
+        # [(request headers, expected status, expected body, expected Content-Range), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, str], int, bytes, typing.Union[str, None]]] = [
+            ({}, 200, body, None),
+            ({'Range': 'bytes=0-'}, 206, body, 'bytes 0-999/1000'),
+            ({'Range': 'bytes=400-'}, 206, body[400:], 'bytes 400-999/1000'),
+            ({'Range': 'bytes=400-', 'If-Range': etag}, 206, body[400:], 'bytes 400-999/1000'),
+            ({'Range': 'bytes=400-', 'If-Range': '"other"'}, 200, body, None),
+            ({'Range': 'bytes=1000-'}, 416, b'', 'bytes */1000'),
+            ({'Range': 'bytes=0-10'}, 200, body, None),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (headers, expected_status, expected_body, expected_range) = test_case
+
+            with self.subTest(msg = f"Case {i} ({headers}):"):
+                response = requests.get(self._get_image_url(), headers = headers, timeout = 10)
+
+                self.assertEqual(expected_status, response.status_code)
+                self.assertEqual(expected_body, response.content)
+                self.assertEqual(expected_range, response.headers.get('Content-Range', None))
+
+        self.assertEqual(1000, len(body))
+        self.assertEqual(b'\xff\xd8', body[:2])
+        self.assertEqual(b'\xff\xd9', body[-2:])
+
+    def test_injected_failures(self) -> None:
+        """ Test that image requests fail as configured. """
+
+        # [(options, expected status, expected count kind), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, typing.Any], int, str]] = [
+            ({'error_rate': 1.0}, 500, 'error'),
+            ({'error_rate': 1.0, 'error_status': 503}, 503, 'error'),
+            ({'throttle_rate': 1.0}, 429, 'throttled'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (options, expected_status, expected_kind) = test_case
+
+            with self.subTest(msg = f"Case {i} ({options}):"):
+                old_options = {name: getattr(self._server.options, name) for name in options}
+                for (name, value) in options.items():
+                    setattr(self._server.options, name, value)
+
+                try:
+                    response = requests.get(self._get_image_url(), timeout = 10)
+                finally:
+                    for (name, value) in old_options.items():
+                        setattr(self._server.options, name, value)
+
+                self.assertEqual(expected_status, response.status_code)
+                self.assertEqual({'image': 1, expected_kind: 1}, self._server.reset_counts())
+
+                if (expected_status == http.HTTPStatus.TOO_MANY_REQUESTS):
+                    self.assertEqual('0', response.headers['Retry-After'])
+
+    def test_dropped_connection(self) -> None:
+        """ Test that a dropped response is cut off halfway through its body. """
+
+        self._server.options.drop_rate = 1.0
+        try:
+            with requests.get(self._get_image_url(), stream = True, timeout = 10) as response:
+                self.assertEqual(200, response.status_code)
+                with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                    response.content  # pylint: disable=pointless-statement
+        finally:
+            self._server.options.drop_rate = 0.0
+
+        self.assertEqual({'image': 1, 'dropped': 1}, self._server.reset_counts())
+
+    def test_options_from_args(self) -> None:
+        """ Test building options from the command line. """
+
+        parser = argparse.ArgumentParser()
+        comics.bench.server.add_server_arguments(parser)
+
+        options = comics.bench.server.options_from_args(parser.parse_args([]))
+        self.assertEqual(comics.bench.server.DEFAULT_CHAPTER_COUNT, options.chapter_count)
+        self.assertIsNone(options.bandwidth_bytes_per_sec)
+        self.assertEqual(0.0, options.latency_secs)
+
+        options = comics.bench.server.options_from_args(parser.parse_args([
+            '--chapters', '3',
+            '--latency-ms', '250',
+            '--bandwidth-kib', '0.5',
+            '--error-status', '502',
+        ]))
+        self.assertEqual(3, options.chapter_count)
+        self.assertEqual(0.25, options.latency_secs)
+        self.assertEqual(512, options.bandwidth_bytes_per_sec)
+        self.assertEqual(502, options.error_status)
+
+    def _get_image_url(self) -> str:
+        """ Get the URL of the server's first image. """
+
+        return comics.bench.fixtures.image_urls(self._server.base_url, comics.bench.fixtures.chapter_ids(2)[0], 1)[0]
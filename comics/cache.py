@@ -0,0 +1,194 @@
+import abc
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+import edq.util.dirent
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES: int = 1024
+
+DEFAULT_TTL_SECS: float = 60.0 * 60.0
+
+CACHE_FILE_EXTENSION: str = '.json'
+
+class MetadataCache(abc.ABC):
+    """
+    A cache for (text) metadata that sources would otherwise have to fetch on every run,
+    e.g., parsed comic info or tokens scraped from a site's scripts.
+    Entries expire after their TTL, and the least recently written entries are evicted once the cache is full.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> typing.Union[str, None]:
+        """ Get a live entry, or None if there is no entry (or it has expired). """
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str, ttl_secs: float = DEFAULT_TTL_SECS) -> None:
+        """ Store an entry that will expire after the given number of seconds. """
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """ Remove an entry (if it exists). """
+
+    def get_json(self, key: str) -> typing.Any:
+        """ Get a JSON entry, or None if there is no (valid) entry. """
+
+        value = self.get(key)
+        if (value is None):
+            return None
+
+        try:
+            return json.loads(value)
+        except ValueError:
+            self.delete(key)
+            return None
+
+    def set_json(self, key: str, value: typing.Any, ttl_secs: float = DEFAULT_TTL_SECS) -> None:
+        """ Store a JSON entry. """
+
+        self.set(key, json.dumps(value), ttl_secs = ttl_secs)
+
+class MemoryCache(MetadataCache):
+    """ A cache that only lives as long as the process. """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries: int = max(1, max_entries)
+        """ The most entries that will be kept at once. """
+
+        self._lock: threading.Lock = threading.Lock()
+        self._entries: collections.OrderedDict[str, typing.Tuple[float, str]] = collections.OrderedDict()
+
+    def get(self, key: str) -> typing.Union[str, None]:
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if (entry is None):
+                return None
+
+            if (entry[0] <= time.time()):
+                del self._entries[key]
+                return None
+
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl_secs: float = DEFAULT_TTL_SECS) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl_secs, value)
+
+            while (len(self._entries) > self.max_entries):
+                self._entries.popitem(last = False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+class DiskCache(MetadataCache):
+    """
+    A cache that persists across runs as one JSON file per entry in a directory.
+    Entries are written atomically, so a cache can be shared by several processes.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.cache_dir: str = cache_dir
+        """ Where entries are stored. """
+
+        self.max_entries: int = max(1, max_entries)
+        """ The most entries that will be kept at once. """
+
+        edq.util.dirent.mkdir(cache_dir)
+
+    def get(self, key: str) -> typing.Union[str, None]:
+        path = self._path(key)
+
+        try:
+            with open(path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if ((not isinstance(entry, dict)) or (entry.get('key') != key) or (entry.get('expires', 0.0) <= time.time())):
+            self.delete(key)
+            return None
+
+        value = entry.get('value', None)
+        if (not isinstance(value, str)):
+            return None
+
+        return value
+
+    def set(self, key: str, value: str, ttl_secs: float = DEFAULT_TTL_SECS) -> None:
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        entry = {
+            'key': key,
+            'expires': time.time() + ttl_secs,
+            'value': value,
+        }
+
+        with open(temp_path, 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+            json.dump(entry, file)
+
+        os.replace(temp_path, path)
+
+        self._evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> str:
+        """ Get the path for a key. """
+
+        digest = hashlib.sha256(key.encode(edq.util.dirent.DEFAULT_ENCODING)).hexdigest()
+        return os.path.join(self.cache_dir, digest + CACHE_FILE_EXTENSION)
+
+    def _evict(self) -> None:
+        """ Remove the least recently written entries until the cache is no longer over capacity. """
+
+        entries = []
+        with os.scandir(self.cache_dir) as dirents:
+            for dirent in dirents:
+                if (not dirent.name.endswith(CACHE_FILE_EXTENSION)):
+                    continue
+
+                try:
+                    entries.append((dirent.stat().st_mtime, dirent.path))
+                except OSError:
+                    continue
+
+        if (len(entries) <= self.max_entries):
+            return
+
+        entries.sort()
+        for (_, path) in entries[:(len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+_default_cache: typing.Union[MetadataCache, None] = None  # pylint: disable=invalid-name
+"""
+The cache used by sources that have not been given their own.
+If None, such sources do not cache anything.
+"""
+
+def get_default_cache() -> typing.Union[MetadataCache, None]:
+    """ Get the cache used by sources that have not been given their own. """
+
+    return _default_cache
+
+def set_default_cache(cache: typing.Union[MetadataCache, None]) -> None:
+    """ Set the cache used by sources that have not been given their own. """
+
+    global _default_cache  # pylint: disable=global-statement
+    _default_cache = cache
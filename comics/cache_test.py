@@ -0,0 +1,180 @@
+import json
+import os
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.cache
+import comics.download_test
+import comics.sources.coffeemanga_to
+
+class TestCache(edq.testing.unittest.BaseTest):
+    """ Test the metadata caches. """
+
+    def test_get_set_delete(self) -> None:
+        """ Test storing, reading, and removing entries. """
+
+        for cache in self._make_caches():
+            with self.subTest(msg = f"{type(cache).__name__}:"):
+                self.assertIsNone(cache.get('a'))
+
+                cache.set('a', 'A')
+                cache.set('b', 'B')
+                cache.set('a', 'AA')
+                self.assertEqual('AA', cache.get('a'))
+                self.assertEqual('B', cache.get('b'))
+
+                cache.delete('a')
+                cache.delete('missing')
+                self.assertIsNone(cache.get('a'))
+                self.assertEqual('B', cache.get('b'))
+
+    def test_expiry(self) -> None:
+        """ Test that entries are gone once their TTL is up. """
+
+        for cache in self._make_caches():
+            with self.subTest(msg = f"{type(cache).__name__}:"):
+                cache.set('expired', 'X', ttl_secs = 0.0)
+                cache.set('old', 'X', ttl_secs = -10.0)
+                cache.set('live', 'Y', ttl_secs = 60.0)
+
+                self.assertIsNone(cache.get('expired'))
+                self.assertIsNone(cache.get('old'))
+                self.assertEqual('Y', cache.get('live'))
+
+    def test_eviction(self) -> None:
+        """ Test that the least recently written entries are evicted once the cache is full. """
+
+        for cache in self._make_caches(max_entries = 2):
+            with self.subTest(msg = f"{type(cache).__name__}:"):
+                cache.set('a', 'A')
+                self._tick(cache)
+                cache.set('b', 'B')
+                self._tick(cache)
+
+                # Rewriting makes an entry the newest.
+                cache.set('a', 'AA')
+                self._tick(cache)
+                cache.set('c', 'C')
+
+                self.assertEqual(['AA', None, 'C'], [cache.get(key) for key in ['a', 'b', 'c']])
+
+    def test_json(self) -> None:
+        """ Test JSON entries, including one that does not parse. """
+
+        for cache in self._make_caches():
+            with self.subTest(msg = f"{type(cache).__name__}:"):
+                cache.set_json('a', {'b': [1, 2]})
+                self.assertEqual({'b': [1, 2]}, cache.get_json('a'))
+
+                cache.set('bad', '{')
+                self.assertIsNone(cache.get_json('bad'))
+                self.assertIsNone(cache.get('bad'))
+
+                self.assertIsNone(cache.get_json('missing'))
+
+    def test_disk_cache_persists(self) -> None:
+        """ Test that entries are shared between caches on the same directory, and that broken entry files are ignored. """
+
+        cache_dir = self._make_temp_dir()
+        first = comics.cache.DiskCache(cache_dir)
+        second = comics.cache.DiskCache(cache_dir)
+
+        first.set('a', 'A')
+        self.assertEqual('A', second.get('a'))
+
+        first.set('b', 'B')
+        path = first._path('b')
+
+        # [(file contents, expected), ...]
+        test_cases = [
+            ('not json', None),
+            (json.dumps(['not', 'an', 'entry']), None),
+            (json.dumps({'key': 'other', 'expires': 1e12, 'value': 'B'}), None),
+            (json.dumps({'key': 'b', 'expires': 1e12, 'value': 5}), None),
+            (json.dumps({'key': 'b', 'expires': 1e12, 'value': 'B'}), 'B'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (contents, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                with open(path, 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+                    file.write(contents)
+
+                self.assertEqual(expected, second.get('b'))
+
+        self.assertEqual([], [name for name in os.listdir(cache_dir) if name.endswith('.tmp')])
+
+    def test_default_cache(self) -> None:
+        """ Test that sources fall back to the default cache. """
+
+        cache = comics.cache.MemoryCache()
+        own_cache = comics.cache.MemoryCache()
+
+        source = comics.download_test.FakeSource()
+        own_source = comics.download_test.FakeSource(metadata_cache = own_cache)
+
+        old_cache = comics.cache.get_default_cache()
+        try:
+            comics.cache.set_default_cache(cache)
+            self.assertIs(cache, source.get_metadata_cache())
+            self.assertIs(own_cache, own_source.get_metadata_cache())
+
+            comics.cache.set_default_cache(None)
+            self.assertIsNone(source.get_metadata_cache())
+        finally:
+            comics.cache.set_default_cache(old_cache)
+
+    def test_source_uses_cache(self) -> None:
+        """ Test that a cached comic costs no page or script requests, and that a stale cached next action is refetched. """
+
+        with comics.download_test.stand_in_server() as server:
+            cache = comics.cache.MemoryCache()
+            source = comics.sources.coffeemanga_to.ComicSource(base_url = server.base_url, metadata_cache = cache, rate_per_sec = 1000.0)
+
+            server.reset_counts()
+            comic = source.get_info_from_url(server.comic_url)
+            self.assertFalse(comic.extra_info['cached'])
+            self.assertEqual({'page': 1, 'chunk': 1}, server.reset_counts())
+
+            cached_comic = source.get_info_from_url(server.comic_url)
+            self.assertTrue(cached_comic.extra_info['cached'])
+            self.assertEqual({}, server.reset_counts())
+            self.assertEqual(comic.to_dict()['chapters'], cached_comic.to_dict()['chapters'])
+
+            # A redeploy changes the next action.
+            chunk_path = comic.extra_info['chunk_path']
+            cache.set(comics.sources.coffeemanga_to._next_action_cache_key(chunk_path), 'stale')
+
+            stale_comic = source.get_info_from_url(server.comic_url)
+            images = source.get_chapter_images(stale_comic, stale_comic.chapters[0])
+
+            self.assertEqual(comics.download_test.STAND_IN_IMAGE_COUNT, len(images))
+            self.assertEqual({'bad_action': 1, 'page': 1, 'chunk': 1, 'action': 1}, server.reset_counts())
+            self.assertEqual(comic.extra_info['next_action'], stale_comic.extra_info['next_action'])
+
+    def _make_caches(self, **kwargs: typing.Any) -> typing.List[comics.cache.MetadataCache]:
+        """ Make one of each kind of cache. """
+
+        return [
+            comics.cache.MemoryCache(**kwargs),
+            comics.cache.DiskCache(self._make_temp_dir(), **kwargs),
+        ]
+
+    def _tick(self, cache: comics.cache.MetadataCache) -> None:
+        """ Make sure the next write to a disk cache is seen as newer (file times may be coarse). """
+
+        if (not isinstance(cache, comics.cache.DiskCache)):
+            return
+
+        for name in os.listdir(cache.cache_dir):
+            path = os.path.join(cache.cache_dir, name)
+            mtime = os.path.getmtime(path) - 10.0
+            os.utime(path, (mtime, mtime))
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
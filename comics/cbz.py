@@ -0,0 +1,182 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+import typing
+import zipfile
+
+import comics.metrics
+
+_logger = logging.getLogger(__name__)
+
+EXTENSION: str = '.cbz'
+
+PARTIAL_SUFFIX: str = '.part'
+""" Archives are built under a path with this suffix, and only renamed into place when finalized. """
+
+DEFAULT_FINALIZE_PROCESSES: int = 2
+
+def is_archive_path(path: str) -> bool:
+    """ Check if a path names a chapter archive. """
+
+    return path.endswith(EXTENSION)
+
+def read_sizes(path: str) -> typing.Dict[str, int]:
+    """ Get the size of each image in an archive from its central directory, or an empty dict if the archive cannot be read. """
+
+    try:
+        with zipfile.ZipFile(path, 'r') as archive:
+            return {info.filename: info.file_size for info in archive.infolist()}
+    except (OSError, zipfile.BadZipFile):
+        return {}
+
+class ChapterArchive:
+    """
+    A chapter written as a CBZ archive (a stored, uncompressed zip of the chapter's images) instead of a directory of loose files.
+
+    Images are added to a partial archive as they arrive, and its central directory is rewritten after every image,
+    so the partial archive always lists exactly which images it holds.
+    An interrupted chapter is resumed by reopening its partial archive and skipping the images it already lists.
+    Once the chapter is done, the archive must be finalized (see finalize() and Finalizer).
+
+    Images may be added from several threads at once.
+    Nothing is written to disk until the first image is added.
+    """
+
+    def __init__(self, path: str, overwrite: bool = False) -> None:
+        self.path: str = path
+        """ Where the finalized archive goes. """
+
+        self.part_path: str = path + PARTIAL_SUFFIX
+        """ Where the archive is built. """
+
+        self._names: typing.Set[str] = set()
+        self._needs_finalizing: bool = False
+        self._lock: threading.Lock = threading.Lock()
+
+        if (overwrite):
+            return
+
+        # Prefer an interrupted build, since it will hold at least as much as the last finalized archive.
+        for candidate in (self.part_path, self.path):
+            if (not os.path.exists(candidate)):
+                continue
+
+            try:
+                with zipfile.ZipFile(candidate, 'r') as archive:
+                    self._names = set(archive.namelist())
+            except zipfile.BadZipFile:
+                # Cut off while an image was being added, the archive can't be trusted.
+                _logger.warning("Discarding unreadable chapter archive: '%s'.", candidate)
+                continue
+
+            self._needs_finalizing = (candidate == self.part_path)
+            break
+
+    def contains(self, name: str) -> bool:
+        """ Check if an image is already in the archive. """
+
+        with self._lock:
+            return (name in self._names)
+
+    def add(self, name: str, data: bytes) -> None:
+        """ Add an image to the archive (stored as-is, without compression). """
+
+        with self._lock, comics.metrics.timed(comics.metrics.PHASE_DISK_WRITE):
+            if (not self._needs_finalizing):
+                self._start_build()
+
+            with zipfile.ZipFile(self.part_path, 'a', compression = zipfile.ZIP_STORED) as archive:
+                archive.writestr(name, data)
+
+            self._names.add(name)
+
+    def needs_finalizing(self) -> bool:
+        """ Check if images were added (now or in an interrupted run) since the archive was last finalized. """
+
+        with self._lock:
+            return self._needs_finalizing
+
+    def _start_build(self) -> None:
+        """ Start a partial archive from the finalized archive (if there is one) or from nothing. """
+
+        if (len(self._names) > 0):
+            os.replace(self.path, self.part_path)
+        elif (os.path.exists(self.part_path)):
+            os.remove(self.part_path)
+
+        self._needs_finalizing = True
+
+def finalize(part_path: str, path: str, names: typing.List[str]) -> int:
+    """
+    Finalize an archive: check every entry, copy the entries into the given (page) order (any others follow),
+    and rename the result to `path`.
+    Entries are copied without recompression.
+    Returns the number of entries.
+    """
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        with zipfile.ZipFile(part_path, 'r') as source, zipfile.ZipFile(temp_path, 'w', compression = zipfile.ZIP_STORED) as target:
+            present = set(source.namelist())
+            ordered_names = [name for name in names if name in present]
+            ordered_names += sorted(present.difference(ordered_names))
+
+            for name in ordered_names:
+                info = source.getinfo(name)
+
+                # Reading checks the entry's CRC.
+                with source.open(info, 'r') as file:
+                    target.writestr(info, file.read(), compress_type = zipfile.ZIP_STORED)
+
+        os.replace(temp_path, path)
+    except BaseException:
+        if (os.path.exists(temp_path)):
+            os.remove(temp_path)
+
+        raise
+
+    os.remove(part_path)
+
+    return len(ordered_names)
+
+class Finalizer:
+    """
+    Finalizes archives in a pool of worker processes.
+    The pool is only started once there is something to finalize.
+    With zero processes, archives are finalized right away in the calling thread.
+    """
+
+    def __init__(self, processes: int = DEFAULT_FINALIZE_PROCESSES) -> None:
+        self.processes: int = max(0, processes)
+        """ The number of worker processes. """
+
+        self._executor: typing.Union[concurrent.futures.ProcessPoolExecutor, None] = None
+
+    def submit(self, archive: ChapterArchive, names: typing.List[str]) -> concurrent.futures.Future:
+        """ Start finalizing an archive, see finalize(). """
+
+        if (self.processes == 0):
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            try:
+                future.set_result(finalize(archive.part_path, archive.path, names))
+            except Exception as ex:
+                future.set_exception(ex)
+
+            return future
+
+        if (self._executor is None):
+            # Forking a process that has threads (e.g., download workers) is not safe.
+            context = multiprocessing.get_context('spawn')
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers = self.processes, mp_context = context)
+
+        return self._executor.submit(finalize, archive.part_path, archive.path, names)
+
+    def close(self) -> None:
+        """ Wait for all outstanding work and stop the pool. """
+
+        if (self._executor is not None):
+            self._executor.shutdown(wait = True)
+            self._executor = None
@@ -0,0 +1,173 @@
+import os
+import typing
+import zipfile
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.cbz
+
+class TestCBZ(edq.testing.unittest.BaseTest):
+    """ Test building and finalizing chapter archives. """
+
+    def test_archive_add(self) -> None:
+        """ Test that images are added to the partial archive, and that nothing is written before the first image. """
+
+        path = self._make_archive_path()
+        archive = comics.cbz.ChapterArchive(path)
+
+        self.assertFalse(archive.needs_finalizing())
+        self.assertFalse(os.path.exists(archive.part_path))
+
+        archive.add('001.jpg', b'one')
+        archive.add('002.jpg', b'two')
+
+        self.assertTrue(archive.needs_finalizing())
+        self.assertTrue(archive.contains('001.jpg'))
+        self.assertFalse(archive.contains('003.jpg'))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual({'001.jpg': 3, '002.jpg': 3}, comics.cbz.read_sizes(archive.part_path))
+
+    def test_archive_resume(self) -> None:
+        """ Test reopening partial, finalized, and broken archives. """
+
+        # [(files to create (relative to the archive's path), overwrite, expected names, expected needs finalizing), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, typing.Union[typing.List[str], None]], bool, typing.List[str], bool]] = [
+            ({}, False, [], False),
+            ({'': ['a']}, False, ['a'], False),
+            ({comics.cbz.PARTIAL_SUFFIX: ['a', 'b']}, False, ['a', 'b'], True),
+
+            # An interrupted build wins over the finalized archive.
+            ({'': ['a'], comics.cbz.PARTIAL_SUFFIX: ['a', 'b']}, False, ['a', 'b'], True),
+
+            # An unreadable partial archive is ignored.
+            ({'': ['a'], comics.cbz.PARTIAL_SUFFIX: None}, False, ['a'], False),
+
+            ({'': ['a'], comics.cbz.PARTIAL_SUFFIX: ['a', 'b']}, True, [], False),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (files, overwrite, expected_names, expected_needs_finalizing) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                path = self._make_archive_path()
+                for (suffix, names) in files.items():
+                    _write_archive(path + suffix, names)
+
+                archive = comics.cbz.ChapterArchive(path, overwrite = overwrite)
+
+                self.assertEqual(expected_needs_finalizing, archive.needs_finalizing())
+                for name in ['a', 'b']:
+                    self.assertEqual((name in expected_names), archive.contains(name))
+
+    def test_archive_add_after_finalized(self) -> None:
+        """ Test that adding to a finalized archive continues from what it holds. """
+
+        path = self._make_archive_path()
+        _write_archive(path, ['a'])
+
+        archive = comics.cbz.ChapterArchive(path)
+        archive.add('b', b'bb')
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual({'a': 1, 'b': 2}, comics.cbz.read_sizes(archive.part_path))
+
+    def test_finalize_base(self) -> None:
+        """ Test that finalizing orders entries by page (with any others after), renames the archive, and keeps the data. """
+
+        # [(added names, page names, expected order), ...]
+        test_cases = [
+            (['b', 'a', 'c'], ['a', 'b', 'c'], ['a', 'b', 'c']),
+            (['b', 'a', 'c'], ['c', 'a'], ['c', 'a', 'b']),
+            (['z', 'y'], [], ['y', 'z']),
+            (['a'], ['missing', 'a'], ['a']),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (added_names, page_names, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                path = self._make_archive_path()
+                archive = comics.cbz.ChapterArchive(path)
+                for name in added_names:
+                    archive.add(name, name.encode('utf-8') * 10)
+
+                count = comics.cbz.finalize(archive.part_path, path, page_names)
+
+                self.assertEqual(len(expected), count)
+                self.assertFalse(os.path.exists(archive.part_path))
+
+                with zipfile.ZipFile(path, 'r') as result:
+                    self.assertEqual(expected, result.namelist())
+                    self.assertIsNone(result.testzip())
+
+                    for info in result.infolist():
+                        self.assertEqual(zipfile.ZIP_STORED, info.compress_type)
+                        self.assertEqual(info.filename.encode('utf-8') * 10, result.read(info))
+
+    def test_finalize_bad_crc(self) -> None:
+        """ Test that a corrupted entry fails finalizing and leaves the partial archive (and no finalized one) behind. """
+
+        path = self._make_archive_path()
+        archive = comics.cbz.ChapterArchive(path)
+        archive.add('a', b'A' * 64)
+        archive.add('b', b'B' * 64)
+
+        with open(archive.part_path, 'rb') as file:
+            data = file.read()
+
+        with open(archive.part_path, 'wb') as file:
+            file.write(data.replace(b'B' * 64, (b'B' * 63) + b'X'))
+
+        with self.assertRaisesRegex(zipfile.BadZipFile, 'CRC'):
+            comics.cbz.finalize(archive.part_path, path, ['a', 'b'])
+
+        self.assertTrue(os.path.exists(archive.part_path))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([os.path.basename(archive.part_path)], os.listdir(os.path.dirname(path)))
+
+    def test_finalizer(self) -> None:
+        """ Test finalizing in the calling thread and in worker processes. """
+
+        for processes in [0, 1]:
+            with self.subTest(msg = f"Processes {processes}:"):
+                path = self._make_archive_path()
+                archive = comics.cbz.ChapterArchive(path)
+                archive.add('b', b'b')
+                archive.add('a', b'a')
+
+                finalizer = comics.cbz.Finalizer(processes)
+                try:
+                    self.assertEqual(2, finalizer.submit(archive, ['a', 'b']).result())
+                finally:
+                    finalizer.close()
+
+                with zipfile.ZipFile(path, 'r') as result:
+                    self.assertEqual(['a', 'b'], result.namelist())
+
+    def test_read_sizes_unreadable(self) -> None:
+        """ Test that missing and broken archives have no sizes. """
+
+        path = self._make_archive_path()
+        self.assertEqual({}, comics.cbz.read_sizes(path))
+
+        _write_archive(path, None)
+        self.assertEqual({}, comics.cbz.read_sizes(path))
+
+    def _make_archive_path(self) -> str:
+        """ Get a path for an archive in a new temp dir. """
+
+        return os.path.join(edq.util.dirent.get_temp_dir(prefix = 'comics-test-'), '0001' + comics.cbz.EXTENSION)
+
+def _write_archive(path: str, names: typing.Union[typing.List[str], None]) -> None:
+    """ Write an archive holding the given (one byte) entries, or an unreadable file for None. """
+
+    if (names is None):
+        with open(path, 'wb') as file:
+            file.write(b'not a zip')
+
+        return
+
+    with zipfile.ZipFile(path, 'w', compression = zipfile.ZIP_STORED) as archive:
+        for name in names:
+            archive.writestr(name, name.encode('utf-8'))
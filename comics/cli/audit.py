@@ -0,0 +1,78 @@
+"""
+Audit a downloaded library: find truncated images and saved error pages (that downloads would otherwise treat as done).
+Only files that changed since the last audit are read again.
+Bad files can be written to a repair list for `comics.cli.download --repair-list`.
+"""
+
+import argparse
+import sys
+
+import comics.audit
+import comics.cli.parser
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    report = comics.audit.audit(args.library_dir,
+            index_path = args.index_path,
+            processes = args.processes,
+            full = args.full,
+    )
+
+    if (not args.summary_only):
+        for status in report.bad_files:
+            print(f"{status.path} - {status.status}")
+
+    print(f"\n{report}")
+
+    if (args.repair_list_path is not None):
+        comics.audit.write_repair_list(args.repair_list_path, report.bad_files)
+
+    return min(len(report.bad_files), 100)
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = False,
+    )
+
+    parser.add_argument('library_dir', metavar = 'DIR',
+        type = str,
+        help = 'The library (e.g., the --out-dir of downloads) to audit.',
+    )
+
+    parser.add_argument('--repair-list-path', dest = 'repair_list_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Write the bad files to this file as JSONL (default: %(default)s).",
+    )
+
+    parser.add_argument('--index-path', dest = 'index_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = f"Where to keep what each file looked like when it was last checked (default: '{comics.audit.INDEX_FILENAME}' in the library).",
+    )
+
+    parser.add_argument('--processes', dest = 'processes',
+        action = 'store', type = int, default = None,
+        help = "The number of processes to read files with, zero reads them in this process (default: one per core).",
+    )
+
+    parser.add_argument('--full', dest = 'full',
+        action = 'store_true', default = False,
+        help = "Read every file again, even ones that have not changed since the last audit (default: %(default)s).",
+    )
+
+    parser.add_argument('--summary-only', dest = 'summary_only',
+        action = 'store_true', default = False,
+        help = "Only print a summary, instead of every bad file (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -4,51 +4,200 @@ Download comics by URL.
 
 import argparse
 import sys
+import typing
 
-import edq.net.request
-
+import comics.audit
+import comics.cache
 import comics.cli.parser
 import comics.download
+import comics.metrics
+import comics.model
+import comics.scheduler
+import comics.selection
+import comics.source
+import comics.store
+import comics.transcode
+
+METRICS_FORMAT_JSON: str = 'json'
+METRICS_FORMAT_PROMETHEUS: str = 'prometheus'
 
 def run_cli(args: argparse.Namespace) -> int:
     """ Run the CLI. """
 
-    # Set the HTTP timeout.
-    edq.net.request._module_makerequest_options = {
-        'timeout': 5.0,
-    }
+    _apply_retry_options(args)
+
+    if (args.metadata_cache_dir is not None):
+        comics.cache.set_default_cache(comics.cache.DiskCache(args.metadata_cache_dir))
+
+    transcoder = None
+    if (args.transcode is not None):
+        if (args.output_format != comics.download.OUTPUT_FORMAT_DIR):
+            print("Error: --transcode only works with directory output.", file = sys.stderr)
+            return 1
+
+        try:
+            transcoder = comics.transcode.Transcoder(args.transcode, quality = args.transcode_quality, processes = args.transcode_processes)
+        except ValueError as ex:
+            print(f"Error: {ex}", file = sys.stderr)
+            return 1
+
+    store = None
+    if (args.image_store_dir is not None):
+        store = comics.store.ImageStore(args.image_store_dir)
+
+    if (args.repair_list_path is not None):
+        removed = comics.audit.apply_repairs(comics.audit.read_repair_list(args.repair_list_path), store = store)
+        print(f"Removed {removed} bad files to download again.\n")
+
+    report = _Report(args.summary_only, (args.metrics_path is not None) and (args.metrics_format == METRICS_FORMAT_JSON))
+
+    try:
+        comics.scheduler.download_all(args.urls, args.out_dir,
+                on_result = report.on_result,
+                on_chapter = report.on_chapter,
+                keep_chapters = False,
+                parallel_comics = args.parallel_comics,
+                total_workers = args.total_workers,
+                source_workers = args.source_workers,
+                dry_run = args.dry_run,
+                workers = args.workers,
+                prefetch_chapters = args.prefetch_chapters,
+                use_manifest = args.use_manifest,
+                output_format = args.output_format,
+                store = store,
+                transcoder = transcoder,
+                selection = _get_selection(args),
+        )
+    finally:
+        if (store is not None):
+            store.close()
+
+        if (transcoder is not None):
+            transcoder.close()
+
+    print(f"\nTotal Missing Count: {report.total_missing_images}, Total Chapter Errors: {report.total_chapter_errors}")
 
-    total_missing_count = 0
-    total_chapter_errors = 0
+    if (args.metrics_path is not None):
+        _write_metrics(args.metrics_path, args.metrics_format, report.comic_summaries)
+
+    return min((report.total_missing_images + report.total_chapter_errors), 100)
+
+def _apply_retry_options(args: argparse.Namespace) -> None:
+    """ Override the retry policy of each comic's source with any options that were given. """
 
     for url in args.urls:
-        result = comics.download.download(url, args.out_dir, dry_run = args.dry_run)
+        source = comics.source.lookup(url)
+        if (source is None):
+            continue
+
+        if (args.timeout_secs is not None):
+            source.retry_policy.timeout_secs = args.timeout_secs
+
+        if (args.retries is not None):
+            source.retry_policy.retries = args.retries
+
+        if (args.no_hedge):
+            source.retry_policy.hedge_percentile = None
+
+class _ComicSummary:
+    """ What is kept about a comic while its chapters stream in: counters, and (only if they will be written) each chapter's metrics. """
+
+    def __init__(self) -> None:
+        self.result: typing.Union[comics.model.DownloadResult, None] = None
+        self.missing_images: int = 0
+        self.chapter_errors: int = 0
+        self.chapter_metrics: typing.List[typing.Tuple[str, comics.metrics.Metrics]] = []
+
+class _Report:
+    """ Prints chapters as they finish (unless only summaries are wanted) and each comic's summary as it finishes. """
+
+    def __init__(self, summary_only: bool, keep_chapter_metrics: bool) -> None:
+        self.summary_only: bool = summary_only
+        self.keep_chapter_metrics: bool = keep_chapter_metrics
+
+        self.total_missing_images: int = 0
+        self.total_chapter_errors: int = 0
+
+        self.comic_summaries: typing.List[_ComicSummary] = []
+        """ Finished comics (that did not fail outright). """
 
-        print(result.comic)
-        print("    Chapters:")
+        self._in_progress: typing.Dict[str, _ComicSummary] = {}
 
-        missing_images = 0
-        chapter_errors = 0
+    def on_chapter(self, url: str, comic: comics.model.ComicInfo, chapter_download_result: comics.model.ChapterDownloadResult) -> None:
+        """ Count (and print) a finished chapter. """
 
-        for chapter_download_result in result.chapter_download_results:
-            missing_images += chapter_download_result.missing_count()
+        summary = self._in_progress.setdefault(url, _ComicSummary())
 
-            if (chapter_download_result.has_error()):
-                chapter_errors += 1
+        summary.missing_images += chapter_download_result.missing_count()
+        if (chapter_download_result.has_error()):
+            summary.chapter_errors += 1
 
-            print(f"        {chapter_download_result}")
+        if (self.keep_chapter_metrics):
+            summary.chapter_metrics.append((str(chapter_download_result.chapter), chapter_download_result.metrics))
+
+        if (self.summary_only):
+            return
+
+        print(f"{comic} - {chapter_download_result}")
+        if (chapter_download_result.error_count() > 0):
             for image_download_result in chapter_download_result.image_results:
                 if (image_download_result.has_error()):
-                    print(f"            {image_download_result.image} - {image_download_result.error_text()}")
+                    print(f"    {image_download_result.image} - {image_download_result.error_text()}")
+
+    def on_result(self, batch_result: comics.scheduler.BatchResult) -> None:
+        """ Print a finished comic's summary. """
+
+        summary = self._in_progress.pop(batch_result.url, _ComicSummary())
+
+        if (batch_result.result is None):
+            print(f"{batch_result.url} - Error: {batch_result.exception}")
+            self.total_chapter_errors += 1
+            return
+
+        summary.result = batch_result.result
+        self.comic_summaries.append(summary)
+
+        print(f"{batch_result.result.comic} - Missing Count: {summary.missing_images}, Chapter Errors: {summary.chapter_errors}")
+
+        self.total_missing_images += summary.missing_images
+        self.total_chapter_errors += summary.chapter_errors
+
+def _write_metrics(path: str, metrics_format: str, comic_summaries: typing.List[_ComicSummary]) -> None:
+    """ Write the metrics for each downloaded comic. """
+
+    results = [summary.result for summary in comic_summaries if summary.result is not None]
+
+    if (metrics_format == METRICS_FORMAT_PROMETHEUS):
+        comics.metrics.write_prometheus(path, [({'comic': result.comic.name}, result.metrics) for result in results])
+        return
 
-        print(f"    Missing Count: {missing_images}, Chapter Errors: {chapter_errors}")
+    data = []
+    for summary in comic_summaries:
+        if (summary.result is None):
+            continue
 
-        total_missing_count += missing_images
-        total_chapter_errors += chapter_errors
+        data.append({
+            'url': summary.result.comic.url,
+            'comic': summary.result.comic.name,
+            'metrics': summary.result.metrics.to_dict(),
+            'chapters': [{
+                'chapter': chapter,
+                'metrics': metrics.to_dict(),
+            } for (chapter, metrics) in summary.chapter_metrics],
+        })
 
-    print(f"\nTotal Missing Count: {total_missing_count}, Total Chapter Errors: {total_chapter_errors}")
+    comics.metrics.write_json(path, data)
 
-    return min((total_missing_count + total_chapter_errors), 100)
+def _get_selection(args: argparse.Namespace) -> comics.selection.ChapterSelection:
+    """ Get the chapters to download from the parsed args. """
+
+    return comics.selection.ChapterSelection(
+            ranges = args.chapter_ranges,
+            last = args.last_chapters,
+            newer_than = args.newer_than,
+            newest_first = args.newest_first,
+            stop_at_present = args.stop_at_present,
+    )
 
 def main() -> int:
     """ Get a parser, parse the args, and call run. """
@@ -77,6 +226,129 @@ def _get_parser() -> argparse.ArgumentParser:
         help = "Don't download anything (default: %(default)s).",
     )
 
+    parser.add_argument('--output-format', dest = 'output_format',
+        action = 'store', type = str, default = comics.download.OUTPUT_FORMAT_DIR,
+        choices = comics.download.OUTPUT_FORMATS,
+        help = "Write each chapter as a directory of images or as a CBZ archive (default: %(default)s).",
+    )
+
+    parser.add_argument('--transcode', dest = 'transcode',
+        action = 'store', type = str, default = None,
+        choices = comics.transcode.FORMATS,
+        help = "Re-encode downloaded images in this format (when smaller) in background processes, needs Pillow (default: keep images as is).",
+    )
+
+    parser.add_argument('--transcode-quality', dest = 'transcode_quality',
+        action = 'store', type = int, default = comics.transcode.DEFAULT_QUALITY,
+        help = "The encoder quality (0-100) for --transcode (default: %(default)s).",
+    )
+
+    parser.add_argument('--transcode-processes', dest = 'transcode_processes',
+        action = 'store', type = int, default = None,
+        help = "The number of processes to re-encode images with (default: one per core).",
+    )
+
+    parser.add_argument('--chapters', dest = 'chapter_ranges', metavar = 'RANGES',
+        action = 'store', type = comics.selection.parse_ranges, default = None,
+        help = "Only these chapters, by name or by index with a '#' (e.g., '1-10,12.5,#0-#4,100-') (default: all chapters).",
+    )
+
+    parser.add_argument('--last', dest = 'last_chapters', metavar = 'N',
+        action = 'store', type = int, default = None,
+        help = "Only the newest N chapters (default: all chapters).",
+    )
+
+    parser.add_argument('--newer-than', dest = 'newer_than', metavar = 'CHAPTER',
+        action = 'store', type = str, default = None,
+        help = "Only chapters after this one (by name, or by index with a '#') (default: all chapters).",
+    )
+
+    parser.add_argument('--newest-first', dest = 'newest_first',
+        action = 'store_true', default = False,
+        help = "Download the newest chapters first (default: %(default)s).",
+    )
+
+    parser.add_argument('--stop-at-present', dest = 'stop_at_present',
+        action = 'store_true', default = False,
+        help = "With --newest-first, stop at the first chapter that is already fully present (default: %(default)s).",
+    )
+
+    parser.add_argument('--workers', dest = 'workers',
+        action = 'store', type = int, default = 1,
+        help = "The number of images to download concurrently for each comic, capped by each source's limit (default: %(default)s).",
+    )
+
+    parser.add_argument('--prefetch-chapters', dest = 'prefetch_chapters',
+        action = 'store', type = int, default = 0,
+        help = "The number of upcoming chapters to list images for while the current chapter downloads (default: %(default)s).",
+    )
+
+    parser.add_argument('--parallel-comics', dest = 'parallel_comics',
+        action = 'store', type = int, default = comics.scheduler.DEFAULT_PARALLEL_COMICS,
+        help = "The number of comics to download at once (default: %(default)s).",
+    )
+
+    parser.add_argument('--total-workers', dest = 'total_workers',
+        action = 'store', type = int, default = None,
+        help = "The most images to download at once across all comics (default: no overall limit).",
+    )
+
+    parser.add_argument('--source-workers', dest = 'source_workers',
+        action = 'store', type = int, default = None,
+        help = "The most images to download at once from any one source across all comics (default: each source's limit).",
+    )
+
+    parser.add_argument('--timeout-secs', dest = 'timeout_secs',
+        action = 'store', type = float, default = None,
+        help = "The timeout for connecting to a host and for each read from it, for every source (default: each source's policy).",
+    )
+
+    parser.add_argument('--retries', dest = 'retries',
+        action = 'store', type = int, default = None,
+        help = "The number of times to retry a failed request, for every source (default: each source's policy).",
+    )
+
+    parser.add_argument('--no-hedge', dest = 'no_hedge',
+        action = 'store_true', default = False,
+        help = "Never send duplicate requests for images that are slower than usual to arrive (default: %(default)s).",
+    )
+
+    parser.add_argument('--use-manifest', dest = 'use_manifest',
+        action = 'store_true', default = False,
+        help = "Keep a manifest in each comic's directory and skip chapters it shows as complete (default: %(default)s).",
+    )
+
+    parser.add_argument('--summary-only', dest = 'summary_only',
+        action = 'store_true', default = False,
+        help = "Only print a summary of each comic (as it finishes), instead of every chapter (as it finishes) (default: %(default)s).",
+    )
+
+    parser.add_argument('--metrics-path', dest = 'metrics_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Write timings for each phase of each download (and counts of bytes, retries, and skips) to this file (default: %(default)s).",
+    )
+
+    parser.add_argument('--metrics-format', dest = 'metrics_format',
+        action = 'store', type = str, default = METRICS_FORMAT_JSON,
+        choices = [METRICS_FORMAT_JSON, METRICS_FORMAT_PROMETHEUS],
+        help = "The format of --metrics-path: JSON (with a breakdown by chapter) or a Prometheus textfile (default: %(default)s).",
+    )
+
+    parser.add_argument('--image-store-dir', dest = 'image_store_dir',
+        action = 'store', type = str, default = None,
+        help = "Keep images in a content-addressed store in this directory, hardlinked into chapters and never refetched (default: %(default)s).",
+    )
+
+    parser.add_argument('--repair-list', dest = 'repair_list_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Before downloading, remove the bad files listed by `comics.cli.audit` so they are fetched again (default: %(default)s).",
+    )
+
+    parser.add_argument('--metadata-cache-dir', dest = 'metadata_cache_dir',
+        action = 'store', type = str, default = None,
+        help = "Cache comic metadata (e.g., parsed comic pages and site tokens) in this directory between runs (default: %(default)s).",
+    )
+
     return parser
 
 if (__name__ == '__main__'):
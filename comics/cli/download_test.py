@@ -0,0 +1,104 @@
+import contextlib
+import io
+import json
+import os
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.cli.download
+import comics.download_test
+import comics.metrics
+import comics.retry
+
+class TestDownloadCLI(edq.testing.unittest.BaseTest):
+    """ Test the download CLI. """
+
+    def test_retry_options(self) -> None:
+        """ Test that retry options only override a source's policy when they are given. """
+
+        # [(args, expected (timeout, retries, hedge percentile)), ...]
+        test_cases = [
+            ([], (7.5, 2, 0.9)),
+            (['--timeout-secs', '1.5'], (1.5, 2, 0.9)),
+            (['--retries', '0'], (7.5, 0, 0.9)),
+            (['--no-hedge'], (7.5, 2, None)),
+            (['--timeout-secs', '3', '--retries', '5', '--no-hedge'], (3.0, 5, None)),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (args, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({args}):"):
+                policy = comics.retry.RetryPolicy(timeout_secs = 7.5, retries = 2, hedge_percentile = 0.9)
+                url = comics.download_test.register_fake_source(comics.download_test.FakeSource(retry_policy = policy))
+
+                comics.cli.download._apply_retry_options(comics.cli.download._get_parser().parse_args([url] + args))
+
+                self.assertEqual(expected, (policy.timeout_secs, policy.retries, policy.hedge_percentile))
+
+    def test_selection_options(self) -> None:
+        """ Test that newest first and stopping at present chapters are separate options. """
+
+        # [(args, expected (newest first, stop at present)), ...]
+        test_cases = [
+            ([], (False, False)),
+            (['--newest-first'], (True, False)),
+            (['--stop-at-present'], (False, True)),
+            (['--newest-first', '--stop-at-present'], (True, True)),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (args, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({args}):"):
+                selection = comics.cli.download._get_selection(comics.cli.download._get_parser().parse_args(['http://test.invalid'] + args))
+                self.assertEqual(expected, (selection.newest_first, selection.stop_at_present))
+
+    def test_run_streams_chapters(self) -> None:
+        """ Test that each chapter is printed as it finishes (unless only summaries are wanted), along with each comic's summary. """
+
+        # [(extra args, expected chapter lines), ...]
+        test_cases = [
+            ([], comics.download_test.FAKE_CHAPTER_COUNT),
+            (['--summary-only'], 0),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (extra_args, expected_chapter_lines) = test_case
+
+            with self.subTest(msg = f"Case {i} ({extra_args}):"):
+                url = comics.download_test.register_fake_source(comics.download_test.FakeSource(failing_chapters = {1}))
+                missing_url = 'http://missing.test.invalid/series/missing'
+
+                out_dir = edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+                metrics_path = os.path.join(out_dir, 'metrics.json')
+
+                args = comics.cli.download._get_parser().parse_args([url, missing_url,
+                        '--out-dir', out_dir, '--dry-run', '--metrics-path', metrics_path] + extra_args)
+
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    exit_status = comics.cli.download.run_cli(args)
+
+                lines = output.getvalue().splitlines()
+
+                # A dry run fetches no images, so they are all missing.
+                missing_count = (comics.download_test.FAKE_CHAPTER_COUNT - 1) * comics.download_test.FAKE_IMAGE_COUNT
+
+                # The missing comic counts as a chapter error.
+                self.assertEqual(missing_count + 2, exit_status)
+
+                chapter_lines = [line for line in lines if (line.startswith('Fake Comic - ') and ('Missing Count' not in line))]
+                self.assertEqual(expected_chapter_lines, len(chapter_lines))
+
+                self.assertIn(f"Fake Comic - Missing Count: {missing_count}, Chapter Errors: 1", lines)
+                self.assertTrue(any(line.startswith(f"{missing_url} - Error: ") for line in lines))
+                self.assertEqual(f"Total Missing Count: {missing_count}, Total Chapter Errors: 2", lines[-1])
+
+                with open(metrics_path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+                    metrics = json.load(file)
+
+                self.assertEqual([url], [comic['url'] for comic in metrics])
+                self.assertEqual(comics.download_test.FAKE_CHAPTER_COUNT, len(metrics[0]['chapters']))
+                self.assertEqual(1, metrics[0]['metrics']['counters'][comics.metrics.COUNTER_CHAPTERS_FAILED])
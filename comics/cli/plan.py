@@ -0,0 +1,145 @@
+"""
+Plan downloads: resolve comics, their chapters, and each chapter's images into a work list (without downloading any images).
+The work list can be written as JSONL and/or added to a work queue for `comics.cli.work`.
+"""
+
+import argparse
+import sys
+
+import comics.cache
+import comics.cli.parser
+import comics.download
+import comics.plan
+import comics.selection
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    if (args.metadata_cache_dir is not None):
+        comics.cache.set_default_cache(comics.cache.DiskCache(args.metadata_cache_dir))
+
+    work = []
+    errors = 0
+
+    for url in args.urls:
+        try:
+            comic_work = comics.download.plan(url, args.out_dir,
+                    prefetch_chapters = args.prefetch_chapters,
+                    use_manifest = args.use_manifest,
+                    output_format = args.output_format,
+                    selection = _get_selection(args),
+            )
+        except Exception as ex:
+            print(f"{url}\n    Error: {ex}")
+            errors += 1
+            continue
+
+        unlisted = sum(1 for item in comic_work if item.images is None)
+        print(f"{url}\n    Chapters: {len(comic_work)}, Unlisted Chapters: {unlisted}")
+
+        work += comic_work
+
+    if (args.plan_path is not None):
+        comics.plan.write_jsonl(args.plan_path, work)
+
+    if (args.queue_path is not None):
+        with comics.plan.WorkQueue(args.queue_path) as queue:
+            added = queue.add(work)
+
+        print(f"\nQueued {added} new chapters (of {len(work)}).")
+
+    return min(errors, 100)
+
+def _get_selection(args: argparse.Namespace) -> comics.selection.ChapterSelection:
+    """ Get the chapters to plan from the parsed args. """
+
+    return comics.selection.ChapterSelection(
+            ranges = args.chapter_ranges,
+            last = args.last_chapters,
+            newer_than = args.newer_than,
+            newest_first = args.newest_first,
+            stop_at_present = args.stop_at_present,
+    )
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = True,
+    )
+
+    parser.add_argument('urls', metavar = 'URLS',
+        type = str, nargs = '+',
+        help = 'URLs to plan.',
+    )
+
+    parser.add_argument('--out-dir', dest = 'out_dir',
+        action = 'store', type = str, default = '.',
+        help = "Where the comics will be downloaded to (default: %(default)s).",
+    )
+
+    parser.add_argument('--plan-path', dest = 'plan_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Write the work list to this file as JSONL (default: %(default)s).",
+    )
+
+    parser.add_argument('--queue-path', dest = 'queue_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Add the work list to the work queue in this file (chapters that are already queued are not added again) (default: %(default)s).",
+    )
+
+    parser.add_argument('--output-format', dest = 'output_format',
+        action = 'store', type = str, default = comics.download.OUTPUT_FORMAT_DIR,
+        choices = comics.download.OUTPUT_FORMATS,
+        help = "Write each chapter as a directory of images or as a CBZ archive (default: %(default)s).",
+    )
+
+    parser.add_argument('--chapters', dest = 'chapter_ranges', metavar = 'RANGES',
+        action = 'store', type = comics.selection.parse_ranges, default = None,
+        help = "Only these chapters, by name or by index with a '#' (e.g., '1-10,12.5,#0-#4,100-') (default: all chapters).",
+    )
+
+    parser.add_argument('--last', dest = 'last_chapters', metavar = 'N',
+        action = 'store', type = int, default = None,
+        help = "Only the newest N chapters (default: all chapters).",
+    )
+
+    parser.add_argument('--newer-than', dest = 'newer_than', metavar = 'CHAPTER',
+        action = 'store', type = str, default = None,
+        help = "Only chapters after this one (by name, or by index with a '#') (default: all chapters).",
+    )
+
+    parser.add_argument('--newest-first', dest = 'newest_first',
+        action = 'store_true', default = False,
+        help = "Plan the newest chapters first (default: %(default)s).",
+    )
+
+    parser.add_argument('--stop-at-present', dest = 'stop_at_present',
+        action = 'store_true', default = False,
+        help = "With --newest-first, stop at the first chapter the manifest shows as complete (default: %(default)s).",
+    )
+
+    parser.add_argument('--prefetch-chapters', dest = 'prefetch_chapters',
+        action = 'store', type = int, default = 0,
+        help = "The number of chapters to list images for at once (default: %(default)s).",
+    )
+
+    parser.add_argument('--use-manifest', dest = 'use_manifest',
+        action = 'store_true', default = False,
+        help = "Leave out chapters that each comic's manifest shows as complete (default: %(default)s).",
+    )
+
+    parser.add_argument('--metadata-cache-dir', dest = 'metadata_cache_dir',
+        action = 'store', type = str, default = None,
+        help = "Cache comic metadata (e.g., parsed comic pages and site tokens) in this directory between runs (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import edq.testing.unittest
+
+import comics.cli.plan
+
+class TestPlanCLI(edq.testing.unittest.BaseTest):
+    """ Test the plan CLI. """
+
+    def test_selection_options(self) -> None:
+        """ Test that newest first and stopping at present chapters are separate options. """
+
+        # [(args, expected (newest first, stop at present)), ...]
+        test_cases = [
+            ([], (False, False)),
+            (['--newest-first'], (True, False)),
+            (['--stop-at-present'], (False, True)),
+            (['--newest-first', '--stop-at-present'], (True, True)),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (args, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({args}):"):
+                selection = comics.cli.plan._get_selection(comics.cli.plan._get_parser().parse_args(['http://test.invalid'] + args))
+                self.assertEqual(expected, (selection.newest_first, selection.stop_at_present))
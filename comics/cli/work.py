@@ -0,0 +1,164 @@
+"""
+Execute planned downloads (see `comics.cli.plan`):
+claim chapters from a work queue until it is empty (optionally with several local worker processes), or run through a JSONL work list.
+Any number of these may work on the same queue at once, including on other hosts sharing the filesystem.
+"""
+
+import argparse
+import concurrent.futures
+import multiprocessing
+import sys
+import typing
+
+import comics.cli.parser
+import comics.download
+import comics.model
+import comics.plan
+import comics.store
+
+def run_cli(args: argparse.Namespace) -> int:
+    """ Run the CLI. """
+
+    if ((args.queue_path is None) == (args.plan_path is None)):
+        print("Exactly one of --queue-path or --plan-path is required.", file = sys.stderr)
+        return 2
+
+    # A dry run does not claim anything, so several processes would all go through the same items.
+    if ((args.queue_path is None) or (args.processes <= 1) or args.dry_run):
+        totals = _run_worker(args)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers = args.processes, mp_context = context) as executor:
+            futures = [executor.submit(_run_worker, args, index) for index in range(args.processes)]
+            worker_totals = [future.result() for future in futures]
+
+        totals = (
+            sum(worker_total[0] for worker_total in worker_totals),
+            sum(worker_total[1] for worker_total in worker_totals),
+            sum(worker_total[2] for worker_total in worker_totals),
+        )
+
+    chapters, missing_images, chapter_errors = totals
+    print(f"\nTotal Chapters: {chapters}, Total Missing Count: {missing_images}, Total Chapter Errors: {chapter_errors}")
+
+    if (args.queue_path is not None):
+        with comics.plan.WorkQueue(args.queue_path) as queue:
+            counts = queue.counts()
+
+        print("Queue: " + ', '.join(f"{state}: {count}" for (state, count) in sorted(counts.items())))
+
+    return min((missing_images + chapter_errors), 100)
+
+def _run_worker(args: argparse.Namespace, index: typing.Union[int, None] = None) -> typing.Tuple[int, int, int]:
+    """
+    Execute work in this process, returning the number of chapters, missing images, and chapter errors.
+    `index` is this process's place among several local worker processes (if there are several).
+    """
+
+    totals = [0, 0, 0]
+
+    def on_result(work: comics.plan.ChapterWork, result: comics.model.ChapterDownloadResult) -> None:
+        print(f"{work.comic} - {result}", flush = True)
+        if (result.error_count() > 0):
+            for image_download_result in result.image_results:
+                if (image_download_result.has_error()):
+                    print(f"    {image_download_result.image} - {image_download_result.error_text()}", flush = True)
+
+        totals[0] += 1
+        totals[1] += result.missing_count()
+        if (result.has_error()):
+            totals[2] += 1
+
+    store = None
+    if (args.image_store_dir is not None):
+        store = comics.store.ImageStore(args.image_store_dir)
+
+    options: typing.Dict[str, typing.Any] = {
+        'dry_run': args.dry_run,
+        'workers': args.workers,
+        'use_manifest': args.use_manifest,
+        'store': store,
+    }
+
+    try:
+        if (args.queue_path is not None):
+            with comics.plan.WorkQueue(args.queue_path) as queue:
+                comics.download.execute_queue(queue, worker_id = _get_worker_id(args.worker_id, index), on_result = on_result, **options)
+        else:
+            for work in comics.plan.read_jsonl(args.plan_path):
+                on_result(work, comics.download.execute(work, **options))
+    finally:
+        if (store is not None):
+            store.close()
+
+    return totals[0], totals[1], totals[2]
+
+def _get_worker_id(worker_id: typing.Union[str, None], index: typing.Union[int, None]) -> typing.Union[str, None]:
+    """
+    Get the queue ID of one of the local worker processes.
+    A given ID is shared by every process, so each process gets its own ID by adding its index
+    (otherwise, they could complete each other's items).
+    Without a given ID, each process uses its default ID (which is already unique).
+    """
+
+    if ((worker_id is None) or (index is None)):
+        return worker_id
+
+    return f"{worker_id}:{index}"
+
+def main() -> int:
+    """ Get a parser, parse the args, and call run. """
+
+    return run_cli(_get_parser().parse_args())
+
+def _get_parser() -> argparse.ArgumentParser:
+    """ Get the parser. """
+
+    parser = comics.cli.parser.get_parser(__doc__.strip(),
+        include_net = True,
+    )
+
+    parser.add_argument('--queue-path', dest = 'queue_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Claim work from the work queue in this file (default: %(default)s).",
+    )
+
+    parser.add_argument('--plan-path', dest = 'plan_path', metavar = 'PATH',
+        action = 'store', type = str, default = None,
+        help = "Execute every item in this JSONL work list, in order (default: %(default)s).",
+    )
+
+    parser.add_argument('--processes', dest = 'processes',
+        action = 'store', type = int, default = 1,
+        help = "The number of worker processes claiming from the queue (default: %(default)s).",
+    )
+
+    parser.add_argument('--worker-id', dest = 'worker_id',
+        action = 'store', type = str, default = None,
+        help = "How this worker is identified in the queue, plus each process's index if there are several (default: this host and process ID).",
+    )
+
+    parser.add_argument('--dry-run', dest = 'dry_run',
+        action = 'store_true', default = False,
+        help = "Don't download anything, or change the queue (default: %(default)s).",
+    )
+
+    parser.add_argument('--workers', dest = 'workers',
+        action = 'store', type = int, default = 1,
+        help = "The number of images to download concurrently in each process, capped by each source's limit (default: %(default)s).",
+    )
+
+    parser.add_argument('--use-manifest', dest = 'use_manifest',
+        action = 'store_true', default = False,
+        help = "Record finished chapters in each comic's manifest (default: %(default)s).",
+    )
+
+    parser.add_argument('--image-store-dir', dest = 'image_store_dir',
+        action = 'store', type = str, default = None,
+        help = "Keep images in a content-addressed store in this directory, hardlinked into chapters and never refetched (default: %(default)s).",
+    )
+
+    return parser
+
+if (__name__ == '__main__'):
+    sys.exit(main())
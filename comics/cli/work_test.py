@@ -0,0 +1,27 @@
+import edq.testing.unittest
+
+import comics.cli.work
+
+class TestWorkCLI(edq.testing.unittest.BaseTest):
+    """ Test the work CLI. """
+
+    def test_get_worker_id(self) -> None:
+        """ Test that each local worker process gets its own queue ID. """
+
+        # [(worker id, process index, expected), ...]
+        test_cases = [
+            ('a', None, 'a'),
+            ('a', 0, 'a:0'),
+            ('a', 3, 'a:3'),
+            (None, None, None),
+            (None, 2, None),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (worker_id, index, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({worker_id}, {index}):"):
+                self.assertEqual(expected, comics.cli.work._get_worker_id(worker_id, index))
+
+        ids = {comics.cli.work._get_worker_id('host', index) for index in range(4)}
+        self.assertEqual(4, len(ids))
@@ -1,100 +1,1411 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
 import logging
 import os
 import typing
 
-import edq.net.request
 import edq.util.dirent
 
+import comics.cbz
+import comics.manifest
+import comics.metrics
 import comics.model
+import comics.net
+import comics.plan
+import comics.selection
 import comics.source
+import comics.store
+import comics.transcode
 
 _logger = logging.getLogger(__name__)
 
+OUTPUT_FORMAT_DIR: str = 'dir'
+""" Write each chapter as a directory of image files. """
+
+OUTPUT_FORMAT_CBZ: str = 'cbz'
+""" Write each chapter as a CBZ archive (see comics.cbz). """
+
+OUTPUT_FORMATS: typing.List[str] = [OUTPUT_FORMAT_DIR, OUTPUT_FORMAT_CBZ]
+
+ImageSlot = typing.Callable[[], typing.AsyncContextManager[typing.Any]]
+"""
+Makes a context that must be held while an async download transfers an image,
+allowing limits to be shared between several downloads (see comics.scheduler).
+"""
+
 def download(
         comic_url: str,
         base_dir: str,
         stop_on_chapter_error: bool = False,
         overwrite: bool = False,
         dry_run: bool = False,
+        workers: int = 1,
+        prefetch_chapters: int = 0,
+        chunk_size: int = comics.net.DEFAULT_CHUNK_SIZE,
+        use_manifest: bool = False,
+        resume: bool = True,
+        output_format: str = OUTPUT_FORMAT_DIR,
+        store: typing.Union[comics.store.ImageStore, None] = None,
+        transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+        selection: typing.Union[comics.selection.ChapterSelection, None] = None,
         ) -> comics.model.DownloadResult:
-    """ Download a comic by URL. """
+    """
+    Download a comic by URL.
 
-    _logger.info("Fetching comic for '%s'.", comic_url)
+    `workers` is the number of images within a chapter that may be fetched concurrently.
+    It is capped by the source's `max_concurrency`.
+    Image results are always reported in page order.
 
-    source = comics.source.lookup(comic_url)
-    if (source is None):
-        raise ValueError(f"Could not find a matching source for '{comic_url}'.")
+    `prefetch_chapters` is the number of chapters ahead of the current one whose image lists are resolved
+    while the current chapter's images are downloading.
+    It is also capped by the source's `max_concurrency`.
 
-    comic = source.get_info_from_url(comic_url)
+    Image bodies are streamed to disk `chunk_size` bytes at a time through a partial file
+    that is only renamed into place once complete.
+    With `resume`, partial files left by interrupted transfers are continued with HTTP ranges (when the server allows it).
+
+    With `use_manifest`, a manifest (see comics.manifest) in the comic's directory records what has been downloaded.
+    Chapters it shows as complete are skipped without any requests, and only new or incomplete chapters are processed.
+
+    With an `output_format` of OUTPUT_FORMAT_CBZ, each chapter's images are added to a CBZ archive as they arrive
+    (held in memory between fetching and writing) instead of being written as loose files.
+    Images already in an archive are skipped, and archives are finalized in worker processes while later chapters download.
+
+    With a `store`, images whose URLs are already stored are taken from the store instead of being fetched,
+    and every fetched image is added to it (see comics.store).
+
+    With a `transcoder`, each chapter's images are re-encoded in the transcoder's worker processes once the chapter's images are written,
+    while later chapters download (see comics.transcode).
+    Each chapter's result is only handed back (and recorded in the manifest) once its images are encoded.
+    Transcoding is only available for OUTPUT_FORMAT_DIR.
+
+    With a `selection`, only some of the comic's chapters are processed (e.g., a range, or the last few),
+    possibly newest first and stopping at the first chapter that is already fully present (see comics.selection).
+    Chapters that are not selected cost no requests.
+
+    Timings for each phase (and counts of bytes, retries, and skips) are recorded in the result's metrics
+    and in the metrics of each chapter's result (see comics.metrics).
+
+    Downloading can also be split into planning and executing (e.g., to spread the work over several processes),
+    see plan() and execute().
+    To handle each chapter as soon as it is finished (without holding every result until the end), see stream().
+    """
+
+    with stream(comic_url, base_dir,
+            stop_on_chapter_error = stop_on_chapter_error,
+            overwrite = overwrite,
+            dry_run = dry_run,
+            workers = workers,
+            prefetch_chapters = prefetch_chapters,
+            chunk_size = chunk_size,
+            use_manifest = use_manifest,
+            resume = resume,
+            output_format = output_format,
+            store = store,
+            transcoder = transcoder,
+            selection = selection,
+    ) as download_stream:
+        chapter_download_results = list(download_stream)
+
+    result = comics.model.DownloadResult(download_stream.comic, download_stream.out_dir, chapter_download_results,
+            metrics = download_stream.metrics)
+
+    _logger.debug("Metrics for '%s': %s.", result.comic, result.metrics)
+
+    return result
+
+async def download_async(
+        comic_url: str,
+        base_dir: str,
+        stop_on_chapter_error: bool = False,
+        overwrite: bool = False,
+        dry_run: bool = False,
+        workers: int = 1,
+        prefetch_chapters: int = 0,
+        chunk_size: int = comics.net.DEFAULT_CHUNK_SIZE,
+        use_manifest: bool = False,
+        resume: bool = True,
+        image_slot: typing.Union[ImageSlot, None] = None,
+        output_format: str = OUTPUT_FORMAT_DIR,
+        store: typing.Union[comics.store.ImageStore, None] = None,
+        transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+        selection: typing.Union[comics.selection.ChapterSelection, None] = None,
+        ) -> comics.model.DownloadResult:
+    """
+    An async variant of download().
+
+    The source is queried through its async API,
+    and up to `workers` images (capped by the source's `max_concurrency`) are in flight at once.
+    No thread is held for the length of the download,
+    only blocking I/O for a single request or write is moved off of the event loop.
+
+    If given, a context from `image_slot` is also held for each image transfer,
+    so a scheduler can limit several concurrent downloads together.
+    """
+
+    download_stream = await stream_async(comic_url, base_dir,
+            stop_on_chapter_error = stop_on_chapter_error,
+            overwrite = overwrite,
+            dry_run = dry_run,
+            workers = workers,
+            prefetch_chapters = prefetch_chapters,
+            chunk_size = chunk_size,
+            use_manifest = use_manifest,
+            resume = resume,
+            image_slot = image_slot,
+            output_format = output_format,
+            store = store,
+            transcoder = transcoder,
+            selection = selection,
+    )
+
+    async with download_stream:
+        chapter_download_results = [chapter_download_result async for chapter_download_result in download_stream]
+
+    result = comics.model.DownloadResult(download_stream.comic, download_stream.out_dir, chapter_download_results,
+            metrics = download_stream.metrics)
+
+    _logger.debug("Metrics for '%s': %s.", result.comic, result.metrics)
+
+    return result
+
+class DownloadStream:
+    """
+    A comic download in progress (see stream()).
+    Iterating over it downloads the comic's chapters in order, yielding each chapter's result as soon as that chapter is finished.
+    Results are not kept, so memory use does not grow with the number of chapters.
+    A chapter written as an archive is yielded once its archive is finalized, while later chapters keep downloading.
+    Closing the stream early (or leaving its context) stops the download once the chapters already started are finished.
+    """
+
+    def __init__(self,
+            comic: comics.model.ComicInfo,
+            out_dir: str,
+            metrics: comics.metrics.Metrics,
+            chapters: typing.Generator[comics.model.ChapterDownloadResult, None, None],
+            ) -> None:
+        self.comic: comics.model.ComicInfo = comic
+        """ The comic being downloaded. """
+
+        self.out_dir: str = out_dir
+        """ The directory the comic is downloaded to. """
+
+        self.metrics: comics.metrics.Metrics = metrics
+        """ Timings and counters for work outside of any chapter (e.g., fetching the comic's info). """
+
+        self._chapters: typing.Generator[comics.model.ChapterDownloadResult, None, None] = chapters
+
+    def __iter__(self) -> typing.Iterator[comics.model.ChapterDownloadResult]:
+        return self._chapters
+
+    def close(self) -> None:
+        """ Stop the download (if it is not already done) and release its resources. """
+
+        self._chapters.close()
 
+    def __enter__(self) -> 'DownloadStream':
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+class AsyncDownloadStream:
+    """ An async variant of DownloadStream (see stream_async()). """
+
+    def __init__(self,
+            comic: comics.model.ComicInfo,
+            out_dir: str,
+            metrics: comics.metrics.Metrics,
+            chapters: typing.AsyncGenerator[comics.model.ChapterDownloadResult, None],
+            ) -> None:
+        self.comic: comics.model.ComicInfo = comic
+        """ The comic being downloaded. """
+
+        self.out_dir: str = out_dir
+        """ The directory the comic is downloaded to. """
+
+        self.metrics: comics.metrics.Metrics = metrics
+        """ Timings and counters for work outside of any chapter (e.g., fetching the comic's info). """
+
+        self._chapters: typing.AsyncGenerator[comics.model.ChapterDownloadResult, None] = chapters
+
+    def __aiter__(self) -> typing.AsyncIterator[comics.model.ChapterDownloadResult]:
+        return self._chapters
+
+    async def aclose(self) -> None:
+        """ Stop the download (if it is not already done) and release its resources. """
+
+        await self._chapters.aclose()
+
+    async def __aenter__(self) -> 'AsyncDownloadStream':
+        return self
+
+    async def __aexit__(self, *args: typing.Any) -> None:
+        await self.aclose()
+
+def stream(
+        comic_url: str,
+        base_dir: str,
+        stop_on_chapter_error: bool = False,
+        overwrite: bool = False,
+        dry_run: bool = False,
+        workers: int = 1,
+        prefetch_chapters: int = 0,
+        chunk_size: int = comics.net.DEFAULT_CHUNK_SIZE,
+        use_manifest: bool = False,
+        resume: bool = True,
+        output_format: str = OUTPUT_FORMAT_DIR,
+        store: typing.Union[comics.store.ImageStore, None] = None,
+        transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+        selection: typing.Union[comics.selection.ChapterSelection, None] = None,
+        ) -> DownloadStream:
+    """
+    Start downloading a comic by URL, see download() for the options.
+    The comic's info is fetched right away,
+    and each chapter is then downloaded as the returned stream is iterated over.
+    """
+
+    options = _DownloadOptions(stop_on_chapter_error, overwrite, dry_run, chunk_size, resume, output_format,
+            store = store, transcoder = transcoder, selection = selection)
+    source, workers = _get_source(comic_url, workers)
+
+    comic_metrics = comics.metrics.Metrics()
+    with comics.metrics.recording(comic_metrics):
+        comic = source.get_info_from_url(comic_url)
+
+    comic_out_dir = _make_comic_dir(comic, base_dir, dry_run)
+    chapters = _stream_chapters(source, comic, comic_out_dir, workers, prefetch_chapters, use_manifest, options)
+
+    return DownloadStream(comic, comic_out_dir, comic_metrics, chapters)
+
+async def stream_async(
+        comic_url: str,
+        base_dir: str,
+        stop_on_chapter_error: bool = False,
+        overwrite: bool = False,
+        dry_run: bool = False,
+        workers: int = 1,
+        prefetch_chapters: int = 0,
+        chunk_size: int = comics.net.DEFAULT_CHUNK_SIZE,
+        use_manifest: bool = False,
+        resume: bool = True,
+        image_slot: typing.Union[ImageSlot, None] = None,
+        output_format: str = OUTPUT_FORMAT_DIR,
+        store: typing.Union[comics.store.ImageStore, None] = None,
+        transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+        selection: typing.Union[comics.selection.ChapterSelection, None] = None,
+        ) -> AsyncDownloadStream:
+    """ An async variant of stream(), see download_async() for the options. """
+
+    options = _DownloadOptions(stop_on_chapter_error, overwrite, dry_run, chunk_size, resume, output_format,
+            image_slot = image_slot, store = store, transcoder = transcoder, selection = selection)
+    source, workers = _get_source(comic_url, workers)
+
+    comic_metrics = comics.metrics.Metrics()
+    with comics.metrics.recording(comic_metrics):
+        comic = await source.get_info_from_url_async(comic_url)
+
+    comic_out_dir = _make_comic_dir(comic, base_dir, dry_run)
+    chapters = _stream_chapters_async(source, comic, comic_out_dir, workers, prefetch_chapters, use_manifest, options)
+
+    return AsyncDownloadStream(comic, comic_out_dir, comic_metrics, chapters)
+
+def plan(
+        comic_url: str,
+        base_dir: str,
+        overwrite: bool = False,
+        prefetch_chapters: int = 0,
+        use_manifest: bool = False,
+        output_format: str = OUTPUT_FORMAT_DIR,
+        selection: typing.Union[comics.selection.ChapterSelection, None] = None,
+        ) -> typing.List[comics.plan.ChapterWork]:
+    """
+    The planning half of download():
+    resolve a comic, its chapters, and each chapter's images into work that execute() can carry out later
+    (possibly in other processes or on other hosts, see comics.plan).
+    No images are fetched and nothing is written.
+
+    With `use_manifest`, chapters that the comic's manifest shows as complete are left out of the plan.
+    With a `selection`, only the selected chapters are planned (in the selection's order),
+    stopping at the first chapter the manifest shows as complete if the selection says to.
+    A chapter whose images cannot be listed is still planned, and its images will be listed when it is executed.
+    """
+
+    options = _DownloadOptions(False, overwrite, True, comics.net.DEFAULT_CHUNK_SIZE, True, output_format, selection = selection)
+    source, _ = _get_source(comic_url, 1)
+
+    comic = source.get_info_from_url(comic_url)
     comic_out_dir = os.path.join(base_dir, comic.name)
+
+    # The plan carries the comic's info (e.g., what a source needs to list images), but not every chapter.
+    planned_comic = comics.model.ComicInfo(comic.url, comic.name, source_id = comic.source_id, **comic.extra_info)
+
+    manifest = _open_manifest(comic_out_dir, use_manifest, True)
+    try:
+        planned_chapters = _plan_chapters(comic, comic_out_dir, manifest, options)
+    finally:
+        if (manifest is not None):
+            manifest.close()
+
+    pending_chapters = [chapter for (chapter, result) in planned_chapters if result is None]
+    prefetcher = _ImageListPrefetcher(source, comic, pending_chapters, [comics.metrics.Metrics() for _ in pending_chapters], prefetch_chapters)
+
+    work = []
+    try:
+        for (i, chapter) in enumerate(pending_chapters):
+            _logger.info("Planning '%s' chapter '%s'.", comic, chapter)
+
+            images: typing.Union[typing.List[comics.model.ComicImage], None] = None
+            try:
+                images = prefetcher.get(i)
+            except Exception as ex:
+                _logger.warning("Failed to list images for '%s' chapter '%s', they will be listed when executing.", comic, chapter, exc_info = ex)
+
+            work.append(comics.plan.ChapterWork(planned_comic, chapter, comic_out_dir, output_format, images = images))
+    finally:
+        prefetcher.close()
+
+    return work
+
+def execute(
+        work: comics.plan.ChapterWork,
+        stop_on_chapter_error: bool = False,
+        overwrite: bool = False,
+        dry_run: bool = False,
+        workers: int = 1,
+        chunk_size: int = comics.net.DEFAULT_CHUNK_SIZE,
+        use_manifest: bool = False,
+        resume: bool = True,
+        store: typing.Union[comics.store.ImageStore, None] = None,
+        transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+        ) -> comics.model.ChapterDownloadResult:
+    """
+    The execution half of download(): download a single planned chapter (see plan()).
+    Options are the same as download()'s.
+    Archives are finalized in this process, since executing is meant to be spread over several processes already.
+    """
+
+    options = _DownloadOptions(stop_on_chapter_error, overwrite, dry_run, chunk_size, resume, work.output_format,
+            store = store, transcoder = transcoder)
+    source, workers = _get_source(work.comic.url, workers)
+
     if (not dry_run):
-        edq.util.dirent.mkdir(comic_out_dir)
+        edq.util.dirent.mkdir(work.comic_out_dir)
 
-    _logger.info("Downloading '%s' to '%s'.", comic, comic_out_dir)
+    chapter_download_result, archive = _start_chapter(work.comic, work.chapter, work.comic_out_dir, options, comics.metrics.Metrics())
+
+    manifest = _open_manifest(work.comic_out_dir, use_manifest, dry_run)
+    finisher = _ChapterFinisher(manifest, finalize_processes = 0, transcoder = _get_transcoder(options), dry_run = options.dry_run)
+
+    executor = None
+    if (workers > 1):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'comics-download')
+
+    try:
+        with comics.metrics.recording(chapter_download_result.metrics):
+            images = work.images
+            if (images is None):
+                try:
+                    with comics.metrics.timed(comics.metrics.PHASE_IMAGE_LIST):
+                        images = source.get_chapter_images(work.comic, work.chapter)
+                except Exception as ex:
+                    _record_chapter_error(work.comic, chapter_download_result, ex)
+
+                    if (stop_on_chapter_error):
+                        raise ex
+
+                    return chapter_download_result
+
+            _add_image_results(work.comic, chapter_download_result, images)
 
-    chapter_download_results: typing.List[comics.model.ChapterDownloadResult] = []
+            if (executor is None):
+                _download_images_serial(source, chapter_download_result.image_results, archive, options)
+            else:
+                _download_images_concurrent(source, executor, chapter_download_result.image_results, archive, options)
 
-    for chapter in comic.chapters:
-        _logger.info("Fetching images for '%s' chapter '%s'.", comic, chapter)
+        finisher.add(chapter_download_result, archive)
+        finisher.drain()
+    finally:
+        if (executor is not None):
+            executor.shutdown(wait = True, cancel_futures = True)
 
-        chapter_out_dir = os.path.join(comic_out_dir, str(chapter))
-        if (not dry_run):
-            edq.util.dirent.mkdir(chapter_out_dir)
+        finisher.close()
 
-        chapter_download_result = comics.model.ChapterDownloadResult(chapter, chapter_out_dir)
-        chapter_download_results.append(chapter_download_result)
+        if (manifest is not None):
+            manifest.close()
+
+    return chapter_download_result
+
+def execute_queue(
+        queue: comics.plan.WorkQueue,
+        worker_id: typing.Union[str, None] = None,
+        on_result: typing.Union[typing.Callable[[comics.plan.ChapterWork, comics.model.ChapterDownloadResult], None], None] = None,
+        **kwargs: typing.Any) -> int:
+    """
+    Claim and execute work from a queue until there is none left, returning the number of items executed.
+    Any additional arguments are passed to execute().
+    A chapter with any errors or missing images is handed back to the queue to be retried.
+
+    A dry run leaves the queue alone: it runs through the pending items (see WorkQueue.peek()) without claiming or completing any of them,
+    since a dry run fetches no images and would otherwise mark every chapter as failed.
+    """
+
+    if (kwargs.get('dry_run', False)):
+        pending = queue.peek()
+        for (_, work) in pending:
+            chapter_download_result = execute(work, **kwargs)
+            if (on_result is not None):
+                on_result(work, chapter_download_result)
+
+        return len(pending)
+
+    if (worker_id is None):
+        worker_id = comics.plan.get_default_worker_id()
+
+    count = 0
+    while True:
+        claimed = queue.claim(worker_id)
+        if (claimed is None):
+            return count
+
+        item_id, work = claimed
+        count += 1
 
         try:
-            images = source.get_chapter_images(comic, chapter)
+            chapter_download_result = execute(work, **kwargs)
         except Exception as ex:
-            _logger.error("Failed for get images for '%s' chapter '%s'.", comic, chapter, exc_info = ex)
-            chapter_download_result.error = "Failed to fetch chapter images."
-            chapter_download_result.exception = ex
+            _logger.error("Failed to execute '%s'.", work, exc_info = ex)
+            queue.complete(item_id, worker_id, error = str(ex))
+            continue
 
-            if (stop_on_chapter_error):
-                raise ex
+        error = None
+        if (chapter_download_result.has_error()):
+            error = chapter_download_result.error_text()
+        elif (chapter_download_result.missing_count() > 0):
+            error = f"Missing {chapter_download_result.missing_count()} images."
 
-            continue
+        queue.complete(item_id, worker_id, error = error)
 
-        _logger.debug("Downloading images for '%s' chapter '%s' to '%s'.", comic, chapter, chapter_out_dir)
+        if (on_result is not None):
+            on_result(work, chapter_download_result)
 
-        wait_required = False
-        for image in images:
-            out_path = os.path.join(chapter_out_dir, str(image))
+class _DownloadOptions:
+    """ The options of a download that are needed while downloading images. """
 
-            image_download_result = comics.model.ImageDownloadResult(image, out_path)
-            chapter_download_result.image_results.append(image_download_result)
+    def __init__(self,
+            stop_on_chapter_error: bool,
+            overwrite: bool,
+            dry_run: bool,
+            chunk_size: int,
+            resume: bool,
+            output_format: str,
+            image_slot: typing.Union[ImageSlot, None] = None,
+            store: typing.Union[comics.store.ImageStore, None] = None,
+            transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+            selection: typing.Union[comics.selection.ChapterSelection, None] = None,
+            ) -> None:
+        if ((transcoder is not None) and (output_format != OUTPUT_FORMAT_DIR)):
+            raise ValueError(f"Transcoding is only available for the '{OUTPUT_FORMAT_DIR}' output format.")
 
-            if (wait_required):
-                source.image_wait()
+        self.stop_on_chapter_error: bool = stop_on_chapter_error
+        self.overwrite: bool = overwrite
+        self.dry_run: bool = dry_run
+        self.chunk_size: int = chunk_size
+        self.resume: bool = resume
+        self.output_format: str = output_format
+        self.image_slot: typing.Union[ImageSlot, None] = image_slot
+        self.store: typing.Union[comics.store.ImageStore, None] = store
+        self.transcoder: typing.Union[comics.transcode.Transcoder, None] = transcoder
+        self.selection: typing.Union[comics.selection.ChapterSelection, None] = selection
 
-            wait_required = False
+def _stream_chapters(
+        source: comics.model.ComicSource,
+        comic: comics.model.ComicInfo,
+        comic_out_dir: str,
+        workers: int,
+        prefetch_chapters: int,
+        use_manifest: bool,
+        options: _DownloadOptions,
+        ) -> typing.Generator[comics.model.ChapterDownloadResult, None, None]:
+    """ Download a comic's chapters, yielding each result in order as soon as its chapter is finished. """
+
+    manifest = _open_manifest(comic_out_dir, use_manifest, options.dry_run)
+    planned_chapters = _plan_chapters(comic, comic_out_dir, manifest, options)
+    pending_chapters = [chapter for (chapter, result) in planned_chapters if result is None]
+    pending_metrics = [comics.metrics.Metrics() for _ in pending_chapters]
+
+    executor = None
+    if (workers > 1):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'comics-download')
+
+    prefetcher = _ImageListPrefetcher(source, comic, pending_chapters, pending_metrics, prefetch_chapters)
+    finisher = _ChapterFinisher(manifest, transcoder = _get_transcoder(options), dry_run = options.dry_run)
+
+    try:
+        pending_index = 0
+        for (chapter, complete_result) in planned_chapters:
+            if (complete_result is not None):
+                finisher.add(complete_result, record = False)
+                yield from finisher.pop_ready()
+                continue
+
+            chapter_download_result, archive = _start_chapter(comic, chapter, comic_out_dir, options, pending_metrics[pending_index])
+
+            pending_index += 1
+
+            try:
+                images = prefetcher.get(pending_index - 1)
+            except Exception as ex:
+                _record_chapter_error(comic, chapter_download_result, ex)
 
-            _logger.debug("Downloading image to '%s'.", out_path)
+                if (options.stop_on_chapter_error):
+                    raise ex
 
-            if ((not overwrite) and os.path.exists(out_path)):
-                _logger.debug("Image already exists, skipping: '%s'.", out_path)
-                image_download_result.already_exists = True
+                finisher.add(chapter_download_result, record = False)
+                yield from finisher.pop_ready()
                 continue
 
-            if (dry_run):
+            _add_image_results(comic, chapter_download_result, images)
+
+            with comics.metrics.recording(chapter_download_result.metrics):
+                if (executor is None):
+                    _download_images_serial(source, chapter_download_result.image_results, archive, options)
+                else:
+                    _download_images_concurrent(source, executor, chapter_download_result.image_results, archive, options)
+
+            finisher.add(chapter_download_result, archive)
+            yield from finisher.pop_ready()
+
+            if (_should_stop(options, chapter_download_result)):
+                break
+
+        yield from finisher.drain()
+    finally:
+        prefetcher.close()
+        finisher.close()
+
+        if (executor is not None):
+            executor.shutdown(wait = True, cancel_futures = True)
+
+        if (manifest is not None):
+            manifest.close()
+
+    _logger.debug("Connection stats for '%s': %s.", source, source.session.stats)
+
+async def _stream_chapters_async(
+        source: comics.model.ComicSource,
+        comic: comics.model.ComicInfo,
+        comic_out_dir: str,
+        workers: int,
+        prefetch_chapters: int,
+        use_manifest: bool,
+        options: _DownloadOptions,
+        ) -> typing.AsyncGenerator[comics.model.ChapterDownloadResult, None]:
+    """
+    An async variant of _stream_chapters().
+    Blocking bookkeeping (the manifest, chapter directories and archives, and the finisher) is run off of the event loop,
+    all in one thread of its own, since a manifest's connection may only be used by the thread that opened it.
+    """
+
+    bookkeeper = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'comics-bookkeeping')
+
+    manifest = None
+    finisher = None
+    prefetcher = None
+
+    try:
+        manifest = await _run_blocking(bookkeeper, _open_manifest, comic_out_dir, use_manifest, options.dry_run)
+        planned_chapters = await _run_blocking(bookkeeper, _plan_chapters, comic, comic_out_dir, manifest, options)
+        pending_chapters = [chapter for (chapter, result) in planned_chapters if result is None]
+        pending_metrics = [comics.metrics.Metrics() for _ in pending_chapters]
+
+        semaphore = asyncio.Semaphore(workers)
+        prefetcher = _AsyncImageListPrefetcher(source, comic, pending_chapters, pending_metrics, prefetch_chapters)
+        finisher = await _run_blocking(bookkeeper, functools.partial(_ChapterFinisher, manifest,
+                transcoder = _get_transcoder(options), dry_run = options.dry_run))
+
+        pending_index = 0
+        for (chapter, complete_result) in planned_chapters:
+            if (complete_result is not None):
+                await _run_blocking(bookkeeper, functools.partial(finisher.add, complete_result, record = False))
+                for ready_result in await _run_blocking(bookkeeper, finisher.pop_ready):
+                    yield ready_result
+
                 continue
 
+            chapter_download_result, archive = await _run_blocking(bookkeeper, _start_chapter,
+                    comic, chapter, comic_out_dir, options, pending_metrics[pending_index])
+
+            pending_index += 1
+
             try:
-                response, _ = edq.net.request.make_get(image.url, retries = comics.model.DEFAULT_RETRIES)
-                image_download_result.downloaded = True
-                wait_required = True
+                images = await prefetcher.get(pending_index - 1)
             except Exception as ex:
-                _logger.error("Failed for get image: '%s'.", image.url, exc_info = ex)
-                image_download_result.error = 'Failed to fetch image.'
-                image_download_result.exception = ex
+                _record_chapter_error(comic, chapter_download_result, ex)
 
-                if (stop_on_chapter_error):
+                if (options.stop_on_chapter_error):
                     raise ex
 
+                await _run_blocking(bookkeeper, functools.partial(finisher.add, chapter_download_result, record = False))
+                for ready_result in await _run_blocking(bookkeeper, finisher.pop_ready):
+                    yield ready_result
+
                 continue
 
-            edq.util.dirent.write_file_bytes(out_path, response.content)
+            _add_image_results(comic, chapter_download_result, images)
+
+            with comics.metrics.recording(chapter_download_result.metrics):
+                await _download_images_async(source, semaphore, chapter_download_result.image_results, archive, options)
+
+            await _run_blocking(bookkeeper, finisher.add, chapter_download_result, archive)
+            for ready_result in await _run_blocking(bookkeeper, finisher.pop_ready):
+                yield ready_result
+
+            if (_should_stop(options, chapter_download_result)):
+                break
+
+        # Wait for archives without holding up the bookkeeping thread, the manifest is then updated there.
+        await asyncio.to_thread(finisher.wait)
+        for ready_result in await _run_blocking(bookkeeper, finisher.drain):
+            yield ready_result
+    finally:
+        if (prefetcher is not None):
+            await prefetcher.close()
+
+        if (finisher is not None):
+            await asyncio.to_thread(finisher.wait)
+            await _run_blocking(bookkeeper, finisher.close)
+
+        if (manifest is not None):
+            await _run_blocking(bookkeeper, manifest.close)
+
+        bookkeeper.shutdown(wait = False)
+
+    _logger.debug("Connection stats for '%s': %s.", source, source.session.stats)
+
+async def _run_blocking(executor: concurrent.futures.Executor, function: typing.Callable[..., typing.Any], *args: typing.Any) -> typing.Any:
+    """ Run a blocking call in an executor (in a copy of the caller's context, so metrics still follow) and wait for it. """
+
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, function, *args))
+
+class _ImageListPrefetcher:
+    """
+    Resolves chapter image lists in order,
+    keeping the lists for up to `depth` chapters past the current one in flight in the background.
+    A depth of zero fetches each list only when it is asked for.
+
+    Lists are resolved in batches through ComicSource.get_chapter_images_batch() (see _get_batch_size()),
+    so a source that can list several chapters per request needs far fewer round trips.
+    Other sources list each chapter on its own, with the chapters in the prefetch window listed concurrently
+    (the current chapter is always submitted first).
+    Each batch is recorded in the metrics of its first chapter, regardless of which chapter is current.
+    """
+
+    def __init__(self,
+            source: comics.model.ComicSource,
+            comic: comics.model.ComicInfo,
+            chapters: typing.List[comics.model.ComicChapter],
+            metrics: typing.List[comics.metrics.Metrics],
+            depth: int,
+            ) -> None:
+        self._source: comics.model.ComicSource = source
+        self._comic: comics.model.ComicInfo = comic
+        self._chapters: typing.List[comics.model.ComicChapter] = chapters
+        self._metrics: typing.List[comics.metrics.Metrics] = metrics
+        self._depth: int = max(0, min(depth, source.max_concurrency))
+        self._batch_size: int = _get_batch_size(source)
+
+        self._executor: typing.Union[concurrent.futures.ThreadPoolExecutor, None] = None
+        if (self._depth > 0):
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = _get_batch_workers(source, self._depth),
+                    thread_name_prefix = 'comics-prefetch')
+
+        # The batch (and where it starts) that each submitted chapter is in.
+        self._batches: typing.Dict[int, typing.Tuple[int, concurrent.futures.Future]] = {}
+        self._next_index: int = 0
+
+    def get(self, index: int) -> typing.List[comics.model.ComicImage]:
+        """ Get the images for the chapter at the given index, raising anything the source raised. """
+
+        last_index = min(index + self._depth, len(self._chapters) - 1)
+        while (self._next_index <= last_index):
+            start, end = self._next_index, min(self._next_index + self._batch_size, len(self._chapters))
+
+            future: concurrent.futures.Future
+            if (self._executor is None):
+                future = concurrent.futures.Future()
+                future.set_result(self._fetch(start, end))
+            else:
+                future = self._executor.submit(self._fetch, start, end)
+
+            for batch_index in range(start, end):
+                self._batches[batch_index] = (start, future)
+
+            self._next_index = end
+
+        start, future = self._batches.pop(index)
+        return _unpack_result(future.result()[index - start])
+
+    def _fetch(self, start: int, end: int) -> typing.List[typing.Union[typing.List[comics.model.ComicImage], Exception]]:
+        """ Fetch the images for the chapters in the given range. """
+
+        with comics.metrics.recording(self._metrics[start]), comics.metrics.timed(comics.metrics.PHASE_IMAGE_LIST):
+            return self._source.get_chapter_images_batch(self._comic, self._chapters[start:end])
+
+    def close(self) -> None:
+        """ Stop any outstanding work. """
+
+        if (self._executor is not None):
+            self._executor.shutdown(wait = True, cancel_futures = True)
+
+class _AsyncImageListPrefetcher:
+    """ An async variant of _ImageListPrefetcher. """
+
+    def __init__(self,
+            source: comics.model.ComicSource,
+            comic: comics.model.ComicInfo,
+            chapters: typing.List[comics.model.ComicChapter],
+            metrics: typing.List[comics.metrics.Metrics],
+            depth: int,
+            ) -> None:
+        self._source: comics.model.ComicSource = source
+        self._comic: comics.model.ComicInfo = comic
+        self._chapters: typing.List[comics.model.ComicChapter] = chapters
+        self._metrics: typing.List[comics.metrics.Metrics] = metrics
+        self._depth: int = max(0, min(depth, source.max_concurrency))
+        self._batch_size: int = _get_batch_size(source)
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(_get_batch_workers(source, self._depth))
+
+        self._batches: typing.Dict[int, typing.Tuple[int, asyncio.Future]] = {}
+        self._next_index: int = 0
+
+    async def get(self, index: int) -> typing.List[comics.model.ComicImage]:
+        """ Get the images for the chapter at the given index, raising anything the source raised. """
+
+        last_index = min(index + self._depth, len(self._chapters) - 1)
+        while (self._next_index <= last_index):
+            start, end = self._next_index, min(self._next_index + self._batch_size, len(self._chapters))
+            task = asyncio.ensure_future(self._fetch(start, end))
+
+            for batch_index in range(start, end):
+                self._batches[batch_index] = (start, task)
+
+            self._next_index = end
+
+        start, batch = self._batches.pop(index)
+        results = await batch
+        return _unpack_result(results[index - start])
+
+    async def _fetch(self, start: int, end: int) -> typing.List[typing.Union[typing.List[comics.model.ComicImage], Exception]]:
+        """ Fetch the images for the chapters in the given range. """
+
+        async with self._semaphore:
+            with comics.metrics.recording(self._metrics[start]), comics.metrics.timed(comics.metrics.PHASE_IMAGE_LIST):
+                return await self._source.get_chapter_images_batch_async(self._comic, self._chapters[start:end])
+
+    async def close(self) -> None:
+        """ Stop any outstanding work. """
+
+        # Chapters in the same batch share a task.
+        tasks: typing.List[asyncio.Future] = []
+        for (_, task) in self._batches.values():
+            if (not any(task is seen for seen in tasks)):
+                task.cancel()
+                tasks.append(task)
+
+        await asyncio.gather(*tasks, return_exceptions = True)
+        self._batches.clear()
+
+def _get_batch_size(source: comics.model.ComicSource) -> int:
+    """
+    Get the number of chapters to resolve in each batch.
+    A source that can list several chapters per request (see ComicSource.chapter_batch_size) gets batches of that size.
+    Otherwise, each chapter is its own batch, so the current chapter never waits on a slower chapter past it.
+    """
+
+    return source.chapter_batch_size
+
+def _get_batch_workers(source: comics.model.ComicSource, depth: int) -> int:
+    """
+    Get the number of batches that may be resolved at once.
+    A source without batches lists the current chapter and the `depth` chapters past it concurrently (up to its `max_concurrency`).
+    """
+
+    if (source.chapter_batch_size > 1):
+        return max(1, depth)
+
+    return max(1, min(depth + 1, source.max_concurrency))
+
+def _unpack_result(result: typing.Union[typing.List[comics.model.ComicImage], Exception]) -> typing.List[comics.model.ComicImage]:
+    """ Get a chapter's images from its batch result, raising the chapter's exception if it failed. """
+
+    if (isinstance(result, Exception)):
+        raise result
+
+    return result
+
+class _ChapterFinisher:
+    """
+    Hands back finished chapters in order,
+    recording them in the manifest (if there is one) once any archive they have is finalized (in worker processes)
+    and any images they have are transcoded (in the transcoder's worker processes).
+    Chapters are recorded in the thread that created the finisher.
+    On a dry run, nothing on disk is touched (not even a partial archive left by an interrupted run).
+    """
+
+    def __init__(self,
+            manifest: typing.Union[comics.manifest.Manifest, None],
+            finalize_processes: int = comics.cbz.DEFAULT_FINALIZE_PROCESSES,
+            transcoder: typing.Union[comics.transcode.Transcoder, None] = None,
+            dry_run: bool = False,
+            ) -> None:
+        self._manifest: typing.Union[comics.manifest.Manifest, None] = manifest
+        self._dry_run: bool = dry_run
+        self._finalizer: comics.cbz.Finalizer = comics.cbz.Finalizer(finalize_processes)
+        self._transcoder: typing.Union[comics.transcode.Transcoder, None] = transcoder
+        self._pending: typing.Deque[_PendingChapter] = collections.deque()
+
+    def add(self,
+            chapter_download_result: comics.model.ChapterDownloadResult,
+            archive: typing.Union[comics.cbz.ChapterArchive, None] = None,
+            record: bool = True,
+            ) -> None:
+        """
+        Add a chapter whose images are done,
+        starting to finalize its archive or transcode its images, and (unless told not to) recording it when ready.
+        """
+
+        pending = _PendingChapter(chapter_download_result, record)
+
+        if ((archive is not None) and (not self._dry_run) and archive.needs_finalizing()):
+            names = [str(image_download_result.image) for image_download_result in chapter_download_result.image_results]
+            pending.archive_future = self._finalizer.submit(archive, names)
+
+        if ((archive is None) and (self._transcoder is not None) and record):
+            pending.transcoded = comics.transcode.read_map(chapter_download_result.out_path)
+            done_names = set(pending.transcoded.values())
+
+            for image_download_result in chapter_download_result.image_results:
+                if (not (image_download_result.downloaded or image_download_result.already_exists)):
+                    continue
+
+                name = os.path.basename(image_download_result.out_path)
+                if ((name in done_names) or (not self._transcoder.wants(image_download_result.out_path))):
+                    continue
+
+                future = self._transcoder.submit(image_download_result.out_path)
+                pending.transcodes.append((image_download_result, name, future))
+
+        self._pending.append(pending)
+
+    def pop_ready(self) -> typing.List[comics.model.ChapterDownloadResult]:
+        """ Take (and record) the chapters at the front that are completely finished. """
+
+        ready = []
+        while (len(self._pending) > 0):
+            pending = self._pending[0]
+            if (not all(future.done() for future in pending.get_futures())):
+                break
+
+            self._pending.popleft()
+
+            chapter_download_result = pending.chapter_download_result
+
+            if (pending.archive_future is not None):
+                _check_finalized(chapter_download_result, pending.archive_future)
+
+            if (len(pending.transcodes) > 0):
+                _apply_transcodes(pending)
+
+            if (pending.record and (self._manifest is not None)):
+                self._manifest.record_chapter(chapter_download_result)
+
+            ready.append(chapter_download_result)
+
+        return ready
+
+    def wait(self) -> None:
+        """ Wait for all archives to be finalized and all images to be transcoded (without recording anything). """
+
+        concurrent.futures.wait([future for pending in self._pending for future in pending.get_futures()])
+
+    def drain(self) -> typing.List[comics.model.ChapterDownloadResult]:
+        """ Wait for all outstanding work, and take (and record) every remaining chapter. """
+
+        self.wait()
+        return self.pop_ready()
+
+    def close(self) -> None:
+        """ Finish any remaining chapters and stop finalizing. """
+
+        self.drain()
+        self._finalizer.close()
+
+class _PendingChapter:
+    """ A chapter waiting on the finisher. """
+
+    def __init__(self, chapter_download_result: comics.model.ChapterDownloadResult, record: bool) -> None:
+        self.chapter_download_result: comics.model.ChapterDownloadResult = chapter_download_result
+        self.record: bool = record
+
+        self.archive_future: typing.Union[concurrent.futures.Future, None] = None
+
+        self.transcodes: typing.List[typing.Tuple[comics.model.ImageDownloadResult, str, concurrent.futures.Future]] = []
+        """ Each image being transcoded, along with the name it was downloaded as. """
+
+        self.transcoded: typing.Dict[str, str] = {}
+        """ The chapter's transcode map (see comics.transcode.read_map()). """
+
+    def get_futures(self) -> typing.List[concurrent.futures.Future]:
+        """ Get all the work this chapter is waiting on. """
+
+        futures = [future for (_, _, future) in self.transcodes]
+        if (self.archive_future is not None):
+            futures.append(self.archive_future)
+
+        return futures
+
+def _check_finalized(chapter_download_result: comics.model.ChapterDownloadResult, future: concurrent.futures.Future) -> None:
+    """ Note if a chapter's archive could not be finalized. """
+
+    try:
+        future.result()
+    except Exception as ex:
+        _logger.error("Failed to finalize archive for chapter '%s'.", chapter_download_result.chapter, exc_info = ex)
+        chapter_download_result.error = "Failed to finalize chapter archive."
+        chapter_download_result.exception = ex
+        chapter_download_result.metrics.add(comics.metrics.COUNTER_CHAPTERS_FAILED)
+
+def _apply_transcodes(pending: _PendingChapter) -> None:
+    """
+    Point a chapter's image results at their transcoded files and record the chapter's transcode map.
+    An image that could not be transcoded is left as it was downloaded.
+    """
+
+    chapter_download_result = pending.chapter_download_result
+    metrics = chapter_download_result.metrics
+
+    for (image_download_result, name, future) in pending.transcodes:
+        try:
+            out_path, original_size, encoded_size, secs = future.result()
+        except Exception as ex:
+            _logger.warning("Failed to transcode image, keeping the original: '%s'.", image_download_result.out_path, exc_info = ex)
+            continue
+
+        image_download_result.out_path = out_path
+        pending.transcoded[name] = os.path.basename(out_path)
+
+        metrics.add_time(comics.metrics.PHASE_TRANSCODE, secs)
+        if (encoded_size < original_size):
+            metrics.add(comics.metrics.COUNTER_IMAGES_TRANSCODED)
+            metrics.add(comics.metrics.COUNTER_TRANSCODE_BYTES_SAVED, original_size - encoded_size)
+
+    try:
+        comics.transcode.write_map(chapter_download_result.out_path, pending.transcoded)
+    except OSError as ex:
+        _logger.warning("Failed to record transcoded images for chapter '%s'.", chapter_download_result.chapter, exc_info = ex)
+
+def _get_transcoder(options: _DownloadOptions) -> typing.Union[comics.transcode.Transcoder, None]:
+    """ Get the transcoder that finished chapters should go through (none for a dry run, since nothing was written). """
+
+    if (options.dry_run):
+        return None
+
+    return options.transcoder
+
+def _should_stop(options: _DownloadOptions, chapter_download_result: comics.model.ChapterDownloadResult) -> bool:
+    """ Check if the selection says to stop after this chapter (see comics.selection.ChapterSelection.stop_at_present). """
+
+    if (options.selection is None):
+        return False
+
+    if (options.selection.should_stop(chapter_download_result)):
+        _logger.info("Stopping at chapter '%s', it is already fully present.", chapter_download_result.chapter)
+        return True
+
+    return False
+
+def _get_source(comic_url: str, workers: int) -> typing.Tuple[comics.model.ComicSource, int]:
+    """ Find the source for a comic and the number of workers it allows. """
+
+    _logger.info("Fetching comic for '%s'.", comic_url)
+
+    source = comics.source.lookup(comic_url)
+    if (source is None):
+        raise ValueError(f"Could not find a matching source for '{comic_url}'.")
+
+    return source, max(1, min(workers, source.max_concurrency))
+
+def _make_comic_dir(comic: comics.model.ComicInfo, base_dir: str, dry_run: bool) -> str:
+    """ Create (unless this is a dry run) and return the output directory for a comic. """
+
+    comic_out_dir = os.path.join(base_dir, comic.name)
+    if (not dry_run):
+        edq.util.dirent.mkdir(comic_out_dir)
+
+    _logger.info("Downloading '%s' to '%s'.", comic, comic_out_dir)
+
+    return comic_out_dir
+
+def _open_manifest(comic_out_dir: str, use_manifest: bool, dry_run: bool) -> typing.Union[comics.manifest.Manifest, None]:
+    """ Open the comic's manifest if one is being used (read-only for dry runs). """
+
+    if (not use_manifest):
+        return None
+
+    return comics.manifest.Manifest(comic_out_dir, read_only = dry_run)
+
+def _plan_chapters(
+        comic: comics.model.ComicInfo,
+        comic_out_dir: str,
+        manifest: typing.Union[comics.manifest.Manifest, None],
+        options: _DownloadOptions,
+        ) -> typing.List[typing.Tuple[comics.model.ComicChapter, typing.Union[comics.model.ChapterDownloadResult, None]]]:
+    """
+    Pair each (selected) chapter with a result if the manifest shows it as already complete, or None if it still needs to be processed.
+    """
+
+    chapters = comic.chapters
+    if (options.selection is not None):
+        chapters = options.selection.select(chapters)
+
+    planned_chapters = []
+    for chapter in chapters:
+        complete_result = None
+        if ((manifest is not None) and (not options.overwrite)):
+            complete_result = manifest.get_complete_chapter(chapter, _chapter_out_path(comic_out_dir, chapter, options))
+
+        if (complete_result is not None):
+            _logger.debug("Skipping complete chapter '%s' chapter '%s'.", comic, chapter)
+            complete_result.metrics.add(comics.metrics.COUNTER_CHAPTERS_SKIPPED)
+            complete_result.metrics.add(comics.metrics.COUNTER_IMAGES_SKIPPED, len(complete_result.image_results))
+
+        planned_chapters.append((chapter, complete_result))
+
+        if ((complete_result is not None) and _should_stop(options, complete_result)):
+            break
+
+    return planned_chapters
+
+def _chapter_out_path(comic_out_dir: str, chapter: comics.model.ComicChapter, options: _DownloadOptions) -> str:
+    """ Get the output directory (or archive) for a chapter. """
+
+    out_path = os.path.join(comic_out_dir, str(chapter))
+    if (options.output_format == OUTPUT_FORMAT_CBZ):
+        out_path += comics.cbz.EXTENSION
+
+    return out_path
+
+def _start_chapter(
+        comic: comics.model.ComicInfo,
+        chapter: comics.model.ComicChapter,
+        comic_out_dir: str,
+        options: _DownloadOptions,
+        metrics: comics.metrics.Metrics,
+        ) -> typing.Tuple[comics.model.ChapterDownloadResult, typing.Union[comics.cbz.ChapterArchive, None]]:
+    """
+    Create an empty result for a chapter,
+    along with either its output directory (created unless this is a dry run) or its archive.
+    """
+
+    _logger.info("Fetching images for '%s' chapter '%s'.", comic, chapter)
+
+    chapter_out_path = _chapter_out_path(comic_out_dir, chapter, options)
+    chapter_download_result = comics.model.ChapterDownloadResult(chapter, chapter_out_path, metrics = metrics)
+
+    if (options.output_format == OUTPUT_FORMAT_CBZ):
+        return chapter_download_result, comics.cbz.ChapterArchive(chapter_out_path, overwrite = options.overwrite)
+
+    if (not options.dry_run):
+        edq.util.dirent.mkdir(chapter_out_path)
+
+    return chapter_download_result, None
+
+def _record_chapter_error(
+        comic: comics.model.ComicInfo,
+        chapter_download_result: comics.model.ChapterDownloadResult,
+        ex: Exception,
+        ) -> None:
+    """ Note that a chapter's images could not be fetched. """
+
+    _logger.error("Failed for get images for '%s' chapter '%s'.", comic, chapter_download_result.chapter, exc_info = ex)
+    chapter_download_result.error = "Failed to fetch chapter images."
+    chapter_download_result.exception = ex
+    chapter_download_result.metrics.add(comics.metrics.COUNTER_CHAPTERS_FAILED)
+
+def _add_image_results(
+        comic: comics.model.ComicInfo,
+        chapter_download_result: comics.model.ChapterDownloadResult,
+        images: typing.List[comics.model.ComicImage],
+        ) -> None:
+    """
+    Add an (empty) result for each image in page order, ahead of any downloading.
+    An image that was transcoded in an earlier download points at its encoded file (if that file is still there).
+    """
+
+    _logger.debug("Downloading images for '%s' chapter '%s' to '%s'.", comic, chapter_download_result.chapter, chapter_download_result.out_path)
+
+    transcoded = {}
+    if (not comics.cbz.is_archive_path(chapter_download_result.out_path)):
+        transcoded = comics.transcode.read_map(chapter_download_result.out_path)
+
+    for image in images:
+        out_path = os.path.join(chapter_download_result.out_path, str(image))
+
+        encoded_name = transcoded.get(str(image), None)
+        if (encoded_name is not None):
+            encoded_path = os.path.join(chapter_download_result.out_path, encoded_name)
+            if (os.path.exists(encoded_path)):
+                out_path = encoded_path
+
+        chapter_download_result.add_image_result(comics.model.ImageDownloadResult(image, out_path))
+
+def _download_images_serial(
+        source: comics.model.ComicSource,
+        image_results: typing.List[comics.model.ImageDownloadResult],
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """ Download a chapter's images one at a time. """
+
+    for image_download_result in image_results:
+        _download_image(source, image_download_result, archive, options)
+
+        if (options.stop_on_chapter_error and (image_download_result.exception is not None)):
+            raise image_download_result.exception
+
+def _download_images_concurrent(
+        source: comics.model.ComicSource,
+        executor: concurrent.futures.ThreadPoolExecutor,
+        image_results: typing.List[comics.model.ImageDownloadResult],
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """
+    Download a chapter's images using a pool of workers.
+    Results are written into the (already ordered) `image_results`,
+    so page order is kept regardless of completion order.
+    """
+
+    # Each worker runs in a copy of the current context, so it records into the chapter's metrics.
+    futures = [executor.submit(contextvars.copy_context().run, _worker_download_image, source, image_download_result, archive, options)
+            for image_download_result in image_results]
+
+    # Any failure that escapes a worker stops the rest of the chapter.
+    _, not_done = concurrent.futures.wait(futures, return_when = concurrent.futures.FIRST_EXCEPTION)
+    for future in not_done:
+        future.cancel()
+
+    # Let any in-flight downloads finish before reporting.
+    concurrent.futures.wait(not_done)
+
+    # Raise the first failure in page order.
+    for future in futures:
+        if (not future.cancelled()):
+            future.result()
+
+def _worker_download_image(
+        source: comics.model.ComicSource,
+        image_download_result: comics.model.ImageDownloadResult,
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """ Download an image inside a worker. """
+
+    _download_image(source, image_download_result, archive, options)
+
+    if (options.stop_on_chapter_error and (image_download_result.exception is not None)):
+        raise image_download_result.exception
+
+async def _download_images_async(
+        source: comics.model.ComicSource,
+        semaphore: asyncio.Semaphore,
+        image_results: typing.List[comics.model.ImageDownloadResult],
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """
+    Download a chapter's images as concurrent tasks limited by the semaphore.
+    Results are written into the (already ordered) `image_results`.
+    """
+
+    tasks = [asyncio.ensure_future(_task_download_image(source, semaphore, image_download_result, archive, options))
+            for image_download_result in image_results]
+
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions = True)
+        raise
+
+async def _task_download_image(
+        source: comics.model.ComicSource,
+        semaphore: asyncio.Semaphore,
+        image_download_result: comics.model.ImageDownloadResult,
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """ Download an image inside a task. """
+
+    if (not _check_image_needed(image_download_result, archive, options)):
+        return
+
+    image = image_download_result.image
+
+    try:
+        if ((options.store is not None) and (await asyncio.to_thread(_fill_from_store, image_download_result, archive, options))):
+            image_download_result.downloaded = True
+        else:
+            async with _hold_image_slot(semaphore, options):
+                if (archive is None):
+                    await source.session.download_file_async(image.url, image_download_result.out_path,
+                            chunk_size = options.chunk_size, retries = source.retries, resume = options.resume)
+                    await asyncio.to_thread(_add_to_store, image_download_result, None, options)
+                else:
+                    data = await source.session.fetch_bytes_async(image.url, chunk_size = options.chunk_size, retries = source.retries)
+                    await asyncio.to_thread(_add_to_archive, image_download_result, archive, data, options)
+
+            image_download_result.downloaded = True
+            comics.metrics.add(comics.metrics.COUNTER_IMAGES_DOWNLOADED)
+    except Exception as ex:
+        _record_image_error(image_download_result, ex)
+
+    if (options.stop_on_chapter_error and (image_download_result.exception is not None)):
+        raise image_download_result.exception
+
+@contextlib.asynccontextmanager
+async def _hold_image_slot(semaphore: asyncio.Semaphore, options: _DownloadOptions) -> typing.AsyncIterator[None]:
+    """ Hold this download's semaphore and then any shared slot for the length of an image transfer. """
+
+    async with semaphore:
+        if (options.image_slot is None):
+            yield
+            return
+
+        async with options.image_slot():
+            yield
+
+def _download_image(
+        source: comics.model.ComicSource,
+        image_download_result: comics.model.ImageDownloadResult,
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """ Download a single image (to its own file or into the chapter's archive), recording the outcome in the result. """
+
+    if (not _check_image_needed(image_download_result, archive, options)):
+        return
+
+    image = image_download_result.image
+
+    try:
+        if (_fill_from_store(image_download_result, archive, options)):
+            image_download_result.downloaded = True
+            return
+
+        if (archive is None):
+            source.session.download_file(image.url, image_download_result.out_path,
+                    chunk_size = options.chunk_size, retries = source.retries, resume = options.resume)
+            _add_to_store(image_download_result, None, options)
+        else:
+            data = source.session.fetch_bytes(image.url, chunk_size = options.chunk_size, retries = source.retries)
+            _add_to_archive(image_download_result, archive, data, options)
+
+        image_download_result.downloaded = True
+        comics.metrics.add(comics.metrics.COUNTER_IMAGES_DOWNLOADED)
+    except Exception as ex:
+        _record_image_error(image_download_result, ex)
+
+def _fill_from_store(
+        image_download_result: comics.model.ImageDownloadResult,
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> bool:
+    """ Write an image from the store (if the store has its URL), returning True if it did. """
+
+    if (options.store is None):
+        return False
+
+    image = image_download_result.image
+
+    if (archive is None):
+        found = options.store.link(image.url, image_download_result.out_path)
+    else:
+        data = options.store.read(image.url)
+        found = (data is not None)
+        if (data is not None):
+            archive.add(str(image), data)
+
+    if (found):
+        _logger.debug("Image taken from the store: '%s'.", image.url)
+        comics.metrics.add(comics.metrics.COUNTER_IMAGES_FROM_STORE)
+
+    return found
+
+def _add_to_archive(
+        image_download_result: comics.model.ImageDownloadResult,
+        archive: comics.cbz.ChapterArchive,
+        data: bytes,
+        options: _DownloadOptions,
+        ) -> None:
+    """ Add a fetched image to the chapter's archive (and the store). """
+
+    archive.add(str(image_download_result.image), data)
+    _add_to_store(image_download_result, data, options)
+
+def _add_to_store(
+        image_download_result: comics.model.ImageDownloadResult,
+        data: typing.Union[bytes, None],
+        options: _DownloadOptions,
+        ) -> None:
+    """ Add a fetched image (its bytes or, if not given, its file) to the store (if there is one). """
+
+    if (options.store is None):
+        return
+
+    with comics.metrics.timed(comics.metrics.PHASE_DISK_WRITE):
+        if (data is None):
+            options.store.add_file(image_download_result.image.url, image_download_result.out_path)
+        else:
+            options.store.add_bytes(image_download_result.image.url, data)
+
+def _check_image_needed(
+        image_download_result: comics.model.ImageDownloadResult,
+        archive: typing.Union[comics.cbz.ChapterArchive, None],
+        options: _DownloadOptions,
+        ) -> bool:
+    """ Check if an image actually needs to be fetched, noting if it already exists (as a file or in the chapter's archive). """
+
+    out_path = image_download_result.out_path
+
+    _logger.debug("Downloading image to '%s'.", out_path)
+
+    if (archive is None):
+        exists = os.path.exists(out_path)
+    else:
+        exists = archive.contains(str(image_download_result.image))
+
+    if ((not options.overwrite) and exists):
+        _logger.debug("Image already exists, skipping: '%s'.", out_path)
+        image_download_result.already_exists = True
+        comics.metrics.add(comics.metrics.COUNTER_IMAGES_SKIPPED)
+        return False
+
+    return (not options.dry_run)
+
+def _record_image_error(image_download_result: comics.model.ImageDownloadResult, ex: Exception) -> None:
+    """ Note that an image could not be fetched. """
 
-    return comics.model.DownloadResult(comic, comic_out_dir, chapter_download_results)
+    _logger.error("Failed for get image: '%s'.", image_download_result.image.url, exc_info = ex)
+    image_download_result.error = 'Failed to fetch image.'
+    image_download_result.exception = ex
+    comics.metrics.add(comics.metrics.COUNTER_IMAGES_FAILED)
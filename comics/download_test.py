@@ -0,0 +1,516 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+import typing
+import unittest.mock
+import zipfile
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.bench.server
+import comics.cbz
+import comics.download
+import comics.manifest
+import comics.metrics
+import comics.model
+import comics.selection
+import comics.source
+import comics.sources.coffeemanga_to
+
+FAKE_CHAPTER_COUNT: int = 7
+FAKE_IMAGE_COUNT: int = 2
+
+_fake_host_lock: threading.Lock = threading.Lock()
+_fake_host_count: int = 0  # pylint: disable=invalid-name
+
+class FakeSource(comics.model.ComicSource):
+    """
+    A source that makes no requests.
+    It lists a fixed set of chapters, and records every batch of chapters it is asked to list.
+    """
+
+    def __init__(self, failing_chapters: typing.Union[typing.Set[int], None] = None, **kwargs: typing.Any) -> None:
+        super().__init__('fake', **kwargs)
+
+        self.failing_chapters: typing.Set[int] = failing_chapters or set()
+        self.batch_sizes: typing.List[int] = []
+        self.listed_chapters: typing.List[int] = []
+
+        self._lock: threading.Lock = threading.Lock()
+
+    def get_info_from_url(self, url: str) -> comics.model.ComicInfo:
+        chapters = [comics.model.ComicChapter(url, index = i, source_id = str(i), name = str(i + 1)) for i in range(FAKE_CHAPTER_COUNT)]
+        return comics.model.ComicInfo(url, 'Fake Comic', chapters = chapters)
+
+    def get_chapter_images(self, comic: comics.model.ComicInfo, chapter: comics.model.ComicChapter) -> typing.List[comics.model.ComicImage]:
+        with self._lock:
+            self.listed_chapters.append(chapter.index)
+
+        if (chapter.index in self.failing_chapters):
+            raise ValueError(f"Chapter {chapter.index} is broken.")
+
+        return [comics.model.ComicImage(f"{comic.url}/{chapter.index}/{i}.jpg", index = i) for i in range(FAKE_IMAGE_COUNT)]
+
+    def get_chapter_images_batch(self,
+            comic: comics.model.ComicInfo,
+            chapters: typing.List[comics.model.ComicChapter],
+            ) -> typing.List[typing.Union[typing.List[comics.model.ComicImage], Exception]]:
+        with self._lock:
+            self.batch_sizes.append(len(chapters))
+
+        return super().get_chapter_images_batch(comic, chapters)
+
+    async def get_chapter_images_batch_async(self,
+            comic: comics.model.ComicInfo,
+            chapters: typing.List[comics.model.ComicChapter],
+            ) -> typing.List[typing.Union[typing.List[comics.model.ComicImage], Exception]]:
+        with self._lock:
+            self.batch_sizes.append(len(chapters))
+
+        return await super().get_chapter_images_batch_async(comic, chapters)
+
+class _SlowSource(FakeSource):
+    """ A fake source that does not finish listing one chapter until it is released (or a few seconds have passed). """
+
+    def __init__(self, slow_chapter: int, release: threading.Event, **kwargs: typing.Any) -> None:
+        super().__init__(**kwargs)
+
+        self.slow_chapter: int = slow_chapter
+        self.release: threading.Event = release
+
+        self.slow_finished_first: bool = False
+        """ If the slow chapter finished listing without being released. """
+
+    def get_chapter_images(self, comic: comics.model.ComicInfo, chapter: comics.model.ComicChapter) -> typing.List[comics.model.ComicImage]:
+        if (chapter.index == self.slow_chapter):
+            self.slow_finished_first = (not self.release.wait(timeout = 3.0))
+
+        return super().get_chapter_images(comic, chapter)
+
+def register_fake_source(source: comics.model.ComicSource) -> str:
+    """ Register a source under a new (unresolvable) host and return a comic URL on that host. """
+
+    global _fake_host_count  # pylint: disable=global-statement
+
+    with _fake_host_lock:
+        _fake_host_count += 1
+        url = f"http://fake-{_fake_host_count}.test.invalid"
+
+    comics.source.register(url, source)
+    return f"{url}/series/fake"
+
+STAND_IN_CHAPTER_COUNT: int = 3
+STAND_IN_IMAGE_COUNT: int = 8
+
+_stand_in_server: typing.Union[comics.bench.server.StandInServer, None] = None  # pylint: disable=invalid-name
+
+@contextlib.contextmanager
+def stand_in_server(**options: typing.Any) -> typing.Iterator[comics.bench.server.StandInServer]:
+    """
+    Get the stand-in server (see comics.bench.server) shared by all tests, with some of its options changed for the duration of the context.
+    The server (and its source, which can only be registered once for its host) is started on first use and runs until the tests exit.
+    """
+
+    global _stand_in_server  # pylint: disable=global-statement
+
+    with _fake_host_lock:
+        if (_stand_in_server is None):
+            server_options = comics.bench.server.ServerOptions(chapter_count = STAND_IN_CHAPTER_COUNT, images_per_chapter = STAND_IN_IMAGE_COUNT)
+            _stand_in_server = comics.bench.server.StandInServer(server_options).start()
+
+            source = comics.sources.coffeemanga_to.ComicSource(base_url = _stand_in_server.base_url, rate_per_sec = 1000.0)
+            comics.source.register(_stand_in_server.base_url, source)
+
+        server = _stand_in_server
+
+    old_options = {name: getattr(server.options, name) for name in options}
+    for (name, value) in options.items():
+        setattr(server.options, name, value)
+
+    try:
+        yield server
+    finally:
+        for (name, value) in old_options.items():
+            setattr(server.options, name, value)
+
+def _stream_dry_run(
+        url: str,
+        base_dir: str,
+        prefetch_chapters: int,
+        use_async: bool,
+        source: FakeSource,
+        ) -> typing.Tuple[typing.List[int], typing.List[comics.model.ChapterDownloadResult]]:
+    """ Stream a dry run, returning the chapters that had been listed when the first chapter came back, and every chapter's result. """
+
+    if (not use_async):
+        with comics.download.stream(url, base_dir, dry_run = True, prefetch_chapters = prefetch_chapters) as download_stream:
+            iterator = iter(download_stream)
+            results = [next(iterator)]
+            first_listed = sorted(source.listed_chapters)
+            results += list(iterator)
+
+        return first_listed, results
+
+    async def run() -> typing.Tuple[typing.List[int], typing.List[comics.model.ChapterDownloadResult]]:
+        download_stream = await comics.download.stream_async(url, base_dir, dry_run = True, prefetch_chapters = prefetch_chapters)
+        results: typing.List[comics.model.ChapterDownloadResult] = []
+        first_listed: typing.List[int] = []
+
+        async with download_stream:
+            async for result in download_stream:
+                if (len(results) == 0):
+                    first_listed = sorted(source.listed_chapters)
+
+                results.append(result)
+
+        return first_listed, results
+
+    return asyncio.run(run())
+
+def _get_first_images(
+        source: '_SlowSource',
+        comic: comics.model.ComicInfo,
+        prefetch_chapters: int,
+        use_async: bool,
+        ) -> typing.List[comics.model.ComicImage]:
+    """ Get the first chapter's images through a prefetcher, releasing the source's slow chapter once they are in. """
+
+    metrics = [comics.metrics.Metrics() for _ in comic.chapters]
+
+    if (not use_async):
+        prefetcher = comics.download._ImageListPrefetcher(source, comic, comic.chapters, metrics, prefetch_chapters)
+        try:
+            return prefetcher.get(0)
+        finally:
+            source.release.set()
+            prefetcher.close()
+
+    async def run() -> typing.List[comics.model.ComicImage]:
+        async_prefetcher = comics.download._AsyncImageListPrefetcher(source, comic, comic.chapters, metrics, prefetch_chapters)
+        try:
+            return await async_prefetcher.get(0)
+        finally:
+            source.release.set()
+            await async_prefetcher.close()
+
+    return asyncio.run(run())
+
+def list_files(base_dir: str) -> typing.Dict[str, bytes]:
+    """ Get the contents of every file under a directory, by relative path. """
+
+    files = {}
+    for (dirpath, _, filenames) in os.walk(base_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as file:
+                files[os.path.relpath(path, base_dir)] = file.read()
+
+    return files
+
+class TestDownload(edq.testing.unittest.BaseTest):
+    """ Test downloading comics. """
+
+    def test_plan_batches(self) -> None:
+        """ Test that chapter image lists are resolved in batches sized to the source and the prefetch window. """
+
+        # [(source kwargs, prefetch chapters, expected batch sizes), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, typing.Any], int, typing.List[int]]] = [
+            # A source without a batch request lists each chapter on its own, with or without prefetching.
+            ({}, 0, [1] * FAKE_CHAPTER_COUNT),
+            ({}, 2, [1] * FAKE_CHAPTER_COUNT),
+            ({'max_concurrency': 2}, 4, [1] * FAKE_CHAPTER_COUNT),
+
+            # A source that can list several chapters per request.
+            ({'chapter_batch_size': 4}, 0, [4, 3]),
+            ({'chapter_batch_size': 4}, 2, [4, 3]),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (kwargs, prefetch_chapters, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({kwargs}, {prefetch_chapters}):"):
+                source = FakeSource(**kwargs)
+                url = register_fake_source(source)
+
+                work = comics.download.plan(url, self._make_temp_dir(), prefetch_chapters = prefetch_chapters)
+
+                self.assertEqual(expected, source.batch_sizes)
+                self.assertEqual(list(range(FAKE_CHAPTER_COUNT)), sorted(source.listed_chapters))
+                self.assertEqual(list(range(FAKE_CHAPTER_COUNT)), [item.chapter.index for item in work])
+                self.assertEqual([FAKE_IMAGE_COUNT] * FAKE_CHAPTER_COUNT, [len(item.images or []) for item in work])
+
+    def test_plan_batch_errors(self) -> None:
+        """ Test that a chapter that fails to list does not fail the rest of its batch. """
+
+        source = FakeSource(failing_chapters = {1}, chapter_batch_size = 4)
+        url = register_fake_source(source)
+
+        work = comics.download.plan(url, self._make_temp_dir(), prefetch_chapters = 2)
+
+        self.assertEqual([4, 3], source.batch_sizes)
+        self.assertEqual([True, False, True, True, True, True, True], [item.images is not None for item in work])
+
+    def test_async_prefetcher_batches(self) -> None:
+        """ Test that the async prefetcher resolves the same batches. """
+
+        source = FakeSource(chapter_batch_size = 4)
+        comic = source.get_info_from_url('http://fake.test.invalid/series/fake')
+        metrics = [comics.metrics.Metrics() for _ in comic.chapters]
+
+        async def run() -> typing.List[int]:
+            prefetcher = comics.download._AsyncImageListPrefetcher(source, comic, comic.chapters, metrics, 2)
+            try:
+                return [len(await prefetcher.get(i)) for i in range(len(comic.chapters))]
+            finally:
+                await prefetcher.close()
+
+        self.assertEqual([FAKE_IMAGE_COUNT] * FAKE_CHAPTER_COUNT, asyncio.run(run()))
+        self.assertEqual([4, 3], source.batch_sizes)
+
+    def test_prefetcher_slow_chapter(self) -> None:
+        """ Test that the current chapter's images are handed back without waiting on a slower prefetched chapter. """
+
+        for use_async in [False, True]:
+            with self.subTest(msg = f"Async {use_async}:"):
+                source = _SlowSource(slow_chapter = 2, release = threading.Event())
+                comic = source.get_info_from_url('http://fake.test.invalid/series/fake')
+
+                images = _get_first_images(source, comic, 2, use_async)
+
+                self.assertEqual(FAKE_IMAGE_COUNT, len(images))
+                self.assertFalse(source.slow_finished_first)
+
+    def test_download_prefetch(self) -> None:
+        """ Test that image lists are resolved ahead of the current chapter, and that a failed list only fails its own chapter. """
+
+        # [(prefetch chapters, chapters that may have been listed by the time the first chapter is done), ...]
+        # The prefetched chapters are listed concurrently with the first one, so they may or may not have started yet.
+        test_cases = [
+            (0, [0]),
+            (1, [0, 1]),
+            (2, [0, 1, 2]),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (prefetch_chapters, expected) = test_case
+
+            for use_async in [False, True]:
+                with self.subTest(msg = f"Case {i} ({prefetch_chapters}, async {use_async}):"):
+                    source = FakeSource(failing_chapters = {1})
+                    url = register_fake_source(source)
+
+                    (first_listed, results) = _stream_dry_run(url, self._make_temp_dir(), prefetch_chapters, use_async, source)
+
+                    self.assertIn(0, first_listed)
+                    self.assertLessEqual(set(first_listed), set(expected))
+                    self.assertEqual(list(range(FAKE_CHAPTER_COUNT)), sorted(source.listed_chapters))
+                    self.assertEqual(list(range(FAKE_CHAPTER_COUNT)), [result.chapter.index for result in results])
+                    self.assertEqual([False, True, False, False, False, False, False], [result.has_error() for result in results])
+                    self.assertEqual(FAKE_IMAGE_COUNT, len(results[0].image_results))
+
+    def test_dry_run_leaves_partial_archives(self) -> None:
+        """ Test that a dry run does not finalize (or otherwise touch) archives left by an interrupted run. """
+
+        for use_async in [False, True]:
+            with self.subTest(msg = f"Async {use_async}:"):
+                url = register_fake_source(FakeSource())
+                base_dir = self._make_temp_dir()
+
+                kwargs: typing.Dict[str, typing.Any] = {
+                    'dry_run': True,
+                    'output_format': comics.download.OUTPUT_FORMAT_CBZ,
+                }
+
+                # Nothing is written, so a first dry run is just a way to learn where the archives go.
+                result = comics.download.download(url, base_dir, **kwargs)
+                self.assertEqual([], os.listdir(base_dir))
+
+                part_path = result.chapter_download_results[0].out_path + comics.cbz.PARTIAL_SUFFIX
+                edq.util.dirent.mkdir(os.path.dirname(part_path))
+                with zipfile.ZipFile(part_path, 'w') as archive:
+                    archive.writestr('0.jpg', b'image')
+
+                with open(part_path, 'rb') as file:
+                    expected = file.read()
+
+                if (use_async):
+                    result = asyncio.run(comics.download.download_async(url, base_dir, **kwargs))
+                else:
+                    result = comics.download.download(url, base_dir, **kwargs)
+
+                self.assertEqual(FAKE_CHAPTER_COUNT, len(result.chapter_download_results))
+                self.assertEqual([os.path.basename(part_path)], os.listdir(os.path.dirname(part_path)))
+
+                with open(part_path, 'rb') as file:
+                    self.assertEqual(expected, file.read())
+
+    def test_download_workers(self) -> None:
+        """ Test that the number of workers is capped by the source's limit. """
+
+        # [(workers, max concurrency, expected workers), ...]
+        test_cases = [
+            (1, 4, 1),
+            (4, 4, 4),
+            (8, 4, 4),
+            (8, 2, 2),
+            (0, 4, 1),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (workers, max_concurrency, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({workers}, {max_concurrency}):"):
+                source = FakeSource(max_concurrency = max_concurrency)
+                url = register_fake_source(source)
+
+                self.assertEqual((source, expected), comics.download._get_source(url, workers))
+
+    def test_download_concurrent_images(self) -> None:
+        """ Test that a chapter's images are fetched concurrently and reported in page order. """
+
+        selection = comics.selection.ChapterSelection(last = 1)
+
+        with stand_in_server(latency_secs = 0.1) as server:
+            start = time.monotonic()
+            result = comics.download.download(server.comic_url, self._make_temp_dir(), workers = 4, selection = selection)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(1, len(result.chapter_download_results))
+        chapter_download_result = result.chapter_download_results[0]
+
+        image_results = chapter_download_result.image_results
+        self.assertEqual(list(range(STAND_IN_IMAGE_COUNT)), [image_result.image.index for image_result in image_results])
+        self.assertTrue(all(image_result.downloaded for image_result in image_results))
+
+        # Leave out the (slow) requests for the comic and the chapter's image list.
+        for phase in [comics.metrics.PHASE_SERIES_FETCH, comics.metrics.PHASE_NEXT_ACTION_FETCH]:
+            elapsed -= result.metrics.get_secs(phase)
+
+        elapsed -= chapter_download_result.metrics.get_secs(comics.metrics.PHASE_IMAGE_LIST)
+
+        # One at a time, the images would take at least 0.8 seconds.
+        self.assertGreaterEqual(chapter_download_result.metrics.get_secs(comics.metrics.PHASE_IMAGE_GET), 0.8)
+        self.assertLess(elapsed, 0.6)
+
+    def test_download_async_matches_sync(self) -> None:
+        """ Test that the async pipeline downloads the same files (in the same order) as the sync one. """
+
+        with stand_in_server() as server:
+            sync_dir = self._make_temp_dir()
+            sync_result = comics.download.download(server.comic_url, sync_dir, workers = 3, prefetch_chapters = 1)
+
+            async_dir = self._make_temp_dir()
+            async_result = asyncio.run(comics.download.download_async(server.comic_url, async_dir, workers = 3, prefetch_chapters = 1))
+
+        for result in [sync_result, async_result]:
+            self.assertEqual(STAND_IN_CHAPTER_COUNT, len(result.chapter_download_results))
+            for chapter_download_result in result.chapter_download_results:
+                self.assertFalse(chapter_download_result.has_error())
+                self.assertEqual(0, chapter_download_result.missing_count())
+                indexes = [image_result.image.index for image_result in chapter_download_result.image_results]
+                self.assertEqual(list(range(STAND_IN_IMAGE_COUNT)), indexes)
+
+        sync_files = list_files(sync_dir)
+        self.assertEqual(STAND_IN_CHAPTER_COUNT * STAND_IN_IMAGE_COUNT, len(sync_files))
+        self.assertEqual({server.image_body}, set(sync_files.values()))
+        self.assertEqual(sync_files, list_files(async_dir))
+
+    def test_download_async_bookkeeping_threads(self) -> None:
+        """ Test that the async pipeline keeps the manifest and chapter setup off of the event loop, all in one thread. """
+
+        thread_names: typing.Dict[str, typing.Set[str]] = {}
+
+        def record_thread(name: str, function: typing.Callable[..., typing.Any]) -> typing.Callable[..., typing.Any]:
+            def wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+                thread_names.setdefault(name, set()).add(threading.current_thread().name)
+                return function(*args, **kwargs)
+
+            return wrapper
+
+        patches = [
+            unittest.mock.patch.object(comics.manifest.Manifest, name, record_thread(name, getattr(comics.manifest.Manifest, name)))
+            for name in ['__init__', 'get_complete_chapter', 'record_chapter', 'close']
+        ]
+        patches.append(unittest.mock.patch.object(comics.download, '_start_chapter', record_thread('start', comics.download._start_chapter)))
+
+        with contextlib.ExitStack() as stack, stand_in_server() as server:
+            for patch in patches:
+                stack.enter_context(patch)
+
+            out_dir = self._make_temp_dir()
+            for _ in range(2):
+                result = asyncio.run(comics.download.download_async(server.comic_url, out_dir, workers = 2, use_manifest = True))
+                self.assertEqual(STAND_IN_CHAPTER_COUNT, len(result.chapter_download_results))
+
+        self.assertEqual({'__init__', 'get_complete_chapter', 'record_chapter', 'close', 'start'}, set(thread_names))
+
+        all_names = set.union(*thread_names.values())
+        self.assertTrue(all(name.startswith('comics-bookkeeping') for name in all_names), msg = str(thread_names))
+
+    def test_stream_archives(self) -> None:
+        """ Test that each chapter is yielded with its archive already finalized, and that results match a full download. """
+
+        with stand_in_server() as server:
+            base_dir = self._make_temp_dir()
+
+            download_stream = comics.download.stream(server.comic_url, base_dir, workers = 2, output_format = comics.download.OUTPUT_FORMAT_CBZ)
+            with download_stream:
+                indexes = []
+                for chapter_download_result in download_stream:
+                    indexes.append(chapter_download_result.chapter.index)
+
+                    self.assertFalse(chapter_download_result.has_error())
+                    self.assertTrue(os.path.isfile(chapter_download_result.out_path))
+                    self.assertFalse(os.path.exists(chapter_download_result.out_path + comics.cbz.PARTIAL_SUFFIX))
+
+                    with zipfile.ZipFile(chapter_download_result.out_path, 'r') as archive:
+                        self.assertEqual(STAND_IN_IMAGE_COUNT, len(archive.namelist()))
+
+            self.assertEqual(list(range(STAND_IN_CHAPTER_COUNT)), indexes)
+            self.assertEqual(1, download_stream.metrics.to_dict()['phases'][comics.metrics.PHASE_SERIES_FETCH]['count'])
+
+            result = comics.download.download(server.comic_url, self._make_temp_dir(), output_format = comics.download.OUTPUT_FORMAT_CBZ)
+            self.assertEqual(indexes, [chapter_download_result.chapter.index for chapter_download_result in result.chapter_download_results])
+
+    def test_stream_close_early(self) -> None:
+        """ Test that closing a stream after its first chapter stops the download without starting the rest. """
+
+        for use_async in [False, True]:
+            with self.subTest(msg = f"Async {use_async}:"):
+                with stand_in_server() as server:
+                    server.reset_counts()
+
+                    first_index = self._stream_first_chapter(server.comic_url, self._make_temp_dir(), use_async)
+                    counts = server.reset_counts()
+
+                self.assertEqual(0, first_index)
+
+                # Only the first chapter (and at most the one after it, if it had already started) was fetched.
+                self.assertGreaterEqual(counts['image'], STAND_IN_IMAGE_COUNT)
+                self.assertLessEqual(counts['image'], 2 * STAND_IN_IMAGE_COUNT)
+                self.assertLess(counts['action'], STAND_IN_CHAPTER_COUNT)
+
+    def _stream_first_chapter(self, url: str, base_dir: str, use_async: bool) -> int:
+        """ Stream a comic, stopping after its first chapter, and return that chapter's index. """
+
+        if (not use_async):
+            with comics.download.stream(url, base_dir, workers = 2) as download_stream:
+                return next(iter(download_stream)).chapter.index
+
+        async def run() -> int:
+            download_stream = await comics.download.stream_async(url, base_dir, workers = 2)
+            async with download_stream:
+                async for chapter_download_result in download_stream:
+                    return chapter_download_result.chapter.index
+
+            return -1
+
+        return asyncio.run(run())
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
@@ -0,0 +1,288 @@
+import codecs
+import json
+import logging
+import typing
+
+_logger = logging.getLogger(__name__)
+
+TAG_TEXT: str = 'T'
+"""
+The tag of a text row, whose payload is `<hex byte length>,<text>` (with no trailing newline)
+instead of a line of JSON.
+"""
+
+_WHITESPACE: str = ' \t\r\n'
+
+_DECODER: json.JSONDecoder = json.JSONDecoder()
+
+Chunks = typing.Iterable[typing.Union[bytes, str]]
+""" A response body as it arrives: bytes (UTF-8) or already decoded text. """
+
+class FlightRow:
+    """
+    A single row of a React Server Components "flight" response (as sent by Next.js for pages and server actions).
+    Each row is `<hex id>:<tag><payload>`, where the (often empty) tag is a run of capital letters.
+    """
+
+    __slots__ = ('row_id', 'tag', 'text')
+
+    def __init__(self, row_id: str, tag: str, text: str) -> None:
+        self.row_id: str = row_id
+        """ The row's (hex) id, which other rows refer to (e.g., `$@1`). """
+
+        self.tag: str = tag
+        """ The row's tag (e.g., `I` for a module import or `T` for text), empty for plain JSON. """
+
+        self.text: str = text
+        """ The row's payload: JSON text, or the raw text for a text row. """
+
+    def value(self) -> typing.Any:
+        """ Decode the row's payload (a text row's payload is already its value). """
+
+        if (self.tag == TAG_TEXT):
+            return self.text
+
+        return json.loads(self.text)
+
+    def __repr__(self) -> str:
+        return f"{self.row_id}:{self.tag}{self.text[:40]}"
+
+def iter_rows(chunks: Chunks) -> typing.Iterator[FlightRow]:
+    """
+    Parse a flight response in a single pass as it arrives, yielding each row as soon as it is complete.
+    Nothing is decoded past finding where each row ends.
+    """
+
+    scanner = _Scanner(chunks)
+    while True:
+        row = scanner.read_row_header()
+        if (row is None):
+            return
+
+        row_id, tag = row
+        yield FlightRow(row_id, tag, scanner.read_row_payload(tag))
+
+def iter_array_items(chunks: Chunks, row_id: str) -> typing.Iterator[typing.Any]:
+    """
+    Parse a flight response in a single pass as it arrives, yielding each item of the (JSON) array in the given row
+    as soon as that item is complete.
+    Rows before it are skipped without being decoded, and nothing after the array is read.
+    """
+
+    scanner = _Scanner(chunks)
+    while True:
+        row = scanner.read_row_header()
+        if (row is None):
+            raise ValueError(f"Flight response has no row '{row_id}'.")
+
+        if (row[0] != row_id):
+            scanner.read_row_payload(row[1])
+            continue
+
+        if (row[1] != ''):
+            raise ValueError(f"Flight row '{row_id}' is not JSON (tag '{row[1]}').")
+
+        yield from scanner.read_array_items()
+        return
+
+class _Scanner:
+    """
+    Reads flight rows from chunks of a response, decoding bytes incrementally and never searching the same text twice.
+    Consumed text is dropped whenever more is read, so only the row being read is buffered.
+    """
+
+    def __init__(self, chunks: Chunks) -> None:
+        self._chunks: typing.Iterator[typing.Union[bytes, str]] = iter(chunks)
+        self._decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer: str = ''
+        self._pos: int = 0
+        self._done: bool = False
+
+    def read_row_header(self) -> typing.Union[typing.Tuple[str, str], None]:
+        """ Read the id and tag of the next row, or None at the end of the response. """
+
+        self._skip_whitespace()
+        if (not self._ensure(1)):
+            return None
+
+        colon = self._find(':')
+        if (colon < 0):
+            raise ValueError("Flight response ends in the middle of a row id.")
+
+        row_id = self._buffer[self._pos:colon]
+        if ((len(row_id) == 0) or (not all(char in '0123456789abcdefABCDEF' for char in row_id))):
+            raise ValueError(f"Invalid flight row id: '{row_id[:40]}'.")
+
+        self._pos = colon + 1
+
+        # Reading more may move the buffer, so the tag is measured from the current position.
+        size = 0
+        while (self._ensure(size + 1) and ('A' <= self._buffer[self._pos + size] <= 'Z')):
+            size += 1
+
+        tag = self._buffer[self._pos:(self._pos + size)]
+        self._pos += size
+
+        return row_id, tag
+
+    def read_row_payload(self, tag: str) -> str:
+        """ Read the rest of the current row (after its header). """
+
+        if (tag == TAG_TEXT):
+            return self._read_text_payload()
+
+        end = self._find('\n')
+        if (end < 0):
+            # The last row may end without a newline.
+            end = len(self._buffer)
+
+        text = self._buffer[self._pos:end]
+        self._pos = min(end + 1, len(self._buffer))
+        return text
+
+    def read_array_items(self) -> typing.Iterator[typing.Any]:
+        """ Read the current row as a JSON array, yielding each item as soon as it is complete. """
+
+        self._skip_whitespace()
+        if ((not self._ensure(1)) or (self._buffer[self._pos] != '[')):
+            raise ValueError("Flight row is not an array.")
+
+        self._pos += 1
+        self._skip_whitespace()
+        if (self._ensure(1) and (self._buffer[self._pos] == ']')):
+            self._pos += 1
+            return
+
+        while True:
+            yield self._read_array_item()
+
+            # Items are almost always followed right away by a separator.
+            buffer = self._buffer
+            pos = self._pos
+            if ((pos >= len(buffer)) or (buffer[pos] in _WHITESPACE)):
+                self._skip_whitespace()
+                if (not self._ensure(1)):
+                    raise ValueError("Flight response ends in the middle of an array.")
+
+                buffer = self._buffer
+                pos = self._pos
+
+            if (buffer[pos] == ']'):
+                self._pos = pos + 1
+                return
+
+            if (buffer[pos] != ','):
+                raise ValueError(f"Expected ',' in flight array, found '{buffer[pos]}'.")
+
+            self._pos = pos + 1
+
+    def _read_array_item(self) -> typing.Any:
+        """
+        Decode the array item at the current position, reading more until it is complete.
+        An item is only rejected once it fails to decode against text that has its whole row (or the rest of the response).
+        """
+
+        while True:
+            if (self._pos >= len(self._buffer)):
+                if (not self._read()):
+                    raise ValueError("Flight response ends in the middle of an array.")
+
+                continue
+
+            try:
+                item, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as ex:
+                if (self._buffer[self._pos] in _WHITESPACE):
+                    self._skip_whitespace()
+                    continue
+
+                # An item that is only partly here, unless its row has already ended.
+                if ((self._buffer.find('\n', self._pos) >= 0) or (not self._read())):
+                    raise ValueError(f"Invalid item in flight array: {ex}.") from ex
+
+                continue
+
+            # A number (or literal) at the very end may still be missing digits.
+            if ((end >= len(self._buffer)) and self._read()):
+                continue
+
+            self._pos = end
+            return item
+
+    def _read_text_payload(self) -> str:
+        """ Read a text row's payload: `<hex byte length>,<text>`. """
+
+        comma = self._find(',')
+        if (comma < 0):
+            raise ValueError("Flight response ends in the middle of a text row.")
+
+        size = int(self._buffer[self._pos:comma], 16)
+        self._pos = comma + 1
+
+        # The length is in (UTF-8) bytes, which is at least the number of characters.
+        while True:
+            candidate = self._buffer[self._pos:(self._pos + size)]
+            encoded = candidate.encode('utf-8')
+            if (len(encoded) >= size):
+                text = encoded[:size].decode('utf-8')
+                self._pos += len(text)
+                return text
+
+            if (not self._read()):
+                raise ValueError("Flight response ends in the middle of a text row.")
+
+    def _find(self, char: str) -> int:
+        """ Find the next occurrence of a character (reading as needed), or -1 if the response ends first. """
+
+        start = self._pos
+        while True:
+            index = self._buffer.find(char, start)
+            if (index >= 0):
+                return index
+
+            # Only search the newly read text next time.
+            start = len(self._buffer)
+            offset = self._pos
+            if (not self._read()):
+                return -1
+
+            start -= (offset - self._pos)
+
+    def _skip_whitespace(self) -> None:
+        """ Move past any whitespace (reading as needed). """
+
+        while (self._ensure(1) and (self._buffer[self._pos] in _WHITESPACE)):
+            self._pos += 1
+
+    def _ensure(self, count: int) -> bool:
+        """ Make sure that at least `count` unread characters are buffered, returning False if the response ends first. """
+
+        while ((len(self._buffer) - self._pos) < count):
+            if (not self._read()):
+                return False
+
+        return True
+
+    def _read(self) -> bool:
+        """ Buffer the next chunk (dropping consumed text), returning False at the end of the response. """
+
+        while (not self._done):
+            chunk = next(self._chunks, None)
+
+            text = ''
+            if (chunk is None):
+                self._done = True
+                text = self._decoder.decode(b'', final = True)
+            elif (isinstance(chunk, str)):
+                text = chunk
+            else:
+                text = self._decoder.decode(chunk)
+
+            if (len(text) == 0):
+                continue
+
+            self._buffer = self._buffer[self._pos:] + text
+            self._pos = 0
+            return True
+
+        return False
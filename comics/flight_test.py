@@ -0,0 +1,128 @@
+import json
+import typing
+
+import edq.testing.unittest
+
+import comics.bench.fixtures
+import comics.flight
+
+# A response with a text row (whose length counts UTF-8 bytes), a tagged row, and an array of mixed items.
+MIXED_RESPONSE: str = '0:{"a":"$@1"}\n2:T7,héllo!3:I["x",1]\n1:[1, 23 ,"é\\n",true,null,{"a":[1,-2.5e3]}]\n4:"after"\n'
+
+MIXED_ROWS: typing.List[typing.Tuple[str, str, typing.Any]] = [
+    ('0', '', {'a': '$@1'}),
+    ('2', 'T', 'héllo!'),
+    ('3', 'I', ['x', 1]),
+    ('1', '', [1, 23, 'é\n', True, None, {'a': [1, -2500.0]}]),
+    ('4', '', 'after'),
+]
+
+class TestFlight(edq.testing.unittest.BaseTest):
+    """ Test parsing flight responses. """
+
+    def test_iter_rows_base(self) -> None:
+        """ Test reading whole rows. """
+
+        rows = list(comics.flight.iter_rows([MIXED_RESPONSE.encode('utf-8')]))
+        self.assertEqual(MIXED_ROWS, [(row.row_id, row.tag, row.value()) for row in rows])
+
+    def test_iter_array_items_base(self) -> None:
+        """ Test reading the items of an array row. """
+
+        # [(response, row id, expected), ...]
+        test_cases = [
+            (MIXED_RESPONSE, '1', MIXED_ROWS[3][2]),
+            ('1:[]\n', '1', []),
+            ('1:[ ]', '1', []),
+            ('1:[1,2]', '1', [1, 2]),
+            ('0:"x"\n1:[123]', '1', [123]),
+            ('a:[{"b":"]"}]\n', 'a', [{'b': ']'}]),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (response, row_id, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ('{response}'):"):
+                actual = list(comics.flight.iter_array_items([response.encode('utf-8')], row_id))
+                self.assertEqual(expected, actual)
+
+    def test_iter_array_items_errors(self) -> None:
+        """ Test that broken responses are rejected. """
+
+        # [(response, error substring), ...]
+        test_cases = [
+            ('1:[1,2', 'ends in the middle of an array'),
+            ('1:[1,', 'ends in the middle of an array'),
+            ('1:[1 2]\n', "Expected ','"),
+            ('1:[1,,2]\n', 'Invalid item'),
+            ('1:[{"a":]\n2:[]', 'Invalid item'),
+            ('0:{}\n', "no row '1'"),
+            ('1:{"a":1}\n', 'not an array'),
+            ('1:T3,abc', 'not JSON'),
+            ('zz:[]\n', 'Invalid flight row id'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (response, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ('{response}'):"):
+                with self.assertRaisesRegex(ValueError, expected):
+                    list(comics.flight.iter_array_items([response.encode('utf-8')], '1'))
+
+    def test_chunk_boundaries(self) -> None:
+        """ Test that every split of a response (including inside UTF-8 characters) parses the same as the whole response. """
+
+        images_response = comics.bench.fixtures.chapter_images_response('http://test.invalid', 1, image_count = 3)
+
+        # [(response, array row id), ...]
+        test_cases = [
+            (MIXED_RESPONSE, '1'),
+            (images_response, '1'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (response, row_id) = test_case
+            data = response.encode('utf-8')
+
+            expected_rows = [(row.row_id, row.tag, row.text) for row in comics.flight.iter_rows([response])]
+            expected_items = [row.value() for row in comics.flight.iter_rows([response]) if row.row_id == row_id][0]
+
+            # The array must match what the standard decoder makes of its row.
+            row_prefix = f"\n{row_id}:"
+            row_start = ('\n' + response).index(row_prefix) + len(row_id) + 1
+            self.assertEqual(json.loads(response[row_start:].split('\n', 1)[0]), expected_items)
+
+            for split in range(len(data) + 1):
+                chunks = [data[:split], data[split:]]
+
+                with self.subTest(msg = f"Case {i}, split at {split}:"):
+                    rows = [(row.row_id, row.tag, row.text) for row in comics.flight.iter_rows(chunks)]
+                    self.assertEqual(expected_rows, rows)
+
+                    items = list(comics.flight.iter_array_items(chunks, row_id))
+                    self.assertEqual(expected_items, items)
+
+    def test_single_byte_chunks(self) -> None:
+        """ Test a response that arrives a byte at a time. """
+
+        data = MIXED_RESPONSE.encode('utf-8')
+        chunks = [data[i:(i + 1)] for i in range(len(data))]
+
+        rows = list(comics.flight.iter_rows(chunks))
+        self.assertEqual(MIXED_ROWS, [(row.row_id, row.tag, row.value()) for row in rows])
+
+        self.assertEqual(MIXED_ROWS[3][2], list(comics.flight.iter_array_items(chunks, '1')))
+
+    def test_array_items_are_yielded_early(self) -> None:
+        """ Test that items are yielded before the rest of the response has been read. """
+
+        read_chunks = []
+
+        def chunks() -> typing.Iterator[bytes]:
+            for chunk in [b'1:[{"a":1},', b'{"a":2},', b'{"a":3}]\n']:
+                read_chunks.append(chunk)
+                yield chunk
+
+        items = comics.flight.iter_array_items(chunks(), '1')
+        self.assertEqual({'a': 1}, next(items))
+        self.assertEqual(1, len(read_chunks))
@@ -0,0 +1,185 @@
+import logging
+import os
+import sqlite3
+import time
+import typing
+
+import comics.cbz
+import comics.model
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME: str = '.comics-manifest.sqlite'
+""" The name of the manifest file kept in each comic's output directory. """
+
+_SCHEMA: typing.List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS chapters (
+        chapter_key TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        dirname TEXT NOT NULL,
+        image_count INTEGER NOT NULL,
+        complete INTEGER NOT NULL,
+        updated REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS images (
+        chapter_key TEXT NOT NULL,
+        image_index INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        url TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        PRIMARY KEY (chapter_key, image_index)
+    )
+    ''',
+]
+
+class Manifest:
+    """
+    A record of what has already been downloaded for a single comic,
+    stored as an SQLite database in the comic's output directory.
+    Chapters that the manifest knows are complete (and whose files are still on disk) can be skipped without any network calls.
+    """
+
+    def __init__(self, comic_out_dir: str, read_only: bool = False) -> None:
+        self.path: str = os.path.join(comic_out_dir, MANIFEST_FILENAME)
+        """ Where the manifest is stored. """
+
+        self.read_only: bool = read_only
+        """ If set, nothing will be written to the manifest (and it will not be created if it does not exist). """
+
+        self._connection: typing.Union[sqlite3.Connection, None] = None
+
+        if (read_only):
+            if (os.path.exists(self.path)):
+                self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri = True)
+        else:
+            self._connection = sqlite3.connect(self.path)
+            with self._connection:
+                for statement in _SCHEMA:
+                    self._connection.execute(statement)
+
+    def close(self) -> None:
+        """ Close the manifest. """
+
+        if (self._connection is not None):
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> 'Manifest':
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+    def get_complete_chapter(self,
+            chapter: comics.model.ComicChapter,
+            chapter_out_dir: str,
+            ) -> typing.Union[comics.model.ChapterDownloadResult, None]:
+        """
+        If the manifest shows this chapter as complete and all its images are still on disk
+        (with the recorded sizes, as files or in the chapter's archive),
+        then return a result for it (with every image marked as already existing).
+        Otherwise, return None.
+        """
+
+        if (self._connection is None):
+            return None
+
+        key = _chapter_key(chapter)
+
+        row = self._connection.execute(
+                'SELECT image_count, complete, dirname FROM chapters WHERE chapter_key = ?',
+                (key,)).fetchone()
+
+        if ((row is None) or (not row[1]) or (row[2] != os.path.basename(chapter_out_dir))):
+            return None
+
+        image_rows = self._connection.execute(
+                'SELECT image_index, filename, url, size FROM images WHERE chapter_key = ? ORDER BY image_index',
+                (key,)).fetchall()
+
+        if (len(image_rows) != row[0]):
+            return None
+
+        sizes = _ImageSizes(chapter_out_dir)
+
+        result = comics.model.ChapterDownloadResult(chapter, chapter_out_dir)
+        for (index, filename, url, size) in image_rows:
+            out_path = os.path.join(chapter_out_dir, filename)
+
+            if (sizes.get(out_path) != size):
+                return None
+
+            name, extension = os.path.splitext(filename)
+            image = comics.model.ComicImage(url, extension = extension, index = index, name = name)
+            result.add_image_result(comics.model.ImageDownloadResult(image, out_path, already_exists = True))
+
+        return result
+
+    def record_chapter(self, chapter_download_result: comics.model.ChapterDownloadResult) -> None:
+        """
+        Record the outcome of downloading a chapter.
+        A chapter is complete if it had no errors and none of its images are missing.
+        """
+
+        if ((self._connection is None) or self.read_only):
+            return
+
+        key = _chapter_key(chapter_download_result.chapter)
+        complete = ((not chapter_download_result.has_error()) and (chapter_download_result.missing_count() == 0))
+
+        sizes = _ImageSizes(chapter_download_result.out_path)
+
+        image_rows = []
+        for (i, image_download_result) in enumerate(chapter_download_result.image_results):
+            if (not (image_download_result.downloaded or image_download_result.already_exists)):
+                continue
+
+            size = sizes.get(image_download_result.out_path)
+            if (size is None):
+                complete = False
+                continue
+
+            filename = os.path.basename(image_download_result.out_path)
+            image_rows.append((key, i, filename, image_download_result.image.url, size))
+
+        with self._connection:
+            self._connection.execute('DELETE FROM images WHERE chapter_key = ?', (key,))
+            self._connection.executemany(
+                    'INSERT INTO images (chapter_key, image_index, filename, url, size) VALUES (?, ?, ?, ?, ?)',
+                    image_rows)
+            self._connection.execute(
+                    'INSERT OR REPLACE INTO chapters (chapter_key, name, dirname, image_count, complete, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, str(chapter_download_result.chapter), os.path.basename(chapter_download_result.out_path),
+                    len(chapter_download_result.image_results), int(complete), time.time()))
+
+        _logger.debug("Recorded chapter '%s' in manifest (complete: %s).", chapter_download_result.chapter, complete)
+
+class _ImageSizes:
+    """ Looks up the sizes of a chapter's images, either as files or from the chapter's archive (read once). """
+
+    def __init__(self, chapter_out_path: str) -> None:
+        self._archive_sizes: typing.Union[typing.Dict[str, int], None] = None
+        if (comics.cbz.is_archive_path(chapter_out_path)):
+            self._archive_sizes = comics.cbz.read_sizes(chapter_out_path)
+
+    def get(self, out_path: str) -> typing.Union[int, None]:
+        """ Get the size of an image, or None if it is missing. """
+
+        if (self._archive_sizes is not None):
+            return self._archive_sizes.get(os.path.basename(out_path), None)
+
+        try:
+            return os.path.getsize(out_path)
+        except OSError:
+            return None
+
+def _chapter_key(chapter: comics.model.ComicChapter) -> str:
+    """ Get the key used to identify a chapter in the manifest. """
+
+    if (chapter.source_id is not None):
+        return f"id:{chapter.source_id}"
+
+    return f"name:{chapter}"
@@ -0,0 +1,192 @@
+import os
+import typing
+import zipfile
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.download
+import comics.download_test
+import comics.manifest
+import comics.metrics
+import comics.model
+
+COMIC_URL: str = 'http://test.invalid/series/test'
+
+class TestManifest(edq.testing.unittest.BaseTest):
+    """ Test the download manifest. """
+
+    def test_complete_chapter_base(self) -> None:
+        """ Test that a recorded complete chapter is found again, as long as its images are still on disk with the same sizes. """
+
+        # [(change to make after recording, expected to be found), ...]
+        test_cases: typing.List[typing.Tuple[typing.Callable[[str], None], bool]] = [
+            (lambda chapter_dir: None, True),
+
+            # Same size, different bytes: sizes are all that is checked.
+            (lambda chapter_dir: _write(os.path.join(chapter_dir, '001.jpg'), b'XX'), True),
+
+            (lambda chapter_dir: _write(os.path.join(chapter_dir, '001.jpg'), b'1'), False),
+            (lambda chapter_dir: _write(os.path.join(chapter_dir, '001.jpg'), b'111'), False),
+            (lambda chapter_dir: os.remove(os.path.join(chapter_dir, '002.jpg')), False),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (change, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                comic_dir = self._make_temp_dir()
+                result = _make_chapter_result(comic_dir, {'001.jpg': b'11', '002.jpg': b'222'})
+
+                with comics.manifest.Manifest(comic_dir) as manifest:
+                    manifest.record_chapter(result)
+
+                change(result.out_path)
+
+                with comics.manifest.Manifest(comic_dir) as manifest:
+                    found = manifest.get_complete_chapter(result.chapter, result.out_path)
+
+                self.assertEqual(expected, (found is not None))
+                if (found is None):
+                    continue
+
+                self.assertEqual(['001.jpg', '002.jpg'], [os.path.basename(image_result.out_path) for image_result in found.image_results])
+                self.assertEqual([0, 1], [image_result.image.index for image_result in found.image_results])
+                self.assertEqual(['001', '002'], [image_result.image.name for image_result in found.image_results])
+                self.assertTrue(all(image_result.already_exists for image_result in found.image_results))
+
+    def test_incomplete_chapter(self) -> None:
+        """ Test that chapters with errors, missing images, or a different directory are not complete. """
+
+        # [(chapter error, failed image, lookup dirname (None for the recorded one)), ...]
+        test_cases: typing.List[typing.Tuple[typing.Union[str, None], bool, typing.Union[str, None]]] = [
+            ('Broken.', False, None),
+            (None, True, None),
+            (None, False, 'Renamed'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (error, failed_image, dirname) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                comic_dir = self._make_temp_dir()
+                result = _make_chapter_result(comic_dir, {'001.jpg': b'11'})
+                result.error = error
+
+                if (failed_image):
+                    image = comics.model.ComicImage(f"{COMIC_URL}/2.jpg", extension = '.jpg', index = 1, name = '002')
+                    result.add_image_result(comics.model.ImageDownloadResult(image, os.path.join(result.out_path, '002.jpg'), error = 'Failed.'))
+
+                out_path = result.out_path
+                if (dirname is not None):
+                    out_path = os.path.join(comic_dir, dirname)
+                    os.rename(result.out_path, out_path)
+
+                with comics.manifest.Manifest(comic_dir) as manifest:
+                    manifest.record_chapter(result)
+                    self.assertIsNone(manifest.get_complete_chapter(result.chapter, out_path))
+
+    def test_archive_sizes(self) -> None:
+        """ Test that the images of an archived chapter are checked against the archive. """
+
+        comic_dir = self._make_temp_dir()
+        archive_path = os.path.join(comic_dir, '0001.cbz')
+
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            archive.writestr('001.jpg', b'11')
+            archive.writestr('002.jpg', b'222')
+
+        result = comics.model.ChapterDownloadResult(_make_chapter(), archive_path)
+        for (i, name) in enumerate(['001', '002']):
+            image = comics.model.ComicImage(f"{COMIC_URL}/{i}.jpg", extension = '.jpg', index = i, name = name)
+            result.add_image_result(comics.model.ImageDownloadResult(image, os.path.join(archive_path, f"{name}.jpg"), downloaded = True))
+
+        with comics.manifest.Manifest(comic_dir) as manifest:
+            manifest.record_chapter(result)
+            self.assertIsNotNone(manifest.get_complete_chapter(result.chapter, archive_path))
+
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            archive.writestr('001.jpg', b'11')
+            archive.writestr('002.jpg', b'22')
+
+        with comics.manifest.Manifest(comic_dir) as manifest:
+            self.assertIsNone(manifest.get_complete_chapter(result.chapter, archive_path))
+
+    def test_read_only(self) -> None:
+        """ Test that a read-only manifest is never created or written. """
+
+        comic_dir = self._make_temp_dir()
+        result = _make_chapter_result(comic_dir, {'001.jpg': b'11'})
+
+        with comics.manifest.Manifest(comic_dir, read_only = True) as manifest:
+            manifest.record_chapter(result)
+            self.assertIsNone(manifest.get_complete_chapter(result.chapter, result.out_path))
+
+        self.assertFalse(os.path.exists(os.path.join(comic_dir, comics.manifest.MANIFEST_FILENAME)))
+
+        with comics.manifest.Manifest(comic_dir) as manifest:
+            manifest.record_chapter(result)
+
+        with comics.manifest.Manifest(comic_dir, read_only = True) as manifest:
+            self.assertIsNotNone(manifest.get_complete_chapter(result.chapter, result.out_path))
+
+            result.add_image_result(comics.model.ImageDownloadResult(result.image_results[0].image, result.image_results[0].out_path))
+            manifest.record_chapter(result)
+
+        with comics.manifest.Manifest(comic_dir, read_only = True) as manifest:
+            found = manifest.get_complete_chapter(result.chapter, result.out_path)
+            self.assertEqual(1, len(typing.cast(comics.model.ChapterDownloadResult, found).image_results))
+
+    def test_download_skips_complete_chapters(self) -> None:
+        """ Test that a download with a manifest makes no requests for chapters that are already complete. """
+
+        base_dir = self._make_temp_dir()
+
+        with comics.download_test.stand_in_server() as server:
+            first = comics.download.download(server.comic_url, base_dir, use_manifest = True)
+            server.reset_counts()
+
+            second = comics.download.download(server.comic_url, base_dir, use_manifest = True)
+            counts = server.reset_counts()
+
+        self.assertEqual(0, counts.get('image', 0))
+        self.assertEqual(0, counts.get('action', 0))
+
+        for (first_result, second_result) in zip(first.chapter_download_results, second.chapter_download_results):
+            self.assertEqual([image_result.out_path for image_result in first_result.image_results],
+                    [image_result.out_path for image_result in second_result.image_results])
+            self.assertTrue(all(image_result.already_exists for image_result in second_result.image_results))
+            self.assertEqual(1, second_result.metrics.get_count(comics.metrics.COUNTER_CHAPTERS_SKIPPED))
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+
+def _make_chapter() -> comics.model.ComicChapter:
+    """ Make a test chapter. """
+
+    return comics.model.ComicChapter(COMIC_URL, index = 0, source_id = '100', name = '1')
+
+def _make_chapter_result(comic_dir: str, images: typing.Dict[str, bytes]) -> comics.model.ChapterDownloadResult:
+    """ Write a chapter's images and make its (successful) result. """
+
+    chapter_dir = os.path.join(comic_dir, '0001')
+    edq.util.dirent.mkdir(chapter_dir)
+
+    result = comics.model.ChapterDownloadResult(_make_chapter(), chapter_dir)
+    for (i, (filename, data)) in enumerate(images.items()):
+        out_path = os.path.join(chapter_dir, filename)
+        _write(out_path, data)
+
+        name, extension = os.path.splitext(filename)
+        image = comics.model.ComicImage(f"{COMIC_URL}/{i}.jpg", extension = extension, index = i, name = name)
+        result.add_image_result(comics.model.ImageDownloadResult(image, out_path, downloaded = True))
+
+    return result
+
+def _write(path: str, data: bytes) -> None:
+    """ Write a file. """
+
+    with open(path, 'wb') as file:
+        file.write(data)
@@ -0,0 +1,312 @@
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import typing
+
+import edq.util.dirent
+
+PHASE_SERIES_FETCH: str = 'series_fetch'
+""" Fetching (and parsing) a comic's page. Includes any courtesy waits and retries along the way. """
+
+PHASE_NEXT_ACTION_FETCH: str = 'next_action_fetch'
+""" Fetching (and parsing) the script that holds a site's server action token. Includes any courtesy waits and retries along the way. """
+
+PHASE_IMAGE_LIST: str = 'image_list'
+""" Getting the list of images for a chapter from its source. Includes any courtesy waits and retries along the way. """
+
+PHASE_IMAGE_GET: str = 'image_get'
+""" Time on the network for image requests: waiting for responses and reading their bodies (but not writing them or courtesy waits). """
+
+PHASE_DISK_WRITE: str = 'disk_write'
+""" Writing image bodies to disk and moving them into place. """
+
+PHASE_COURTESY_WAIT: str = 'courtesy_wait'
+""" Sleeping to be polite to a host: waiting on the rate limiter and backing off between retries. """
+
+PHASE_TRANSCODE: str = 'transcode'
+""" CPU time spent re-encoding images in worker processes (see comics.transcode). Overlaps with the other phases. """
+
+COUNTER_REQUESTS: str = 'requests'
+""" HTTP requests made (every attempt counts). """
+
+COUNTER_RETRIES: str = 'retries'
+""" Attempts that were retries of an earlier failed (or throttled) attempt. """
+
+COUNTER_HEDGED_REQUESTS: str = 'hedged_requests'
+""" Duplicate image requests sent because the first was slower than usual for its host (see comics.retry). """
+
+COUNTER_CIRCUIT_REJECTIONS: str = 'circuit_rejections'
+""" Requests that were not sent because their host has been failing (see comics.retry.CircuitBreaker). """
+
+COUNTER_RESPONSE_BYTES: str = 'response_bytes'
+""" Bytes read from (non-streamed) response bodies, e.g., pages and server action responses. """
+
+COUNTER_DOWNLOAD_BYTES: str = 'download_bytes'
+""" Bytes of image bodies written to disk. """
+
+COUNTER_IMAGES_DOWNLOADED: str = 'images_downloaded'
+COUNTER_IMAGES_SKIPPED: str = 'images_skipped'
+""" Images that were not fetched because they already exist. """
+
+COUNTER_IMAGES_FROM_STORE: str = 'images_from_store'
+""" Images that were not fetched because their URL was already in the image store (see comics.store). """
+
+COUNTER_IMAGES_FAILED: str = 'images_failed'
+COUNTER_IMAGES_TRANSCODED: str = 'images_transcoded'
+""" Images that were replaced with a smaller encoding (see comics.transcode). """
+
+COUNTER_TRANSCODE_BYTES_SAVED: str = 'transcode_bytes_saved'
+""" Bytes saved on disk by re-encoding images. """
+
+COUNTER_CHAPTERS_SKIPPED: str = 'chapters_skipped'
+""" Chapters that were not processed because the manifest showed them as complete. """
+
+COUNTER_CHAPTERS_FAILED: str = 'chapters_failed'
+
+PROMETHEUS_PREFIX: str = 'comics_'
+
+_INVALID_NAME_PATTERN: re.Pattern = re.compile(r'[^a-zA-Z0-9_]')
+
+class PhaseStats:
+    """ The time spent in one phase. """
+
+    def __init__(self, count: int = 0, total_secs: float = 0.0, max_secs: float = 0.0) -> None:
+        self.count: int = count
+        """ The number of times the phase was entered. """
+
+        self.total_secs: float = total_secs
+        """ The total time spent in the phase (concurrent work is summed, so this may exceed wall time). """
+
+        self.max_secs: float = max_secs
+        """ The longest single time spent in the phase. """
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """ Get a JSON-friendly representation. """
+
+        return {
+            'count': self.count,
+            'total_secs': self.total_secs,
+            'max_secs': self.max_secs,
+        }
+
+class Metrics:
+    """
+    Thread-safe timings (per phase) and counters for some unit of work, e.g., a comic or a chapter.
+
+    Code records into whatever metrics are current (see recording()) through the module-level
+    timed(), add_time(), and add() functions,
+    so sources and the network layer can be instrumented without passing metrics around.
+    """
+
+    def __init__(self) -> None:
+        self.phases: typing.Dict[str, PhaseStats] = {}
+        """ Time spent in each phase. """
+
+        self.counters: typing.Dict[str, int] = {}
+        """ Counts of events (and bytes). """
+
+        self._lock: threading.Lock = threading.Lock()
+
+    def add_time(self, phase: str, secs: float) -> None:
+        """ Record time spent in a phase. """
+
+        with self._lock:
+            stats = self.phases.get(phase, None)
+            if (stats is None):
+                stats = PhaseStats()
+                self.phases[phase] = stats
+
+            stats.count += 1
+            stats.total_secs += secs
+            stats.max_secs = max(stats.max_secs, secs)
+
+    def add(self, counter: str, count: int = 1) -> None:
+        """ Add to a counter. """
+
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def get_secs(self, phase: str) -> float:
+        """ Get the total time spent in a phase. """
+
+        with self._lock:
+            stats = self.phases.get(phase, None)
+            if (stats is None):
+                return 0.0
+
+            return stats.total_secs
+
+    def get_count(self, counter: str) -> int:
+        """ Get a counter's value. """
+
+        with self._lock:
+            return self.counters.get(counter, 0)
+
+    def merge(self, other: 'Metrics') -> None:
+        """ Add another set of metrics into this one. """
+
+        with other._lock:
+            phases = [(phase, PhaseStats(stats.count, stats.total_secs, stats.max_secs)) for (phase, stats) in other.phases.items()]
+            counters = list(other.counters.items())
+
+        with self._lock:
+            for (phase, other_stats) in phases:
+                stats = self.phases.get(phase, None)
+                if (stats is None):
+                    self.phases[phase] = other_stats
+                    continue
+
+                stats.count += other_stats.count
+                stats.total_secs += other_stats.total_secs
+                stats.max_secs = max(stats.max_secs, other_stats.max_secs)
+
+            for (counter, count) in counters:
+                self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """ Get a JSON-friendly representation. """
+
+        with self._lock:
+            return {
+                'phases': {phase: stats.to_dict() for (phase, stats) in sorted(self.phases.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def __repr__(self) -> str:
+        with self._lock:
+            phases = ', '.join(f"{phase}: {stats.total_secs:.3f}s" for (phase, stats) in sorted(self.phases.items()))
+            counters = ', '.join(f"{counter}: {count}" for (counter, count) in sorted(self.counters.items()))
+
+        return f"Metrics(phases: [{phases}], counters: [{counters}])"
+
+_current: contextvars.ContextVar[typing.Union[Metrics, None]] = contextvars.ContextVar('comics_metrics', default = None)
+
+def current() -> typing.Union[Metrics, None]:
+    """ Get the metrics currently being recorded into (if any). """
+
+    return _current.get()
+
+@contextlib.contextmanager
+def recording(metrics: Metrics) -> typing.Iterator[Metrics]:
+    """
+    Record into the given metrics for the duration of the context.
+    The metrics follow the context into async tasks and asyncio.to_thread(),
+    but work submitted to a thread pool must be run in a copy of the context (see contextvars.copy_context()).
+    """
+
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+@contextlib.contextmanager
+def timed(phase: str) -> typing.Iterator[None]:
+    """ Record the time spent in the context as a phase (into the current metrics, if any). """
+
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        add_time(phase, time.monotonic() - start)
+
+def add_time(phase: str, secs: float) -> None:
+    """ Record time spent in a phase into the current metrics (if any). """
+
+    metrics = _current.get()
+    if (metrics is not None):
+        metrics.add_time(phase, secs)
+
+def add(counter: str, count: int = 1) -> None:
+    """ Add to a counter in the current metrics (if any). """
+
+    metrics = _current.get()
+    if (metrics is not None):
+        metrics.add(counter, count)
+
+def to_prometheus(labeled_metrics: typing.List[typing.Tuple[typing.Dict[str, str], Metrics]], prefix: str = PROMETHEUS_PREFIX) -> str:
+    """
+    Format metrics in the Prometheus text exposition format (e.g., for the node exporter's textfile collector).
+    Each set of metrics is written with its labels.
+    """
+
+    phase_families: typing.Dict[str, typing.Tuple[str, str, typing.List[str]]] = {
+        'phase_seconds_total': ('counter', "Time spent in each download phase.", []),
+        'phase_calls_total': ('counter', "The number of times each download phase was entered.", []),
+        'phase_max_seconds': ('gauge', "The longest single time spent in each download phase.", []),
+    }
+    counter_families: typing.Dict[str, typing.List[str]] = {}
+
+    for (labels, metrics) in labeled_metrics:
+        data = metrics.to_dict()
+
+        for (phase, stats) in data['phases'].items():
+            phase_labels = _format_labels({**labels, 'phase': phase})
+            phase_families['phase_seconds_total'][2].append(f"{phase_labels} {stats['total_secs']!r}")
+            phase_families['phase_calls_total'][2].append(f"{phase_labels} {stats['count']}")
+            phase_families['phase_max_seconds'][2].append(f"{phase_labels} {stats['max_secs']!r}")
+
+        for (counter, count) in data['counters'].items():
+            name = _INVALID_NAME_PATTERN.sub('_', counter) + '_total'
+            counter_families.setdefault(name, []).append(f"{_format_labels(labels)} {count}")
+
+    lines = []
+    for (name, (metric_type, help_text, samples)) in phase_families.items():
+        lines += _format_family(prefix + name, metric_type, help_text, samples)
+
+    for (name, samples) in sorted(counter_families.items()):
+        lines += _format_family(prefix + name, 'counter', f"The total {name[:-len('_total')].replace('_', ' ')}.", samples)
+
+    return '\n'.join(lines) + '\n'
+
+def write_json(path: str, data: typing.Any) -> None:
+    """ Atomically write JSON to a file. """
+
+    _write_atomic(path, json.dumps(data, indent = 4) + '\n')
+
+def write_prometheus(path: str, labeled_metrics: typing.List[typing.Tuple[typing.Dict[str, str], Metrics]]) -> None:
+    """ Atomically write a Prometheus textfile (see to_prometheus()). """
+
+    _write_atomic(path, to_prometheus(labeled_metrics))
+
+def _format_family(name: str, metric_type: str, help_text: str, samples: typing.List[str]) -> typing.List[str]:
+    """ Format a metric family (its help, type, and samples). """
+
+    if (len(samples) == 0):
+        return []
+
+    lines = [
+        f"# HELP {name} {help_text}",
+        f"# TYPE {name} {metric_type}",
+    ]
+
+    for sample in samples:
+        lines.append(f"{name}{sample}")
+
+    return lines
+
+def _format_labels(labels: typing.Dict[str, str]) -> str:
+    """ Format Prometheus labels. """
+
+    if (len(labels) == 0):
+        return ''
+
+    parts = []
+    for (key, value) in labels.items():
+        value = value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+
+    return '{' + ','.join(parts) + '}'
+
+def _write_atomic(path: str, text: str) -> None:
+    """ Write a file through a temp file, so readers (e.g., a textfile collector) never see a partial file. """
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+        file.write(text)
+
+    os.replace(temp_path, path)
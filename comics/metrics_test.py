@@ -0,0 +1,208 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import os
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.download
+import comics.download_test
+import comics.metrics
+
+class TestMetrics(edq.testing.unittest.BaseTest):
+    """ Test recording and exporting metrics. """
+
+    def test_metrics_base(self) -> None:
+        """ Test recording phases and counters. """
+
+        metrics = comics.metrics.Metrics()
+        metrics.add_time('a', 1.0)
+        metrics.add_time('a', 3.0)
+        metrics.add_time('b', 0.5)
+        metrics.add('x')
+        metrics.add('x', 4)
+
+        self.assertEqual(4.0, metrics.get_secs('a'))
+        self.assertEqual(0.0, metrics.get_secs('missing'))
+        self.assertEqual(5, metrics.get_count('x'))
+        self.assertEqual(0, metrics.get_count('missing'))
+
+        expected = {
+            'phases': {
+                'a': {'count': 2, 'total_secs': 4.0, 'max_secs': 3.0},
+                'b': {'count': 1, 'total_secs': 0.5, 'max_secs': 0.5},
+            },
+            'counters': {'x': 5},
+        }
+
+        self.assertEqual(expected, metrics.to_dict())
+        self.assertEqual('Metrics(phases: [a: 4.000s, b: 0.500s], counters: [x: 5])', repr(metrics))
+
+    def test_merge(self) -> None:
+        """ Test adding one set of metrics into another (without the two sharing any state). """
+
+        metrics = comics.metrics.Metrics()
+        metrics.add_time('a', 1.0)
+        metrics.add('x', 2)
+
+        other = comics.metrics.Metrics()
+        other.add_time('a', 2.0)
+        other.add_time('b', 0.5)
+        other.add('x', 3)
+        other.add('y')
+
+        metrics.merge(other)
+        metrics.merge(comics.metrics.Metrics())
+        other.add_time('b', 10.0)
+
+        expected = {
+            'phases': {
+                'a': {'count': 2, 'total_secs': 3.0, 'max_secs': 2.0},
+                'b': {'count': 1, 'total_secs': 0.5, 'max_secs': 0.5},
+            },
+            'counters': {'x': 5, 'y': 1},
+        }
+
+        self.assertEqual(expected, metrics.to_dict())
+
+    def test_recording(self) -> None:
+        """ Test that the module-level functions record into the current metrics, and do nothing without any. """
+
+        comics.metrics.add('x')
+        with comics.metrics.timed('a'):
+            pass
+
+        self.assertIsNone(comics.metrics.current())
+
+        outer = comics.metrics.Metrics()
+        inner = comics.metrics.Metrics()
+
+        with comics.metrics.recording(outer):
+            comics.metrics.add('x')
+
+            with comics.metrics.recording(inner):
+                self.assertIs(inner, comics.metrics.current())
+                comics.metrics.add('x', 2)
+                comics.metrics.add_time('b', 1.0)
+
+            with comics.metrics.timed('a'):
+                pass
+
+        self.assertIsNone(comics.metrics.current())
+        self.assertEqual({'x': 1}, outer.to_dict()['counters'])
+        self.assertEqual(['a'], list(outer.to_dict()['phases'].keys()))
+        self.assertEqual({'phases': {'b': {'count': 1, 'total_secs': 1.0, 'max_secs': 1.0}}, 'counters': {'x': 2}}, inner.to_dict())
+
+    def test_recording_across_tasks_and_threads(self) -> None:
+        """ Test that the current metrics follow async tasks and copied contexts, but not plain pool threads. """
+
+        metrics = comics.metrics.Metrics()
+
+        async def task(count: int) -> None:
+            await asyncio.sleep(0)
+            comics.metrics.add('tasks', count)
+
+        async def run() -> None:
+            with comics.metrics.recording(metrics):
+                await asyncio.gather(task(1), task(2))
+                await asyncio.to_thread(comics.metrics.add, 'to_thread')
+
+        asyncio.run(run())
+
+        with comics.metrics.recording(metrics), concurrent.futures.ThreadPoolExecutor(max_workers = 1) as executor:
+            executor.submit(comics.metrics.add, 'plain_thread').result()
+            executor.submit(contextvars.copy_context().run, comics.metrics.add, 'copied_context').result()
+
+        self.assertEqual({'copied_context': 1, 'tasks': 3, 'to_thread': 1}, metrics.to_dict()['counters'])
+
+    def test_to_prometheus(self) -> None:
+        """ Test the Prometheus text format. """
+
+        metrics = comics.metrics.Metrics()
+        metrics.add_time(comics.metrics.PHASE_IMAGE_GET, 1.5)
+        metrics.add_time(comics.metrics.PHASE_IMAGE_GET, 0.25)
+        metrics.add(comics.metrics.COUNTER_REQUESTS, 3)
+
+        other = comics.metrics.Metrics()
+        other.add('odd-name.x', 1)
+
+        # [(labeled metrics, expected), ...]
+        test_cases: typing.List[typing.Tuple[typing.List[typing.Tuple[typing.Dict[str, str], comics.metrics.Metrics]], str]] = [
+            ([], '\n'),
+            ([({}, comics.metrics.Metrics())], '\n'),
+            ([({'comic': 'A "B"\\C\nD'}, metrics), ({}, other)], '''
+# HELP comics_phase_seconds_total Time spent in each download phase.
+# TYPE comics_phase_seconds_total counter
+comics_phase_seconds_total{comic="A \\"B\\"\\\\C\\nD",phase="image_get"} 1.75
+# HELP comics_phase_calls_total The number of times each download phase was entered.
+# TYPE comics_phase_calls_total counter
+comics_phase_calls_total{comic="A \\"B\\"\\\\C\\nD",phase="image_get"} 2
+# HELP comics_phase_max_seconds The longest single time spent in each download phase.
+# TYPE comics_phase_max_seconds gauge
+comics_phase_max_seconds{comic="A \\"B\\"\\\\C\\nD",phase="image_get"} 1.5
+# HELP comics_odd_name_x_total The total odd name x.
+# TYPE comics_odd_name_x_total counter
+comics_odd_name_x_total 1
+# HELP comics_requests_total The total requests.
+# TYPE comics_requests_total counter
+comics_requests_total{comic="A \\"B\\"\\\\C\\nD"} 3
+'''.lstrip()),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (labeled_metrics, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                self.assertEqual(expected, comics.metrics.to_prometheus(labeled_metrics))
+
+    def test_write(self) -> None:
+        """ Test writing metrics files (which replace any old file whole). """
+
+        temp_dir = edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+        json_path = os.path.join(temp_dir, 'metrics.json')
+        prometheus_path = os.path.join(temp_dir, 'metrics.prom')
+
+        metrics = comics.metrics.Metrics()
+        metrics.add(comics.metrics.COUNTER_REQUESTS)
+
+        for _ in range(2):
+            comics.metrics.write_json(json_path, metrics.to_dict())
+            comics.metrics.write_prometheus(prometheus_path, [({'comic': 'a'}, metrics)])
+
+        self.assertEqual(['metrics.json', 'metrics.prom'], sorted(os.listdir(temp_dir)))
+
+        with open(json_path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+            self.assertEqual(metrics.to_dict(), json.load(file))
+
+        with open(prometheus_path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+            self.assertEqual(comics.metrics.to_prometheus([({'comic': 'a'}, metrics)]), file.read())
+
+    def test_download_metrics(self) -> None:
+        """ Test that a download counts every request and image, and that its total is the sum of the comic and its chapters. """
+
+        with comics.download_test.stand_in_server() as server:
+            server.reset_counts()
+            result = comics.download.download(server.comic_url, edq.util.dirent.get_temp_dir(prefix = 'comics-test-'), workers = 2)
+            server_counts = server.reset_counts()
+
+        image_count = comics.download_test.STAND_IN_CHAPTER_COUNT * comics.download_test.STAND_IN_IMAGE_COUNT
+        self.assertEqual(image_count, server_counts['image'])
+
+        self.assertEqual(sum(server_counts.values()), result.metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+        self.assertEqual(image_count, result.metrics.get_count(comics.metrics.COUNTER_IMAGES_DOWNLOADED))
+        self.assertEqual(image_count * len(server.image_body), result.metrics.get_count(comics.metrics.COUNTER_DOWNLOAD_BYTES))
+        self.assertEqual(1, result.metrics.to_dict()['phases'][comics.metrics.PHASE_SERIES_FETCH]['count'])
+
+        chapter_results = result.chapter_download_results
+        self.assertEqual(comics.download_test.STAND_IN_CHAPTER_COUNT, len(chapter_results))
+
+        for chapter_result in chapter_results:
+            self.assertEqual(comics.download_test.STAND_IN_IMAGE_COUNT, chapter_result.metrics.get_count(comics.metrics.COUNTER_IMAGES_DOWNLOADED))
+            self.assertEqual(1, chapter_result.metrics.to_dict()['phases'][comics.metrics.PHASE_IMAGE_LIST]['count'])
+            self.assertEqual(0.0, chapter_result.metrics.get_secs(comics.metrics.PHASE_SERIES_FETCH))
+
+        self.assertEqual(sum(chapter_result.metrics.get_secs(comics.metrics.PHASE_IMAGE_GET) for chapter_result in chapter_results),
+                result.metrics.get_secs(comics.metrics.PHASE_IMAGE_GET))
@@ -1,15 +1,28 @@
 import abc
+import asyncio
+import concurrent.futures
+import contextvars
 import os
-import time
+import threading
 import typing
 
-DEFAULT_IMAGE_WAIT_SECS: float = 0.15
+import comics.cache
+import comics.metrics
+import comics.net
+import comics.ratelimit
+import comics.retry
 
-DEFAULT_RETRIES: int = 4
+DEFAULT_RETRIES: int = comics.retry.DEFAULT_RETRIES
+
+DEFAULT_MAX_CONCURRENCY: int = 4
+
+DEFAULT_CHAPTER_BATCH_SIZE: int = 1
 
 class ComicImage:
     """ Information about an image that appears in a comic chapter. """
 
+    __slots__ = ('url', 'extension', 'index', 'source_id', 'name')
+
     def __init__(self,
             url: str,
             extension: typing.Union[str, None] = None,
@@ -51,8 +64,36 @@ class ComicImage:
 
         return f"{self.index:03d}{self.extension}"
 
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """ Get a JSON-friendly representation. """
+
+        return {
+            'url': self.url,
+            'extension': self.extension,
+            'index': self.index,
+            'source_id': self.source_id,
+            'name': self.name,
+        }
+
+    @staticmethod
+    def from_dict(data: typing.Dict[str, typing.Any]) -> 'ComicImage':
+        """ Load an image from to_dict(). """
+
+        return ComicImage(data['url'],
+                extension = data.get('extension', None),
+                index = data.get('index', 0),
+                source_id = data.get('source_id', None),
+                name = data.get('name', None))
+
 class ImageDownloadResult:
-    """ Information about an image's download status. """
+    """
+    Information about an image's download status.
+
+    Once the result belongs to a chapter (see ChapterDownloadResult.add_image_result()),
+    changes to its status are counted by the chapter as they happen.
+    """
+
+    __slots__ = ('image', 'out_path', '_downloaded', '_already_exists', '_error', '_exception', '_counts')
 
     def __init__(self,
             image: ComicImage,
@@ -66,24 +107,62 @@ class ImageDownloadResult:
         """ The target of the download. """
 
         self.out_path: str = out_path
-        """ Where the image was written. """
+        """
+        Where the image was written.
+        For a chapter written as an archive, this is the archive's path joined with the image's name within it.
+        """
+
+        self._downloaded: bool = downloaded
+        self._already_exists: bool = already_exists
+        self._error: typing.Union[str, None] = error
+        self._exception: typing.Union[Exception, None] = exception
 
-        self.downloaded: bool = downloaded
+        self._counts: typing.Union[_ImageCounts, None] = None
+
+    @property
+    def downloaded(self) -> bool:
         """ If the image was actually downloaded. """
 
-        self.already_exists: bool = already_exists
+        return self._downloaded
+
+    @downloaded.setter
+    def downloaded(self, downloaded: bool) -> None:
+        self._set_status('_downloaded', downloaded)
+
+    @property
+    def already_exists(self) -> bool:
         """ If the image already exists. """
 
-        self.error: typing.Union[str, None] = error
+        return self._already_exists
+
+    @already_exists.setter
+    def already_exists(self, already_exists: bool) -> None:
+        self._set_status('_already_exists', already_exists)
+
+    @property
+    def error(self) -> typing.Union[str, None]:
         """ A text describing any error that occurred. """
 
-        self.exception: typing.Union[Exception, None] = exception
+        return self._error
+
+    @error.setter
+    def error(self, error: typing.Union[str, None]) -> None:
+        self._set_status('_error', error)
+
+    @property
+    def exception(self) -> typing.Union[Exception, None]:
         """ Any exception that was thrown. """
 
+        return self._exception
+
+    @exception.setter
+    def exception(self, exception: typing.Union[Exception, None]) -> None:
+        self._set_status('_exception', exception)
+
     def has_error(self) -> bool:
         """ Check if this image download had any type of error. """
 
-        return ((self.error is not None) or (self.exception is not None))
+        return ((self._error is not None) or (self._exception is not None))
 
     def error_text(self) -> str:
         """ Get a textual representation of the error for this download, or an empty string if there was no error. """
@@ -99,9 +178,53 @@ class ImageDownloadResult:
 
         return ''
 
+    def _set_status(self, name: str, value: typing.Any) -> None:
+        """ Set one of the status fields, keeping the owning chapter's counts in step. """
+
+        counts = self._counts
+        if (counts is None):
+            setattr(self, name, value)
+            return
+
+        with counts.lock:
+            counts.apply(self, -1)
+            setattr(self, name, value)
+            counts.apply(self, 1)
+
+class _ImageCounts:
+    """
+    Running counts of a chapter's image statuses.
+    Image results point at their chapter's counts (rather than the chapter itself), so results never form a reference cycle.
+    """
+
+    __slots__ = ('lock', 'total', 'present', 'downloaded', 'already_exists', 'errors')
+
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        """ Guards the counts, since images are recorded from worker threads. """
+
+        self.total: int = 0
+        self.present: int = 0
+        self.downloaded: int = 0
+        self.already_exists: int = 0
+        self.errors: int = 0
+
+    def apply(self, image_download_result: ImageDownloadResult, sign: int) -> None:
+        """ Add (sign 1) or remove (sign -1) an image's status from the counts. The lock must be held. """
+
+        downloaded = image_download_result.downloaded
+        already_exists = image_download_result.already_exists
+
+        self.present += sign * int(downloaded or already_exists)
+        self.downloaded += sign * int(downloaded)
+        self.already_exists += sign * int(already_exists)
+        self.errors += sign * int(image_download_result.has_error())
+
 class ComicChapter:
     """ Information about a comic's chapter. """
 
+    __slots__ = ('url', 'index', 'source_id', 'name')
+
     def __init__(self,
             url: str,
             index: int = 0,
@@ -114,7 +237,7 @@ class ComicChapter:
         For some sources, this could point to the comic (and not a specific chapter).
         """
 
-        self.index: int = 0
+        self.index: int = index
         """
         The ordering for this chapter within the comic (according to the source).
         In an ideal world, this would indicate the reading order,
@@ -136,8 +259,34 @@ class ComicChapter:
 
         return f"{self.index:03d}"
 
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """ Get a JSON-friendly representation. """
+
+        return {
+            'url': self.url,
+            'index': self.index,
+            'source_id': self.source_id,
+            'name': self.name,
+        }
+
+    @staticmethod
+    def from_dict(data: typing.Dict[str, typing.Any]) -> 'ComicChapter':
+        """ Load a chapter from to_dict(). """
+
+        return ComicChapter(data['url'],
+                index = data.get('index', 0),
+                source_id = data.get('source_id', None),
+                name = data.get('name', None))
+
 class ChapterDownloadResult:
-    """ Information about a chapter's download status. """
+    """
+    Information about a chapter's download status.
+
+    Image results must be added with add_image_result() (not appended to `image_results`),
+    so that the chapter can keep count of their statuses as they change.
+    """
+
+    __slots__ = ('chapter', 'out_path', 'image_results', 'error', 'exception', 'metrics', '_counts')
 
     def __init__(self,
             chapter: ComicChapter,
@@ -145,17 +294,15 @@ class ChapterDownloadResult:
             image_results: typing.Union[typing.List[ImageDownloadResult], None] = None,
             error: typing.Union[str, None] = None,
             exception: typing.Union[Exception, None] = None,
+            metrics: typing.Union[comics.metrics.Metrics, None] = None,
             ) -> None:
         self.chapter: ComicChapter = chapter
         """ The target of the download. """
 
         self.out_path: str = out_path
-        """ Where the chapter is downloaded to. """
-
-        if (image_results is None):
-            image_results = []
+        """ Where the chapter is downloaded to (a directory or an archive). """
 
-        self.image_results: typing.List[ImageDownloadResult] = image_results
+        self.image_results: typing.List[ImageDownloadResult] = []
         """ The image download results. """
 
         self.error: typing.Union[str, None] = error
@@ -164,15 +311,49 @@ class ChapterDownloadResult:
         self.exception: typing.Union[Exception, None] = exception
         """ Any exception that was thrown. """
 
+        if (metrics is None):
+            metrics = comics.metrics.Metrics()
+
+        self.metrics: comics.metrics.Metrics = metrics
+        """ Timings and counters for the work done on this chapter (see comics.metrics). """
+
+        self._counts: _ImageCounts = _ImageCounts()
+
+        for image_result in (image_results or []):
+            self.add_image_result(image_result)
+
+    def add_image_result(self, image_result: ImageDownloadResult) -> None:
+        """ Add an image's result to this chapter (an image result may only belong to one chapter). """
+
+        if (image_result._counts is not None):  # pylint: disable=protected-access
+            raise ValueError(f"Image result already belongs to a chapter: '{image_result.out_path}'.")
+
+        with self._counts.lock:
+            image_result._counts = self._counts  # pylint: disable=protected-access
+            self._counts.total += 1
+            self._counts.apply(image_result, 1)
+
+            self.image_results.append(image_result)
+
     def missing_count(self) -> int:
         """ Get a count of the images that are missing (not downloaded or pre-existing). """
 
-        count = 0
-        for image_result in self.image_results:
-            if (image_result.downloaded or image_result.already_exists):
-                count += 1
+        return (self._counts.total - self._counts.present)
+
+    def downloaded_count(self) -> int:
+        """ Get a count of the images that were downloaded. """
+
+        return self._counts.downloaded
+
+    def already_exists_count(self) -> int:
+        """ Get a count of the images that already existed. """
 
-        return (len(self.image_results) - count)
+        return self._counts.already_exists
+
+    def error_count(self) -> int:
+        """ Get a count of the images that had any type of error. """
+
+        return self._counts.errors
 
     def has_error(self) -> bool:
         """ Check if this image download had any type of error. """
@@ -197,25 +378,14 @@ class ChapterDownloadResult:
         if (self.has_error()):
             return f"{self.chapter} - Error: {self.error_text()}"
 
-        downloaded = 0
-        errors = 0
-        already_exists = 0
-
-        for image_result in self.image_results:
-            if (image_result.downloaded):
-                downloaded += 1
-
-            if (image_result.has_error()):
-                errors += 1
-
-            if (image_result.already_exists):
-                already_exists += 1
-
-        return f"{self.chapter} - Images: {len(self.image_results)}, Downloads: {downloaded}, Errors: {errors}, Already Exists: {already_exists}"
+        return (f"{self.chapter} - Images: {len(self.image_results)}, Downloads: {self.downloaded_count()}, "
+                + f"Errors: {self.error_count()}, Already Exists: {self.already_exists_count()}")
 
 class ComicInfo:
     """ Information about a comic for the purposes of downloading. """
 
+    __slots__ = ('url', 'name', 'source_id', 'chapters', 'extra_info')
+
     def __init__(self,
             url: str,
             name: str,
@@ -248,13 +418,44 @@ class ComicInfo:
 
         return text
 
+    def to_dict(self, include_chapters: bool = True) -> typing.Dict[str, typing.Any]:
+        """
+        Get a JSON-friendly representation.
+        Any extra info must itself be JSON-friendly.
+        """
+
+        data: typing.Dict[str, typing.Any] = {
+            'url': self.url,
+            'name': self.name,
+            'source_id': self.source_id,
+            'extra_info': self.extra_info,
+        }
+
+        if (include_chapters):
+            data['chapters'] = [chapter.to_dict() for chapter in self.chapters]
+
+        return data
+
+    @staticmethod
+    def from_dict(data: typing.Dict[str, typing.Any]) -> 'ComicInfo':
+        """ Load a comic from to_dict(). """
+
+        chapters = [ComicChapter.from_dict(chapter) for chapter in data.get('chapters', [])]
+        return ComicInfo(data['url'], data['name'],
+                source_id = data.get('source_id', None),
+                chapters = chapters,
+                **data.get('extra_info', {}))
+
 class DownloadResult:
     """ The result of downloading a comic. """
 
+    __slots__ = ('comic', 'out_dir', 'chapter_download_results', 'metrics')
+
     def __init__(self,
             comic: ComicInfo,
             out_dir: str,
             chapter_download_results: typing.List[ChapterDownloadResult],
+            metrics: typing.Union[comics.metrics.Metrics, None] = None,
             ) -> None:
         self.comic: ComicInfo = comic
         """ The target comic. """
@@ -267,30 +468,109 @@ class DownloadResult:
         Information about the status of images for each chapter.
         """
 
+        # The passed metrics only cover work outside of any chapter (e.g., fetching the comic's info).
+        total_metrics = comics.metrics.Metrics()
+        if (metrics is not None):
+            total_metrics.merge(metrics)
+
+        for chapter_download_result in chapter_download_results:
+            total_metrics.merge(chapter_download_result.metrics)
+
+        self.metrics: comics.metrics.Metrics = total_metrics
+        """ Timings and counters for the whole download, including every chapter (see comics.metrics). """
+
 class ComicSource(abc.ABC):
-    """ An abstraction for a source that comics can be download from. """
+    """
+    An abstraction for a source that comics can be download from.
+
+    Requests made through the source's session are measured automatically (see comics.metrics).
+    Sources can time their own phases (e.g., fetching a comic's page) with comics.metrics.timed().
+
+    How requests are timed out, retried, and hedged (and when a failing host is left alone) is set by the source's retry policy.
+    `retries`, if given, overrides the policy's number of retries.
+    """
 
     def __init__(self,
             name: str,
-            image_wait_secs: float = DEFAULT_IMAGE_WAIT_SECS,
-            retries: int = DEFAULT_RETRIES,
+            retries: typing.Union[int, None] = None,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            rate_per_sec: float = comics.ratelimit.DEFAULT_RATE_PER_SEC,
+            burst: int = comics.ratelimit.DEFAULT_BURST,
+            metadata_cache: typing.Union[comics.cache.MetadataCache, None] = None,
+            retry_policy: typing.Union[comics.retry.RetryPolicy, None] = None,
+            chapter_batch_size: int = DEFAULT_CHAPTER_BATCH_SIZE,
             ) -> None:
         self.name = name
         """ A display name for this source. """
 
-        self.image_wait_secs: float = image_wait_secs
-        """ How long to wait between image requests. """
+        if (retry_policy is None):
+            retry_policy = comics.retry.RetryPolicy()
+
+        if (retries is not None):
+            retry_policy.retries = max(0, retries)
 
-        self.retries: int = retries
-        """ The number of times to retry a request. """
+        self.retry_policy: comics.retry.RetryPolicy = retry_policy
+        """ How this source's requests are timed out, retried, and hedged (shared with its session). """
+
+        self.max_concurrency: int = max(1, max_concurrency)
+        """
+        The maximum number of requests that may be in flight against this source at once.
+        Downloads will never use more workers than this, regardless of what is requested.
+        """
+
+        self.chapter_batch_size: int = max(1, chapter_batch_size)
+        """
+        The most chapters whose image lists the source can resolve in a single request (see get_chapter_images_batch()).
+        One means the source can only list a chapter at a time.
+        """
+
+        self.rate_limiter: comics.ratelimit.RateLimiter = comics.ratelimit.RateLimiter(rate_per_sec, burst)
+        """
+        Paces every request made to this source, per host.
+        Each host gets `burst` requests at once and then `rate_per_sec` requests per second,
+        backing off automatically when the host throttles us.
+        """
+
+        # Image workers and chapter prefetching are each capped at max_concurrency.
+        self.session: comics.net.Session = comics.net.Session(pool_size = 2 * self.max_concurrency,
+                rate_limiter = self.rate_limiter, retry_policy = self.retry_policy)
+        """
+        The keep-alive session that all requests to this source (metadata and images) should go through.
+        Its stats show how often connections are reused.
+        """
+
+        self.metadata_cache: typing.Union[comics.cache.MetadataCache, None] = metadata_cache
+        """ A cache for this source's metadata, see get_metadata_cache(). """
 
     def __repr__(self) -> str:
         return self.name
 
-    def image_wait(self) -> None:
-        """ A courtesy wait between downloading images. """
+    @property
+    def retries(self) -> int:
+        """ The number of times to retry a request (see `retry_policy`). """
+
+        return self.retry_policy.retries
+
+    @retries.setter
+    def retries(self, retries: int) -> None:
+        self.retry_policy.retries = max(0, retries)
 
-        time.sleep(self.image_wait_secs)
+    def get_metadata_cache(self) -> typing.Union[comics.cache.MetadataCache, None]:
+        """
+        Get the cache this source should keep metadata in:
+        its own cache if it has one, otherwise the default cache (see comics.cache.set_default_cache()).
+        None means nothing should be cached.
+        """
+
+        if (self.metadata_cache is not None):
+            return self.metadata_cache
+
+        return comics.cache.get_default_cache()
+
+    def close(self) -> None:
+        """ Release any resources (e.g., pooled connections) held by this source. """
+
+        self.session.close()
 
     @abc.abstractmethod
     def get_info_from_url(self, url: str) -> ComicInfo:
@@ -299,3 +579,75 @@ class ComicSource(abc.ABC):
     @abc.abstractmethod
     def get_chapter_images(self, comic: ComicInfo, chapter: ComicChapter) -> typing.List[ComicImage]:
         """ Get the images that make up a chapter. """
+
+    async def get_info_from_url_async(self, url: str) -> ComicInfo:
+        """
+        An async variant of get_info_from_url().
+        By default, the blocking version is run in one of the session's threads (see comics.net.Session.run_blocking_async()).
+        Sources should override this with a native implementation when they can.
+        """
+
+        return typing.cast(ComicInfo, await self.session.run_blocking_async(self.get_info_from_url, url))
+
+    async def get_chapter_images_async(self, comic: ComicInfo, chapter: ComicChapter) -> typing.List[ComicImage]:
+        """
+        An async variant of get_chapter_images().
+        By default, the blocking version is run in one of the session's threads (see comics.net.Session.run_blocking_async()).
+        Sources should override this with a native implementation when they can.
+        """
+
+        return typing.cast(typing.List[ComicImage], await self.session.run_blocking_async(self.get_chapter_images, comic, chapter))
+
+    def get_chapter_images_batch(self,
+            comic: ComicInfo,
+            chapters: typing.List[ComicChapter],
+            ) -> typing.List[typing.Union[typing.List[ComicImage], Exception]]:
+        """
+        Get the images that make up each of several chapters (in the same order as the chapters).
+        A chapter whose images could not be listed gets the exception that was raised instead,
+        so one bad chapter does not fail the rest.
+
+        Sources that can list several chapters in one request should override this (and set `chapter_batch_size`).
+        By default, each chapter is listed with get_chapter_images(), up to `max_concurrency` at a time.
+        Any current metrics (see comics.metrics) follow the requests into the worker threads.
+        """
+
+        workers = min(self.max_concurrency, len(chapters))
+        if (workers <= 1):
+            return [_get_chapter_images_result(self, comic, chapter) for chapter in chapters]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'comics-chapter-batch') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, _get_chapter_images_result, self, comic, chapter) for chapter in chapters]
+            return [future.result() for future in futures]
+
+    async def get_chapter_images_batch_async(self,
+            comic: ComicInfo,
+            chapters: typing.List[ComicChapter],
+            ) -> typing.List[typing.Union[typing.List[ComicImage], Exception]]:
+        """
+        An async variant of get_chapter_images_batch().
+        By default, each chapter is listed with get_chapter_images_async(), up to `max_concurrency` at a time.
+        """
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def get_result(chapter: ComicChapter) -> typing.Union[typing.List[ComicImage], Exception]:
+            async with semaphore:
+                try:
+                    return await self.get_chapter_images_async(comic, chapter)
+                except Exception as ex:
+                    return ex
+
+        return list(await asyncio.gather(*[get_result(chapter) for chapter in chapters]))
+
+def _get_chapter_images_result(
+        source: ComicSource,
+        comic: ComicInfo,
+        chapter: ComicChapter,
+        ) -> typing.Union[typing.List[ComicImage], Exception]:
+    """ List a chapter's images, returning (instead of raising) any exception. """
+
+    try:
+        return source.get_chapter_images(comic, chapter)
+    except Exception as ex:
+        return ex
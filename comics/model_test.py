@@ -0,0 +1,153 @@
+import concurrent.futures
+import typing
+
+import edq.testing.unittest
+
+import comics.metrics
+import comics.model
+
+class TestModel(edq.testing.unittest.BaseTest):
+    """ Test the comic and result models. """
+
+    def test_slots(self) -> None:
+        """ Test that model objects carry no per-instance dict. """
+
+        image = comics.model.ComicImage('http://test.invalid/1.jpg')
+        chapter = comics.model.ComicChapter('http://test.invalid/1')
+
+        objects = [
+            image,
+            chapter,
+            comics.model.ImageDownloadResult(image, '/tmp/1.jpg'),
+            comics.model.ChapterDownloadResult(chapter, '/tmp'),
+            comics.model.ComicInfo('http://test.invalid', 'Comic'),
+            comics.model.DownloadResult(comics.model.ComicInfo('http://test.invalid', 'Comic'), '/tmp', []),
+        ]
+
+        for (i, value) in enumerate(objects):
+            with self.subTest(msg = f"Case {i} ({type(value).__name__}):"):
+                self.assertFalse(hasattr(value, '__dict__'))
+
+                with self.assertRaises(AttributeError):
+                    setattr(value, 'not_a_field', 1)
+
+    def test_chapter_counts(self) -> None:
+        """ Test that a chapter's counts follow its images' statuses as they change. """
+
+        chapter_result = comics.model.ChapterDownloadResult(comics.model.ComicChapter('http://test.invalid/1', name = '1'), '/tmp/1',
+                image_results = [self._make_image_result(0, already_exists = True)])
+
+        image_results = [self._make_image_result(i) for i in range(1, 4)]
+        for image_result in image_results:
+            chapter_result.add_image_result(image_result)
+
+        # [(change, expected (missing, downloaded, already exists, errors)), ...]
+        test_cases: typing.List[typing.Tuple[typing.Callable[[], None], typing.Tuple[int, int, int, int]]] = [
+            (lambda: None, (3, 0, 1, 0)),
+            (lambda: setattr(image_results[0], 'downloaded', True), (2, 1, 1, 0)),
+            (lambda: setattr(image_results[0], 'downloaded', True), (2, 1, 1, 0)),
+            (lambda: setattr(image_results[1], 'error', 'Broken.'), (2, 1, 1, 1)),
+            (lambda: setattr(image_results[1], 'exception', ValueError('Broken.')), (2, 1, 1, 1)),
+            (lambda: setattr(image_results[1], 'error', None), (2, 1, 1, 1)),
+            (lambda: setattr(image_results[1], 'exception', None), (2, 1, 1, 0)),
+            (lambda: setattr(image_results[2], 'already_exists', True), (1, 1, 2, 0)),
+            (lambda: setattr(image_results[2], 'downloaded', True), (1, 2, 2, 0)),
+            (lambda: setattr(image_results[0], 'downloaded', False), (2, 1, 2, 0)),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (change, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                change()
+
+                actual = (chapter_result.missing_count(), chapter_result.downloaded_count(),
+                        chapter_result.already_exists_count(), chapter_result.error_count())
+                self.assertEqual(expected, actual)
+
+                # The counts must always match a full scan.
+                self.assertEqual(sum(1 for result in chapter_result.image_results if not (result.downloaded or result.already_exists)),
+                        chapter_result.missing_count())
+                self.assertEqual(sum(1 for result in chapter_result.image_results if result.has_error()), chapter_result.error_count())
+
+        self.assertEqual('1 - Images: 4, Downloads: 1, Errors: 0, Already Exists: 2', repr(chapter_result))
+
+        chapter_result.error = 'Failed.'
+        self.assertEqual('1 - Error: Failed. - None', repr(chapter_result))
+
+    def test_image_result_belongs_to_one_chapter(self) -> None:
+        """ Test that an image result can not be counted by two chapters. """
+
+        image_result = self._make_image_result(0)
+        comics.model.ChapterDownloadResult(comics.model.ComicChapter('http://test.invalid/1'), '/tmp/1', image_results = [image_result])
+
+        other = comics.model.ChapterDownloadResult(comics.model.ComicChapter('http://test.invalid/2'), '/tmp/2')
+        with self.assertRaisesRegex(ValueError, 'already belongs'):
+            other.add_image_result(image_result)
+
+        self.assertEqual([], other.image_results)
+        self.assertEqual(0, other.missing_count())
+
+    def test_chapter_counts_threads(self) -> None:
+        """ Test that counts stay right when images are recorded from several threads at once. """
+
+        chapter_result = comics.model.ChapterDownloadResult(comics.model.ComicChapter('http://test.invalid/1'), '/tmp/1')
+        image_results = [self._make_image_result(i) for i in range(2000)]
+
+        def record(image_result: comics.model.ImageDownloadResult) -> None:
+            chapter_result.add_image_result(image_result)
+
+            if (image_result.image.index % 3 == 0):
+                image_result.error = 'Broken.'
+            else:
+                image_result.downloaded = True
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+            list(executor.map(record, image_results))
+
+        self.assertEqual(667, chapter_result.missing_count())
+        self.assertEqual(1333, chapter_result.downloaded_count())
+        self.assertEqual(667, chapter_result.error_count())
+
+    def test_round_trip(self) -> None:
+        """ Test that comics, chapters, and images survive to_dict() and from_dict(). """
+
+        image = comics.model.ComicImage('http://test.invalid/1.png', index = 3, source_id = 'a', name = 'page')
+        self.assertEqual(image.to_dict(), comics.model.ComicImage.from_dict(image.to_dict()).to_dict())
+        self.assertEqual('.png', image.extension)
+        self.assertEqual('page.png', repr(image))
+
+        chapters = [comics.model.ComicChapter('http://test.invalid/1', index = i, source_id = str(i), name = None) for i in range(3)]
+        comic = comics.model.ComicInfo('http://test.invalid', 'Comic', source_id = '7', chapters = chapters, next_action = 'abc')
+
+        loaded = comics.model.ComicInfo.from_dict(comic.to_dict())
+        self.assertEqual(comic.to_dict(), loaded.to_dict())
+        self.assertEqual({'next_action': 'abc'}, loaded.extra_info)
+        self.assertEqual('Comic (7)', repr(loaded))
+        self.assertEqual(['0', '1', '2'], [repr(chapter) for chapter in loaded.chapters])
+
+        self.assertNotIn('chapters', comic.to_dict(include_chapters = False))
+
+    def test_download_result_metrics(self) -> None:
+        """ Test that a comic's metrics add up its own and its chapters' metrics (without changing any of them). """
+
+        comic_metrics = comics.metrics.Metrics()
+        comic_metrics.add(comics.metrics.COUNTER_REQUESTS, 2)
+
+        chapter_results = []
+        for i in range(3):
+            chapter_result = comics.model.ChapterDownloadResult(comics.model.ComicChapter('http://test.invalid', index = i), '/tmp')
+            chapter_result.metrics.add(comics.metrics.COUNTER_REQUESTS, 10)
+            chapter_results.append(chapter_result)
+
+        result = comics.model.DownloadResult(comics.model.ComicInfo('http://test.invalid', 'Comic'), '/tmp', chapter_results, metrics = comic_metrics)
+
+        self.assertEqual(32, result.metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+        self.assertEqual(2, comic_metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+        self.assertEqual(10, chapter_results[0].metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+
+    def _make_image_result(self, index: int, **kwargs: typing.Any) -> comics.model.ImageDownloadResult:
+        """ Make an image result. """
+
+        image = comics.model.ComicImage(f"http://test.invalid/{index}.jpg", index = index)
+        return comics.model.ImageDownloadResult(image, f"/tmp/{index}.jpg", **kwargs)
@@ -0,0 +1,859 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import http
+import io
+import logging
+import os
+import re
+import threading
+import time
+import typing
+
+import edq.core.errors
+import edq.net.settings
+import requests
+import requests.adapters
+import urllib3
+
+import comics.metrics
+import comics.ratelimit
+import comics.retry
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE: int = 64 * 1024
+""" The number of bytes read from a streamed response body at a time. """
+
+DEFAULT_POOL_SIZE: int = 8
+
+PARTIAL_FILE_SUFFIX: str = '.part'
+""" Downloads are written to a file with this suffix next to their final path, and only renamed into place when complete. """
+
+MAX_HOST_POOLS: int = 16
+""" The number of hosts a session will keep a connection pool open for at once. """
+
+THROTTLE_STATUSES: typing.Set[int] = {
+    http.HTTPStatus.TOO_MANY_REQUESTS,
+    http.HTTPStatus.SERVICE_UNAVAILABLE,
+}
+""" Response statuses that mean a host wants us to slow down (and may be retried). """
+
+class ConnectionStats:
+    """ Counters for the requests made through a session and the connections they needed. """
+
+    def __init__(self) -> None:
+        self.requests: int = 0
+        """ The number of requests that were sent. """
+
+        self.new_connections: int = 0
+        """ The number of connections that had to be opened (each one a fresh TCP (and possibly TLS) handshake). """
+
+        self._lock: threading.Lock = threading.Lock()
+
+    def add_request(self) -> None:
+        """ Count a sent request. """
+
+        with self._lock:
+            self.requests += 1
+
+    def add_connection(self) -> None:
+        """ Count an opened connection. """
+
+        with self._lock:
+            self.new_connections += 1
+
+    def reused_connections(self) -> int:
+        """ Get the number of requests that were served over an already open connection. """
+
+        return max(0, self.requests - self.new_connections)
+
+    def __repr__(self) -> str:
+        return f"Requests: {self.requests}, New Connections: {self.new_connections}, Reused Connections: {self.reused_connections()}"
+
+class Session:
+    """
+    A keep-alive HTTP session with a bounded connection pool per host.
+    A session is safe to share between threads,
+    and all requests through it (metadata and images alike) reuse the same pool,
+    are paced by the same rate limiter, and follow the same retry policy.
+
+    The async methods are not a native non-blocking client:
+    they wait on the rate limiter on the event loop, and then run the blocking request in one of the session's own threads.
+    There is one thread per pooled connection (see run_blocking_async()),
+    so async callers are limited by the same pool as everyone else and never queue behind unrelated work in asyncio's default executor.
+    """
+
+    def __init__(self,
+            pool_size: int = DEFAULT_POOL_SIZE,
+            rate_limiter: typing.Union[comics.ratelimit.RateLimiter, None] = None,
+            retry_policy: typing.Union[comics.retry.RetryPolicy, None] = None,
+            ) -> None:
+        self.pool_size: int = max(1, pool_size)
+        """ The maximum number of idle connections kept open to each host. """
+
+        if (retry_policy is None):
+            retry_policy = comics.retry.RetryPolicy()
+
+        self.retry_policy: comics.retry.RetryPolicy = retry_policy
+        """ How requests are timed out, backed off between retries, and hedged, and when a failing host is left alone. """
+
+        self.host_tracker: comics.retry.HostTracker = comics.retry.HostTracker(retry_policy)
+        """ The circuit breaker and recent response times for each host. """
+
+        self.rate_limiter: typing.Union[comics.ratelimit.RateLimiter, None] = rate_limiter
+        """ If set, every attempt at a request must first get a token for its host. """
+
+        self.stats: ConnectionStats = ConnectionStats()
+        """ Counters that can be used to confirm that connections are being reused. """
+
+        self._session: requests.Session = requests.Session()
+
+        self._executor_lock: threading.Lock = threading.Lock()
+        self._hedge_executor: typing.Union[concurrent.futures.ThreadPoolExecutor, None] = None
+        self._blocking_executor: typing.Union[concurrent.futures.ThreadPoolExecutor, None] = None
+
+        adapter = _CountingAdapter(self.stats, pool_connections = MAX_HOST_POOLS, pool_maxsize = self.pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def request(self, method: str, url: str,
+            retries: int = 0,
+            raise_for_status: bool = True,
+            **kwargs: typing.Any) -> typing.Tuple[requests.Response, str]:
+        """
+        Make an HTTP request and return the response object and text body.
+        Failed attempts (including throttled ones) are retried according to the session's retry policy.
+        Any additional arguments are passed to requests.
+        """
+
+        return self._request(method, url, retries, raise_for_status, True, kwargs)
+
+    async def request_async(self, method: str, url: str,
+            retries: int = 0,
+            raise_for_status: bool = True,
+            **kwargs: typing.Any) -> typing.Tuple[requests.Response, str]:
+        """
+        An awaitable request().
+        Waiting on the rate limiter happens on the event loop,
+        and only the blocking request itself is offloaded to one of the session's threads (see run_blocking_async()).
+        """
+
+        if (self.rate_limiter is not None):
+            _record_wait(await self.rate_limiter.acquire_async(url))
+
+        return typing.cast(typing.Tuple[requests.Response, str],
+                await self.run_blocking_async(self._request, method, url, retries, raise_for_status, False, kwargs))
+
+    async def run_blocking_async(self, function: typing.Callable[..., typing.Any], *args: typing.Any) -> typing.Any:
+        """
+        Run a blocking call (e.g., a request through this session, or reading a streamed response) in one of the session's threads.
+        The session has one thread per pooled connection (`pool_size`), so calls beyond that wait for a thread.
+        The call runs in a copy of the caller's context, so anything it records goes to the caller's metrics.
+        """
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_blocking_executor(), functools.partial(context.run, function, *args))
+
+    def _request(self,
+            method: str,
+            url: str,
+            retries: int,
+            raise_for_status: bool,
+            acquire_first: bool,
+            kwargs: typing.Dict[str, typing.Any],
+            phase: typing.Union[str, None] = None,
+            hedge: bool = False,
+            ) -> typing.Tuple[requests.Response, str]:
+        """
+        Make a request, see request().
+        If a phase is given, the time spent on the network is recorded as that phase (see comics.metrics).
+        With `hedge`, slow attempts may be hedged (see _send_hedged()).
+        """
+
+        options: typing.Dict[str, typing.Any] = {
+            'timeout': self.retry_policy.timeout_secs,
+            'verify': edq.net.settings.get_https_verification(),
+        }
+
+        options.update(kwargs)
+
+        _logger.debug("Making %s request: '%s'.", method, url)
+        response = self._request_with_retry(method, url, options, max(0, retries), acquire_first, phase, hedge)
+
+        if (raise_for_status):
+            try:
+                response.raise_for_status()
+            except Exception:
+                # A streamed response would otherwise hold onto its connection.
+                response.close()
+                raise
+
+        if (options.get('stream', False)):
+            return response, ''
+
+        comics.metrics.add(comics.metrics.COUNTER_RESPONSE_BYTES, len(response.content))
+
+        return response, response.text
+
+    def get(self, url: str, **kwargs: typing.Any) -> typing.Tuple[requests.Response, str]:
+        """ Make a GET request and return the response object and text body. """
+
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: typing.Any) -> typing.Tuple[requests.Response, str]:
+        """ Make a POST request and return the response object and text body. """
+
+        return self.request('POST', url, **kwargs)
+
+    def download_file(self, url: str, out_path: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            retries: int = 0,
+            resume: bool = True,
+            **kwargs: typing.Any) -> int:
+        """
+        Stream the body of a GET request to disk and return the number of bytes written.
+
+        The body is written in chunks, so memory use does not depend on the size of the body.
+        It is written to a partial file that is atomically renamed to `out_path` only once the body is complete,
+        so `out_path` never holds a truncated body.
+
+        With `resume`, a partial file left by an interrupted transfer (in this call or an earlier run) is kept,
+        and the rest of the body is requested with a Range header.
+        If the server does not honor the range, the body is fetched in full.
+        Transfers that fail partway through the body are retried (`retries` times) from where they stopped.
+        Without `resume`, the partial file is removed on any failure.
+
+        Time on the network and time writing to disk are recorded separately (see comics.metrics).
+        """
+
+        return self._download_file(url, out_path, chunk_size, retries, resume, True, kwargs)
+
+    async def download_file_async(self, url: str, out_path: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            retries: int = 0,
+            resume: bool = True,
+            **kwargs: typing.Any) -> int:
+        """ An awaitable download_file(), offloaded the same way as request_async(). """
+
+        if (self.rate_limiter is not None):
+            _record_wait(await self.rate_limiter.acquire_async(url))
+
+        return typing.cast(int, await self.run_blocking_async(self._download_file, url, out_path, chunk_size, retries, resume, False, kwargs))
+
+    def fetch_bytes(self, url: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            retries: int = 0,
+            **kwargs: typing.Any) -> bytes:
+        """
+        Stream the body of a GET request into memory and return it.
+        Transfers are made (and retried from where they stopped) the same way as download_file(),
+        for callers that write the body somewhere other than its own file (e.g., into an archive).
+        """
+
+        sink = _MemorySink()
+        self._fetch_to_sink(url, sink, chunk_size, retries, True, True, kwargs)
+        return sink.get_bytes()
+
+    async def fetch_bytes_async(self, url: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            retries: int = 0,
+            **kwargs: typing.Any) -> bytes:
+        """ An awaitable fetch_bytes(), offloaded the same way as request_async(). """
+
+        if (self.rate_limiter is not None):
+            _record_wait(await self.rate_limiter.acquire_async(url))
+
+        sink = _MemorySink()
+        await self.run_blocking_async(self._fetch_to_sink, url, sink, chunk_size, retries, True, False, kwargs)
+        return sink.get_bytes()
+
+    def _download_file(self,
+            url: str,
+            out_path: str,
+            chunk_size: int,
+            retries: int,
+            resume: bool,
+            acquire_first: bool,
+            kwargs: typing.Dict[str, typing.Any],
+            ) -> int:
+        """ Download a file, see download_file(). """
+
+        sink = _FileSink(out_path + PARTIAL_FILE_SUFFIX)
+        if (not resume):
+            sink.discard()
+
+        self._fetch_to_sink(url, sink, chunk_size, retries, resume, acquire_first, kwargs)
+
+        with comics.metrics.timed(comics.metrics.PHASE_DISK_WRITE):
+            os.replace(sink.path, out_path)
+
+        return os.path.getsize(out_path)
+
+    def _fetch_to_sink(self,
+            url: str,
+            sink: '_BodySink',
+            chunk_size: int,
+            retries: int,
+            resume: bool,
+            acquire_first: bool,
+            kwargs: typing.Dict[str, typing.Any],
+            ) -> None:
+        """
+        Fetch a body into a sink, retrying transfers that fail (either the request itself or partway through the body).
+        Every request counts against the same `retries`, so a transfer is attempted at most `1 + retries` times in all.
+        With `resume`, retries continue from where the last transfer stopped, otherwise the sink is discarded on any failure.
+        """
+
+        # Try once and then the number of allowed retries.
+        attempt_count = 1 + max(0, retries)
+
+        errors: typing.List[Exception] = []
+        validator = None
+        throttled = False
+
+        try:
+            for attempt_index in range(attempt_count):
+                # A throttled attempt has already paused the rate limiter.
+                if (attempt_index > 0):
+                    comics.metrics.add(comics.metrics.COUNTER_RETRIES)
+
+                if ((attempt_index > 0) and (not (throttled and (self.rate_limiter is not None)))):
+                    # Wait before the next retry.
+                    self._backoff(attempt_index)
+
+                try:
+                    validator = self._stream_to_sink(url, sink, chunk_size, validator, (acquire_first or (attempt_index > 0)), kwargs)
+                except (_BodyError, _RequestError) as ex:
+                    errors.append(ex.cause)
+                    throttled = (isinstance(ex, _RequestError) and ex.throttled)
+
+                    if (isinstance(ex, _BodyError)):
+                        # A failed request has already been counted against its host.
+                        _logger.debug("Transfer of '%s' stopped partway through the body.", url, exc_info = ex)
+                        self.host_tracker.fail(url)
+
+                    if (not resume):
+                        sink.discard()
+
+                    continue
+
+                return
+        except BaseException:
+            if (not resume):
+                sink.discard()
+
+            raise
+
+        raise edq.core.errors.RetryError(f"HTTP GET for '{url}'", attempt_count, retry_errors = errors)
+
+    def _stream_to_sink(self,
+            url: str,
+            sink: '_BodySink',
+            chunk_size: int,
+            validator: typing.Union[str, None],
+            acquire_first: bool,
+            kwargs: typing.Dict[str, typing.Any],
+            ) -> typing.Union[str, None]:
+        """
+        Make a single request for (the rest of) a body and append it to the sink.
+        Returns a validator (ETag or Last-Modified) for the body if the server sent one.
+        The request is not retried here (see _fetch_to_sink()):
+        a request that fails or is throttled is raised as a _RequestError, and failures while reading the body are raised as a _BodyError.
+        """
+
+        offset = sink.size()
+
+        headers = dict(kwargs.get('headers', None) or {})
+
+        # Offsets must count the bytes as they are sent, not after decompression.
+        headers['Accept-Encoding'] = 'identity'
+
+        if (offset > 0):
+            headers['Range'] = f"bytes={offset}-"
+            if (validator is not None):
+                headers['If-Range'] = validator
+
+        options = kwargs.copy()
+        options['headers'] = headers
+        options['stream'] = True
+
+        try:
+            response, _ = self._request('GET', url, 0, False, acquire_first, options, comics.metrics.PHASE_IMAGE_GET, hedge = True)
+        except edq.core.errors.RetryError as ex:
+            raise _RequestError(ex.retry_errors[-1] if (len(ex.retry_errors) > 0) else ex) from ex
+
+        with response:
+            if (_is_throttled(response)):
+                raise _RequestError(requests.HTTPError(f"Throttled ({response.status_code}).", response = response), throttled = True)
+
+            if ((offset > 0) and (response.status_code == http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)):
+                # The partial body does not match what the server has, start over.
+                _logger.debug("Server rejected resuming '%s' at byte %d, fetching in full.", url, offset)
+                sink.discard()
+                return self._stream_to_sink(url, sink, chunk_size, None, True, kwargs)
+
+            response.raise_for_status()
+
+            new_validator = _get_validator(response)
+
+            append = False
+            if ((offset > 0) and (response.status_code == http.HTTPStatus.PARTIAL_CONTENT)):
+                if (_content_range_start(response) != offset):
+                    sink.discard()
+                    raise _BodyError(ValueError(f"Server returned an unexpected range for '{url}'."))
+
+                append = True
+                _logger.debug("Resuming '%s' at byte %d.", url, offset)
+            elif (offset > 0):
+                _logger.debug("Server did not honor a range for '%s', fetching in full.", url)
+
+            with sink.open(append) as file:
+                _write_body(response, file, chunk_size)
+
+        return new_validator
+
+    async def get_async(self, url: str, **kwargs: typing.Any) -> typing.Tuple[requests.Response, str]:
+        """ An awaitable get(), see request_async(). """
+
+        return await self.request_async('GET', url, **kwargs)
+
+    async def post_async(self, url: str, **kwargs: typing.Any) -> typing.Tuple[requests.Response, str]:
+        """ An awaitable post(), see request_async(). """
+
+        return await self.request_async('POST', url, **kwargs)
+
+    def add_response_hook(self, hook: typing.Callable[[requests.Response], None]) -> None:
+        """
+        Call a function with every response this session receives (including ones that will be retried),
+        as soon as its headers have arrived.
+        `response.elapsed` holds the time from sending the request to receiving its headers.
+        """
+
+        def call_hook(response: requests.Response, *args: typing.Any, **kwargs: typing.Any) -> None:
+            hook(response)
+
+        self._session.hooks['response'].append(call_hook)
+
+    def close(self) -> None:
+        """ Close all pooled connections. """
+
+        with self._executor_lock:
+            for executor in (self._hedge_executor, self._blocking_executor):
+                if (executor is not None):
+                    executor.shutdown(wait = False)
+
+            self._hedge_executor = None
+            self._blocking_executor = None
+
+        self._session.close()
+
+    def _request_with_retry(self,
+            method: str,
+            url: str,
+            options: typing.Dict[str, typing.Any],
+            retries: int,
+            acquire_first: bool = True,
+            phase: typing.Union[str, None] = None,
+            hedge: bool = False,
+            ) -> requests.Response:
+        """
+        Make a request, retrying on failure or throttling.
+        If the final attempt is throttled, its response is returned.
+        If a phase is given, the time spent on the network is recorded as that phase.
+        A host whose circuit is open (see comics.retry.CircuitBreaker) is not sent anything and a CircuitOpenError is raised.
+        """
+
+        # Try once and then the number of allowed retries.
+        attempt_count = 1 + retries
+
+        errors: typing.List[Exception] = []
+        throttled = False
+        for attempt_index in range(attempt_count):
+            # A throttled attempt has already paused the rate limiter.
+            if (attempt_index > 0):
+                comics.metrics.add(comics.metrics.COUNTER_RETRIES)
+
+            if ((attempt_index > 0) and (not (throttled and (self.rate_limiter is not None)))):
+                # Wait before the next retry.
+                self._backoff(attempt_index)
+
+            if (not self.host_tracker.allow(url)):
+                comics.metrics.add(comics.metrics.COUNTER_CIRCUIT_REJECTIONS)
+                raise comics.retry.CircuitOpenError(f"Host has been failing, not sending {method} request: '{url}'.")
+
+            if ((self.rate_limiter is not None) and ((attempt_index > 0) or acquire_first)):
+                _record_wait(self.rate_limiter.acquire(url))
+
+            self.stats.add_request()
+            comics.metrics.add(comics.metrics.COUNTER_REQUESTS)
+
+            hedge_delay = None
+            if (hedge):
+                hedge_delay = self.host_tracker.hedge_delay(url)
+
+            start = time.monotonic()
+            try:
+                if (hedge_delay is None):
+                    response = self._session.request(method, url, **options)
+                else:
+                    response = self._send_hedged(method, url, options, hedge_delay)
+            except Exception as ex:
+                throttled = False
+                errors.append(ex)
+                self.host_tracker.fail(url)
+                continue
+            finally:
+                if (phase is not None):
+                    comics.metrics.add_time(phase, time.monotonic() - start)
+
+            throttled = self._check_throttled(url, response)
+            if (response.status_code >= http.HTTPStatus.INTERNAL_SERVER_ERROR):
+                self.host_tracker.fail(url)
+            elif (not throttled):
+                self.host_tracker.succeed(url)
+
+                if (hedge):
+                    self.host_tracker.add_latency(url, time.monotonic() - start)
+
+            if ((not throttled) or (attempt_index == (attempt_count - 1))):
+                return response
+
+            response.close()
+            errors.append(requests.HTTPError(f"Throttled ({response.status_code}).", response = response))
+
+        raise edq.core.errors.RetryError(f"HTTP {method} for '{url}'", attempt_count, retry_errors = errors)
+
+    def _send_hedged(self, method: str, url: str, options: typing.Dict[str, typing.Any], hedge_delay: float) -> requests.Response:
+        """
+        Send a request, and if its response has not arrived within `hedge_delay`, send a duplicate and use whichever arrives first.
+        A hedge is only sent if the host's circuit is closed and its rate limiter has a token free right away,
+        so hedging never waits on (or adds to the backlog of) a host that is already struggling.
+        The response that loses is closed when it arrives.
+        """
+
+        executor = self._get_hedge_executor()
+        futures = [executor.submit(self._session.request, method, url, **options)]
+
+        done, _ = concurrent.futures.wait(futures, timeout = hedge_delay)
+        if ((len(done) == 0) and self._can_hedge(url)):
+            _logger.debug("Hedging %s request after %.3f seconds: '%s'.", method, hedge_delay, url)
+            self.stats.add_request()
+            comics.metrics.add(comics.metrics.COUNTER_REQUESTS)
+            comics.metrics.add(comics.metrics.COUNTER_HEDGED_REQUESTS)
+
+            futures.append(executor.submit(self._session.request, method, url, **options))
+
+        pending = set(futures)
+        error: typing.Union[Exception, None] = None
+
+        while (len(pending) > 0):
+            done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+
+            response = None
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    error = ex
+                    continue
+
+                if (response is None):
+                    response = result
+                else:
+                    result.close()
+
+            if (response is not None):
+                for future in pending:
+                    future.cancel()
+                    future.add_done_callback(_close_response)
+
+                return response
+
+        if (error is None):
+            raise ValueError(f"No response for hedged {method} request: '{url}'.")
+
+        raise error
+
+    def _can_hedge(self, url: str) -> bool:
+        """ Check if a hedge may be sent to a URL's host right now (taking a rate limiter token if so). """
+
+        if (not self.host_tracker.allow(url)):
+            return False
+
+        return ((self.rate_limiter is None) or self.rate_limiter.try_acquire(url))
+
+    def _get_hedge_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """ Get the threads that hedged requests are sent from (starting them if needed). """
+
+        with self._executor_lock:
+            if (self._hedge_executor is None):
+                # A hedged request holds two threads at most.
+                self._hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 2 * self.pool_size, thread_name_prefix = 'comics-hedge')
+
+            return self._hedge_executor
+
+    def _get_blocking_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """ Get the threads that async calls are offloaded to (starting them if needed). """
+
+        with self._executor_lock:
+            if (self._blocking_executor is None):
+                self._blocking_executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.pool_size, thread_name_prefix = 'comics-async')
+
+            return self._blocking_executor
+
+    def _backoff(self, attempt_index: int) -> None:
+        """ Wait before a retry (according to the retry policy), recording the time as a courtesy wait. """
+
+        secs = self.retry_policy.backoff_secs(attempt_index)
+        time.sleep(secs)
+        _record_wait(secs)
+
+    def _check_throttled(self, url: str, response: requests.Response) -> bool:
+        """ Check if a response is asking us to slow down, and let the rate limiter know how the request went. """
+
+        throttled = _is_throttled(response)
+
+        if (self.rate_limiter is not None):
+            if (throttled):
+                self.rate_limiter.throttle(url, response.headers.get('Retry-After', None))
+            elif (response.status_code < http.HTTPStatus.BAD_REQUEST):
+                self.rate_limiter.succeed(url)
+
+        return throttled
+
+def _is_throttled(response: requests.Response) -> bool:
+    """ Check if a response is asking us to slow down. """
+
+    if (response.status_code == http.HTTPStatus.TOO_MANY_REQUESTS):
+        return True
+
+    return ((response.status_code in THROTTLE_STATUSES) and (response.headers.get('Retry-After', None) is not None))
+
+def iter_body(response: requests.Response, chunk_size: int = DEFAULT_CHUNK_SIZE) -> typing.Iterator[bytes]:
+    """
+    Iterate over a streamed response's body (see the `stream` argument to request()) as it arrives,
+    so it can be parsed without being buffered in full.
+    The bytes read are recorded as they would be for a buffered response.
+    """
+
+    for chunk in response.iter_content(chunk_size = max(1, chunk_size)):
+        comics.metrics.add(comics.metrics.COUNTER_RESPONSE_BYTES, len(chunk))
+        yield chunk
+
+def _write_body(response: requests.Response, file: typing.IO[bytes], chunk_size: int) -> None:
+    """
+    Write a streamed response's body to a file,
+    recording the time spent reading (as the image_get phase) and writing (as the disk_write phase) separately.
+    Failures while reading the body are raised as a _BodyError.
+    """
+
+    read_secs = 0.0
+    write_secs = 0.0
+    size = 0
+
+    chunks = response.iter_content(chunk_size = max(1, chunk_size))
+
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                chunk = next(chunks, None)
+            except requests.RequestException as ex:
+                raise _BodyError(ex) from ex
+            finally:
+                read_secs += time.monotonic() - start
+
+            if (chunk is None):
+                break
+
+            start = time.monotonic()
+            file.write(chunk)
+            write_secs += time.monotonic() - start
+            size += len(chunk)
+    finally:
+        comics.metrics.add_time(comics.metrics.PHASE_IMAGE_GET, read_secs)
+        comics.metrics.add_time(comics.metrics.PHASE_DISK_WRITE, write_secs)
+        comics.metrics.add(comics.metrics.COUNTER_DOWNLOAD_BYTES, size)
+
+def _close_response(future: concurrent.futures.Future) -> None:
+    """ Close the response of a request that lost a hedge (if it got one). """
+
+    if (future.cancelled() or (future.exception() is not None)):
+        return
+
+    future.result().close()
+
+def _record_wait(secs: float) -> None:
+    """ Record time spent waiting to be polite to a host (if there was any). """
+
+    if (secs > 0.0):
+        comics.metrics.add_time(comics.metrics.PHASE_COURTESY_WAIT, secs)
+
+class _BodySink(typing.Protocol):
+    """ Somewhere a (possibly resumed) response body is collected. """
+
+    def size(self) -> int:
+        """ Get the number of bytes collected so far. """
+
+    def open(self, append: bool) -> typing.ContextManager[typing.IO[bytes]]:
+        """ Open the sink for writing, either after what was already collected or from the start. """
+
+    def discard(self) -> None:
+        """ Throw away anything collected so far. """
+
+class _FileSink:
+    """ Collects a body in a partial file. """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+
+    def size(self) -> int:
+        """ Get the number of bytes collected so far. """
+
+        if (not os.path.exists(self.path)):
+            return 0
+
+        return os.path.getsize(self.path)
+
+    def open(self, append: bool) -> typing.ContextManager[typing.IO[bytes]]:
+        """ Open the partial file for writing. """
+
+        return open(self.path, 'ab' if append else 'wb')  # pylint: disable=consider-using-with
+
+    def discard(self) -> None:
+        """ Remove the partial file. """
+
+        if (os.path.exists(self.path)):
+            os.remove(self.path)
+
+class _MemorySink:
+    """ Collects a body in memory. """
+
+    def __init__(self) -> None:
+        self._buffer: io.BytesIO = io.BytesIO()
+
+    def size(self) -> int:
+        """ Get the number of bytes collected so far. """
+
+        return len(self._buffer.getbuffer())
+
+    def open(self, append: bool) -> typing.ContextManager[typing.IO[bytes]]:
+        """ Position the buffer for writing (it stays open when the context exits). """
+
+        if (not append):
+            self.discard()
+
+        self._buffer.seek(0, io.SEEK_END)
+        return contextlib.nullcontext(self._buffer)
+
+    def discard(self) -> None:
+        """ Empty the buffer. """
+
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def get_bytes(self) -> bytes:
+        """ Get everything collected. """
+
+        return self._buffer.getvalue()
+
+class _BodyError(Exception):
+    """ A failure while reading a response body (after the response itself was successful). """
+
+    def __init__(self, cause: Exception) -> None:
+        super().__init__(str(cause))
+
+        self.cause: Exception = cause
+
+class _RequestError(Exception):
+    """ A request for a body that failed or was throttled (before any of the body was read). """
+
+    def __init__(self, cause: Exception, throttled: bool = False) -> None:
+        super().__init__(str(cause))
+
+        self.cause: Exception = cause
+        self.throttled: bool = throttled
+
+def _get_validator(response: requests.Response) -> typing.Union[str, None]:
+    """ Get a value that can be used in an If-Range header to make sure a resumed body is the same one. """
+
+    etag = response.headers.get('ETag', None)
+    if ((etag is not None) and (not etag.startswith('W/'))):
+        return str(etag)
+
+    last_modified = response.headers.get('Last-Modified', None)
+    if (last_modified is not None):
+        return str(last_modified)
+
+    return None
+
+def _content_range_start(response: requests.Response) -> typing.Union[int, None]:
+    """ Get the first byte position from a response's Content-Range header. """
+
+    value = response.headers.get('Content-Range', '')
+    match = re.match(r'^\s*bytes\s+(\d+)-', value)
+    if (match is None):
+        return None
+
+    return int(match.group(1))
+
+class _CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    """ A connection pool that counts the connections it opens. """
+
+    stats: typing.Union[ConnectionStats, None] = None
+
+    def _new_conn(self) -> typing.Any:
+        if (self.stats is not None):
+            self.stats.add_connection()
+
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    """ A connection pool that counts the connections it opens. """
+
+    stats: typing.Union[ConnectionStats, None] = None
+
+    def _new_conn(self) -> typing.Any:
+        if (self.stats is not None):
+            self.stats.add_connection()
+
+        return super()._new_conn()
+
+class _CountingPoolManager(urllib3.PoolManager):
+    """ A pool manager that hands out counting connection pools. """
+
+    def __init__(self, stats: ConnectionStats, **kwargs: typing.Any) -> None:
+        super().__init__(**kwargs)
+
+        self._stats: ConnectionStats = stats
+
+        self.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme: str, host: str, port: int, request_context: typing.Any = None) -> typing.Any:
+        pool = super()._new_pool(scheme, host, port, request_context = request_context)
+        if (isinstance(pool, (_CountingHTTPConnectionPool, _CountingHTTPSConnectionPool))):
+            pool.stats = self._stats
+
+        return pool
+
+class _CountingAdapter(requests.adapters.HTTPAdapter):
+    """ A transport adapter that records connection statistics. """
+
+    def __init__(self, stats: ConnectionStats, **kwargs: typing.Any) -> None:
+        # Must be set before the parent constructor builds the pool manager.
+        self._stats: ConnectionStats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs: typing.Any) -> None:
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = _CountingPoolManager(self._stats, num_pools = connections, maxsize = maxsize, block = block, **pool_kwargs)
@@ -0,0 +1,362 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import threading
+import time
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.bench.fixtures
+import comics.bench.server
+import comics.metrics
+import comics.net
+import comics.retry
+
+class TestNet(edq.testing.unittest.BaseTest):
+    """ Test HTTP sessions. """
+
+    _server: comics.bench.server.StandInServer
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._server = comics.bench.server.StandInServer(comics.bench.server.ServerOptions(chapter_count = 2, images_per_chapter = 4)).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._server.stop()
+
+    def test_connection_reuse(self) -> None:
+        """ Test that requests reuse pooled connections, including after more threads than pooled connections have used the session. """
+
+        session = comics.net.Session(pool_size = 2)
+        urls = self._get_image_urls(4)
+        hook_statuses = []
+        session.add_response_hook(lambda response: hook_statuses.append(response.status_code))
+
+        try:
+            for url in urls * 3:
+                session.get(url)
+
+            self.assertEqual(12, session.stats.requests)
+            self.assertEqual(1, session.stats.new_connections)
+            self.assertEqual(11, session.stats.reused_connections())
+            self.assertEqual([200] * 12, hook_statuses)
+
+            # More threads than pooled connections: extra connections are opened, but the pool keeps serving.
+            with concurrent.futures.ThreadPoolExecutor(max_workers = 4) as executor:
+                bodies = list(executor.map(session.fetch_bytes, urls * 5))
+
+            self.assertEqual([self._server.image_body] * 20, bodies)
+            self.assertEqual(32, session.stats.requests)
+            self.assertLessEqual(session.stats.new_connections, 1 + 20)
+            self.assertGreater(session.stats.reused_connections(), 0)
+
+            new_connections = session.stats.new_connections
+            for url in urls:
+                session.get(url)
+
+            self.assertEqual(new_connections, session.stats.new_connections)
+        finally:
+            session.close()
+
+    def test_connection_stats(self) -> None:
+        """ Test the connection counters on their own. """
+
+        stats = comics.net.ConnectionStats()
+        for _ in range(5):
+            stats.add_request()
+
+        stats.add_connection()
+        stats.add_connection()
+
+        self.assertEqual(3, stats.reused_connections())
+        self.assertEqual('Requests: 5, New Connections: 2, Reused Connections: 3', repr(stats))
+
+        stats.add_connection()
+        stats.add_connection()
+        stats.add_connection()
+        stats.add_connection()
+        self.assertEqual(0, stats.reused_connections())
+
+    def test_download_file_base(self) -> None:
+        """ Test that a body is streamed to a partial file and only moved into place once complete. """
+
+        session = comics.net.Session()
+        out_dir = self._make_temp_dir()
+
+        try:
+            for chunk_size in [1000, comics.net.DEFAULT_CHUNK_SIZE]:
+                with self.subTest(msg = f"Chunk size {chunk_size}:"):
+                    out_path = os.path.join(out_dir, f"{chunk_size}.jpg")
+                    size = session.download_file(self._get_image_urls(1)[0], out_path, chunk_size = chunk_size)
+
+                    self.assertEqual(len(self._server.image_body), size)
+                    self.assertEqual([os.path.basename(out_path)], [name for name in os.listdir(out_dir) if name.startswith(f"{chunk_size}.")])
+
+                    with open(out_path, 'rb') as file:
+                        self.assertEqual(self._server.image_body, file.read())
+        finally:
+            session.close()
+
+    def test_download_file_interrupted(self) -> None:
+        """ Test that a transfer cut off partway through never leaves a truncated file at the final path. """
+
+        # [(resume, expect a partial file), ...]
+        test_cases = [
+            (False, False),
+            (True, True),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (resume, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} (resume {resume}):"):
+                session = self._make_session()
+                out_path = os.path.join(self._make_temp_dir(), 'image.jpg')
+                part_path = out_path + comics.net.PARTIAL_FILE_SUFFIX
+
+                with open(out_path, 'wb') as file:
+                    file.write(b'old')
+
+                try:
+                    with self._server_options(drop_rate = 1.0), self.assertRaises(Exception):
+                        session.download_file(self._get_image_urls(1)[0], out_path, chunk_size = 1000, retries = 1, resume = resume)
+                finally:
+                    session.close()
+
+                with open(out_path, 'rb') as file:
+                    self.assertEqual(b'old', file.read())
+
+                self.assertEqual(expected, os.path.exists(part_path))
+                if (expected):
+                    # The server cuts off every transfer halfway through (what is left of) the image.
+                    self.assertGreater(os.path.getsize(part_path), 0)
+                    self.assertLess(os.path.getsize(part_path), len(self._server.image_body))
+
+    def test_download_file_resume(self) -> None:
+        """ Test that a partial file left behind is continued with a Range request, or fetched in full when it can not be. """
+
+        body = self._server.image_body
+
+        # [(partial file contents, resume, expected (status, range header) of each response), ...]
+        test_cases: typing.List[typing.Tuple[bytes, bool, typing.List[typing.Tuple[int, typing.Union[str, None]]]]] = [
+            (body[:1000], True, [(206, 'bytes=1000-')]),
+            (body[:1], True, [(206, 'bytes=1-')]),
+            (body + b'extra', True, [(416, f"bytes={len(body) + 5}-"), (200, None)]),
+            (body[:1000], False, [(200, None)]),
+            (b'', True, [(200, None)]),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (partial, resume, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({len(partial)} bytes, resume {resume}):"):
+                session = self._make_session()
+                responses = self._record_responses(session)
+
+                out_path = os.path.join(self._make_temp_dir(), 'image.jpg')
+                with open(out_path + comics.net.PARTIAL_FILE_SUFFIX, 'wb') as file:
+                    file.write(partial)
+
+                try:
+                    size = session.download_file(self._get_image_urls(1)[0], out_path, resume = resume)
+                finally:
+                    session.close()
+
+                self.assertEqual(expected, responses)
+                self.assertEqual(len(body), size)
+                self.assertFalse(os.path.exists(out_path + comics.net.PARTIAL_FILE_SUFFIX))
+
+                with open(out_path, 'rb') as file:
+                    self.assertEqual(body, file.read())
+
+    def test_download_file_resume_after_drop(self) -> None:
+        """ Test that a transfer cut off partway through is retried from where it stopped. """
+
+        session = self._make_session()
+        responses = self._record_responses(session)
+
+        # Only the first transfer is cut off (the server decides before sending the body).
+        session.add_response_hook(lambda response: setattr(self._server.options, 'drop_rate', 0.0))
+        out_path = os.path.join(self._make_temp_dir(), 'image.jpg')
+
+        try:
+            with self._server_options(drop_rate = 1.0):
+                size = session.download_file(self._get_image_urls(1)[0], out_path, chunk_size = 1000, retries = 1)
+        finally:
+            session.close()
+
+        body = self._server.image_body
+
+        # The retry asks for the rest after what was written (whole chunks, up to where the server cut off).
+        self.assertEqual([200, 206], [status for (status, _) in responses])
+        offset = int(str(responses[1][1]).removeprefix('bytes=').removesuffix('-'))
+        self.assertGreater(offset, 0)
+        self.assertLessEqual(offset, len(body) // 2)
+
+        self.assertEqual(len(body), size)
+
+        with open(out_path, 'rb') as file:
+            self.assertEqual(body, file.read())
+
+    def test_fetch_bytes_interrupted(self) -> None:
+        """ Test that fetching into memory fails cleanly when every transfer is cut off. """
+
+        session = self._make_session()
+        try:
+            with self._server_options(drop_rate = 1.0), self.assertRaises(Exception):
+                session.fetch_bytes(self._get_image_urls(1)[0], retries = 1)
+        finally:
+            session.close()
+
+    def test_fetch_retries_shared(self) -> None:
+        """ Test that every request of a transfer counts against the same retries (request retries are not nested in body retries). """
+
+        retries = 2
+
+        # [(server options, throttle every other request), ...]
+        test_cases = [
+            ({'drop_rate': 1.0}, False),
+            ({'throttle_rate': 1.0}, False),
+            ({'drop_rate': 1.0, 'throttle_rate': 1.0}, True),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (options, alternate) = test_case
+
+            for use_file in [False, True]:
+                with self.subTest(msg = f"Case {i} ({options}, {alternate}, file {use_file}):"):
+                    session = self._make_session()
+                    metrics = comics.metrics.Metrics()
+
+                    if (alternate):
+                        # Throttled and cut off requests take turns, so each transfer's request only goes through on a retry.
+                        session.add_response_hook(lambda response: setattr(self._server.options, 'throttle_rate',
+                                1.0 - self._server.options.throttle_rate))
+
+                    try:
+                        with self._server_options(**options), comics.metrics.recording(metrics), self.assertRaises(Exception):
+                            if (use_file):
+                                session.download_file(self._get_image_urls(1)[0], os.path.join(self._make_temp_dir(), 'image.jpg'),
+                                        retries = retries)
+                            else:
+                                session.fetch_bytes(self._get_image_urls(1)[0], retries = retries)
+                    finally:
+                        session.close()
+
+                    self.assertEqual(1 + retries, metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+                    self.assertEqual(retries, metrics.get_count(comics.metrics.COUNTER_RETRIES))
+
+    def test_run_blocking_async_threads(self) -> None:
+        """ Test that offloaded calls run in the session's threads, no more at once than its pool size, in the caller's context. """
+
+        session = comics.net.Session(pool_size = 2)
+
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+        thread_names = set()
+
+        def work(value: int) -> int:
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+                thread_names.add(threading.current_thread().name)
+
+            time.sleep(0.02)
+            comics.metrics.add(comics.metrics.COUNTER_REQUESTS)
+
+            with lock:
+                running[0] -= 1
+
+            return value * 2
+
+        async def run() -> typing.List[int]:
+            with comics.metrics.recording(metrics):
+                return list(await asyncio.gather(*[session.run_blocking_async(work, i) for i in range(8)]))
+
+        metrics = comics.metrics.Metrics()
+        try:
+            self.assertEqual([i * 2 for i in range(8)], asyncio.run(run()))
+        finally:
+            session.close()
+
+        self.assertEqual(8, metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+        self.assertLessEqual(most_running[0], 2)
+        self.assertTrue(all(name.startswith('comics-async') for name in thread_names), msg = str(thread_names))
+
+    def test_async_requests(self) -> None:
+        """ Test the async request, fetch, and download methods (including after the session has been closed once). """
+
+        session = comics.net.Session(pool_size = 2)
+        out_path = os.path.join(self._make_temp_dir(), 'image.jpg')
+        image_urls = self._get_image_urls(4)
+
+        async def run() -> typing.Tuple[typing.List[bytes], int, str]:
+            bodies = list(await asyncio.gather(*[session.fetch_bytes_async(url) for url in image_urls]))
+            size = await session.download_file_async(image_urls[0], out_path)
+            _, text = await session.get_async(self._server.base_url + '/missing', raise_for_status = False)
+            return bodies, size, text
+
+        try:
+            for _ in range(2):
+                metrics = comics.metrics.Metrics()
+                with comics.metrics.recording(metrics):
+                    bodies, size, text = asyncio.run(run())
+
+                session.close()
+
+                self.assertEqual([self._server.image_body] * 4, bodies)
+                self.assertEqual(len(self._server.image_body), size)
+                self.assertEqual('Not Found', text)
+                self.assertEqual(6, metrics.get_count(comics.metrics.COUNTER_REQUESTS))
+
+                with open(out_path, 'rb') as file:
+                    self.assertEqual(self._server.image_body, file.read())
+        finally:
+            session.close()
+
+    def _get_image_urls(self, count: int) -> typing.List[str]:
+        """ Get the URLs of the first images of the server's first chapter. """
+
+        chapter_id = comics.bench.fixtures.chapter_ids(2)[0]
+        return comics.bench.fixtures.image_urls(self._server.base_url, chapter_id, count)
+
+    def _record_responses(self, session: comics.net.Session) -> typing.List[typing.Tuple[int, typing.Union[str, None]]]:
+        """ Record the status and Range header of each response the session gets. """
+
+        responses: typing.List[typing.Tuple[int, typing.Union[str, None]]] = []
+
+        def hook(response: typing.Any) -> None:
+            value = response.request.headers.get('Range', None)
+            responses.append((response.status_code, (None if (value is None) else str(value))))
+
+        session.add_response_hook(hook)
+        return responses
+
+    def _make_session(self) -> comics.net.Session:
+        """ Make a session that retries without waiting. """
+
+        return comics.net.Session(retry_policy = comics.retry.RetryPolicy(backoff_base_secs = 0.0, hedge_percentile = None))
+
+    @contextlib.contextmanager
+    def _server_options(self, **options: typing.Any) -> typing.Iterator[None]:
+        """ Change some of the server's options for the duration of the context. """
+
+        old_options = {name: getattr(self._server.options, name) for name in options}
+        for (name, value) in options.items():
+            setattr(self._server.options, name, value)
+
+        try:
+            yield
+        finally:
+            for (name, value) in old_options.items():
+                setattr(self._server.options, name, value)
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
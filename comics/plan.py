@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import typing
+
+import edq.util.dirent
+
+import comics.model
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECS: float = 60.0 * 60.0
+""" How long a claimed item may go without being completed before another worker may claim it. """
+
+DEFAULT_MAX_ATTEMPTS: int = 3
+
+STATE_PENDING: str = 'pending'
+STATE_CLAIMED: str = 'claimed'
+STATE_DONE: str = 'done'
+STATE_FAILED: str = 'failed'
+""" Items that did not succeed within the allowed number of attempts. """
+
+_SCHEMA: typing.List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_key TEXT NOT NULL UNIQUE,
+        data TEXT NOT NULL,
+        state TEXT NOT NULL,
+        worker TEXT,
+        claimed REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS items_state ON items (state, id)
+    ''',
+]
+
+class ChapterWork:
+    """
+    A planned unit of work: one chapter of a comic,
+    along with everything needed to download it without asking the source about the comic again.
+    """
+
+    def __init__(self,
+            comic: comics.model.ComicInfo,
+            chapter: comics.model.ComicChapter,
+            comic_out_dir: str,
+            output_format: str,
+            images: typing.Union[typing.List[comics.model.ComicImage], None] = None,
+            ) -> None:
+        self.comic: comics.model.ComicInfo = comic
+        """ The chapter's comic (its chapters are not kept). """
+
+        self.chapter: comics.model.ComicChapter = chapter
+        """ The chapter to download. """
+
+        self.comic_out_dir: str = comic_out_dir
+        """ The directory the comic is downloaded to. """
+
+        self.output_format: str = output_format
+        """ How the chapter is written (see comics.download.OUTPUT_FORMATS). """
+
+        self.images: typing.Union[typing.List[comics.model.ComicImage], None] = images
+        """ The chapter's images, or None if they could not be listed while planning (they will be listed when executing). """
+
+    def get_key(self) -> str:
+        """ Get a key that identifies this work (the same chapter planned twice has the same key). """
+
+        chapter = self.chapter.source_id
+        if (chapter is None):
+            chapter = str(self.chapter)
+
+        return f"{self.comic_out_dir}#{chapter}"
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """ Get a JSON-friendly representation. """
+
+        images = None
+        if (self.images is not None):
+            images = [image.to_dict() for image in self.images]
+
+        return {
+            'comic': self.comic.to_dict(include_chapters = False),
+            'chapter': self.chapter.to_dict(),
+            'comic_out_dir': self.comic_out_dir,
+            'output_format': self.output_format,
+            'images': images,
+        }
+
+    @staticmethod
+    def from_dict(data: typing.Dict[str, typing.Any]) -> 'ChapterWork':
+        """ Load work from to_dict(). """
+
+        images = None
+        if (data.get('images', None) is not None):
+            images = [comics.model.ComicImage.from_dict(image) for image in data['images']]
+
+        return ChapterWork(
+                comics.model.ComicInfo.from_dict(data['comic']),
+                comics.model.ComicChapter.from_dict(data['chapter']),
+                data['comic_out_dir'],
+                data['output_format'],
+                images = images)
+
+    def __repr__(self) -> str:
+        return f"{self.comic.name} - {self.chapter}"
+
+def write_jsonl(path: str, work: typing.List[ChapterWork]) -> None:
+    """ Write a work list as JSONL (one item per line). """
+
+    with open(path, 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+        for item in work:
+            file.write(json.dumps(item.to_dict()) + '\n')
+
+def read_jsonl(path: str) -> typing.List[ChapterWork]:
+    """ Read a work list written by write_jsonl(). """
+
+    work = []
+    with open(path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+        for line in file:
+            line = line.strip()
+            if (len(line) > 0):
+                work.append(ChapterWork.from_dict(json.loads(line)))
+
+    return work
+
+def get_default_worker_id() -> str:
+    """ Get an ID for this process that is unique across hosts sharing a queue. """
+
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class WorkQueue:
+    """
+    A queue of planned work stored in an SQLite database,
+    so that several worker processes (or hosts sharing a filesystem that supports SQLite's locking) can split up the work.
+
+    Workers claim one item at a time inside an exclusive transaction, so no two workers hold the same item.
+    A claimed item that is not completed within `lease_secs` (e.g., its worker died) may be claimed again,
+    and only the worker that holds an item's current claim may complete it.
+    An item that fails (or whose claim runs out) is retried until it has been attempted `max_attempts` times.
+    The same chapter is only ever queued once, so it is safe to add a fresh plan to an existing queue.
+    """
+
+    def __init__(self, path: str,
+            lease_secs: float = DEFAULT_LEASE_SECS,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+            ) -> None:
+        self.path: str = path
+        """ Where the queue is stored. """
+
+        self.lease_secs: float = lease_secs
+        """ How long a claim lasts. """
+
+        self.max_attempts: int = max(1, max_attempts)
+        """ The number of times an item may be attempted before it is marked as failed. """
+
+        # Transactions are managed explicitly, so claims can take the write lock up front.
+        self._connection: typing.Union[sqlite3.Connection, None] = sqlite3.connect(path, isolation_level = None, timeout = 60.0)
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+
+    def close(self) -> None:
+        """ Close the queue. """
+
+        if (self._connection is not None):
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> 'WorkQueue':
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+    def add(self, work: typing.List[ChapterWork]) -> int:
+        """ Queue work, returning how many items were new. """
+
+        connection = self._get_connection()
+
+        rows = [(item.get_key(), json.dumps(item.to_dict()), STATE_PENDING) for item in work]
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            before = connection.total_changes
+            connection.executemany('INSERT OR IGNORE INTO items (item_key, data, state) VALUES (?, ?, ?)', rows)
+            added = connection.total_changes - before
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        return added
+
+    def claim(self, worker_id: typing.Union[str, None] = None) -> typing.Union[typing.Tuple[int, ChapterWork], None]:
+        """ Claim the next available item (and its ID), or None if there is nothing left to claim. """
+
+        if (worker_id is None):
+            worker_id = get_default_worker_id()
+
+        connection = self._get_connection()
+        now = time.time()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Expired claims that were the item's last attempt will never be completed.
+            connection.execute(
+                    'UPDATE items SET state = ?, error = ? WHERE (state = ?) AND (claimed < ?) AND (attempts >= ?)',
+                    (STATE_FAILED, 'Claim expired on the last attempt.', STATE_CLAIMED, now - self.lease_secs, self.max_attempts))
+
+            row = connection.execute(
+                    'SELECT id, data FROM items WHERE (state = ?) OR ((state = ?) AND (claimed < ?)) ORDER BY id LIMIT 1',
+                    (STATE_PENDING, STATE_CLAIMED, now - self.lease_secs)).fetchone()
+
+            if (row is not None):
+                connection.execute(
+                        'UPDATE items SET state = ?, worker = ?, claimed = ?, attempts = attempts + 1 WHERE id = ?',
+                        (STATE_CLAIMED, worker_id, now, row[0]))
+
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        if (row is None):
+            return None
+
+        _logger.debug("Worker '%s' claimed item %d.", worker_id, row[0])
+        return row[0], ChapterWork.from_dict(json.loads(row[1]))
+
+    def complete(self,
+            item_id: int,
+            worker_id: typing.Union[str, None] = None,
+            error: typing.Union[str, None] = None,
+            ) -> bool:
+        """
+        Finish an item claimed by this worker.
+        With an error, the item is queued again (or marked as failed if it is out of attempts).
+        Returns False (and changes nothing) if the worker no longer holds the item's claim
+        (e.g., its lease ran out and another worker claimed it).
+        """
+
+        if (worker_id is None):
+            worker_id = get_default_worker_id()
+
+        connection = self._get_connection()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if (error is None):
+                cursor = connection.execute(
+                        'UPDATE items SET state = ?, error = NULL WHERE (id = ?) AND (state = ?) AND (worker = ?)',
+                        (STATE_DONE, item_id, STATE_CLAIMED, worker_id))
+            else:
+                cursor = connection.execute(
+                        'UPDATE items SET state = (CASE WHEN attempts >= ? THEN ? ELSE ? END), error = ?'
+                        + ' WHERE (id = ?) AND (state = ?) AND (worker = ?)',
+                        (self.max_attempts, STATE_FAILED, STATE_PENDING, error, item_id, STATE_CLAIMED, worker_id))
+
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        if (cursor.rowcount == 0):
+            _logger.warning("Worker '%s' no longer holds item %d, not completing it.", worker_id, item_id)
+            return False
+
+        return True
+
+    def peek(self) -> typing.List[typing.Tuple[int, ChapterWork]]:
+        """
+        Get every pending item (and its ID), in the order they would be claimed, without claiming any of them.
+        Nothing in the queue is changed.
+        """
+
+        rows = self._get_connection().execute('SELECT id, data FROM items WHERE state = ? ORDER BY id', (STATE_PENDING,)).fetchall()
+        return [(row[0], ChapterWork.from_dict(json.loads(row[1]))) for row in rows]
+
+    def counts(self) -> typing.Dict[str, int]:
+        """ Get the number of items in each state. """
+
+        rows = self._get_connection().execute('SELECT state, COUNT(*) FROM items GROUP BY state').fetchall()
+        return dict(rows)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """ Get the open connection. """
+
+        if (self._connection is None):
+            raise ValueError(f"Work queue is closed: '{self.path}'.")
+
+        return self._connection
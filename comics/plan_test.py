@@ -0,0 +1,207 @@
+import os
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.download
+import comics.download_test
+import comics.model
+import comics.plan
+
+COMIC_URL: str = 'http://test.invalid/series/test'
+
+class TestPlan(edq.testing.unittest.BaseTest):
+    """ Test planned work and the work queue. """
+
+    def test_chapter_work_round_trip(self) -> None:
+        """ Test that work survives JSONL, with and without images. """
+
+        work = _make_work(3)
+        work[1].images = None
+
+        path = os.path.join(self._make_temp_dir(), 'plan.jsonl')
+        comics.plan.write_jsonl(path, work)
+        loaded = comics.plan.read_jsonl(path)
+
+        self.assertEqual([item.to_dict() for item in work], [item.to_dict() for item in loaded])
+        self.assertEqual([item.get_key() for item in work], [item.get_key() for item in loaded])
+        self.assertIsNone(loaded[1].images)
+
+    def test_add_deduplicates(self) -> None:
+        """ Test that the same chapter is only queued once. """
+
+        with self._make_queue() as queue:
+            self.assertEqual(3, queue.add(_make_work(3)))
+            self.assertEqual(1, queue.add(_make_work(4)))
+            self.assertEqual({comics.plan.STATE_PENDING: 4}, queue.counts())
+
+    def test_claim_base(self) -> None:
+        """ Test that items are claimed in order, once each, and completed. """
+
+        with self._make_queue() as queue:
+            queue.add(_make_work(2))
+
+            first = queue.claim('a')
+            second = queue.claim('b')
+            self.assertIsNotNone(first)
+            self.assertIsNotNone(second)
+            self.assertIsNone(queue.claim('c'))
+
+            (first_id, first_work) = typing.cast(typing.Tuple[int, comics.plan.ChapterWork], first)
+            (second_id, second_work) = typing.cast(typing.Tuple[int, comics.plan.ChapterWork], second)
+
+            self.assertEqual([0, 1], [first_work.chapter.index, second_work.chapter.index])
+
+            self.assertTrue(queue.complete(first_id, 'a'))
+            self.assertTrue(queue.complete(second_id, 'b', error = 'Broken.'))
+
+            self.assertEqual({comics.plan.STATE_DONE: 1, comics.plan.STATE_PENDING: 1}, queue.counts())
+
+    def test_complete_requires_claim(self) -> None:
+        """ Test that only the worker holding an item's claim can complete it. """
+
+        with self._make_queue() as queue:
+            queue.add(_make_work(1))
+            (item_id, _) = typing.cast(typing.Tuple[int, comics.plan.ChapterWork], queue.claim('a'))
+
+            self.assertFalse(queue.complete(item_id, 'b'))
+            self.assertFalse(queue.complete(item_id + 1, 'a'))
+            self.assertEqual({comics.plan.STATE_CLAIMED: 1}, queue.counts())
+
+            self.assertTrue(queue.complete(item_id, 'a'))
+
+            # Completing twice does nothing.
+            self.assertFalse(queue.complete(item_id, 'a', error = 'Broken.'))
+            self.assertEqual({comics.plan.STATE_DONE: 1}, queue.counts())
+
+    def test_lease_expiry(self) -> None:
+        """ Test that an expired claim can be taken by another worker, and that its old worker can no longer complete it. """
+
+        with self._make_queue() as queue:
+            queue.add(_make_work(1))
+            (item_id, _) = typing.cast(typing.Tuple[int, comics.plan.ChapterWork], queue.claim('a'))
+
+            # Not expired yet.
+            self.assertIsNone(queue.claim('b'))
+
+            queue.lease_secs = -1.0
+            claimed = queue.claim('b')
+            self.assertIsNotNone(claimed)
+            self.assertEqual(item_id, typing.cast(typing.Tuple[int, comics.plan.ChapterWork], claimed)[0])
+
+            self.assertFalse(queue.complete(item_id, 'a'))
+            self.assertEqual({comics.plan.STATE_CLAIMED: 1}, queue.counts())
+
+            self.assertTrue(queue.complete(item_id, 'b'))
+            self.assertEqual({comics.plan.STATE_DONE: 1}, queue.counts())
+
+    def test_lease_expiry_last_attempt(self) -> None:
+        """ Test that an item whose last attempt's claim expired is marked as failed instead of being claimed again. """
+
+        with self._make_queue(max_attempts = 2) as queue:
+            queue.add(_make_work(1))
+            queue.lease_secs = -1.0
+
+            self.assertIsNotNone(queue.claim('a'))
+            (item_id, _) = typing.cast(typing.Tuple[int, comics.plan.ChapterWork], queue.claim('b'))
+
+            self.assertIsNone(queue.claim('c'))
+            self.assertEqual({comics.plan.STATE_FAILED: 1}, queue.counts())
+            self.assertFalse(queue.complete(item_id, 'b'))
+
+    def test_max_attempts(self) -> None:
+        """ Test that a failing item is retried until it is out of attempts. """
+
+        with self._make_queue(max_attempts = 3) as queue:
+            queue.add(_make_work(1))
+
+            for attempt in range(3):
+                claimed = queue.claim('a')
+                self.assertIsNotNone(claimed, msg = f"Attempt {attempt}.")
+                self.assertTrue(queue.complete(typing.cast(typing.Tuple[int, comics.plan.ChapterWork], claimed)[0], 'a', error = 'Broken.'))
+
+            self.assertIsNone(queue.claim('a'))
+            self.assertEqual({comics.plan.STATE_FAILED: 1}, queue.counts())
+
+    def test_shared_queue(self) -> None:
+        """ Test that two connections to the same queue never claim the same item. """
+
+        path = os.path.join(self._make_temp_dir(), 'queue.db')
+        with comics.plan.WorkQueue(path) as first, comics.plan.WorkQueue(path) as second:
+            first.add(_make_work(5))
+
+            claimed_ids = []
+            for (queue, worker_id) in [(first, 'a'), (second, 'b')] * 3:
+                claimed = queue.claim(worker_id)
+                if (claimed is not None):
+                    claimed_ids.append(claimed[0])
+
+            self.assertEqual(5, len(claimed_ids))
+            self.assertEqual(5, len(set(claimed_ids)))
+
+    def test_peek(self) -> None:
+        """ Test that peeking lists the pending items in claim order without claiming any of them. """
+
+        with self._make_queue() as queue:
+            queue.add(_make_work(3))
+            (claimed_id, _) = typing.cast(typing.Tuple[int, comics.plan.ChapterWork], queue.claim('a'))
+
+            pending = queue.peek()
+            self.assertEqual([1, 2], [work.chapter.index for (_, work) in pending])
+            self.assertNotIn(claimed_id, [item_id for (item_id, _) in pending])
+            self.assertEqual({comics.plan.STATE_CLAIMED: 1, comics.plan.STATE_PENDING: 2}, queue.counts())
+
+            claimed_ids = [typing.cast(typing.Tuple[int, comics.plan.ChapterWork], queue.claim('a'))[0] for _ in pending]
+            self.assertEqual([item_id for (item_id, _) in pending], claimed_ids)
+
+    def test_execute_queue_dry_run(self) -> None:
+        """ Test that a dry run goes through every pending item without changing the queue. """
+
+        url = comics.download_test.register_fake_source(comics.download_test.FakeSource())
+        work = comics.download.plan(url, self._make_temp_dir())
+
+        with self._make_queue() as queue:
+            queue.add(work)
+            before = queue.counts()
+
+            executed: typing.List[int] = []
+            count = comics.download.execute_queue(queue, worker_id = 'a', dry_run = True,
+                    on_result = lambda item, result: executed.append(result.chapter.index))
+
+            self.assertEqual(comics.download_test.FAKE_CHAPTER_COUNT, count)
+            self.assertEqual(list(range(comics.download_test.FAKE_CHAPTER_COUNT)), executed)
+            self.assertEqual(before, queue.counts())
+            self.assertEqual({comics.plan.STATE_PENDING: comics.download_test.FAKE_CHAPTER_COUNT}, queue.counts())
+
+    def test_closed_queue(self) -> None:
+        """ Test that a closed queue cannot be used. """
+
+        queue = self._make_queue()
+        queue.close()
+
+        with self.assertRaisesRegex(ValueError, 'closed'):
+            queue.claim('a')
+
+    def _make_queue(self, **kwargs: typing.Any) -> comics.plan.WorkQueue:
+        """ Make a queue in a new temp dir. """
+
+        return comics.plan.WorkQueue(os.path.join(self._make_temp_dir(), 'queue.db'), **kwargs)
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+
+def _make_work(chapter_count: int) -> typing.List[comics.plan.ChapterWork]:
+    """ Plan work for the first chapters of a test comic. """
+
+    comic = comics.model.ComicInfo(COMIC_URL, 'Test Comic')
+
+    work = []
+    for i in range(chapter_count):
+        chapter = comics.model.ComicChapter(COMIC_URL, index = i, source_id = str(i), name = str(i + 1))
+        images = [comics.model.ComicImage(f"{COMIC_URL}/{i}/{j}.jpg", index = j) for j in range(2)]
+        work.append(comics.plan.ChapterWork(comic, chapter, '/tmp/test-comic', comics.download.OUTPUT_FORMAT_DIR, images = images))
+
+    return work
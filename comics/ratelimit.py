@@ -0,0 +1,199 @@
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+import typing
+import urllib.parse
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_PER_SEC: float = 6.0
+
+DEFAULT_BURST: int = 4
+
+DEFAULT_THROTTLE_SECS: float = 1.0
+""" How long to pause a host that throttled us without saying how long to wait. """
+
+MAX_THROTTLE_SECS: float = 300.0
+""" The longest pause a host's Retry-After header is allowed to cause. """
+
+MIN_RATE_FRACTION: float = 1.0 / 64.0
+""" Throttling will never reduce a host's rate below this fraction of its configured rate. """
+
+RECOVERY_FRACTION: float = 0.05
+""" After being throttled, each successful request restores this fraction of a host's configured rate. """
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that allows `burst` requests at once and then `rate_per_sec` requests per second.
+    Tokens are reserved ahead of time (in the style of GCRA), so callers are served in the order they ask
+    and can do their own waiting (blocking or async).
+
+    When throttled, the bucket pauses and halves its rate,
+    then gradually climbs back to its configured rate as requests succeed.
+    """
+
+    def __init__(self,
+            rate_per_sec: float = DEFAULT_RATE_PER_SEC,
+            burst: int = DEFAULT_BURST,
+            ) -> None:
+        if (rate_per_sec <= 0.0):
+            raise ValueError(f"Rate must be positive, got {rate_per_sec}.")
+
+        self.rate_per_sec: float = rate_per_sec
+        """ The configured (maximum) rate. """
+
+        self.burst: int = max(1, burst)
+        """ The number of requests that can be made at once after the bucket has been idle. """
+
+        self.current_rate_per_sec: float = rate_per_sec
+        """ The rate currently allowed, which may be below the configured rate after being throttled. """
+
+        self._lock: threading.Lock = threading.Lock()
+        self._theoretical_arrival: float = 0.0
+        self._paused_until: float = 0.0
+
+    def reserve(self) -> float:
+        """ Take a token and return how many seconds the caller must wait before using it. """
+
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self.current_rate_per_sec
+            tolerance = (self.burst - 1) * interval
+
+            arrival = max(self._theoretical_arrival, now)
+            start = max(now, arrival - tolerance, self._paused_until)
+            self._theoretical_arrival = max(arrival, start) + interval
+
+            return start - now
+
+    def try_acquire(self) -> bool:
+        """ Take a token only if one can be used right away, returning whether one was taken. """
+
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self.current_rate_per_sec
+            tolerance = (self.burst - 1) * interval
+
+            arrival = max(self._theoretical_arrival, now)
+            if (max(arrival - tolerance, self._paused_until) > now):
+                return False
+
+            self._theoretical_arrival = arrival + interval
+            return True
+
+    def acquire(self) -> float:
+        """ Block until a token is available, and return how long (in seconds) that took. """
+
+        delay = self.reserve()
+        if (delay > 0.0):
+            time.sleep(delay)
+
+        return delay
+
+    async def acquire_async(self) -> float:
+        """ Wait (without blocking the event loop) until a token is available, and return how long (in seconds) that took. """
+
+        delay = self.reserve()
+        if (delay > 0.0):
+            await asyncio.sleep(delay)
+
+        return delay
+
+    def throttle(self, pause_secs: typing.Union[float, None] = None) -> None:
+        """ Pause this bucket (for the given time, or a default) and halve its rate. """
+
+        if (pause_secs is None):
+            pause_secs = DEFAULT_THROTTLE_SECS
+
+        pause_secs = min(max(0.0, pause_secs), MAX_THROTTLE_SECS)
+
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + pause_secs)
+            self.current_rate_per_sec = max(self.rate_per_sec * MIN_RATE_FRACTION, self.current_rate_per_sec / 2.0)
+
+    def succeed(self) -> None:
+        """ Note a successful request, recovering some of the rate lost to throttling. """
+
+        if (self.current_rate_per_sec >= self.rate_per_sec):
+            return
+
+        with self._lock:
+            self.current_rate_per_sec = min(self.rate_per_sec, self.current_rate_per_sec + (self.rate_per_sec * RECOVERY_FRACTION))
+
+class RateLimiter:
+    """ Keeps a separate token bucket for each host. """
+
+    def __init__(self,
+            rate_per_sec: float = DEFAULT_RATE_PER_SEC,
+            burst: int = DEFAULT_BURST,
+            ) -> None:
+        self.rate_per_sec: float = rate_per_sec
+        """ The rate each host is allowed. """
+
+        self.burst: int = burst
+        """ The burst each host is allowed. """
+
+        self._lock: threading.Lock = threading.Lock()
+        self._buckets: typing.Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        """ Get the bucket for a URL's host. """
+
+        host = urllib.parse.urlparse(url).netloc.lower()
+
+        with self._lock:
+            bucket = self._buckets.get(host, None)
+            if (bucket is None):
+                bucket = TokenBucket(self.rate_per_sec, self.burst)
+                self._buckets[host] = bucket
+
+            return bucket
+
+    def try_acquire(self, url: str) -> bool:
+        """ Take a token for this URL's host only if it can be used right away, returning whether one was taken. """
+
+        return self.bucket(url).try_acquire()
+
+    def acquire(self, url: str) -> float:
+        """ Block until a request to this URL's host is allowed, and return how long (in seconds) that took. """
+
+        return self.bucket(url).acquire()
+
+    async def acquire_async(self, url: str) -> float:
+        """ Wait (without blocking the event loop) until a request to this URL's host is allowed, and return how long (in seconds) that took. """
+
+        return await self.bucket(url).acquire_async()
+
+    def throttle(self, url: str, retry_after: typing.Union[str, None] = None) -> None:
+        """ Back off a host that has throttled a request, respecting its Retry-After header if one was sent. """
+
+        pause_secs = parse_retry_after(retry_after)
+        _logger.warning("Throttled by '%s', pausing for %s seconds.", url, pause_secs)
+        self.bucket(url).throttle(pause_secs)
+
+    def succeed(self, url: str) -> None:
+        """ Note a successful request to this URL's host. """
+
+        self.bucket(url).succeed()
+
+def parse_retry_after(value: typing.Union[str, None]) -> typing.Union[float, None]:
+    """ Parse a Retry-After header (in seconds or an HTTP date) into a number of seconds, or None if it cannot be parsed. """
+
+    if (value is None):
+        return None
+
+    value = value.strip()
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, date.timestamp() - time.time())
@@ -0,0 +1,199 @@
+import asyncio
+import email.utils
+import time
+import typing
+import unittest.mock
+
+import edq.testing.unittest
+
+import comics.ratelimit
+
+class FakeClock:
+    """ A monotonic clock that only moves when told to. """
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now: float = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestRateLimit(edq.testing.unittest.BaseTest):
+    """ Test rate limiting. """
+
+    def setUp(self) -> None:
+        self._clock = FakeClock()
+        patcher = unittest.mock.patch('comics.ratelimit.time.monotonic', self._clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reserve_base(self) -> None:
+        """ Test that a burst is allowed right away, and that later tokens are spaced out at the rate. """
+
+        # [(rate, burst, expected delays), ...]
+        test_cases = [
+            (10.0, 1, [0.0, 0.1, 0.2, 0.3]),
+            (10.0, 3, [0.0, 0.0, 0.0, 0.1, 0.2, 0.3]),
+            (2.0, 2, [0.0, 0.0, 0.5, 1.0]),
+            (10.0, 0, [0.0, 0.1]),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (rate, burst, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({rate}, {burst}):"):
+                bucket = comics.ratelimit.TokenBucket(rate, burst)
+                actual = [bucket.reserve() for _ in expected]
+                self._assert_delays(expected, actual)
+
+    def test_reserve_over_time(self) -> None:
+        """ Test that tokens are earned back while idle (up to the burst), and that waiting callers keep their place. """
+
+        bucket = comics.ratelimit.TokenBucket(10.0, 3)
+        self._assert_delays([0.0, 0.0, 0.0, 0.1], [bucket.reserve() for _ in range(4)])
+
+        # Half of the way to the next token.
+        self._clock.now += 0.15
+        self._assert_delays([0.05, 0.15], [bucket.reserve() for _ in range(2)])
+
+        # Long idle: only the burst is available.
+        self._clock.now += 10.0
+        self._assert_delays([0.0, 0.0, 0.0, 0.1], [bucket.reserve() for _ in range(4)])
+
+    def test_try_acquire(self) -> None:
+        """ Test that a token is only taken when it can be used right away. """
+
+        bucket = comics.ratelimit.TokenBucket(10.0, 2)
+
+        self.assertEqual([True, True, False, False], [bucket.try_acquire() for _ in range(4)])
+
+        self._clock.now += 0.1
+        self.assertEqual([True, False], [bucket.try_acquire() for _ in range(2)])
+
+        # Failed attempts do not hold back reservations.
+        self._clock.now += 0.1
+        self._assert_delays([0.0, 0.1], [bucket.reserve() for _ in range(2)])
+
+    def test_throttle(self) -> None:
+        """ Test that throttling pauses the bucket and halves its rate, which recovers as requests succeed. """
+
+        bucket = comics.ratelimit.TokenBucket(8.0, 1)
+        bucket.throttle(2.0)
+
+        self.assertEqual(4.0, bucket.current_rate_per_sec)
+        self._assert_delays([2.0, 2.25], [bucket.reserve() for _ in range(2)])
+        self.assertFalse(bucket.try_acquire())
+
+        bucket.succeed()
+        self.assertAlmostEqual(4.4, bucket.current_rate_per_sec)
+
+        for _ in range(100):
+            bucket.succeed()
+
+        self.assertEqual(8.0, bucket.current_rate_per_sec)
+
+    def test_throttle_limits(self) -> None:
+        """ Test the default, longest, and shortest pauses, and the lowest rate. """
+
+        # [(pause, expected delay), ...]
+        test_cases = [
+            (None, comics.ratelimit.DEFAULT_THROTTLE_SECS),
+            (-5.0, 0.0),
+            (0.5, 0.5),
+            (1e9, comics.ratelimit.MAX_THROTTLE_SECS),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (pause_secs, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({pause_secs}):"):
+                bucket = comics.ratelimit.TokenBucket(8.0, 1)
+                bucket.throttle(pause_secs)
+                self._assert_delays([expected], [bucket.reserve()])
+
+        bucket = comics.ratelimit.TokenBucket(64.0, 1)
+        for _ in range(20):
+            bucket.throttle(0.0)
+
+        self.assertEqual(64.0 * comics.ratelimit.MIN_RATE_FRACTION, bucket.current_rate_per_sec)
+
+    def test_bad_rate(self) -> None:
+        """ Test that a bucket needs a positive rate. """
+
+        for rate in [0.0, -1.0]:
+            with self.assertRaisesRegex(ValueError, 'positive'):
+                comics.ratelimit.TokenBucket(rate)
+
+    def test_rate_limiter_hosts(self) -> None:
+        """ Test that each host has its own bucket. """
+
+        limiter = comics.ratelimit.RateLimiter(10.0, 1)
+
+        self.assertIs(limiter.bucket('http://a.test.invalid/1.jpg'), limiter.bucket('HTTP://A.TEST.INVALID/2.jpg'))
+        self.assertIsNot(limiter.bucket('http://a.test.invalid/1.jpg'), limiter.bucket('http://b.test.invalid/1.jpg'))
+
+        self.assertTrue(limiter.try_acquire('http://a.test.invalid/1.jpg'))
+        self.assertFalse(limiter.try_acquire('http://a.test.invalid/2.jpg'))
+        self.assertTrue(limiter.try_acquire('http://b.test.invalid/1.jpg'))
+
+        limiter.throttle('http://b.test.invalid/1.jpg', '3')
+        self._assert_delays([0.1, 3.0], [limiter.bucket(url).reserve() for url in ['http://a.test.invalid/', 'http://b.test.invalid/']])
+
+    def test_parse_retry_after(self) -> None:
+        """ Test parsing Retry-After headers. """
+
+        # [(value, expected), ...]
+        test_cases: typing.List[typing.Tuple[typing.Union[str, None], typing.Union[float, None]]] = [
+            (None, None),
+            ('5', 5.0),
+            (' 2.5 ', 2.5),
+            ('-3', 0.0),
+            ('soon', None),
+            ('', None),
+            ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (value, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ('{value}'):"):
+                self.assertEqual(expected, comics.ratelimit.parse_retry_after(value))
+
+        future = email.utils.formatdate(time.time() + 60.0, usegmt = True)
+        secs = comics.ratelimit.parse_retry_after(future)
+        self.assertIsNotNone(secs)
+        self.assertTrue(55.0 <= typing.cast(float, secs) <= 60.0, msg = str(secs))
+
+    def _assert_delays(self, expected: typing.List[float], actual: typing.List[float]) -> None:
+        """ Check delays (allowing for floating point error). """
+
+        self.assertEqual(len(expected), len(actual), msg = str(actual))
+        for (expected_delay, actual_delay) in zip(expected, actual):
+            self.assertAlmostEqual(expected_delay, actual_delay, msg = str(actual))
+
+class TestRateLimitWaits(edq.testing.unittest.BaseTest):
+    """ Test waiting on rate limits (with the real clock). """
+
+    def test_acquire_waits(self) -> None:
+        """ Test that acquiring (blocking and async) actually waits out the delay. """
+
+        for use_async in [False, True]:
+            with self.subTest(msg = f"Async {use_async}:"):
+                bucket = comics.ratelimit.TokenBucket(20.0, 1)
+
+                start = time.monotonic()
+                if (use_async):
+                    delays = asyncio.run(_acquire_async(bucket, 3))
+                else:
+                    delays = [bucket.acquire() for _ in range(3)]
+
+                elapsed = time.monotonic() - start
+
+                # Each token comes 0.05 seconds after the last.
+                self.assertEqual(0.0, delays[0])
+                self.assertGreater(sum(delays), 0.08)
+                self.assertGreaterEqual(elapsed, 0.09)
+
+async def _acquire_async(bucket: comics.ratelimit.TokenBucket, count: int) -> typing.List[float]:
+    """ Acquire tokens one after another on the event loop. """
+
+    return [await bucket.acquire_async() for _ in range(count)]
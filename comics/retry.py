@@ -0,0 +1,262 @@
+import collections
+import logging
+import random
+import threading
+import time
+import typing
+import urllib.parse
+
+import edq.net.request
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RETRIES: int = 4
+
+DEFAULT_TIMEOUT_SECS: float = 10.0
+
+DEFAULT_BACKOFF_BASE_SECS: float = edq.net.request.RETRY_BACKOFF_SECS
+""" The most a first retry will wait, doubling for each retry after it. """
+
+DEFAULT_BACKOFF_MAX_SECS: float = 30.0
+""" The most any retry will wait. """
+
+DEFAULT_HEDGE_PERCENTILE: float = 0.95
+"""
+Image requests whose response has not arrived within this percentile of their host's recent response times
+get a duplicate (hedged) request.
+"""
+
+DEFAULT_HEDGE_MIN_SAMPLES: int = 20
+""" The number of response times that must be seen from a host before its requests are hedged. """
+
+DEFAULT_HEDGE_MIN_DELAY_SECS: float = 0.05
+""" Hedges are never sent sooner than this, so a host that is uniformly fast does not get doubled traffic. """
+
+LATENCY_WINDOW_SIZE: int = 200
+""" The number of recent response times kept for each host. """
+
+DEFAULT_BREAKER_FAILURES: int = 5
+""" The number of consecutive failures from a host that open its circuit. """
+
+DEFAULT_BREAKER_RESET_SECS: float = 30.0
+""" How long an open circuit rejects requests before letting a single trial request through. """
+
+class CircuitOpenError(Exception):
+    """ A request was not sent because its host has been failing (see CircuitBreaker). """
+
+class RetryPolicy:
+    """
+    How a source's requests are timed out, retried, and hedged, and when a failing host is left alone.
+
+    Policies are read as each request is made, so changes to a source's policy take effect right away.
+    """
+
+    def __init__(self,
+            retries: int = DEFAULT_RETRIES,
+            timeout_secs: float = DEFAULT_TIMEOUT_SECS,
+            backoff_base_secs: float = DEFAULT_BACKOFF_BASE_SECS,
+            backoff_max_secs: float = DEFAULT_BACKOFF_MAX_SECS,
+            jitter: bool = True,
+            hedge_percentile: typing.Union[float, None] = DEFAULT_HEDGE_PERCENTILE,
+            hedge_min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES,
+            hedge_min_delay_secs: float = DEFAULT_HEDGE_MIN_DELAY_SECS,
+            breaker_failures: int = DEFAULT_BREAKER_FAILURES,
+            breaker_reset_secs: float = DEFAULT_BREAKER_RESET_SECS,
+            ) -> None:
+        self.retries: int = max(0, retries)
+        """ The number of times to retry a failed request. """
+
+        self.timeout_secs: float = timeout_secs
+        """ The timeout for connecting to a host and for each read from it. """
+
+        self.backoff_base_secs: float = backoff_base_secs
+        """ The (most) time to wait before the first retry, see backoff_secs(). """
+
+        self.backoff_max_secs: float = backoff_max_secs
+        """ The (most) time to wait before any retry. """
+
+        self.jitter: bool = jitter
+        """
+        Wait a random time (up to the backoff) before each retry,
+        so that requests that failed together do not all retry together.
+        """
+
+        self.hedge_percentile: typing.Union[float, None] = hedge_percentile
+        """ When to send a duplicate image request (see DEFAULT_HEDGE_PERCENTILE), or None to never hedge. """
+
+        self.hedge_min_samples: int = hedge_min_samples
+        """ The number of response times needed from a host before hedging its requests. """
+
+        self.hedge_min_delay_secs: float = hedge_min_delay_secs
+        """ The soonest a hedge may be sent. """
+
+        self.breaker_failures: int = breaker_failures
+        """ The number of consecutive failures that open a host's circuit, or zero to never open it. """
+
+        self.breaker_reset_secs: float = breaker_reset_secs
+        """ How long an open circuit waits before trying the host again. """
+
+    def backoff_secs(self, attempt_index: int) -> float:
+        """
+        Get how long to wait before an attempt (the first retry is attempt 1).
+        The backoff doubles with each retry (up to a limit), and with jitter a random time up to the backoff is used.
+        """
+
+        if (attempt_index <= 0):
+            return 0.0
+
+        secs = min(self.backoff_max_secs, self.backoff_base_secs * (2.0 ** min(attempt_index - 1, 32)))
+        if (self.jitter):
+            secs = random.uniform(0.0, secs)
+
+        return secs
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures from one host.
+    Once there are enough of them, the circuit opens and requests are rejected
+    until the reset time has passed, at which point a single trial request is let through.
+    A successful trial closes the circuit, a failed one keeps it open for another reset period.
+    """
+
+    def __init__(self) -> None:
+        self.failures: int = 0
+        """ The number of failures since the last success. """
+
+        self._lock: threading.Lock = threading.Lock()
+        self._retry_at: float = 0.0
+
+    def allow(self, failure_threshold: int, reset_secs: float) -> bool:
+        """ Check if a request may be sent (taking the trial slot if the circuit is open and due for a trial). """
+
+        with self._lock:
+            if ((failure_threshold <= 0) or (self.failures < failure_threshold)):
+                return True
+
+            now = time.monotonic()
+            if (now < self._retry_at):
+                return False
+
+            # Only one trial per reset period.
+            self._retry_at = now + reset_secs
+            return True
+
+    def succeed(self) -> None:
+        """ Note a successful request, closing the circuit. """
+
+        if (self.failures == 0):
+            return
+
+        with self._lock:
+            self.failures = 0
+
+    def fail(self, failure_threshold: int, reset_secs: float) -> bool:
+        """ Note a failed request, returning True if this failure opened the circuit. """
+
+        with self._lock:
+            self.failures += 1
+            if ((failure_threshold <= 0) or (self.failures < failure_threshold)):
+                return False
+
+            self._retry_at = time.monotonic() + reset_secs
+            return (self.failures == failure_threshold)
+
+class LatencyWindow:
+    """ The most recent response times from one host. """
+
+    def __init__(self, size: int = LATENCY_WINDOW_SIZE) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._samples: typing.Deque[float] = collections.deque(maxlen = max(1, size))
+
+    def add(self, secs: float) -> None:
+        """ Record a response time. """
+
+        with self._lock:
+            self._samples.append(secs)
+
+    def percentile(self, fraction: float, min_samples: int = 1) -> typing.Union[float, None]:
+        """ Get a percentile (as a fraction) of the recent response times, or None if there are fewer than `min_samples`. """
+
+        with self._lock:
+            if (len(self._samples) < max(1, min_samples)):
+                return None
+
+            samples = sorted(self._samples)
+
+        index = min(len(samples) - 1, int(fraction * len(samples)))
+        return samples[index]
+
+class HostTracker:
+    """ Keeps a circuit breaker and recent response times for each host, according to a policy. """
+
+    def __init__(self, policy: RetryPolicy) -> None:
+        self.policy: RetryPolicy = policy
+        """ The policy in effect. """
+
+        self._lock: threading.Lock = threading.Lock()
+        self._breakers: typing.Dict[str, CircuitBreaker] = {}
+        self._latencies: typing.Dict[str, LatencyWindow] = {}
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """ Get the circuit breaker for a URL's host. """
+
+        host = _get_host(url)
+
+        with self._lock:
+            breaker = self._breakers.get(host, None)
+            if (breaker is None):
+                breaker = CircuitBreaker()
+                self._breakers[host] = breaker
+
+            return breaker
+
+    def latencies(self, url: str) -> LatencyWindow:
+        """ Get the recent response times for a URL's host. """
+
+        host = _get_host(url)
+
+        with self._lock:
+            window = self._latencies.get(host, None)
+            if (window is None):
+                window = LatencyWindow()
+                self._latencies[host] = window
+
+            return window
+
+    def allow(self, url: str) -> bool:
+        """ Check if a request to this URL's host may be sent. """
+
+        return self.breaker(url).allow(self.policy.breaker_failures, self.policy.breaker_reset_secs)
+
+    def succeed(self, url: str) -> None:
+        """ Note a successful request to this URL's host. """
+
+        self.breaker(url).succeed()
+
+    def fail(self, url: str) -> None:
+        """ Note a failed request to this URL's host. """
+
+        if (self.breaker(url).fail(self.policy.breaker_failures, self.policy.breaker_reset_secs)):
+            _logger.warning("Too many failures from '%s', pausing requests to its host for %s seconds.", url, self.policy.breaker_reset_secs)
+
+    def add_latency(self, url: str, secs: float) -> None:
+        """ Record how long a response from this URL's host took to arrive. """
+
+        self.latencies(url).add(secs)
+
+    def hedge_delay(self, url: str) -> typing.Union[float, None]:
+        """ Get how long to wait on a request to this URL's host before hedging it, or None if it should not be hedged. """
+
+        if (self.policy.hedge_percentile is None):
+            return None
+
+        secs = self.latencies(url).percentile(self.policy.hedge_percentile, self.policy.hedge_min_samples)
+        if (secs is None):
+            return None
+
+        return max(self.policy.hedge_min_delay_secs, secs)
+
+def _get_host(url: str) -> str:
+    """ Get the key for a URL's host. """
+
+    return urllib.parse.urlparse(url).netloc.lower()
@@ -0,0 +1,143 @@
+import edq.testing.unittest
+
+import comics.retry
+
+class TestRetry(edq.testing.unittest.BaseTest):
+    """ Test retry policies, circuit breakers, and hedging. """
+
+    def test_backoff_secs_base(self) -> None:
+        """ Test that backoff doubles with each retry up to the limit. """
+
+        policy = comics.retry.RetryPolicy(backoff_base_secs = 0.5, backoff_max_secs = 3.0, jitter = False)
+
+        # [(attempt index, expected), ...]
+        test_cases = [
+            (-1, 0.0),
+            (0, 0.0),
+            (1, 0.5),
+            (2, 1.0),
+            (3, 2.0),
+            (4, 3.0),
+            (100, 3.0),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (attempt_index, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({attempt_index}):"):
+                self.assertEqual(expected, policy.backoff_secs(attempt_index))
+
+    def test_backoff_secs_jitter(self) -> None:
+        """ Test that jittered backoff stays under the (unjittered) backoff. """
+
+        policy = comics.retry.RetryPolicy(backoff_base_secs = 0.5, backoff_max_secs = 3.0, jitter = True)
+
+        for attempt_index in range(1, 6):
+            limit = min(3.0, 0.5 * (2 ** (attempt_index - 1)))
+            for _ in range(50):
+                secs = policy.backoff_secs(attempt_index)
+                self.assertGreaterEqual(secs, 0.0)
+                self.assertLessEqual(secs, limit)
+
+    def test_policy_clamps_retries(self) -> None:
+        """ Test that a negative number of retries means no retries. """
+
+        self.assertEqual(0, comics.retry.RetryPolicy(retries = -3).retries)
+
+    def test_circuit_breaker_base(self) -> None:
+        """ Test that a breaker opens after enough failures and that a success closes it. """
+
+        breaker = comics.retry.CircuitBreaker()
+
+        self.assertFalse(breaker.fail(3, 60.0))
+        self.assertFalse(breaker.fail(3, 60.0))
+        self.assertTrue(breaker.allow(3, 60.0))
+
+        # Only the failure that opens the circuit reports it.
+        self.assertTrue(breaker.fail(3, 60.0))
+        self.assertFalse(breaker.fail(3, 60.0))
+        self.assertFalse(breaker.allow(3, 60.0))
+
+        breaker.succeed()
+        self.assertEqual(0, breaker.failures)
+        self.assertTrue(breaker.allow(3, 60.0))
+
+    def test_circuit_breaker_trial(self) -> None:
+        """ Test that an open circuit lets a single trial through once it is due. """
+
+        breaker = comics.retry.CircuitBreaker()
+        for _ in range(2):
+            breaker.fail(2, 0.0)
+
+        self.assertTrue(breaker.allow(2, 60.0))
+        self.assertFalse(breaker.allow(2, 60.0))
+
+    def test_circuit_breaker_disabled(self) -> None:
+        """ Test that a zero threshold never opens the circuit. """
+
+        breaker = comics.retry.CircuitBreaker()
+        for _ in range(10):
+            self.assertFalse(breaker.fail(0, 60.0))
+
+        self.assertTrue(breaker.allow(0, 60.0))
+
+    def test_latency_window_percentile(self) -> None:
+        """ Test percentiles over the most recent response times. """
+
+        window = comics.retry.LatencyWindow(size = 10)
+        self.assertIsNone(window.percentile(0.5))
+
+        for secs in range(1, 21):
+            window.add(float(secs))
+
+        # Only the last 10 (11 to 20) are kept.
+        self.assertEqual(11.0, window.percentile(0.0))
+        self.assertEqual(16.0, window.percentile(0.5))
+        self.assertEqual(20.0, window.percentile(0.95))
+        self.assertEqual(20.0, window.percentile(1.0))
+        self.assertIsNone(window.percentile(0.5, min_samples = 11))
+
+    def test_host_tracker_hedge_delay(self) -> None:
+        """ Test that hedging waits for enough samples, respects the minimum delay, and can be turned off. """
+
+        policy = comics.retry.RetryPolicy(hedge_percentile = 0.5, hedge_min_samples = 3, hedge_min_delay_secs = 0.25)
+        tracker = comics.retry.HostTracker(policy)
+
+        url = 'http://test.invalid/a.jpg'
+        other_url = 'http://other.test.invalid/a.jpg'
+
+        for secs in [1.0, 2.0]:
+            tracker.add_latency(url, secs)
+
+        self.assertIsNone(tracker.hedge_delay(url))
+
+        tracker.add_latency('HTTP://TEST.INVALID/b.jpg', 3.0)
+        self.assertEqual(2.0, tracker.hedge_delay(url))
+        self.assertIsNone(tracker.hedge_delay(other_url))
+
+        for _ in range(3):
+            tracker.add_latency(other_url, 0.01)
+
+        self.assertEqual(0.25, tracker.hedge_delay(other_url))
+
+        policy.hedge_percentile = None
+        self.assertIsNone(tracker.hedge_delay(url))
+
+    def test_host_tracker_breakers(self) -> None:
+        """ Test that each host has its own breaker, following the policy. """
+
+        policy = comics.retry.RetryPolicy(breaker_failures = 2, breaker_reset_secs = 60.0)
+        tracker = comics.retry.HostTracker(policy)
+
+        url = 'http://test.invalid/a.jpg'
+        other_url = 'http://other.test.invalid/a.jpg'
+
+        tracker.fail(url)
+        self.assertTrue(tracker.allow(url))
+
+        tracker.fail(url)
+        self.assertFalse(tracker.allow(url))
+        self.assertTrue(tracker.allow(other_url))
+
+        tracker.succeed(url)
+        self.assertTrue(tracker.allow(url))
@@ -0,0 +1,290 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import logging
+import typing
+
+import comics.download
+import comics.metrics
+import comics.model
+import comics.source
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PARALLEL_COMICS: int = 1
+
+ChapterCallback = typing.Callable[[str, comics.model.ComicInfo, comics.model.ChapterDownloadResult], None]
+""" Called with a comic's URL, its info, and a chapter's result as soon as each chapter is finished. """
+
+MIN_THREADS: int = 32
+""" The fewest threads given to blocking I/O (requests and writes) during a scheduled batch. """
+
+class FairLimiter:
+    """
+    An async limit on how many holders there may be at once.
+    Unlike a semaphore, waiters are grouped by a key (e.g., a comic) and freed slots are handed out to the keys in turn,
+    so one key with many waiters cannot starve the others.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit: int = max(1, limit)
+        """ The most holders at once. """
+
+        self._available: int = self.limit
+        self._waiters: collections.OrderedDict[typing.Any, typing.Deque[asyncio.Future]] = collections.OrderedDict()
+
+    async def acquire(self, key: typing.Any) -> None:
+        """ Wait for a slot (taking a turn with the other keys). """
+
+        if ((self._available > 0) and (len(self._waiters) == 0)):
+            self._available -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, collections.deque()).append(future)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if (future.done() and (not future.cancelled())):
+                # The slot was handed over just as we were cancelled, pass it on.
+                self.release()
+            else:
+                self._remove_waiter(key, future)
+
+            raise
+
+    def release(self) -> None:
+        """ Free a slot, handing it to the next key in turn (if any are waiting). """
+
+        while (len(self._waiters) > 0):
+            key, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+
+            if (len(waiters) == 0):
+                del self._waiters[key]
+            else:
+                self._waiters.move_to_end(key)
+
+            if (not future.done()):
+                future.set_result(None)
+                return
+
+        self._available += 1
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: typing.Any) -> typing.AsyncIterator[None]:
+        """ Hold a slot for the length of the context. """
+
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _remove_waiter(self, key: typing.Any, future: asyncio.Future) -> None:
+        """ Stop waiting. """
+
+        waiters = self._waiters.get(key, None)
+        if (waiters is None):
+            return
+
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+
+        if (len(waiters) == 0):
+            del self._waiters[key]
+
+class BatchResult:
+    """ The outcome of one comic in a batch. """
+
+    def __init__(self,
+            url: str,
+            result: typing.Union[comics.model.DownloadResult, None] = None,
+            exception: typing.Union[Exception, None] = None,
+            ) -> None:
+        self.url: str = url
+        """ The comic's URL. """
+
+        self.result: typing.Union[comics.model.DownloadResult, None] = result
+        """ The download's result (if it finished). """
+
+        self.exception: typing.Union[Exception, None] = exception
+        """ What stopped the download (if it did not finish). """
+
+async def download_all_async(
+        urls: typing.List[str],
+        base_dir: str,
+        parallel_comics: int = DEFAULT_PARALLEL_COMICS,
+        total_workers: typing.Union[int, None] = None,
+        source_workers: typing.Union[int, None] = None,
+        on_chapter: typing.Union[ChapterCallback, None] = None,
+        keep_chapters: bool = True,
+        **kwargs: typing.Any) -> typing.AsyncIterator[BatchResult]:
+    """
+    Download several comics at once, yielding each comic's outcome as soon as it finishes.
+    Any additional arguments are passed to comics.download.stream_async().
+    A URL given more than once is only downloaded (and yielded) once,
+    since its downloads would write to the same place and callers tell comics apart by URL.
+
+    `on_chapter` is called as each chapter finishes.
+    Without `keep_chapters`, chapter results are dropped once they have been passed to `on_chapter`
+    (each comic's result will have no chapter results, but its metrics still cover every chapter),
+    so memory use does not grow with the size of the batch.
+
+    Up to `parallel_comics` comics are downloaded at a time.
+    When a comic finishes, the next one is taken from whichever source has the fewest comics in progress,
+    so a batch that is mostly one host does not leave the others idle.
+
+    Image transfers are limited per source (to `source_workers`, or each source's `max_concurrency`)
+    and overall (to `total_workers`, if set).
+    Within each limit, comics take turns, so chapters from every comic in progress keep moving.
+    """
+
+    pending: collections.OrderedDict[typing.Any, typing.Deque[str]] = collections.OrderedDict()
+    limiters: typing.Dict[typing.Any, FairLimiter] = {}
+
+    for url in dict.fromkeys(urls):
+        source = comics.source.lookup(url)
+        key = url if (source is None) else source
+
+        pending.setdefault(key, collections.deque()).append(url)
+
+        if ((source is not None) and (key not in limiters)):
+            limit = source.max_concurrency if (source_workers is None) else source_workers
+            limiters[key] = FairLimiter(limit)
+
+    total_limiter = None
+    if (total_workers is not None):
+        total_limiter = FairLimiter(total_workers)
+
+    running: typing.Dict[asyncio.Future, typing.Tuple[typing.Any, str]] = {}
+    running_counts: typing.Dict[typing.Any, int] = collections.defaultdict(int)
+
+    try:
+        while ((len(pending) > 0) or (len(running) > 0)):
+            while ((len(running) < max(1, parallel_comics)) and (len(pending) > 0)):
+                # Start the next comic from the least busy source (earlier sources win ties).
+                key = min(pending.keys(), key = lambda pending_key: running_counts[pending_key])
+                url = pending[key].popleft()
+                if (len(pending[key]) == 0):
+                    del pending[key]
+
+                image_slot = _make_image_slot(url, limiters.get(key, None), total_limiter)
+                task = asyncio.ensure_future(_download_comic(url, base_dir, image_slot, on_chapter, keep_chapters, kwargs))
+
+                running[task] = (key, url)
+                running_counts[key] += 1
+
+            done, _ = await asyncio.wait(running.keys(), return_when = asyncio.FIRST_COMPLETED)
+            for done_task in done:
+                key, url = running.pop(done_task)
+                running_counts[key] -= 1
+
+                yield _get_batch_result(url, done_task)
+    finally:
+        for running_task in running:
+            running_task.cancel()
+
+        await asyncio.gather(*running.keys(), return_exceptions = True)
+
+def download_all(
+        urls: typing.List[str],
+        base_dir: str,
+        on_result: typing.Union[typing.Callable[[BatchResult], None], None] = None,
+        parallel_comics: int = DEFAULT_PARALLEL_COMICS,
+        total_workers: typing.Union[int, None] = None,
+        source_workers: typing.Union[int, None] = None,
+        on_chapter: typing.Union[ChapterCallback, None] = None,
+        keep_chapters: bool = True,
+        **kwargs: typing.Any) -> typing.List[BatchResult]:
+    """
+    Run download_all_async() to completion (in a new event loop),
+    calling `on_result` with each comic's outcome as it finishes and returning all of them (in the order they finished).
+    """
+
+    async def run() -> typing.List[BatchResult]:
+        # Each image transfer, chapter listing, and page fetch holds a thread while it blocks.
+        workers = kwargs.get('workers', 1)
+        prefetch_chapters = kwargs.get('prefetch_chapters', 0)
+        thread_count = max(MIN_THREADS, max(1, parallel_comics) * (workers + prefetch_chapters + 1))
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = thread_count, thread_name_prefix = 'comics-batch')
+        asyncio.get_running_loop().set_default_executor(executor)
+
+        batch_results = []
+        async for batch_result in download_all_async(urls, base_dir,
+                parallel_comics = parallel_comics,
+                total_workers = total_workers,
+                source_workers = source_workers,
+                on_chapter = on_chapter,
+                keep_chapters = keep_chapters,
+                **kwargs):
+            batch_results.append(batch_result)
+
+            if (on_result is not None):
+                on_result(batch_result)
+
+        return batch_results
+
+    return asyncio.run(run())
+
+async def _download_comic(
+        url: str,
+        base_dir: str,
+        image_slot: comics.download.ImageSlot,
+        on_chapter: typing.Union[ChapterCallback, None],
+        keep_chapters: bool,
+        kwargs: typing.Dict[str, typing.Any],
+        ) -> comics.model.DownloadResult:
+    """ Download a single comic, handing off each chapter as it finishes. """
+
+    download_stream = await comics.download.stream_async(url, base_dir, image_slot = image_slot, **kwargs)
+
+    chapter_download_results = []
+    chapter_metrics = comics.metrics.Metrics()
+
+    async with download_stream:
+        async for chapter_download_result in download_stream:
+            if (on_chapter is not None):
+                on_chapter(url, download_stream.comic, chapter_download_result)
+
+            if (keep_chapters):
+                chapter_download_results.append(chapter_download_result)
+            else:
+                chapter_metrics.merge(chapter_download_result.metrics)
+
+    chapter_metrics.merge(download_stream.metrics)
+
+    return comics.model.DownloadResult(download_stream.comic, download_stream.out_dir, chapter_download_results, metrics = chapter_metrics)
+
+def _make_image_slot(
+        key: typing.Any,
+        source_limiter: typing.Union[FairLimiter, None],
+        total_limiter: typing.Union[FairLimiter, None],
+        ) -> comics.download.ImageSlot:
+    """ Make the slot a comic's image transfers must hold: one from its source's limiter, then one from the overall limiter. """
+
+    @contextlib.asynccontextmanager
+    async def image_slot() -> typing.AsyncIterator[None]:
+        async with contextlib.AsyncExitStack() as stack:
+            # Always in the same order, so two comics can never each hold what the other is waiting on.
+            for limiter in (source_limiter, total_limiter):
+                if (limiter is not None):
+                    await stack.enter_async_context(limiter.hold(key))
+
+            yield
+
+    return image_slot
+
+def _get_batch_result(url: str, task: asyncio.Future) -> BatchResult:
+    """ Collect the outcome of a finished comic. """
+
+    try:
+        return BatchResult(url, result = task.result())
+    except Exception as ex:
+        _logger.debug("Failed to download comic '%s'.", url, exc_info = ex)
+        return BatchResult(url, exception = ex)
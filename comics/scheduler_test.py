@@ -0,0 +1,167 @@
+import asyncio
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.download_test
+import comics.model
+import comics.scheduler
+
+class TestScheduler(edq.testing.unittest.BaseTest):
+    """ Test downloading batches of comics. """
+
+    def test_fair_limiter_turns(self) -> None:
+        """ Test that freed slots go to each waiting key in turn, not in the order the waits started. """
+
+        async def run() -> typing.List[str]:
+            limiter = comics.scheduler.FairLimiter(1)
+            order = []
+
+            async def hold(key: str, name: str) -> None:
+                async with limiter.hold(key):
+                    order.append(name)
+                    await asyncio.sleep(0)
+
+            await limiter.acquire('first')
+            tasks = [asyncio.ensure_future(hold(key, name)) for (key, name) in [('a', 'a1'), ('a', 'a2'), ('a', 'a3'), ('b', 'b1'), ('c', 'c1')]]
+
+            # Let every task start waiting.
+            await asyncio.sleep(0)
+            limiter.release()
+
+            await asyncio.gather(*tasks)
+            return order
+
+        self.assertEqual(['a1', 'b1', 'c1', 'a2', 'a3'], asyncio.run(run()))
+
+    def test_fair_limiter_limit(self) -> None:
+        """ Test that no more than the limit hold slots at once, and that cancelled waiters give up their turn. """
+
+        # [(limit, expected most holders), ...]
+        test_cases = [
+            (0, 1),
+            (1, 1),
+            (3, 3),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (limit, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} (limit {limit}):"):
+                self.assertEqual(expected, asyncio.run(self._run_limiter(limit)))
+
+    def test_download_all(self) -> None:
+        """ Test a batch across several sources (and a comic no source handles), with and without keeping chapters. """
+
+        for keep_chapters in [True, False]:
+            with self.subTest(msg = f"Keep chapters {keep_chapters}:"):
+                self._check_download_all(keep_chapters)
+
+    def _check_download_all(self, keep_chapters: bool) -> None:
+        """ Download a batch of fake comics (as a dry run) and check the results. """
+
+        started_urls: typing.List[str] = []
+        a_url = comics.download_test.register_fake_source(_RecordingSource(started_urls))
+        b_url = comics.download_test.register_fake_source(_RecordingSource(started_urls))
+        missing_url = 'http://missing.test.invalid/series/missing'
+
+        urls = [a_url, a_url + '-2', a_url + '-3', b_url, missing_url]
+        finished_chapters: typing.List[typing.Tuple[str, int]] = []
+
+        def on_chapter(url: str, comic: comics.model.ComicInfo, result: comics.model.ChapterDownloadResult) -> None:
+            finished_chapters.append((url, result.chapter.index))
+
+        batch_results = comics.scheduler.download_all(urls, edq.util.dirent.get_temp_dir(prefix = 'comics-test-'),
+                parallel_comics = 2,
+                on_chapter = on_chapter,
+                keep_chapters = keep_chapters,
+                dry_run = True)
+
+        self.assertEqual(sorted(urls), sorted(batch_result.url for batch_result in batch_results))
+
+        # The second comic started comes from the idle source, not the next one in the list.
+        # (Info is fetched in threads, so comics started together may be recorded in either order.)
+        self.assertEqual(sorted([a_url, b_url]), sorted(started_urls[:2]))
+        self.assertEqual(sorted([a_url + '-2', a_url + '-3']), sorted(started_urls[2:]))
+
+        for batch_result in batch_results:
+            if (batch_result.url == missing_url):
+                self.assertIsNone(batch_result.result)
+                self.assertIsNotNone(batch_result.exception)
+                continue
+
+            self.assertIsNone(batch_result.exception)
+            self.assertIsNotNone(batch_result.result)
+            result = typing.cast(comics.model.DownloadResult, batch_result.result)
+
+            chapter_indexes = [index for (url, index) in finished_chapters if (url == batch_result.url)]
+            self.assertEqual(list(range(comics.download_test.FAKE_CHAPTER_COUNT)), chapter_indexes)
+
+            expected_count = comics.download_test.FAKE_CHAPTER_COUNT if keep_chapters else 0
+            self.assertEqual(expected_count, len(result.chapter_download_results))
+
+    def test_download_all_duplicates(self) -> None:
+        """ Test that a comic given more than once is only downloaded once (so its chapters are not reported twice). """
+
+        a_url = comics.download_test.register_fake_source(comics.download_test.FakeSource())
+        b_url = comics.download_test.register_fake_source(comics.download_test.FakeSource())
+
+        finished_chapters: typing.List[typing.Tuple[str, int]] = []
+
+        def on_chapter(url: str, comic: comics.model.ComicInfo, result: comics.model.ChapterDownloadResult) -> None:
+            finished_chapters.append((url, result.chapter.index))
+
+        batch_results = comics.scheduler.download_all([a_url, b_url, a_url, a_url], edq.util.dirent.get_temp_dir(prefix = 'comics-test-'),
+                parallel_comics = 4,
+                on_chapter = on_chapter,
+                dry_run = True)
+
+        self.assertEqual(sorted([a_url, b_url]), sorted(batch_result.url for batch_result in batch_results))
+
+        for url in [a_url, b_url]:
+            chapter_indexes = [index for (chapter_url, index) in finished_chapters if (chapter_url == url)]
+            self.assertEqual(list(range(comics.download_test.FAKE_CHAPTER_COUNT)), chapter_indexes)
+
+    async def _run_limiter(self, limit: int) -> int:
+        """ Run more holders than the limit (cancelling one while it waits) and get the most that held a slot at once. """
+
+        limiter = comics.scheduler.FairLimiter(limit)
+        holders = [0]
+        most_holders = [0]
+
+        async def hold(key: int) -> None:
+            async with limiter.hold(key % 2):
+                holders[0] += 1
+                most_holders[0] = max(most_holders[0], holders[0])
+                await asyncio.sleep(0.01)
+                holders[0] -= 1
+
+        tasks = [asyncio.ensure_future(hold(key)) for key in range(8)]
+        await asyncio.sleep(0)
+
+        tasks[-1].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions = True)
+
+        self.assertEqual([None] * 7, results[:-1])
+        self.assertIsInstance(results[-1], asyncio.CancelledError)
+
+        # Every slot is free again.
+        for _ in range(max(1, limit)):
+            await asyncio.wait_for(limiter.acquire('check'), timeout = 1.0)
+
+        return most_holders[0]
+
+class _RecordingSource(comics.download_test.FakeSource):
+    """ A fake source that records the comics it is asked about (shared across sources). """
+
+    def __init__(self, started_urls: typing.List[str], **kwargs: typing.Any) -> None:
+        super().__init__(**kwargs)
+
+        self._started_urls: typing.List[str] = started_urls
+
+    def get_info_from_url(self, url: str) -> comics.model.ComicInfo:
+        with self._lock:
+            self._started_urls.append(url)
+
+        return super().get_info_from_url(url)
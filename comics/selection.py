@@ -0,0 +1,174 @@
+import logging
+import typing
+
+import comics.model
+
+_logger = logging.getLogger(__name__)
+
+INDEX_PREFIX: str = '#'
+""" Marks a chapter bound as an index (e.g., `#0` is the first chapter) instead of a name. """
+
+RANGE_SEPARATOR: str = '-'
+RANGES_SEPARATOR: str = ','
+
+ChapterRange = typing.Tuple[typing.Union[str, None], typing.Union[str, None]]
+""" The first and last chapter (inclusive) of a range, None for an open end. """
+
+class ChapterSelection:
+    """
+    Which of a comic's chapters to download, and in what order.
+
+    A chapter bound (in a range or `newer_than`) is a chapter's name (e.g., `12.5`) or its index with INDEX_PREFIX (e.g., `#0`).
+    A name that no chapter has is compared numerically against the chapters' names (where they are numbers),
+    so `100-` still works before chapter 100 is out.
+
+    Selections combine: a chapter must be in one of the ranges (if there are any), be one of the `last` chapters (if set),
+    and come after `newer_than` (if set).
+
+    With `newest_first`, the selected chapters are processed newest to oldest.
+    With `stop_at_present` as well, the download stops at the first chapter that is already fully present
+    (complete in the manifest, or with every image already on disk),
+    so following an ongoing series only costs requests for its new chapters.
+    """
+
+    def __init__(self,
+            ranges: typing.Union[typing.List[ChapterRange], None] = None,
+            last: typing.Union[int, None] = None,
+            newer_than: typing.Union[str, None] = None,
+            newest_first: bool = False,
+            stop_at_present: bool = False,
+            ) -> None:
+        self.ranges: typing.List[ChapterRange] = list(ranges or [])
+        """ The ranges of chapters to select (all chapters if empty). """
+
+        self.last: typing.Union[int, None] = last
+        """ Only select from the newest this many chapters. """
+
+        self.newer_than: typing.Union[str, None] = newer_than
+        """ Only select chapters after this one. """
+
+        self.newest_first: bool = newest_first
+        """ Process the newest chapters first. """
+
+        self.stop_at_present: bool = stop_at_present
+        """ Stop at the first chapter that is already fully present (only with `newest_first`). """
+
+    def select(self, chapters: typing.List[comics.model.ComicChapter]) -> typing.List[comics.model.ComicChapter]:
+        """ Get the selected chapters (from a comic's chapters, oldest first) in the order they should be processed. """
+
+        positions = range(len(chapters))
+
+        if (self.last is not None):
+            positions = positions[max(0, len(chapters) - max(0, self.last)):]
+
+        if (self.newer_than is not None):
+            after = _resolve_bound(chapters, self.newer_than, False)
+            positions = range(max(positions.start, after + 1), positions.stop)
+
+        if (len(self.ranges) > 0):
+            in_range: typing.Set[int] = set()
+            for (first, last) in self.ranges:
+                start = 0 if (first is None) else _resolve_bound(chapters, first, True)
+                stop = len(chapters) if (last is None) else (_resolve_bound(chapters, last, False) + 1)
+                in_range.update(range(start, stop))
+
+            selected = [chapters[position] for position in positions if position in in_range]
+        else:
+            selected = [chapters[position] for position in positions]
+
+        if (self.newest_first):
+            selected.reverse()
+
+        _logger.debug("Selected %d of %d chapters.", len(selected), len(chapters))
+
+        return selected
+
+    def should_stop(self, chapter_download_result: comics.model.ChapterDownloadResult) -> bool:
+        """ Check if a download should stop after this chapter, because it was already fully present. """
+
+        if (not (self.newest_first and self.stop_at_present)):
+            return False
+
+        return is_present(chapter_download_result)
+
+def is_present(chapter_download_result: comics.model.ChapterDownloadResult) -> bool:
+    """ Check if a chapter was already fully present (nothing had to be fetched, and nothing failed or is missing). """
+
+    return ((len(chapter_download_result.image_results) > 0)
+            and (not chapter_download_result.has_error())
+            and (chapter_download_result.missing_count() == 0)
+            and (chapter_download_result.downloaded_count() == 0))
+
+def parse_ranges(text: str) -> typing.List[ChapterRange]:
+    """
+    Parse ranges of chapters, e.g., `1-10,12.5,#0-#4,100-` (see ChapterSelection for the bounds).
+    A single chapter is a range of one, and either end of a range may be left open.
+    """
+
+    ranges: typing.List[ChapterRange] = []
+    for part in text.split(RANGES_SEPARATOR):
+        part = part.strip()
+        if (len(part) == 0):
+            continue
+
+        if (RANGE_SEPARATOR not in part):
+            ranges.append((part, part))
+            continue
+
+        first, last = part.split(RANGE_SEPARATOR, 1)
+        first = first.strip()
+        last = last.strip()
+        ranges.append(((first if (len(first) > 0) else None), (last if (len(last) > 0) else None)))
+
+    if (len(ranges) == 0):
+        raise ValueError(f"No chapter ranges found in '{text}'.")
+
+    return ranges
+
+def _resolve_bound(chapters: typing.List[comics.model.ComicChapter], bound: str, lower: bool) -> int:
+    """
+    Get the position (in the comic's chapters) of a range bound.
+    A bound that does not name a chapter resolves to the first chapter numbered at least the bound (for a lower bound)
+    or the last chapter numbered at most the bound (for an upper bound), and past the ends if there are none.
+    """
+
+    if (bound.startswith(INDEX_PREFIX)):
+        index = int(bound[len(INDEX_PREFIX):])
+        for (position, chapter) in enumerate(chapters):
+            if (chapter.index == index):
+                return position
+
+        raise ValueError(f"No chapter has index {index}.")
+
+    for (position, chapter) in enumerate(chapters):
+        if (chapter.name == bound):
+            return position
+
+    try:
+        number = float(bound)
+    except ValueError:
+        raise ValueError(f"No chapter is named '{bound}' (and it is not a number).") from None
+
+    numbered: typing.List[typing.Tuple[int, float]] = []
+    for (position, chapter) in enumerate(chapters):
+        value = _get_number(chapter)
+        if (value is not None):
+            numbered.append((position, value))
+
+    if (lower):
+        matches = [position for (position, value) in numbered if value >= number]
+        return min(matches) if (len(matches) > 0) else len(chapters)
+
+    matches = [position for (position, value) in numbered if value <= number]
+    return max(matches) if (len(matches) > 0) else -1
+
+def _get_number(chapter: comics.model.ComicChapter) -> typing.Union[float, None]:
+    """ Get a chapter's name as a number (if it is one). """
+
+    if (chapter.name is None):
+        return None
+
+    try:
+        return float(chapter.name)
+    except ValueError:
+        return None
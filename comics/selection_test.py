@@ -0,0 +1,230 @@
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.download
+import comics.download_test
+import comics.model
+import comics.selection
+
+# Chapter names (oldest first), with a half chapter, a gap (no 5), and an extra that is not a number.
+CHAPTER_NAMES: typing.List[typing.Union[str, None]] = ['1', '2', '2.5', '3', '4', '6', 'extra', None]
+
+class TestSelection(edq.testing.unittest.BaseTest):
+    """ Test picking which of a comic's chapters to download. """
+
+    def test_parse_ranges_base(self) -> None:
+        """ Test parsing range text. """
+
+        # [(text, expected), ...]
+        test_cases: typing.List[typing.Tuple[str, typing.List[comics.selection.ChapterRange]]] = [
+            ('1', [('1', '1')]),
+            ('1-10', [('1', '10')]),
+            (' 1 - 10 , 12.5 ', [('1', '10'), ('12.5', '12.5')]),
+            ('100-', [('100', None)]),
+            ('-5', [(None, '5')]),
+            ('-', [(None, None)]),
+            ('#0-#4,,extra', [('#0', '#4'), ('extra', 'extra')]),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (text, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ('{text}'):"):
+                self.assertEqual(expected, comics.selection.parse_ranges(text))
+
+    def test_parse_ranges_empty(self) -> None:
+        """ Test that text without any ranges is rejected. """
+
+        for text in ['', ' ', ',', ' , ']:
+            with self.subTest(msg = f"'{text}':"):
+                with self.assertRaisesRegex(ValueError, 'No chapter ranges'):
+                    comics.selection.parse_ranges(text)
+
+    def test_select_base(self) -> None:
+        """ Test selecting by ranges, the last chapters, and newer chapters (alone, combined, and at or past the bounds). """
+
+        # [(selection kwargs, expected names), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, typing.Any], typing.List[typing.Union[str, None]]]] = [
+            ({}, CHAPTER_NAMES),
+
+            # Names and indexes.
+            ({'ranges': [('2', '3')]}, ['2', '2.5', '3']),
+            ({'ranges': [('#1', '#3')]}, ['2', '2.5', '3']),
+            ({'ranges': [('extra', 'extra')]}, ['extra']),
+            ({'ranges': [('#7', '#7')]}, [None]),
+            ({'ranges': [('3', '2')]}, []),
+
+            # Open ends.
+            ({'ranges': [('4', None)]}, ['4', '6', 'extra', None]),
+            ({'ranges': [(None, '2')]}, ['1', '2']),
+            ({'ranges': [(None, None)]}, CHAPTER_NAMES),
+
+            # Overlapping ranges are only selected once, in the comic's order.
+            ({'ranges': [('3', '4'), ('1', '1'), ('2', '3')]}, ['1', '2', '2.5', '3', '4']),
+
+            # Numbers that are not a chapter's name.
+            ({'ranges': [('5', '5')]}, []),
+            ({'ranges': [('5', None)]}, ['6', 'extra', None]),
+            ({'ranges': [('2.1', '4.9')]}, ['2.5', '3', '4']),
+            ({'ranges': [('0', '1.5')]}, ['1']),
+            ({'ranges': [('0', '0.5')]}, []),
+            ({'ranges': [('100', None)]}, []),
+            ({'ranges': [(None, '100')]}, ['1', '2', '2.5', '3', '4', '6']),
+
+            # The last chapters.
+            ({'last': 2}, ['extra', None]),
+            ({'last': 0}, []),
+            ({'last': -1}, []),
+            ({'last': 100}, CHAPTER_NAMES),
+
+            # Newer chapters.
+            ({'newer_than': '4'}, ['6', 'extra', None]),
+            ({'newer_than': '#6'}, [None]),
+            ({'newer_than': '#7'}, []),
+            ({'newer_than': '5'}, ['6', 'extra', None]),
+            ({'newer_than': '0'}, CHAPTER_NAMES),
+            ({'newer_than': '100'}, ['extra', None]),
+
+            # Combined.
+            ({'ranges': [('2', '6')], 'last': 4}, ['4', '6']),
+            ({'ranges': [('2', '6')], 'newer_than': '2.5'}, ['3', '4', '6']),
+            ({'last': 5, 'newer_than': '1'}, ['3', '4', '6', 'extra', None]),
+            ({'last': 2, 'newer_than': '6'}, ['extra', None]),
+            ({'last': 2, 'newer_than': 'extra'}, [None]),
+            ({'ranges': [('1', '3')], 'last': 3}, []),
+
+            # Newest first.
+            ({'ranges': [('2', '3')], 'newest_first': True}, ['3', '2.5', '2']),
+            ({'last': 3, 'newest_first': True}, [None, 'extra', '6']),
+        ]
+
+        chapters = _make_chapters()
+
+        for (i, test_case) in enumerate(test_cases):
+            (kwargs, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({kwargs}):"):
+                selection = comics.selection.ChapterSelection(**kwargs)
+                self.assertEqual(expected, [chapter.name for chapter in selection.select(chapters)])
+
+    def test_select_no_chapters(self) -> None:
+        """ Test that selecting from a comic without chapters selects nothing (numbered bounds have nothing to fall on). """
+
+        # [selection kwargs, ...]
+        test_cases: typing.List[typing.Dict[str, typing.Any]] = [
+            {},
+            {'last': 3},
+            {'ranges': [('1', '10')]},
+            {'ranges': [('5', None)]},
+            {'newer_than': '1'},
+        ]
+
+        for (i, kwargs) in enumerate(test_cases):
+            with self.subTest(msg = f"Case {i} ({kwargs}):"):
+                self.assertEqual([], comics.selection.ChapterSelection(**kwargs).select([]))
+
+    def test_select_errors(self) -> None:
+        """ Test that bounds that cannot match any chapter are rejected. """
+
+        # [(selection kwargs, error substring), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, typing.Any], str]] = [
+            ({'ranges': [('#8', None)]}, 'No chapter has index 8'),
+            ({'ranges': [(None, '#-1')]}, 'No chapter has index -1'),
+            ({'newer_than': '#100'}, 'No chapter has index 100'),
+            ({'ranges': [('bonus', None)]}, "No chapter is named 'bonus'"),
+            ({'newer_than': 'bonus'}, "No chapter is named 'bonus'"),
+        ]
+
+        chapters = _make_chapters()
+
+        for (i, test_case) in enumerate(test_cases):
+            (kwargs, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({kwargs}):"):
+                with self.assertRaisesRegex(ValueError, expected):
+                    comics.selection.ChapterSelection(**kwargs).select(chapters)
+
+    def test_is_present(self) -> None:
+        """ Test deciding if a chapter was already fully present. """
+
+        # [(image result kwargs (one per image), chapter error, expected), ...]
+        test_cases: typing.List[typing.Tuple[typing.List[typing.Dict[str, typing.Any]], typing.Union[str, None], bool]] = [
+            ([{'already_exists': True}, {'already_exists': True}], None, True),
+            ([], None, False),
+            ([{'already_exists': True}, {'downloaded': True}], None, False),
+            ([{'already_exists': True}, {}], None, False),
+            ([{'already_exists': True}, {'error': 'broken'}], None, False),
+            ([{'already_exists': True}], 'broken', False),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (image_kwargs, error, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                chapter_download_result = _make_chapter_result(image_kwargs, error)
+                self.assertEqual(expected, comics.selection.is_present(chapter_download_result))
+
+    def test_should_stop(self) -> None:
+        """ Test that only a newest first selection that stops at present chapters stops, and only at a present chapter. """
+
+        present = _make_chapter_result([{'already_exists': True}])
+        downloaded = _make_chapter_result([{'downloaded': True}])
+
+        # [(newest first, stop at present, expected for a present chapter), ...]
+        test_cases = [
+            (True, True, True),
+            (True, False, False),
+            (False, True, False),
+            (False, False, False),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (newest_first, stop_at_present, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({newest_first}, {stop_at_present}):"):
+                selection = comics.selection.ChapterSelection(newest_first = newest_first, stop_at_present = stop_at_present)
+                self.assertEqual(expected, selection.should_stop(present))
+                self.assertFalse(selection.should_stop(downloaded))
+
+    def test_download_stop_at_present(self) -> None:
+        """ Test that a newest first download stops at the first chapter that is already on disk, without listing older chapters. """
+
+        out_dir = edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+        selection = comics.selection.ChapterSelection(newest_first = True, stop_at_present = True)
+
+        with comics.download_test.stand_in_server() as server:
+            result = comics.download.download(server.comic_url, out_dir, selection = comics.selection.ChapterSelection(last = 1))
+            self.assertEqual(1, len(result.chapter_download_results))
+            self.assertEqual(comics.download_test.STAND_IN_IMAGE_COUNT, result.chapter_download_results[0].downloaded_count())
+
+            server.reset_counts()
+            result = comics.download.download(server.comic_url, out_dir, selection = selection)
+
+            counts = server.reset_counts()
+
+        self.assertEqual(1, len(result.chapter_download_results))
+        chapter_download_result = result.chapter_download_results[0]
+        self.assertEqual(comics.download_test.STAND_IN_CHAPTER_COUNT - 1, chapter_download_result.chapter.index)
+        self.assertTrue(comics.selection.is_present(chapter_download_result))
+        self.assertEqual(0, counts.get('image', 0))
+
+def _make_chapters() -> typing.List[comics.model.ComicChapter]:
+    """ Make a comic's chapters (oldest first) with CHAPTER_NAMES. """
+
+    return [comics.model.ComicChapter(f"http://test.invalid/{i}", index = i, name = name) for (i, name) in enumerate(CHAPTER_NAMES)]
+
+def _make_chapter_result(
+        image_kwargs: typing.List[typing.Dict[str, typing.Any]],
+        error: typing.Union[str, None] = None,
+        ) -> comics.model.ChapterDownloadResult:
+    """ Make a chapter's result with an image result for each set of kwargs. """
+
+    image_results = []
+    for (i, kwargs) in enumerate(image_kwargs):
+        image = comics.model.ComicImage(f"http://test.invalid/{i}.jpg", index = i)
+        image_results.append(comics.model.ImageDownloadResult(image, f"/tmp/{i}.jpg", **kwargs))
+
+    return comics.model.ChapterDownloadResult(comics.model.ComicChapter('http://test.invalid/1', name = '1'), '/tmp/1',
+            image_results = image_results, error = error)
@@ -1,3 +1,7 @@
+import importlib.metadata
+import logging
+import sys
+import threading
 import typing
 import urllib.parse
 
@@ -5,65 +9,141 @@ import edq.util.pyimport
 
 import comics.model
 
-KNOWN_SOURCE_MODULES: typing.List[str] = [
-    'comics.sources.coffeemanga_to',
-]
+_logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP: str = 'comics.sources'
+"""
+The entry point group that installed packages can add sources through.
+Each entry point is named after a hostname its source handles and points at the source's module
+(e.g., `coffeemanga.to = comics.sources.coffeemanga_to`), which must be like those in KNOWN_SOURCE_MODULES.
 """
-Source modules that we already know about.
+
+KNOWN_SOURCE_MODULES: typing.Dict[str, str] = {
+    'coffeemanga.to': 'comics.sources.coffeemanga_to',
+}
+"""
+Source modules that we already know about, keyed by the hostname they handle.
+A module is only imported once a URL on its host is looked up.
 Must have `get_urls()` and `get_source(url)` functions.
 """
 
-_known_sources_loaded: bool = False  # pylint: disable=invalid-name
+_lock: threading.RLock = threading.RLock()
 
 _sources: typing.Dict[str, comics.model.ComicSource] = {}
 
-def lookup(url: str) -> typing.Union[comics.model.ComicSource, None]:
-    """ Try to find a comic's source according to it's model. """
+_loaded_modules: typing.Set[str] = set()
 
-    if (not url.startswith('http')):
-        url = f"http://{url}"
+_entry_point_modules: typing.Union[typing.Dict[str, str], None] = None  # pylint: disable=invalid-name
 
-    parts = urllib.parse.urlparse(url)
-    key = parts.hostname
+def lookup(url: str) -> typing.Union[comics.model.ComicSource, None]:
+    """
+    Try to find a comic's source according to it's model.
+    A source module that handles the URL's host (see KNOWN_SOURCE_MODULES and ENTRY_POINT_GROUP) is imported on first use.
+    """
 
+    key = _get_host(url)
     if (key is None):
         return None
 
-    return _sources.get(key, None)
+    with _lock:
+        source = _sources.get(key, None)
+        if (source is not None):
+            return source
 
-def register(url: str, source: comics.model.ComicSource) -> None:
-    """ Register a source. """
+        module_name = KNOWN_SOURCE_MODULES.get(key, None)
+        if (module_name is None):
+            module_name = _get_entry_point_modules().get(key, None)
 
-    if (not url.startswith('http')):
-        url = f"http://{url}"
+        if (module_name is None):
+            return None
+
+        _load_module(module_name)
+
+        return _sources.get(key, None)
+
+def get_sources(load_all: bool = False) -> typing.List[comics.model.ComicSource]:
+    """
+    Get every registered source (once each, even if it is registered for several URLs).
+    Sources that have not been used yet (see lookup()) are only included (and imported) if `load_all` is set.
+    """
+
+    with _lock:
+        if (load_all):
+            for module_name in list(KNOWN_SOURCE_MODULES.values()) + list(_get_entry_point_modules().values()):
+                _load_module(module_name)
+
+        sources: typing.List[comics.model.ComicSource] = []
+        for source in _sources.values():
+            if (not any(source is seen for seen in sources)):
+                sources.append(source)
 
-    parts = urllib.parse.urlparse(url)
-    key = parts.hostname
+        return sources
 
+def register(url: str, source: comics.model.ComicSource) -> None:
+    """ Register a source. """
+
+    key = _get_host(url)
     if (key is None):
         raise ValueError(f"Unable to parse hostname from URL: '{url}'.")
 
-    existing_source = _sources.get(key, None)
-    if (existing_source is not None):
-        raise ValueError(f"Cannot register source ('{source}'), found an existing source ('{existing_source}') at URL: '{url}'.")
-
-    _sources[key] = source
+    with _lock:
+        existing_source = _sources.get(key, None)
+        if (existing_source is not None):
+            raise ValueError(f"Cannot register source ('{source}'), found an existing source ('{existing_source}') at URL: '{url}'.")
 
-def _register_known_sources() -> None:
-    """ Register sources we already know about. """
+        _sources[key] = source
 
-    global _known_sources_loaded  # pylint: disable=global-statement
+def _load_module(module_name: str) -> None:
+    """
+    Import a source module and register a source for each of its URLs (once).
+    Hosts that already have a (explicitly registered) source keep it.
+    """
 
-    if (_known_sources_loaded):
-        return
+    with _lock:
+        if (module_name in _loaded_modules):
+            return
 
-    for known_source_module in KNOWN_SOURCE_MODULES:
-        source_module = edq.util.pyimport.import_name(known_source_module)
+        _logger.debug("Loading source module '%s'.", module_name)
+        source_module = edq.util.pyimport.import_name(module_name)
 
         for url in source_module.get_urls():
-            source = source_module.get_source(url)
-            register(url, source)
+            key = _get_host(url)
+            if ((key is None) or (key in _sources)):
+                continue
+
+            _sources[key] = source_module.get_source(url)
+
+        _loaded_modules.add(module_name)
+
+def _get_entry_point_modules() -> typing.Dict[str, str]:
+    """ Get the source modules added by installed packages (see ENTRY_POINT_GROUP), keyed by hostname. Only looked for once. """
+
+    global _entry_point_modules  # pylint: disable=global-statement
 
-    _known_sources_loaded = True
+    with _lock:
+        if (_entry_point_modules is not None):
+            return _entry_point_modules
+
+        if (sys.version_info >= (3, 10)):
+            entry_points = list(importlib.metadata.entry_points(group = ENTRY_POINT_GROUP))
+        else:
+            entry_points = list(importlib.metadata.entry_points().get(ENTRY_POINT_GROUP, []))
+
+        _entry_point_modules = {}
+        for entry_point in entry_points:
+            key = entry_point.name.lower()
+            if (key in KNOWN_SOURCE_MODULES):
+                _logger.warning("Ignoring source entry point '%s' for a host that already has a known source.", entry_point.name)
+                continue
+
+            _entry_point_modules[key] = entry_point.value
+
+        return _entry_point_modules
+
+def _get_host(url: str) -> typing.Union[str, None]:
+    """ Get the key for a URL's host (the URL may leave out its scheme). """
+
+    if (not url.startswith('http')):
+        url = f"http://{url}"
 
-_register_known_sources()
+    return urllib.parse.urlparse(url).hostname
@@ -0,0 +1,149 @@
+import importlib.metadata
+import typing
+import unittest.mock
+
+import edq.testing.unittest
+
+import comics.download_test
+import comics.model
+import comics.source
+import comics.sources.coffeemanga_to
+
+LAZY_HOST: str = 'lazy.test.invalid'
+PLUGIN_HOST: str = 'plugin.test.invalid'
+
+_created_sources: typing.List[comics.model.ComicSource] = []
+
+def get_urls() -> typing.List[str]:
+    """ Get the URLs handled by this (stand-in) source module. """
+
+    return [f"https://{LAZY_HOST}", f"https://www.{LAZY_HOST}", f"https://{PLUGIN_HOST}"]
+
+def get_source(url: str) -> comics.model.ComicSource:
+    """ Get a source for the given URL, keeping track of every source made. """
+
+    source = comics.download_test.FakeSource()
+    _created_sources.append(source)
+    return source
+
+class TestSource(edq.testing.unittest.BaseTest):
+    """ Test finding sources for comics. """
+
+    def setUp(self) -> None:
+        # Each test gets an empty registry.
+        self._patches: typing.List[typing.Any] = [
+            unittest.mock.patch.dict(comics.source._sources, clear = True),
+            unittest.mock.patch.object(comics.source, '_loaded_modules', set()),
+            unittest.mock.patch.object(comics.source, '_entry_point_modules', None),
+            unittest.mock.patch.dict(comics.source.KNOWN_SOURCE_MODULES, {LAZY_HOST: __name__, f"www.{LAZY_HOST}": __name__}),
+        ]
+
+        for patch in self._patches:
+            patch.start()
+
+        _created_sources.clear()
+
+    def tearDown(self) -> None:
+        for patch in reversed(self._patches):
+            patch.stop()
+
+    def test_get_host(self) -> None:
+        """ Test the registry's key for URLs. """
+
+        # [(url, expected), ...]
+        test_cases = [
+            ('https://coffeemanga.to/series/x', 'coffeemanga.to'),
+            ('coffeemanga.to/series/x', 'coffeemanga.to'),
+            ('http://A.Example.COM:8080/x?y=1', 'a.example.com'),
+            ('127.0.0.1:5000/series/x', '127.0.0.1'),
+            ('http://', None),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (url, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ('{url}'):"):
+                self.assertEqual(expected, comics.source._get_host(url))
+
+    def test_register(self) -> None:
+        """ Test that each host may only have one source. """
+
+        source = comics.download_test.FakeSource()
+        comics.source.register('http://a.test.invalid/one', source)
+
+        self.assertIs(source, comics.source.lookup('https://a.test.invalid:8080/two'))
+        self.assertIsNone(comics.source.lookup('http://b.test.invalid'))
+
+        with self.assertRaisesRegex(ValueError, 'Cannot register source'):
+            comics.source.register('a.test.invalid', comics.download_test.FakeSource())
+
+        with self.assertRaisesRegex(ValueError, 'Unable to parse hostname'):
+            comics.source.register('http://', source)
+
+    def test_lazy_load(self) -> None:
+        """ Test that a source module is only imported once a URL on its host is looked up, and only once. """
+
+        self.assertEqual([], comics.source.get_sources())
+        self.assertEqual([], _created_sources)
+
+        source = comics.source.lookup(f"https://{LAZY_HOST}/series/x")
+        self.assertEqual(3, len(_created_sources))
+        self.assertIs(_created_sources[0], source)
+        self.assertIs(_created_sources[1], comics.source.lookup(f"https://www.{LAZY_HOST}/series/x"))
+
+        comics.source.lookup(f"https://{LAZY_HOST}/series/y")
+        self.assertEqual(3, len(_created_sources))
+        self.assertEqual(_created_sources, comics.source.get_sources())
+
+        coffeemanga_source = comics.source.lookup('https://coffeemanga.to/series/x')
+        self.assertIsInstance(coffeemanga_source, comics.sources.coffeemanga_to.ComicSource)
+
+    def test_registered_source_wins(self) -> None:
+        """ Test that a host with a registered source keeps it when its module is loaded. """
+
+        source = comics.download_test.FakeSource()
+        comics.source.register(f"https://www.{LAZY_HOST}", source)
+
+        comics.source.lookup(f"https://{LAZY_HOST}/series/x")
+
+        self.assertEqual(2, len(_created_sources))
+        self.assertIs(source, comics.source.lookup(f"https://www.{LAZY_HOST}/series/x"))
+
+    def test_get_sources_load_all(self) -> None:
+        """ Test listing every source, each once. """
+
+        source = comics.download_test.FakeSource()
+        comics.source.register('http://a.test.invalid', source)
+        comics.source._sources['b.test.invalid'] = source
+
+        self.assertEqual([source], comics.source.get_sources())
+
+        sources = comics.source.get_sources(load_all = True)
+        self.assertEqual(5, len(sources))
+        self.assertIs(source, sources[0])
+        self.assertEqual(3, len([source for source in sources if source in _created_sources]))
+        self.assertEqual(1, len([source for source in sources if isinstance(source, comics.sources.coffeemanga_to.ComicSource)]))
+
+    def test_entry_points(self) -> None:
+        """ Test finding source modules added by installed packages (that do not take over known hosts). """
+
+        entry_points = [
+            importlib.metadata.EntryPoint(PLUGIN_HOST, __name__, comics.source.ENTRY_POINT_GROUP),
+            importlib.metadata.EntryPoint('Coffeemanga.to', 'not.a.module', comics.source.ENTRY_POINT_GROUP),
+        ]
+
+        def get_entry_points(**kwargs: typing.Any) -> typing.Any:
+            if ('group' not in kwargs):
+                return {comics.source.ENTRY_POINT_GROUP: entry_points}
+
+            return [entry_point for entry_point in entry_points if (entry_point.group == kwargs['group'])]
+
+        with unittest.mock.patch('importlib.metadata.entry_points', side_effect = get_entry_points) as patched:
+            self.assertEqual({PLUGIN_HOST: __name__}, comics.source._get_entry_point_modules())
+
+            source = comics.source.lookup(f"https://{PLUGIN_HOST}/series/x")
+            self.assertIs(_created_sources[2], source)
+
+            self.assertIsInstance(comics.source.lookup('https://coffeemanga.to/series/x'), comics.sources.coffeemanga_to.ComicSource)
+
+            self.assertEqual(1, patched.call_count)
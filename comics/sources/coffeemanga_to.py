@@ -1,62 +1,217 @@
+import html
 import json
+import logging
 import re
+import threading
 import typing
 
-import bs4
-import edq.net.request
 import edq.util.dirent
 
+import comics.flight
+import comics.metrics
 import comics.model
+import comics.net
+
+_logger = logging.getLogger(__name__)
 
 NAME: str = 'coffeemanga.to.'
 URLS: typing.List[str] = [
     'https://coffeemanga.to',
 ]
 
+BASE_URL: str = 'https://coffeemanga.to'
+
 USER_AGENT: str = 'Mozilla/5.0 (X11; Linux x86_64; rv:146.0) Gecko/20100101 Firefox/146.0'
 
+INFO_CACHE_TTL_SECS: float = 60.0 * 60.0
+""" How long a comic's parsed page stays cached. """
+
+NEXT_ACTION_CACHE_TTL_SECS: float = 60.0 * 60.0 * 24.0 * 7.0
+"""
+How long the next action scraped from a JS chunk stays cached.
+It only changes when the site is redeployed (and a failed server action will drop it early).
+"""
+
+IMAGES_ROW_ID: str = '1'
+""" The flight row (in the server action's response) that holds the list of a chapter's images. """
+
+_H1_PATTERN: re.Pattern = re.compile(r'<h1\b[^>]*>(.*?)</h1\s*>', re.DOTALL | re.IGNORECASE)
+_SCRIPT_PATTERN: re.Pattern = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.DOTALL | re.IGNORECASE)
+_SRC_PATTERN: re.Pattern = re.compile(r'\bsrc\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+_TAG_PATTERN: re.Pattern = re.compile(r'<[^>]*>')
+_CHUNK_PATH_PATTERN: re.Pattern = re.compile(r'/_next/static/chunks/app/.*/series/.*/page-.*\.js')
+_CHAPTER_PATTERN: re.Pattern = re.compile(r'\\"chapter\\":(\{[^\}]+\})')
+
+_ParsedInfo = typing.Tuple[str, typing.List[comics.model.ComicChapter], str]
+
 class ComicSource(comics.model.ComicSource):
     """ A source for coffeemanga.to. """
 
-    def __init__(self) -> None:
-        super().__init__(NAME)
+    def __init__(self, base_url: str = BASE_URL, **kwargs: typing.Any) -> None:
+        super().__init__(NAME, **kwargs)
+
+        self.base_url: str = base_url.rstrip('/')
+        """
+        The site's root, which relative paths (e.g., JS chunks) are resolved against.
+        Pointing this elsewhere (e.g., at comics.bench.server) allows working offline.
+        """
+
+        self._refresh_lock: threading.Lock = threading.Lock()
 
     def get_info_from_url(self, url: str) -> comics.model.ComicInfo:
-        _, text = edq.net.request.make_get(url, retries = self.retries)
+        info, info_cached = self._get_cached_info(url)
+        if (info is None):
+            with comics.metrics.timed(comics.metrics.PHASE_SERIES_FETCH):
+                _, text = self.session.get(url, retries = self.retries)
+                info = self._parse_info(url, text)
+
+            self._cache_info(url, info)
+
+        name, chapters, chunk_path = info
+
+        next_action, next_action_cached = self._get_cached_next_action(chunk_path)
+        if (next_action is None):
+            with comics.metrics.timed(comics.metrics.PHASE_NEXT_ACTION_FETCH):
+                _, chunk_text = self.session.get(f"{self.base_url}{chunk_path}", retries = self.retries)
+                next_action = self._parse_next_action(chunk_text)
+
+            self._cache_next_action(chunk_path, next_action)
+
+        return comics.model.ComicInfo(url, name, chapters = chapters,
+                next_action = next_action, chunk_path = chunk_path, cached = (info_cached or next_action_cached))
 
-        document = bs4.BeautifulSoup(text, 'html.parser')
+    async def get_info_from_url_async(self, url: str) -> comics.model.ComicInfo:
+        info, info_cached = self._get_cached_info(url)
+        if (info is None):
+            with comics.metrics.timed(comics.metrics.PHASE_SERIES_FETCH):
+                _, text = await self.session.get_async(url, retries = self.retries)
+                info = self._parse_info(url, text)
 
-        name = document.select('h1')[0].get_text()
+            self._cache_info(url, info)
+
+        name, chapters, chunk_path = info
+
+        next_action, next_action_cached = self._get_cached_next_action(chunk_path)
+        if (next_action is None):
+            with comics.metrics.timed(comics.metrics.PHASE_NEXT_ACTION_FETCH):
+                _, chunk_text = await self.session.get_async(f"{self.base_url}{chunk_path}", retries = self.retries)
+                next_action = self._parse_next_action(chunk_text)
+
+            self._cache_next_action(chunk_path, next_action)
+
+        return comics.model.ComicInfo(url, name, chapters = chapters,
+                next_action = next_action, chunk_path = chunk_path, cached = (info_cached or next_action_cached))
+
+    def _get_cached_info(self, url: str) -> typing.Tuple[typing.Union[_ParsedInfo, None], bool]:
+        """ Get a comic's parsed page from the cache (and if it was found). """
+
+        cache = self.get_metadata_cache()
+        if (cache is None):
+            return None, False
+
+        data = cache.get_json(_info_cache_key(url))
+        if (data is None):
+            return None, False
+
+        chapters = []
+        for chapter in data['chapters']:
+            chapters.append(comics.model.ComicChapter(url, index = chapter['index'], source_id = chapter['source_id'], name = chapter['name']))
+
+        return (data['name'], chapters, data['chunk_path']), True
+
+    def _cache_info(self, url: str, info: _ParsedInfo) -> None:
+        """ Cache a comic's parsed page. """
+
+        cache = self.get_metadata_cache()
+        if (cache is None):
+            return
+
+        name, chapters, chunk_path = info
+        data = {
+            'name': name,
+            'chunk_path': chunk_path,
+            'chapters': [{'index': chapter.index, 'source_id': chapter.source_id, 'name': chapter.name} for chapter in chapters],
+        }
+
+        cache.set_json(_info_cache_key(url), data, ttl_secs = INFO_CACHE_TTL_SECS)
+
+    def _get_cached_next_action(self, chunk_path: str) -> typing.Tuple[typing.Union[str, None], bool]:
+        """ Get the next action for a JS chunk from the cache (and if it was found). """
+
+        cache = self.get_metadata_cache()
+        if (cache is None):
+            return None, False
+
+        next_action = cache.get(_next_action_cache_key(chunk_path))
+        return next_action, (next_action is not None)
+
+    def _cache_next_action(self, chunk_path: str, next_action: str) -> None:
+        """ Cache the next action for a JS chunk. """
+
+        cache = self.get_metadata_cache()
+        if (cache is not None):
+            cache.set(_next_action_cache_key(chunk_path), next_action, ttl_secs = NEXT_ACTION_CACHE_TTL_SECS)
+
+    def _invalidate_cached_info(self, comic: comics.model.ComicInfo) -> bool:
+        """
+        Drop any cached metadata that this comic's info was built from.
+        Returns True if anything cached was used (and a refetch may help).
+        """
+
+        if (not comic.extra_info.get('cached', False)):
+            return False
+
+        cache = self.get_metadata_cache()
+        if (cache is not None):
+            cache.delete(_info_cache_key(comic.url))
+            cache.delete(_next_action_cache_key(comic.extra_info['chunk_path']))
+
+        comic.extra_info['cached'] = False
+
+        _logger.info("Server action failed for '%s' with cached metadata, refetching.", comic)
+        return True
+
+    def _parse_info(self, url: str, text: str) -> _ParsedInfo:
+        """
+        Parse a comic's page.
+        Returns the comic's name, its chapters, and the path to the JS chunk that holds the next action.
+
+        Instead of building a full document, only the first <h1> and the <script> tags are scanned for.
+        """
+
+        match = _H1_PATTERN.search(text)
+        if (match is None):
+            raise ValueError("Unable to locate comic name.")
+
+        name = html.unescape(_TAG_PATTERN.sub('', match.group(1)))
         chapters = None
-        next_action = None
+        chunk_path = None
 
         # Several script tags have information we need.
-        for script_tag in document.select('script'):
-            text = str(script_tag)
+        for match in _SCRIPT_PATTERN.finditer(text):
+            attributes, body = match.group(1), match.group(2)
 
-            if ('imagesCount' in text):
-                chapters = self._parse_chapters_from_script(url, script_tag.get_text())
+            if (('imagesCount' in body) or ('imagesCount' in attributes)):
+                chapters = self._parse_chapters_from_script(url, body)
                 continue
 
-            match = re.search(r'src="(/_next/static/chunks/app/.*/series/.*/page-.*\.js)"', text)
-            if (match is not None):
-                next_action = self._fetch_next_action(match.group(1))
+            if (chunk_path is not None):
                 continue
 
-        if (next_action is None):
+            src_match = _SRC_PATTERN.search(attributes)
+            if ((src_match is not None) and (_CHUNK_PATH_PATTERN.fullmatch(src_match.group(1)) is not None)):
+                chunk_path = src_match.group(1)
+
+        if (chunk_path is None):
             raise ValueError("Unable to locate next_action information.")
 
         if (chapters is None):
             raise ValueError("Unable to locate chapter information.")
 
-        return comics.model.ComicInfo(url, name, chapters = chapters, next_action = next_action)
-
-    def _fetch_next_action(self, url_path: str) -> str:
-        """ Make a request and collect the next action value. """
+        return name, chapters, chunk_path
 
-        url = f"https://coffeemanga.to{url_path}"
-
-        _, text = edq.net.request.make_get(url, retries = self.retries)
+    def _parse_next_action(self, text: str) -> str:
+        """ Collect the next action value from a JS chunk. """
 
         match = re.search(r'\("(\w+)",[^"]*callServer[^"]*"getChapterImages"\)', text)
         if (match is None):
@@ -67,16 +222,16 @@ class ComicSource(comics.model.ComicSource):
     def _parse_chapters_from_script(self, url: str, text: str) -> typing.List[comics.model.ComicChapter]:
         """ Parse chapter information out of a script tag. """
 
-        matches = re.findall(r'\\"chapter\\":(\{[^\}]+\})', text)
-        if ((matches is None) or (len(matches) == 0)):
+        matches = _CHAPTER_PATTERN.findall(text)
+        if (len(matches) == 0):
             raise ValueError("Unable to parse out chapters.")
 
-        chapters = []
-        for (i, match) in enumerate(reversed(matches)):
-            # Convert the JSON string to a JSON object.
-            text = json.loads(f'"{match}"')
-            data = json.loads(text)
+        # The chapters are escaped inside a JS string.
+        # Instead of decoding each one twice, join them into one (still escaped) array and decode that once.
+        rows = json.loads(json.loads(f'"[{",".join(matches)}]"'))
 
+        chapters = []
+        for (i, data) in enumerate(reversed(rows)):
             chapters.append(comics.model.ComicChapter(
                 url = url,
                 index = i,
@@ -87,27 +242,114 @@ class ComicSource(comics.model.ComicSource):
         return chapters
 
     def get_chapter_images(self, comic: comics.model.ComicInfo, chapter: comics.model.ComicChapter) -> typing.List[comics.model.ComicImage]:
+        next_action = comic.extra_info['next_action']
+
+        try:
+            return self._fetch_chapter_images(comic, chapter, next_action)
+        except Exception:
+            # A stale next action (from a redeploy) looks like any other failure.
+            if (not self._refresh_next_action(comic, next_action)):
+                raise
+
+        return self._fetch_chapter_images(comic, chapter, comic.extra_info['next_action'])
+
+    async def get_chapter_images_async(self,
+            comic: comics.model.ComicInfo,
+            chapter: comics.model.ComicChapter,
+            ) -> typing.List[comics.model.ComicImage]:
+        next_action = comic.extra_info['next_action']
+
+        try:
+            return await self._fetch_chapter_images_async(comic, chapter, next_action)
+        except Exception:
+            # A stale next action (from a redeploy) looks like any other failure.
+            # Refreshing is rare, so it is done in a thread to share the blocking lock.
+            if (not await self.session.run_blocking_async(self._refresh_next_action, comic, next_action)):
+                raise
+
+        return await self._fetch_chapter_images_async(comic, chapter, comic.extra_info['next_action'])
+
+    def _refresh_next_action(self, comic: comics.model.ComicInfo, failed_next_action: str) -> bool:
+        """
+        Called after a server action with the given next action failed.
+        If the next action may have been stale (i.e., it came from the cache), refetch it.
+        Returns True if the request should be retried with the comic's (now current) next action.
+        """
+
+        with self._refresh_lock:
+            # Another chapter already refreshed it.
+            if (comic.extra_info['next_action'] != failed_next_action):
+                return True
+
+            if (not self._invalidate_cached_info(comic)):
+                return False
+
+            comic.extra_info['next_action'] = self.get_info_from_url(comic.url).extra_info['next_action']
+            return True
+
+    def _fetch_chapter_images(self,
+            comic: comics.model.ComicInfo,
+            chapter: comics.model.ComicChapter,
+            next_action: str,
+            ) -> typing.List[comics.model.ComicImage]:
+        """ Make the server action request for a chapter's images. """
+
+        payload, headers = self._chapter_images_request(chapter, next_action)
+        response, _ = self.session.post(comic.url, data = payload, headers = headers, retries = self.retries, stream = True)
+        with response:
+            return self._parse_chapter_images(comics.net.iter_body(response))
+
+    async def _fetch_chapter_images_async(self,
+            comic: comics.model.ComicInfo,
+            chapter: comics.model.ComicChapter,
+            next_action: str,
+            ) -> typing.List[comics.model.ComicImage]:
+        """ An async variant of _fetch_chapter_images(). """
+
+        payload, headers = self._chapter_images_request(chapter, next_action)
+        response, _ = await self.session.post_async(comic.url, data = payload, headers = headers, retries = self.retries, stream = True)
+        with response:
+            # Reading the body blocks, so it is parsed in one of the session's threads.
+            images = await self.session.run_blocking_async(self._parse_chapter_images, comics.net.iter_body(response))
+            return typing.cast(typing.List[comics.model.ComicImage], images)
+
+    def _chapter_images_request(self,
+            chapter: comics.model.ComicChapter,
+            next_action: str,
+            ) -> typing.Tuple[bytes, typing.Dict[str, str]]:
+        """ Build the payload and headers for the server action that lists a chapter's images. """
+
         payload = f"[{chapter.source_id}]".encode(edq.util.dirent.DEFAULT_ENCODING)
         headers = {
             'Content-Type': 'text/plain;charset=UTF-8',
             'User-Agent': USER_AGENT,
-            'Next-Action': comic.extra_info['next_action'],
+            'Next-Action': next_action,
         }
 
-        _, text = edq.net.request.make_post(comic.url, data = payload, headers = headers, retries = self.retries)
-
-        match = re.search(r'\s*1:(\[.+\])\s*', text)
-        if (match is None):
-            raise ValueError("Failed to parse out image data structure.")
+        return payload, headers
 
-        data = json.loads(match.group(1))
+    def _parse_chapter_images(self, chunks: comics.flight.Chunks) -> typing.List[comics.model.ComicImage]:
+        """
+        Parse the images out of the server action's (flight) response as it arrives.
+        Each image is built as soon as its record is complete, without buffering the whole response.
+        """
 
         images = []
-        for (i, row) in enumerate(data):
+        for (i, row) in enumerate(comics.flight.iter_array_items(chunks, IMAGES_ROW_ID)):
             images.append(comics.model.ComicImage(row['src'], index = i))
 
         return images
 
+def _info_cache_key(url: str) -> str:
+    """ Get the cache key for a comic's parsed page. """
+
+    return f"{NAME}info:{url}"
+
+def _next_action_cache_key(chunk_path: str) -> str:
+    """ Get the cache key for the next action found in a JS chunk. """
+
+    return f"{NAME}next-action:{chunk_path}"
+
 def get_urls() -> typing.List[str]:
     """ Get URLs handled by these sources. """
 
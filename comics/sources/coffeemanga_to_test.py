@@ -0,0 +1,101 @@
+import typing
+
+import edq.testing.unittest
+
+import comics.bench.fixtures
+import comics.bench.flight
+import comics.sources.coffeemanga_to
+
+URL: str = 'https://coffeemanga.to/series/fixture'
+
+class TestCoffeeMangaTo(edq.testing.unittest.BaseTest):
+    """ Test parsing coffeemanga.to pages and responses. """
+
+    def test_parse_info_base(self) -> None:
+        """ Test parsing a comic's name, chapters (oldest first), and JS chunk out of its page. """
+
+        source = comics.sources.coffeemanga_to.ComicSource()
+
+        # [(page options, expected name, expected chapter count), ...]
+        test_cases: typing.List[typing.Tuple[typing.Dict[str, typing.Any], str, int]] = [
+            ({}, 'Fixture Comic', 200),
+            ({'chapter_count': 1, 'filler_blocks': 0}, 'Fixture Comic', 1),
+            ({'title': 'Tom &amp; <em>Jerry</em>'}, 'Tom & Jerry', 200),
+            ({'chapter_count': 3000}, 'Fixture Comic', 3000),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (options, expected_name, expected_count) = test_case
+
+            with self.subTest(msg = f"Case {i} ({options}):"):
+                name, chapters, chunk_path = source._parse_info(URL, comics.bench.fixtures.series_page(**options))
+
+                self.assertEqual(expected_name, name)
+                self.assertEqual(comics.bench.fixtures.CHUNK_PATH, chunk_path)
+
+                self.assertEqual(list(reversed(comics.bench.fixtures.chapter_ids(expected_count))), [chapter.source_id for chapter in chapters])
+                self.assertEqual(list(range(expected_count)), [chapter.index for chapter in chapters])
+                self.assertEqual([str(number) for number in range(1, expected_count + 1)], [chapter.name for chapter in chapters])
+                self.assertTrue(all(chapter.url == URL for chapter in chapters))
+
+    def test_parse_info_errors(self) -> None:
+        """ Test that pages missing what is needed are rejected. """
+
+        source = comics.sources.coffeemanga_to.ComicSource()
+        page = comics.bench.fixtures.series_page(chapter_count = 2, filler_blocks = 0)
+
+        # [(page, error substring), ...]
+        test_cases = [
+            (page.replace('<h1', '<h2').replace('</h1>', '</h2>'), 'comic name'),
+            (page.replace(comics.bench.fixtures.CHUNK_PATH, '/_next/static/chunks/main.js'), 'next_action'),
+            (page.replace('imagesCount', 'pageCount'), 'chapter information'),
+            (page.replace('\\"chapter\\"', '\\"episode\\"'), 'parse out chapters'),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (text, expected) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                with self.assertRaisesRegex(ValueError, expected):
+                    source._parse_info(URL, text)
+
+    def test_parse_chapters_matches_original(self) -> None:
+        """ Test that decoding all the chapters at once matches the original decoding of each chapter on its own. """
+
+        source = comics.sources.coffeemanga_to.ComicSource()
+
+        for chapter_count in [1, 2, 500]:
+            with self.subTest(msg = f"Chapters {chapter_count}:"):
+                script = comics.bench.flight._get_chapters_script(chapter_count)
+                chapters = source._parse_chapters_from_script(comics.bench.flight.COMIC_URL, script)
+
+                self.assertEqual(comics.bench.flight._parse_chapters_regex([script.encode('utf-8')]), [chapter.source_id for chapter in chapters])
+
+    def test_parse_next_action(self) -> None:
+        """ Test finding the chapter images server action in a JS chunk. """
+
+        source = comics.sources.coffeemanga_to.ComicSource()
+
+        self.assertEqual(comics.bench.fixtures.NEXT_ACTION, source._parse_next_action(comics.bench.fixtures.chunk_script()))
+        self.assertEqual('abc123', source._parse_next_action(comics.bench.fixtures.chunk_script(next_action = 'abc123')))
+
+        with self.assertRaisesRegex(ValueError, 'next action'):
+            source._parse_next_action(comics.bench.fixtures.chunk_script().replace('getChapterImages', 'getChapters'))
+
+    def test_parse_chapter_images(self) -> None:
+        """ Test parsing a chapter's images out of the server action's response, however it is split up. """
+
+        source = comics.sources.coffeemanga_to.ComicSource()
+        base_url = comics.sources.coffeemanga_to.BASE_URL
+
+        for image_count in [0, 1, 40]:
+            data = comics.bench.fixtures.chapter_images_response(base_url, 7, image_count = image_count).encode('utf-8')
+            expected = comics.bench.fixtures.image_urls(base_url, 7, image_count)
+
+            for chunk_size in [1, 100, len(data)]:
+                with self.subTest(msg = f"Images {image_count}, chunk size {chunk_size}:"):
+                    chunks = [data[i:(i + chunk_size)] for i in range(0, len(data), chunk_size)]
+                    images = source._parse_chapter_images(chunks)
+
+                    self.assertEqual(expected, [image.url for image in images])
+                    self.assertEqual(list(range(image_count)), [image.index for image in images])
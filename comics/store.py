@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import typing
+
+import edq.util.dirent
+
+_logger = logging.getLogger(__name__)
+
+INDEX_FILENAME: str = 'index.sqlite'
+OBJECTS_DIRNAME: str = 'objects'
+
+HASH_CHUNK_SIZE: int = 1024 * 1024
+
+_SCHEMA: typing.List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS urls (
+        url TEXT PRIMARY KEY,
+        digest TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        updated REAL NOT NULL
+    )
+    ''',
+]
+
+class ImageStore:
+    """
+    A content-addressed store of image bodies (keyed by their SHA-256), shared between chapters and comics,
+    along with an index of which URL holds which body.
+
+    An image URL that is already in the index is never fetched again,
+    and identical bodies (even from different URLs) are only stored once.
+    Images in chapter directories are hardlinks to the stored bodies (or copies where the filesystem cannot link),
+    so stored images should not be edited in place.
+
+    A store is safe to share between threads and between downloads.
+    """
+
+    def __init__(self, root_dir: str) -> None:
+        self.root_dir: str = root_dir
+        """ Where the store is kept. """
+
+        edq.util.dirent.mkdir(os.path.join(root_dir, OBJECTS_DIRNAME))
+
+        self._lock: threading.Lock = threading.Lock()
+
+        self._connection: typing.Union[sqlite3.Connection, None] = sqlite3.connect(
+                os.path.join(root_dir, INDEX_FILENAME), check_same_thread = False)
+        with self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def close(self) -> None:
+        """ Close the store's index. """
+
+        with self._lock:
+            if (self._connection is not None):
+                self._connection.close()
+                self._connection = None
+
+    def __enter__(self) -> 'ImageStore':
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+    def get_object_path(self, digest: str) -> str:
+        """ Get where the body with the given digest is stored. """
+
+        return os.path.join(self.root_dir, OBJECTS_DIRNAME, digest[:2], digest[2:])
+
+    def lookup(self, url: str) -> typing.Union[str, None]:
+        """
+        Get the path to the stored body for a URL, or None if the URL has not been stored.
+        An entry whose body has gone missing (or changed size) is forgotten.
+        """
+
+        with self._lock:
+            if (self._connection is None):
+                return None
+
+            row = self._connection.execute('SELECT digest, size FROM urls WHERE url = ?', (url,)).fetchone()
+
+        if (row is None):
+            return None
+
+        path = self.get_object_path(row[0])
+
+        try:
+            if (os.path.getsize(path) == row[1]):
+                return path
+        except OSError:
+            pass
+
+        _logger.debug("Dropping stale image store entry for '%s'.", url)
+        with self._lock:
+            if (self._connection is not None):
+                with self._connection:
+                    self._connection.execute('DELETE FROM urls WHERE url = ? AND digest = ?', (url, row[0]))
+
+        return None
+
+    def link(self, url: str, out_path: str) -> bool:
+        """ Place the stored body for a URL at `out_path`, returning False if the URL has not been stored. """
+
+        path = self.lookup(url)
+        if (path is None):
+            return False
+
+        _link_or_copy(path, out_path)
+        return True
+
+    def read(self, url: str) -> typing.Union[bytes, None]:
+        """ Get the stored body for a URL, or None if the URL has not been stored. """
+
+        path = self.lookup(url)
+        if (path is None):
+            return None
+
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def add_file(self, url: str, path: str) -> str:
+        """
+        Store a downloaded file as the body for a URL and return its digest.
+        Afterwards, the file at `path` is a hardlink to the stored body (if the filesystem allows it).
+        """
+
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            while True:
+                chunk = file.read(HASH_CHUNK_SIZE)
+                if (len(chunk) == 0):
+                    break
+
+                hasher.update(chunk)
+
+        digest = hasher.hexdigest()
+        object_path = self.get_object_path(digest)
+
+        if (_is_stored(object_path, os.path.getsize(path))):
+            # Already stored, swap the file for the stored copy.
+            _link_or_copy(object_path, path)
+        else:
+            edq.util.dirent.mkdir(os.path.dirname(object_path))
+            _link_or_copy(path, object_path)
+
+        self._index(url, digest, os.path.getsize(object_path))
+
+        return digest
+
+    def add_bytes(self, url: str, data: bytes) -> str:
+        """ Store a body for a URL and return its digest. """
+
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self.get_object_path(digest)
+
+        if (not _is_stored(object_path, len(data))):
+            edq.util.dirent.mkdir(os.path.dirname(object_path))
+
+            temp_path = _temp_path(object_path)
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+
+            os.replace(temp_path, object_path)
+
+        self._index(url, digest, len(data))
+
+        return digest
+
+    def _index(self, url: str, digest: str, size: int) -> None:
+        """ Record which body a URL holds. """
+
+        with self._lock:
+            if (self._connection is None):
+                return
+
+            with self._connection:
+                self._connection.execute(
+                        'INSERT OR REPLACE INTO urls (url, digest, size, updated) VALUES (?, ?, ?, ?)',
+                        (url, digest, size, time.time()))
+
+def _is_stored(object_path: str, size: int) -> bool:
+    """
+    Check if a body is already stored.
+    A stored body of the wrong size has been damaged (e.g., truncated through one of its hardlinks) and should be replaced.
+    """
+
+    try:
+        return (os.path.getsize(object_path) == size)
+    except OSError:
+        return False
+
+def _link_or_copy(source_path: str, target_path: str) -> None:
+    """ Atomically make `target_path` a hardlink to `source_path`, or a copy if the filesystem cannot link them. """
+
+    temp_path = _temp_path(target_path)
+
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        shutil.copyfile(source_path, temp_path)
+
+    os.replace(temp_path, target_path)
+
+def _temp_path(path: str) -> str:
+    """ Get a temp path next to a path, unique to this thread. """
+
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
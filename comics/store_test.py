@@ -0,0 +1,172 @@
+import os
+import typing
+import unittest.mock
+
+import edq.testing.unittest
+import edq.util.dirent
+
+import comics.download
+import comics.download_test
+import comics.metrics
+import comics.store
+
+class TestStore(edq.testing.unittest.BaseTest):
+    """ Test the content-addressed image store. """
+
+    def test_add_file(self) -> None:
+        """ Test that stored files become hardlinks to a single stored body, however many URLs hold it. """
+
+        temp_dir = self._make_temp_dir()
+        paths = [self._write(temp_dir, name, b'same') for name in ['a.jpg', 'b.jpg']]
+
+        with comics.store.ImageStore(os.path.join(temp_dir, 'store')) as store:
+            digests = [store.add_file(f"http://test.invalid/{i}.jpg", path) for (i, path) in enumerate(paths)]
+            self.assertEqual(digests[0], digests[1])
+
+            object_path = store.get_object_path(digests[0])
+            self.assertEqual(object_path, store.lookup('http://test.invalid/1.jpg'))
+            self.assertEqual(1, len(self._list_objects(store)))
+
+            for path in paths:
+                self.assertTrue(os.path.samefile(object_path, path))
+
+            out_path = os.path.join(temp_dir, 'out.jpg')
+            self.assertTrue(store.link('http://test.invalid/0.jpg', out_path))
+            self.assertTrue(os.path.samefile(object_path, out_path))
+
+            self.assertFalse(store.link('http://test.invalid/missing.jpg', os.path.join(temp_dir, 'missing.jpg')))
+            self.assertFalse(os.path.exists(os.path.join(temp_dir, 'missing.jpg')))
+
+    def test_add_bytes(self) -> None:
+        """ Test storing bodies from memory, and that the index outlives the store that wrote it. """
+
+        root_dir = os.path.join(self._make_temp_dir(), 'store')
+
+        with comics.store.ImageStore(root_dir) as store:
+            store.add_bytes('http://test.invalid/a.jpg', b'one')
+            store.add_bytes('http://test.invalid/b.jpg', b'one')
+            store.add_bytes('http://test.invalid/c.jpg', b'two')
+
+            # A URL that now holds a different body.
+            store.add_bytes('http://test.invalid/c.jpg', b'three')
+
+            self.assertEqual(3, len(self._list_objects(store)))
+
+        with comics.store.ImageStore(root_dir) as store:
+            # [(url, expected), ...]
+            test_cases = [
+                ('http://test.invalid/a.jpg', b'one'),
+                ('http://test.invalid/b.jpg', b'one'),
+                ('http://test.invalid/c.jpg', b'three'),
+                ('http://test.invalid/missing.jpg', None),
+            ]
+
+            for (i, test_case) in enumerate(test_cases):
+                (url, expected) = test_case
+
+                with self.subTest(msg = f"Case {i} ({url}):"):
+                    self.assertEqual(expected, store.read(url))
+
+        store.close()
+        self.assertIsNone(store.lookup('http://test.invalid/a.jpg'))
+
+    def test_link_fallback(self) -> None:
+        """ Test that images are copied where the filesystem cannot link them. """
+
+        temp_dir = self._make_temp_dir()
+        path = self._write(temp_dir, 'a.jpg', b'body')
+
+        with comics.store.ImageStore(os.path.join(temp_dir, 'store')) as store:
+            with unittest.mock.patch('comics.store.os.link', side_effect = OSError('Links are not supported.')) as link:
+                digest = store.add_file('http://test.invalid/a.jpg', path)
+
+                out_path = os.path.join(temp_dir, 'out.jpg')
+                self.assertTrue(store.link('http://test.invalid/a.jpg', out_path))
+
+            self.assertEqual(2, link.call_count)
+
+            object_path = store.get_object_path(digest)
+            for copy_path in [path, out_path]:
+                self.assertFalse(os.path.samefile(object_path, copy_path))
+
+                with open(copy_path, 'rb') as file:
+                    self.assertEqual(b'body', file.read())
+
+            self.assertEqual([], [name for name in os.listdir(temp_dir) if name.endswith('.tmp')])
+
+    def test_damaged_body(self) -> None:
+        """ Test that a stored body that was changed (through one of its links) is forgotten and then replaced. """
+
+        temp_dir = self._make_temp_dir()
+        path = self._write(temp_dir, 'a.jpg', b'body')
+
+        with comics.store.ImageStore(os.path.join(temp_dir, 'store')) as store:
+            digest = store.add_file('http://test.invalid/a.jpg', path)
+
+            with open(path, 'wb') as file:
+                file.write(b'bo')
+
+            self.assertIsNone(store.lookup('http://test.invalid/a.jpg'))
+            self.assertFalse(store.link('http://test.invalid/a.jpg', os.path.join(temp_dir, 'out.jpg')))
+
+            new_path = self._write(temp_dir, 'b.jpg', b'body')
+            self.assertEqual(digest, store.add_file('http://test.invalid/a.jpg', new_path))
+            self.assertEqual(b'body', store.read('http://test.invalid/a.jpg'))
+
+    def test_download_from_store(self) -> None:
+        """ Test that a second download of a comic takes every image from the store instead of fetching it. """
+
+        temp_dir = self._make_temp_dir()
+        image_count = comics.download_test.STAND_IN_CHAPTER_COUNT * comics.download_test.STAND_IN_IMAGE_COUNT
+
+        with comics.store.ImageStore(os.path.join(temp_dir, 'store')) as store, comics.download_test.stand_in_server() as server:
+            # [(expected image requests, expected images from the store), ...]
+            test_cases = [
+                (image_count, 0),
+                (0, image_count),
+            ]
+
+            for (i, test_case) in enumerate(test_cases):
+                (expected_requests, expected_from_store) = test_case
+
+                with self.subTest(msg = f"Case {i}:"):
+                    server.reset_counts()
+                    result = comics.download.download(server.comic_url, os.path.join(temp_dir, str(i)), workers = 2, store = store)
+
+                    self.assertEqual(expected_requests, server.reset_counts().get('image', 0))
+                    self.assertEqual(expected_from_store, result.metrics.get_count(comics.metrics.COUNTER_IMAGES_FROM_STORE))
+
+                    for chapter_result in result.chapter_download_results:
+                        self.assertEqual(comics.download_test.STAND_IN_IMAGE_COUNT, chapter_result.downloaded_count())
+
+                        for image_result in chapter_result.image_results:
+                            with open(image_result.out_path, 'rb') as file:
+                                self.assertEqual(server.image_body, file.read())
+
+            # Every image of every chapter is the same body.
+            self.assertEqual(1, len(self._list_objects(store)))
+
+    def _list_objects(self, store: comics.store.ImageStore) -> typing.List[str]:
+        """ List the stored bodies. """
+
+        objects_dir = os.path.join(store.root_dir, comics.store.OBJECTS_DIRNAME)
+
+        paths = []
+        for (dirpath, _, filenames) in os.walk(objects_dir):
+            paths += [os.path.join(dirpath, filename) for filename in filenames]
+
+        return sorted(paths)
+
+    def _write(self, temp_dir: str, name: str, data: bytes) -> str:
+        """ Write a file and return its path. """
+
+        path = os.path.join(temp_dir, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+        return path
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
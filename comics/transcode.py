@@ -0,0 +1,193 @@
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import time
+import typing
+
+import edq.util.dirent
+
+_logger = logging.getLogger(__name__)
+
+FORMAT_WEBP: str = 'webp'
+""" Re-encode images as (lossy) WebP. """
+
+FORMAT_AVIF: str = 'avif'
+""" Re-encode images as (lossy) AVIF. Needs a Pillow build with AVIF support. """
+
+FORMAT_PNG: str = 'png'
+""" Losslessly re-compress PNG images (other images are left alone). """
+
+FORMATS: typing.List[str] = [FORMAT_WEBP, FORMAT_AVIF, FORMAT_PNG]
+
+DEFAULT_QUALITY: int = 80
+""" The encoder quality (0-100) for lossy formats. """
+
+MAP_FILENAME: str = '.comics-transcoded.json'
+"""
+The name of the file kept in each transcoded chapter's directory,
+mapping the name each image was downloaded as to the name of its encoded file.
+"""
+
+SOURCE_EXTENSIONS: typing.Set[str] = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
+""" The image types that may be re-encoded. """
+
+TranscodeOutcome = typing.Tuple[str, int, int, float]
+""" Where an image ended up, its size before and after, and the (CPU) seconds spent on it. """
+
+class Transcoder:
+    """
+    Re-encodes downloaded images in a pool of worker processes (one per core, by default),
+    so that CPU-bound encoding never holds up the threads that fetch images.
+    The pool is only started once there is something to encode.
+
+    An encoded image replaces the original file (e.g., `001.jpg` becomes `001.webp`),
+    unless the encoding would be larger, in which case the original is kept.
+    Which file each image became is recorded in the chapter's map (see read_map()),
+    so that later downloads know the image is already there.
+
+    Needs Pillow (which is optional), see check_support().
+    """
+
+    def __init__(self,
+            format: str,
+            quality: int = DEFAULT_QUALITY,
+            processes: typing.Union[int, None] = None,
+            ) -> None:
+        check_support(format)
+
+        self.format: str = format
+        """ What images are encoded as (see FORMATS). """
+
+        self.quality: int = min(100, max(0, quality))
+        """ The encoder quality for lossy formats. """
+
+        if (processes is None):
+            processes = os.cpu_count() or 1
+
+        self.processes: int = max(1, processes)
+        """ The number of worker processes. """
+
+        self._executor: typing.Union[concurrent.futures.ProcessPoolExecutor, None] = None
+
+    def wants(self, path: str) -> bool:
+        """ Check if an image file should be encoded. """
+
+        extension = os.path.splitext(path)[-1].lower()
+
+        if (self.format == FORMAT_PNG):
+            return (extension == '.png')
+
+        return ((extension in SOURCE_EXTENSIONS) and (extension != f".{self.format}"))
+
+    def submit(self, path: str) -> concurrent.futures.Future:
+        """ Start encoding an image file, the future's result is a TranscodeOutcome. """
+
+        if (self._executor is None):
+            # Forking a process that has threads (e.g., download workers) is not safe.
+            context = multiprocessing.get_context('spawn')
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers = self.processes, mp_context = context)
+
+        return self._executor.submit(transcode_file, path, self.format, self.quality)
+
+    def close(self) -> None:
+        """ Wait for all outstanding work and stop the pool. """
+
+        if (self._executor is not None):
+            self._executor.shutdown(wait = True)
+            self._executor = None
+
+    def __enter__(self) -> 'Transcoder':
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+def check_support(format: str) -> None:
+    """ Raise a ValueError if images cannot be encoded in a format (an unknown format, no Pillow, or no encoder in Pillow). """
+
+    if (format not in FORMATS):
+        raise ValueError(f"Unknown transcode format '{format}', expected one of: {FORMATS}.")
+
+    try:
+        import PIL.features  # pylint: disable=import-outside-toplevel
+    except ImportError as ex:
+        raise ValueError("Transcoding images requires Pillow (`pip install Pillow`).") from ex
+
+    if (format == FORMAT_PNG):
+        return
+
+    if (not PIL.features.check(format)):
+        raise ValueError(f"This installation of Pillow cannot encode '{format}' images.")
+
+def transcode_file(path: str, format: str, quality: int) -> TranscodeOutcome:
+    """
+    Encode an image file (see Transcoder), returning where the image ended up along with its sizes and the time taken.
+    Runs in a worker process.
+    """
+
+    import PIL.Image  # pylint: disable=import-outside-toplevel,import-error
+
+    start = time.process_time()
+
+    original_size = os.path.getsize(path)
+    out_path = os.path.splitext(path)[0] + f".{format}"
+    temp_path = f"{out_path}.{os.getpid()}.tmp"
+
+    try:
+        with PIL.Image.open(path) as image:
+            if (getattr(image, 'is_animated', False)):
+                # Only the first frame would survive.
+                return path, original_size, original_size, time.process_time() - start
+
+            if (format == FORMAT_PNG):
+                image.save(temp_path, format = 'PNG', optimize = True)
+            elif (image.mode not in ('RGB', 'RGBA')):
+                image.convert('RGBA' if ('A' in image.getbands()) else 'RGB').save(temp_path, format = format.upper(), quality = quality)
+            else:
+                image.save(temp_path, format = format.upper(), quality = quality)
+
+        encoded_size = os.path.getsize(temp_path)
+        if (encoded_size >= original_size):
+            os.remove(temp_path)
+            return path, original_size, original_size, time.process_time() - start
+
+        os.replace(temp_path, out_path)
+    except BaseException:
+        if (os.path.exists(temp_path)):
+            os.remove(temp_path)
+
+        raise
+
+    if (out_path != path):
+        os.remove(path)
+
+    return out_path, original_size, encoded_size, time.process_time() - start
+
+def read_map(chapter_dir: str) -> typing.Dict[str, str]:
+    """ Get a chapter's map of downloaded names to encoded names (empty if nothing in the chapter has been encoded). """
+
+    path = os.path.join(chapter_dir, MAP_FILENAME)
+
+    try:
+        with open(path, 'r', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as ex:
+        _logger.warning("Ignoring unreadable transcode map: '%s'.", path, exc_info = ex)
+        return {}
+
+    return {str(name): str(encoded_name) for (name, encoded_name) in data.items()}
+
+def write_map(chapter_dir: str, transcoded: typing.Dict[str, str]) -> None:
+    """ Replace a chapter's map of downloaded names to encoded names. """
+
+    path = os.path.join(chapter_dir, MAP_FILENAME)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temp_path, 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+        json.dump(transcoded, file, indent = 4, sort_keys = True)
+
+    os.replace(temp_path, path)
@@ -0,0 +1,196 @@
+import io
+import os
+import typing
+
+import edq.testing.unittest
+import edq.util.dirent
+import PIL.Image
+
+import comics.download
+import comics.download_test
+import comics.metrics
+import comics.model
+import comics.transcode
+
+class TestTranscode(edq.testing.unittest.BaseTest):
+    """ Test re-encoding downloaded images. """
+
+    def test_check_support(self) -> None:
+        """ Test that unknown formats are rejected. """
+
+        comics.transcode.check_support(comics.transcode.FORMAT_PNG)
+        comics.transcode.check_support(comics.transcode.FORMAT_WEBP)
+
+        with self.assertRaisesRegex(ValueError, 'Unknown transcode format'):
+            comics.transcode.check_support('bmp')
+
+        with self.assertRaisesRegex(ValueError, 'Unknown transcode format'):
+            comics.transcode.Transcoder('jpg')
+
+    def test_wants(self) -> None:
+        """ Test which images each format re-encodes. """
+
+        # [(format, path, expected), ...]
+        test_cases = [
+            (comics.transcode.FORMAT_WEBP, 'a/001.jpg', True),
+            (comics.transcode.FORMAT_WEBP, 'a/001.JPEG', True),
+            (comics.transcode.FORMAT_WEBP, 'a/001.png', True),
+            (comics.transcode.FORMAT_WEBP, 'a/001.webp', False),
+            (comics.transcode.FORMAT_WEBP, 'a/001.txt', False),
+            (comics.transcode.FORMAT_WEBP, 'a/001', False),
+            (comics.transcode.FORMAT_PNG, 'a/001.png', True),
+            (comics.transcode.FORMAT_PNG, 'a/001.jpg', False),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (format, path, expected) = test_case
+
+            with self.subTest(msg = f"Case {i} ({format}, {path}):"):
+                transcoder = comics.transcode.Transcoder(format, processes = 1)
+                self.assertEqual(expected, transcoder.wants(path))
+
+    def test_transcoder_options(self) -> None:
+        """ Test that quality and process counts are kept in range. """
+
+        # [(quality, processes, expected quality, expected processes), ...]
+        test_cases = [
+            (80, 2, 80, 2),
+            (150, 0, 100, 1),
+            (-5, -1, 0, 1),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (quality, processes, expected_quality, expected_processes) = test_case
+
+            with self.subTest(msg = f"Case {i}:"):
+                transcoder = comics.transcode.Transcoder(comics.transcode.FORMAT_WEBP, quality = quality, processes = processes)
+                self.assertEqual((expected_quality, expected_processes), (transcoder.quality, transcoder.processes))
+
+    def test_transcode_file(self) -> None:
+        """ Test encoding files in place, keeping the original where encoding would not help. """
+
+        # [(file name, image bytes, format, expected name, expect smaller), ...]
+        test_cases: typing.List[typing.Tuple[str, bytes, str, str, bool]] = [
+            ('001.jpg', _make_image('JPEG'), comics.transcode.FORMAT_WEBP, '001.webp', True),
+            ('001.png', _make_image('PNG', mode = 'L'), comics.transcode.FORMAT_WEBP, '001.webp', True),
+            ('001.gif', _make_image('GIF', mode = 'P'), comics.transcode.FORMAT_WEBP, '001.webp', True),
+            ('001.png', _make_image('PNG', optimize = True), comics.transcode.FORMAT_PNG, '001.png', False),
+            ('001.gif', _make_animation(), comics.transcode.FORMAT_WEBP, '001.gif', False),
+        ]
+
+        for (i, test_case) in enumerate(test_cases):
+            (name, data, format, expected_name, expect_smaller) = test_case
+
+            with self.subTest(msg = f"Case {i} ({name} to {format}):"):
+                temp_dir = self._make_temp_dir()
+                path = os.path.join(temp_dir, name)
+                with open(path, 'wb') as file:
+                    file.write(data)
+
+                out_path, original_size, encoded_size, secs = comics.transcode.transcode_file(path, format, comics.transcode.DEFAULT_QUALITY)
+
+                self.assertEqual(os.path.join(temp_dir, expected_name), out_path)
+                self.assertEqual([expected_name], os.listdir(temp_dir))
+                self.assertEqual(len(data), original_size)
+                self.assertEqual(os.path.getsize(out_path), encoded_size)
+                self.assertEqual(expect_smaller, (encoded_size < original_size))
+                self.assertGreaterEqual(secs, 0.0)
+
+                with PIL.Image.open(out_path) as image:
+                    self.assertEqual((64, 48), image.size)
+
+    def test_transcode_file_broken(self) -> None:
+        """ Test that a file that is not an image fails without leaving anything behind. """
+
+        temp_dir = self._make_temp_dir()
+        path = os.path.join(temp_dir, '001.jpg')
+        with open(path, 'wb') as file:
+            file.write(b'not an image')
+
+        with self.assertRaises(PIL.UnidentifiedImageError):
+            comics.transcode.transcode_file(path, comics.transcode.FORMAT_WEBP, comics.transcode.DEFAULT_QUALITY)
+
+        self.assertEqual(['001.jpg'], os.listdir(temp_dir))
+
+    def test_map(self) -> None:
+        """ Test reading and writing a chapter's transcode map. """
+
+        temp_dir = self._make_temp_dir()
+        self.assertEqual({}, comics.transcode.read_map(temp_dir))
+
+        comics.transcode.write_map(temp_dir, {'001.jpg': '001.webp'})
+        comics.transcode.write_map(temp_dir, {'001.jpg': '001.webp', '002.jpg': '002.webp'})
+        self.assertEqual({'001.jpg': '001.webp', '002.jpg': '002.webp'}, comics.transcode.read_map(temp_dir))
+        self.assertEqual([comics.transcode.MAP_FILENAME], os.listdir(temp_dir))
+
+        with open(os.path.join(temp_dir, comics.transcode.MAP_FILENAME), 'w', encoding = edq.util.dirent.DEFAULT_ENCODING) as file:
+            file.write('{')
+
+        self.assertEqual({}, comics.transcode.read_map(temp_dir))
+
+    def test_download_transcodes(self) -> None:
+        """ Test that downloaded images are replaced by their encodings, and that a later download knows they are there. """
+
+        image_count = comics.download_test.STAND_IN_CHAPTER_COUNT * comics.download_test.STAND_IN_IMAGE_COUNT
+        base_dir = self._make_temp_dir()
+
+        with comics.download_test.stand_in_server() as server:
+            old_body = server.image_body
+            server.image_body = _make_image('JPEG')
+
+            try:
+                for expected_requests in [image_count, 0]:
+                    with self.subTest(msg = f"Expected requests {expected_requests}:"):
+                        server.reset_counts()
+
+                        with comics.transcode.Transcoder(comics.transcode.FORMAT_WEBP, processes = 1) as transcoder:
+                            result = comics.download.download(server.comic_url, base_dir, workers = 2, transcoder = transcoder)
+
+                        self.assertEqual(expected_requests, server.reset_counts().get('image', 0))
+                        self._check_transcoded(result, (image_count if (expected_requests > 0) else 0))
+            finally:
+                server.image_body = old_body
+
+    def _check_transcoded(self, result: comics.model.DownloadResult, expected_transcoded: int) -> None:
+        """ Check that every image of a download is an encoded file, listed in its chapter's map. """
+
+        self.assertEqual(expected_transcoded, result.metrics.get_count(comics.metrics.COUNTER_IMAGES_TRANSCODED))
+
+        for chapter_download_result in result.chapter_download_results:
+            self.assertEqual(0, chapter_download_result.missing_count())
+
+            names = sorted(os.path.basename(image_result.out_path) for image_result in chapter_download_result.image_results)
+            self.assertTrue(all(name.endswith('.webp') for name in names), msg = str(names))
+
+            self.assertEqual(sorted(names + [comics.transcode.MAP_FILENAME]), sorted(os.listdir(chapter_download_result.out_path)))
+            self.assertEqual(names, sorted(comics.transcode.read_map(chapter_download_result.out_path).values()))
+
+    def _make_temp_dir(self) -> str:
+        """ Get a new temp dir for a test. """
+
+        return edq.util.dirent.get_temp_dir(prefix = 'comics-test-')
+
+def _make_image(format: str, mode: str = 'RGB', **kwargs: typing.Any) -> bytes:
+    """ Encode a small gradient image. """
+
+    image = PIL.Image.new('RGB', (64, 48))
+    image.putdata([((x * 4) % 256, (y * 5) % 256, ((x + y) * 2) % 256) for y in range(48) for x in range(64)])
+
+    if (mode != 'RGB'):
+        image = image.convert(mode)
+
+    if (format == 'JPEG'):
+        kwargs.setdefault('quality', 100)
+
+    output = io.BytesIO()
+    image.save(output, format = format, **kwargs)
+    return output.getvalue()
+
+def _make_animation() -> bytes:
+    """ Encode a small animated GIF. """
+
+    frames = [PIL.Image.new('RGB', (64, 48), color) for color in ['red', 'blue']]
+
+    output = io.BytesIO()
+    frames[0].save(output, format = 'GIF', save_all = True, append_images = frames[1:])
+    return output.getvalue()